@@ -1,4 +1,5 @@
 from django.contrib import admin
+from django.utils.html import format_html_join
 
 from .models import (
     Article,
@@ -9,6 +10,7 @@ from .models import (
     AssessmentResult,
     AssessmentSubmission,
     Category,
+    ChatConversation,
     ChatLog,
     ConsultationNote,
     ConsultationTicket,
@@ -19,6 +21,7 @@ from .models import (
     RelaxationReminder,
     UserProfile,
 )
+from .services.conversations import conversation_messages
 
 
 @admin.register(Category)
@@ -49,10 +52,33 @@ class ConsultationTicketAdmin(admin.ModelAdmin):
     inlines = [ConsultationNoteInline]
 
 
+@admin.register(ChatConversation)
+class ChatConversationAdmin(admin.ModelAdmin):
+    list_display = ("id", "user", "provider", "turn_count", "risk_flag", "started_at", "last_turn_at")
+    list_filter = ("risk_flag", "provider")
+    list_select_related = ("user",)
+    # 对话表很大，不做全表 COUNT，翻页只依赖 last_turn_at 索引。
+    show_full_result_count = False
+    search_fields = ("user__username",)
+    readonly_fields = ("turn_count", "tail_digest", "started_at", "last_turn_at", "transcript")
+    raw_id_fields = ("user",)
+
+    @admin.display(description="对话内容")
+    def transcript(self, obj):
+        return format_html_join(
+            "\n",
+            "<p><strong>{}</strong>：{}</p>",
+            ((msg.get("role", ""), msg.get("content", "")) for msg in conversation_messages(obj.pk)),
+        )
+
+
 @admin.register(ChatLog)
 class ChatLogAdmin(admin.ModelAdmin):
-    list_display = ("provider", "user", "risk_flag", "created_at")
+    list_display = ("provider", "user", "conversation", "risk_flag", "created_at")
     list_filter = ("provider", "risk_flag")
+    list_select_related = ("user", "conversation")
+    show_full_result_count = False
+    raw_id_fields = ("user", "conversation")
 
 
 @admin.register(UserProfile)
@@ -1,92 +1,990 @@
+import asyncio
+import functools
+import http.client
 import json
+import math
 import os
+import random
 import socket
 import ssl
-import urllib.error
-import urllib.request
+import threading
+import time
+import urllib.parse
+from collections import deque
+from concurrent import futures
+from contextlib import aclosing, asynccontextmanager, closing, contextmanager
+from typing import AsyncIterator, Awaitable, Callable, Iterator
 
 import certifi
 
 from django.conf import settings
 
 
+RETRYABLE_STATUS = frozenset({408, 409, 425, 429, 500, 502, 503, 504})
+
+
 class AIServiceError(Exception):
-    pass
+    def __init__(self, message: str = "", retryable: bool = False):
+        super().__init__(message)
+        # 超时、连接失败、限流和 5xx 可以重试或切换到备用地址，其余错误直接返回给用户。
+        self.retryable = retryable
 
 
 def _get_provider(provider: str) -> dict:
+    """Resolve a provider to its endpoints: the main entry first, then ``fallbacks``.
+
+    A fallback without its own key uses the main entry's key; entries without
+    a ``base_url`` are skipped. The first endpoint's fields are also exposed
+    at the top level.
+    """
     provider = (provider or "").lower().strip()
     config = settings.AI_PROVIDERS.get(provider)
     if not config:
         raise AIServiceError("未识别的 AI 服务商。")
-    api_key = os.environ.get(config.get("api_key_env", ""), "").strip()
-    if not api_key:
+    main_key = os.environ.get(config.get("api_key_env", ""), "").strip()
+    endpoints = []
+    for entry in [config, *config.get("fallbacks", [])]:
+        api_key = os.environ.get(entry.get("api_key_env", ""), "").strip() or main_key
+        if entry.get("base_url") and api_key:
+            endpoints.append(
+                {
+                    "base_url": entry["base_url"],
+                    "api_key": api_key,
+                    "model": entry.get("model", config["model"]),
+                }
+            )
+    if not endpoints:
         raise AIServiceError("AI 服务尚未配置 API Key。")
-    return {
-        "provider": provider,
-        "base_url": config["base_url"],
-        "api_key": api_key,
-        "model": config["model"],
-    }
+    return {"provider": provider, **endpoints[0], "endpoints": endpoints}
 
 
-def call_ai(
-    provider: str,
+def _build_body(
+    config: dict,
     messages: list,
-    model_override: str | None = None,
-    max_tokens: int | None = None,
-) -> str:
-    config = _get_provider(provider)
-    model = model_override or config["model"]
+    model_override: str | None,
+    max_tokens: int | None,
+    stream: bool = False,
+) -> bytes:
     payload = {
-        "model": model,
+        "model": model_override or config["model"],
         "messages": messages,
         "temperature": 0.4,
         "max_tokens": max_tokens or 1024,
     }
-    data = json.dumps(payload).encode("utf-8")
-    request = urllib.request.Request(
-        config["base_url"],
-        data=data,
-        headers={
-            "Content-Type": "application/json",
-            "Authorization": f"Bearer {config['api_key']}",
-        },
-        method="POST",
-    )
-    ssl_context = ssl.create_default_context(cafile=certifi.where())
-    timeout = getattr(settings, "AI_TIMEOUT", 120)
+    if stream:
+        payload["stream"] = True
+    return json.dumps(payload).encode("utf-8")
+
+
+def _headers(config: dict) -> dict:
+    return {
+        "Content-Type": "application/json",
+        "Authorization": f"Bearer {config['api_key']}",
+    }
+
+
+def _http_error(code: int, reason: str, body: bytes) -> AIServiceError:
+    detail = ""
     try:
-        with urllib.request.urlopen(request, timeout=timeout, context=ssl_context) as response:
-            raw = response.read().decode("utf-8")
-    except urllib.error.HTTPError as exc:
-        detail = ""
-        try:
-            detail = exc.read().decode("utf-8", errors="ignore")
-            data = json.loads(detail)
-            if isinstance(data, dict):
-                detail = data.get("error", {}).get("message") or data.get("message") or detail
-        except Exception:
-            detail = detail or ""
-        message = f"AI 请求失败：{exc.code} {exc.reason}"
-        if detail:
-            message = f"{message}（{detail}）"
-        raise AIServiceError(message) from exc
-    except (urllib.error.URLError, socket.timeout, ssl.SSLError) as exc:
-        detail = getattr(exc, "reason", "") or str(exc) or ""
-        if isinstance(exc, socket.timeout):
-            message = "AI 服务连接超时，请稍后重试。"
-        else:
-            message = "AI 服务无法连接，请稍后重试。"
-        if detail:
-            message = f"{message}（{detail}）"
-        raise AIServiceError(message) from exc
-    except Exception as exc:
-        raise AIServiceError("AI 请求出现异常，请稍后重试。") from exc
+        detail = body.decode("utf-8", errors="ignore")
+        data = json.loads(detail)
+        if isinstance(data, dict):
+            detail = data.get("error", {}).get("message") or data.get("message") or detail
+    except Exception:
+        detail = detail or ""
+    message = f"AI 请求失败：{code} {reason}"
+    if detail:
+        message = f"{message}（{detail}）"
+    return AIServiceError(message, retryable=code in RETRYABLE_STATUS)
+
 
+def _connection_error(exc: Exception, timed_out: bool) -> AIServiceError:
+    detail = getattr(exc, "reason", "") or str(exc) or ""
+    if timed_out:
+        message = "AI 服务连接超时，请稍后重试。"
+    else:
+        message = "AI 服务无法连接，请稍后重试。"
+    if detail:
+        message = f"{message}（{detail}）"
+    return AIServiceError(message, retryable=True)
+
+
+def _transport_error(exc: Exception) -> AIServiceError:
+    if isinstance(exc, AIServiceError):
+        return exc
+    if isinstance(exc, (OSError, http.client.HTTPException)):
+        return _connection_error(exc, isinstance(exc, socket.timeout))
+    return AIServiceError("AI 请求出现异常，请稍后重试。")
+
+
+def _parse_completion(raw: str) -> str:
     try:
         result = json.loads(raw)
         content = result["choices"][0]["message"]["content"]
         return content.strip()
     except (KeyError, IndexError, TypeError, json.JSONDecodeError) as exc:
         raise AIServiceError("AI 返回数据解析失败，请检查服务商响应格式。") from exc
+
+
+@functools.lru_cache(maxsize=1)
+def _ssl_context() -> ssl.SSLContext:
+    # 解析 CA 证书包较慢，进程内只做一次。
+    return ssl.create_default_context(cafile=certifi.where())
+
+
+class ProviderClient:
+    """Thread-safe keep-alive connection pool for one provider endpoint.
+
+    Connections are checked out exclusively per request and returned once the
+    response has been fully read; at most ``pool_size`` idle connections are
+    kept. A request on a reused connection that the server already closed is
+    retried once on a fresh connection. ``apost`` does the same over asyncio
+    streams; those idle connections belong to the event loop that opened them.
+    """
+
+    def __init__(self, base_url: str, pool_size: int, timeout: float):
+        parts = urllib.parse.urlsplit(base_url)
+        self.secure = parts.scheme == "https"
+        self.host = parts.hostname or ""
+        self.port = parts.port or (443 if self.secure else 80)
+        self.netloc = parts.netloc
+        self.path = parts.path or "/"
+        if parts.query:
+            self.path = f"{self.path}?{parts.query}"
+        self.pool_size = pool_size
+        self.timeout = timeout
+        self._idle: list[http.client.HTTPConnection] = []
+        self._aidle: list[tuple[asyncio.AbstractEventLoop, asyncio.StreamReader, asyncio.StreamWriter]] = []
+        self._lock = threading.Lock()
+        self.requests = 0
+        self.reused = 0
+        self.connects = 0
+        self.connect_seconds = 0.0
+
+    def _connect(self) -> http.client.HTTPConnection:
+        if self.secure:
+            conn = http.client.HTTPSConnection(
+                self.host, self.port, timeout=self.timeout, context=_ssl_context()
+            )
+        else:
+            conn = http.client.HTTPConnection(self.host, self.port, timeout=self.timeout)
+        started = time.perf_counter()
+        conn.connect()
+        elapsed = time.perf_counter() - started
+        with self._lock:
+            self.connects += 1
+            self.connect_seconds += elapsed
+        return conn
+
+    def _acquire(self) -> tuple[http.client.HTTPConnection, bool]:
+        with self._lock:
+            if self._idle:
+                return self._idle.pop(), True
+        return self._connect(), False
+
+    def _release(self, conn: http.client.HTTPConnection, response) -> None:
+        if response.will_close or not response.isclosed():
+            conn.close()
+            return
+        with self._lock:
+            if len(self._idle) < self.pool_size:
+                self._idle.append(conn)
+                return
+        conn.close()
+
+    @contextmanager
+    def post(self, body: bytes, headers: dict):
+        """POST ``body`` and yield the ``HTTPResponse``; read it fully to recycle."""
+        for attempt in range(2):
+            conn, was_reused = self._acquire()
+            try:
+                conn.request("POST", self.path, body=body, headers=headers)
+                response = conn.getresponse()
+            except (http.client.RemoteDisconnected, ConnectionResetError, BrokenPipeError):
+                conn.close()
+                if was_reused and attempt == 0:
+                    continue
+                raise
+            except BaseException:
+                conn.close()
+                raise
+            break
+        with self._lock:
+            self.requests += 1
+            self.reused += int(was_reused)
+        completed = False
+        try:
+            yield response
+            completed = True
+        finally:
+            if completed:
+                self._release(conn, response)
+            else:
+                conn.close()
+
+    async def _aconnect(self) -> tuple[asyncio.StreamReader, asyncio.StreamWriter]:
+        started = time.perf_counter()
+        reader, writer = await asyncio.open_connection(
+            self.host,
+            self.port,
+            ssl=_ssl_context() if self.secure else None,
+            server_hostname=self.host if self.secure else None,
+        )
+        elapsed = time.perf_counter() - started
+        with self._lock:
+            self.connects += 1
+            self.connect_seconds += elapsed
+        return reader, writer
+
+    async def _aacquire(self) -> tuple[asyncio.StreamReader, asyncio.StreamWriter, bool]:
+        loop = asyncio.get_running_loop()
+        while True:
+            with self._lock:
+                index = next((i for i, entry in enumerate(self._aidle) if entry[0] is loop), None)
+                if index is None:
+                    break
+                _, reader, writer = self._aidle.pop(index)
+            if not writer.is_closing() and not reader.at_eof():
+                return reader, writer, True
+            writer.close()
+        reader, writer = await self._aconnect()
+        return reader, writer, False
+
+    def _arelease(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter) -> None:
+        if not writer.is_closing():
+            with self._lock:
+                if len(self._aidle) < self.pool_size:
+                    self._aidle.append((asyncio.get_running_loop(), reader, writer))
+                    return
+        writer.close()
+
+    async def _aexchange(self, request: bytes) -> "_AsyncResponse | None":
+        """Send ``request`` and read the status line and headers.
+
+        Returns ``None`` when a reused connection turns out to be closed by
+        the server, so the caller can retry on a fresh one.
+        """
+        reader, writer, was_reused = await self._aacquire()
+        try:
+            writer.write(request)
+            await writer.drain()
+            status_line = (await reader.readline()).decode("latin-1").strip()
+            if not status_line:
+                raise ConnectionResetError("connection closed before the response")
+            _, code, *reason = status_line.split(" ", 2)
+            headers = {}
+            while True:
+                line = (await reader.readline()).decode("latin-1").strip()
+                if not line:
+                    break
+                key, _, value = line.partition(":")
+                headers[key.strip().lower()] = value.strip()
+        except (ConnectionError, asyncio.IncompleteReadError):
+            writer.close()
+            if was_reused:
+                return None
+            raise
+        except BaseException:
+            writer.close()
+            raise
+        return _AsyncResponse(reader, writer, int(code), reason[0] if reason else "", headers, was_reused)
+
+    @asynccontextmanager
+    async def apost(self, body: bytes, headers: dict):
+        """Async ``post``: yield an ``_AsyncResponse``; read its body fully to recycle."""
+        head = [f"POST {self.path} HTTP/1.1", f"Host: {self.netloc}"]
+        head += [f"{key}: {value}" for key, value in headers.items()]
+        head += [f"Content-Length: {len(body)}", "", ""]
+        request = "\r\n".join(head).encode("latin-1") + body
+        # 每次返回 None 都丢弃了一条失效的空闲连接，最终会落到新建连接上。
+        while (response := await asyncio.wait_for(self._aexchange(request), self.timeout)) is None:
+            pass
+        with self._lock:
+            self.requests += 1
+            self.reused += int(response.reused)
+        try:
+            yield response
+        finally:
+            if response.complete and not response.will_close:
+                self._arelease(response.reader, response.writer)
+            else:
+                response.writer.close()
+
+    def close(self) -> None:
+        with self._lock:
+            idle, self._idle = self._idle, []
+            aidle, self._aidle = self._aidle, []
+        for conn in idle:
+            conn.close()
+        for _, _, writer in aidle:
+            try:
+                writer.close()
+            except RuntimeError:
+                # 所属事件循环已经关闭，连接随之释放。
+                pass
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {
+                "requests": self.requests,
+                "reused": self.reused,
+                "connects": self.connects,
+                "idle": len(self._idle) + len(self._aidle),
+                "reuse_ratio": self.reused / self.requests if self.requests else 0.0,
+                "avg_connect_ms": (
+                    self.connect_seconds * 1000 / self.connects if self.connects else 0.0
+                ),
+            }
+
+
+_clients: dict[str, ProviderClient] = {}
+_clients_lock = threading.Lock()
+
+
+def get_client(config: dict) -> ProviderClient:
+    key = config["base_url"]
+    with _clients_lock:
+        client = _clients.get(key)
+        if client is None:
+            client = ProviderClient(
+                config["base_url"],
+                pool_size=getattr(settings, "AI_POOL_SIZE", 4),
+                timeout=getattr(settings, "AI_TIMEOUT", 120),
+            )
+            _clients[key] = client
+        return client
+
+
+def pool_stats() -> dict[str, dict]:
+    """Connection-pool metrics keyed by endpoint URL."""
+    with _clients_lock:
+        clients = dict(_clients)
+    return {url: client.stats() for url, client in clients.items()}
+
+
+def close_clients() -> None:
+    with _clients_lock:
+        clients = list(_clients.values())
+        _clients.clear()
+    for client in clients:
+        client.close()
+
+
+def _unavailable(error: AIServiceError | None) -> AIServiceError:
+    # 所有地址都在熔断中时没有可返回的具体错误。
+    return error or AIServiceError("AI 服务暂时不可用，请稍后重试。", retryable=True)
+
+
+class CircuitBreaker:
+    """Per-endpoint breaker: closed → open after ``threshold`` consecutive
+    retryable failures → half-open after ``cooldown`` seconds, when a single
+    trial request decides whether it closes again. A trial that ends without
+    an answer (cancelled, client gone) hands its slot back with ``release()``.
+    """
+
+    CLOSED = "closed"
+    OPEN = "open"
+    HALF_OPEN = "half_open"
+
+    def __init__(self, threshold: int, cooldown: float):
+        self.threshold = threshold
+        self.cooldown = cooldown
+        self.failures = 0
+        self.opened_at: float | None = None
+        self._trial = False
+        self._lock = threading.Lock()
+
+    def _state(self) -> str:
+        if self.opened_at is None:
+            return self.CLOSED
+        if time.monotonic() - self.opened_at >= self.cooldown:
+            return self.HALF_OPEN
+        return self.OPEN
+
+    @property
+    def state(self) -> str:
+        with self._lock:
+            return self._state()
+
+    def allow(self) -> bool:
+        with self._lock:
+            state = self._state()
+            if state == self.CLOSED:
+                return True
+            if state == self.HALF_OPEN and not self._trial:
+                self._trial = True
+                return True
+            return False
+
+    def record_success(self) -> None:
+        with self._lock:
+            self.failures = 0
+            self.opened_at = None
+            self._trial = False
+
+    def record_failure(self) -> None:
+        with self._lock:
+            self.failures += 1
+            self._trial = False
+            if self.failures >= self.threshold:
+                self.opened_at = time.monotonic()
+
+    def release(self) -> None:
+        with self._lock:
+            self._trial = False
+
+
+class EndpointState:
+    """Breaker, recent latencies and counters for one endpoint URL."""
+
+    def __init__(self, config: dict):
+        self.breaker = CircuitBreaker(config["BREAKER_FAILURES"], config["BREAKER_COOLDOWN"])
+        self.latencies: deque[float] = deque(maxlen=config["LATENCY_WINDOW"])
+        self.requests = 0
+        self.errors = 0
+        self.hedges = 0
+        self._lock = threading.Lock()
+
+    def quantile(self, q: float) -> float | None:
+        with self._lock:
+            samples = sorted(self.latencies)
+        if not samples:
+            return None
+        return samples[min(len(samples) - 1, math.ceil(q * len(samples)) - 1)]
+
+    def record(self, seconds: float | None, error: AIServiceError | None = None) -> None:
+        with self._lock:
+            self.requests += 1
+            if error is not None:
+                self.errors += 1
+            elif seconds is not None:
+                self.latencies.append(seconds)
+        if error is None or not error.retryable:
+            # 401、400 之类是请求本身的问题，说明地址本身能应答，按成功处理。
+            self.breaker.record_success()
+        else:
+            self.breaker.record_failure()
+
+    def record_hedge(self) -> None:
+        with self._lock:
+            self.hedges += 1
+
+    def stats(self) -> dict:
+        p95 = self.quantile(0.95)
+        with self._lock:
+            return {
+                "state": self.breaker.state,
+                "consecutive_failures": self.breaker.failures,
+                "requests": self.requests,
+                "errors": self.errors,
+                "hedges": self.hedges,
+                "samples": len(self.latencies),
+                "p95_ms": p95 * 1000 if p95 is not None else None,
+            }
+
+
+class ProviderRouter:
+    """Retries, failover, circuit breaking and optional hedging across endpoints.
+
+    Attempt ``n`` starts at endpoint ``n % len(endpoints)`` and skips any whose
+    breaker is open, so the first retry goes to the first fallback. Retries
+    wait a full-jitter exponential backoff. Only ``retryable`` errors are
+    retried.
+    """
+
+    def __init__(self, config: dict):
+        self.config = config
+        self._states: dict[str, EndpointState] = {}
+        self._lock = threading.Lock()
+        self._pool: futures.ThreadPoolExecutor | None = None
+
+    def state(self, endpoint: dict) -> EndpointState:
+        key = endpoint["base_url"]
+        with self._lock:
+            state = self._states.get(key)
+            if state is None:
+                state = self._states[key] = EndpointState(self.config)
+            return state
+
+    def backoff(self, attempt: int) -> float:
+        ceiling = min(self.config["BACKOFF_MAX"], self.config["BACKOFF_BASE"] * 2 ** (attempt - 1))
+        return random.uniform(0, ceiling)
+
+    def pick(self, endpoints: list[dict], start: int) -> dict | None:
+        for offset in range(len(endpoints)):
+            endpoint = endpoints[(start + offset) % len(endpoints)]
+            if self.state(endpoint).breaker.allow():
+                return endpoint
+        return None
+
+    def hedge_delay(self, endpoint: dict) -> float | None:
+        config = self.config
+        if not config["HEDGE"]:
+            return None
+        state = self.state(endpoint)
+        if len(state.latencies) < config["HEDGE_MIN_SAMPLES"]:
+            return None
+        return max(config["HEDGE_MIN_DELAY"], state.quantile(config["HEDGE_QUANTILE"]))
+
+    def attempts(self, endpoints: list[dict]) -> Iterator[tuple[int, dict]]:
+        """Yield ``(attempt, endpoint)``, sleeping between attempts; stops when all breakers are open."""
+        for attempt in range(self.config["RETRIES"] + 1):
+            if attempt:
+                time.sleep(self.backoff(attempt))
+            endpoint = self.pick(endpoints, attempt)
+            if endpoint is None:
+                return
+            yield attempt, endpoint
+
+    def _timed(self, endpoint: dict, send: Callable[[dict], str]) -> str:
+        state = self.state(endpoint)
+        started = time.perf_counter()
+        try:
+            result = send(endpoint)
+        except AIServiceError as exc:
+            state.record(None, exc)
+            raise
+        except BaseException:
+            state.breaker.release()
+            raise
+        state.record(time.perf_counter() - started)
+        return result
+
+    def _executor(self) -> futures.ThreadPoolExecutor:
+        with self._lock:
+            if self._pool is None:
+                self._pool = futures.ThreadPoolExecutor(
+                    self.config["HEDGE_WORKERS"], thread_name_prefix="ai-hedge"
+                )
+            return self._pool
+
+    def _hedged(self, endpoints: list[dict], attempt: int, endpoint: dict, send) -> str:
+        delay = self.hedge_delay(endpoint)
+        if delay is None:
+            return self._timed(endpoint, send)
+        pool = self._executor()
+        first = pool.submit(self._timed, endpoint, send)
+        try:
+            return first.result(timeout=delay)
+        except futures.TimeoutError:
+            pass
+        backup = self.pick(endpoints, attempt + 1) or endpoint
+        self.state(endpoint).record_hedge()
+        pending = {first, pool.submit(self._timed, backup, send)}
+        error = None
+        while pending:
+            done, pending = futures.wait(pending, return_when=futures.FIRST_COMPLETED)
+            for future in done:
+                try:
+                    # 较慢的一份请求在线程里自然结束，结果丢弃。
+                    return future.result()
+                except AIServiceError as exc:
+                    error = exc
+        raise error
+
+    def call(self, endpoints: list[dict], send: Callable[[dict], str]) -> str:
+        error = None
+        for attempt, endpoint in self.attempts(endpoints):
+            try:
+                return self._hedged(endpoints, attempt, endpoint, send)
+            except AIServiceError as exc:
+                error = exc
+                if not exc.retryable:
+                    raise
+        raise _unavailable(error)
+
+    async def _atimed(self, endpoint: dict, send: Callable[[dict], Awaitable[str]]) -> str:
+        state = self.state(endpoint)
+        started = time.perf_counter()
+        try:
+            result = await send(endpoint)
+        except AIServiceError as exc:
+            state.record(None, exc)
+            raise
+        except BaseException:
+            # 对冲中落败被取消的一方没有结论，只交还半开状态的试探名额。
+            state.breaker.release()
+            raise
+        state.record(time.perf_counter() - started)
+        return result
+
+    async def _ahedged(self, endpoints: list[dict], attempt: int, endpoint: dict, send) -> str:
+        delay = self.hedge_delay(endpoint)
+        if delay is None:
+            return await self._atimed(endpoint, send)
+        first = asyncio.ensure_future(self._atimed(endpoint, send))
+        done, _ = await asyncio.wait({first}, timeout=delay)
+        if done:
+            return first.result()
+        backup = self.pick(endpoints, attempt + 1) or endpoint
+        self.state(endpoint).record_hedge()
+        pending = {first, asyncio.ensure_future(self._atimed(backup, send))}
+        error = None
+        try:
+            while pending:
+                done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+                for task in done:
+                    try:
+                        return task.result()
+                    except AIServiceError as exc:
+                        error = exc
+            raise error
+        finally:
+            for task in pending:
+                task.cancel()
+
+    async def acall(self, endpoints: list[dict], send: Callable[[dict], Awaitable[str]]) -> str:
+        error = None
+        for attempt in range(self.config["RETRIES"] + 1):
+            if attempt:
+                await asyncio.sleep(self.backoff(attempt))
+            endpoint = self.pick(endpoints, attempt)
+            if endpoint is None:
+                break
+            try:
+                return await self._ahedged(endpoints, attempt, endpoint, send)
+            except AIServiceError as exc:
+                error = exc
+                if not exc.retryable:
+                    raise
+        raise _unavailable(error)
+
+    def close(self) -> None:
+        with self._lock:
+            pool, self._pool = self._pool, None
+        if pool is not None:
+            pool.shutdown(wait=False)
+
+    def stats(self) -> dict[str, dict]:
+        with self._lock:
+            states = dict(self._states)
+        return {url: state.stats() for url, state in states.items()}
+
+
+_router: ProviderRouter | None = None
+_router_lock = threading.Lock()
+
+
+def get_router() -> ProviderRouter:
+    global _router
+    with _router_lock:
+        if _router is None:
+            _router = ProviderRouter(settings.AI_ROUTER)
+        return _router
+
+
+def reset_router() -> None:
+    global _router
+    with _router_lock:
+        router, _router = _router, None
+    if router is not None:
+        router.close()
+
+
+def router_stats() -> dict[str, dict]:
+    """Breaker state, latency and hedge counters keyed by endpoint URL."""
+    return get_router().stats()
+
+
+def _post(endpoint: dict, body: bytes) -> str:
+    try:
+        with get_client(endpoint).post(body, _headers(endpoint)) as response:
+            raw = response.read()
+            status, reason = response.status, response.reason
+    except Exception as exc:
+        raise _transport_error(exc) from exc
+    if status >= 400:
+        raise _http_error(status, reason, raw)
+    return _parse_completion(raw.decode("utf-8"))
+
+
+def call_ai(
+    provider: str,
+    messages: list,
+    model_override: str | None = None,
+    max_tokens: int | None = None,
+) -> str:
+    config = _get_provider(provider)
+
+    def send(endpoint: dict) -> str:
+        return _post(endpoint, _build_body(endpoint, messages, model_override, max_tokens))
+
+    return get_router().call(config["endpoints"], send)
+
+
+def parse_stream_line(line: str) -> str | None:
+    """Return the content delta carried by one SSE line of a streamed completion.
+
+    Returns ``None`` once the ``[DONE]`` sentinel is reached and ``""`` for
+    lines without content (keep-alives, role headers, reasoning tokens).
+    """
+    line = line.strip()
+    if not line.startswith("data:"):
+        return ""
+    data = line[len("data:") :].strip()
+    if data == "[DONE]":
+        return None
+    try:
+        chunk = json.loads(data)
+        delta = chunk["choices"][0].get("delta") or {}
+    except (KeyError, IndexError, TypeError, AttributeError, json.JSONDecodeError) as exc:
+        raise AIServiceError("AI 返回数据解析失败，请检查服务商响应格式。") from exc
+    return delta.get("content") or ""
+
+
+def _stream(endpoint: dict, body: bytes) -> Iterator[str]:
+    try:
+        with get_client(endpoint).post(body, _headers(endpoint)) as response:
+            if response.status >= 400:
+                raise _http_error(response.status, response.reason, response.read())
+            while True:
+                raw_line = response.readline()
+                if not raw_line:
+                    break
+                delta = parse_stream_line(raw_line.decode("utf-8", errors="ignore"))
+                if delta is None:
+                    # 读完剩余的结束标记，连接才能放回连接池复用。
+                    response.read()
+                    break
+                if delta:
+                    yield delta
+    except Exception as exc:
+        raise _transport_error(exc) from exc
+
+
+def stream_ai(
+    provider: str,
+    messages: list,
+    model_override: str | None = None,
+    max_tokens: int | None = None,
+) -> Iterator[str]:
+    """Yield reply text pieces as the provider streams them (``stream: true``).
+
+    Failover only happens before the first piece arrives: once text has been
+    shown to the user, an error is raised instead of restarting elsewhere.
+    Streams are never hedged.
+    """
+    config = _get_provider(provider)
+    router = get_router()
+    error = None
+    for _, endpoint in router.attempts(config["endpoints"]):
+        state = router.state(endpoint)
+        body = _build_body(endpoint, messages, model_override, max_tokens, stream=True)
+        started = time.perf_counter()
+        first = True
+        try:
+            with closing(_stream(endpoint, body)) as pieces:
+                for delta in pieces:
+                    if first:
+                        # 流式请求以首段到达时间作为延迟样本。
+                        state.record(time.perf_counter() - started)
+                        first = False
+                    yield delta
+        except AIServiceError as exc:
+            if not first:
+                if exc.retryable:
+                    state.breaker.record_failure()
+                raise
+            state.record(None, exc)
+            error = exc
+            if not exc.retryable:
+                raise
+            continue
+        except BaseException:
+            # 客户端断开（GeneratorExit / CancelledError）时没有结论，只交还试探名额。
+            state.breaker.release()
+            raise
+        if first:
+            state.record(time.perf_counter() - started)
+        return
+    raise _unavailable(error)
+
+
+class _AsyncResponse:
+    """Status line, headers and body reader of one response on a pooled asyncio connection."""
+
+    def __init__(
+        self,
+        reader: asyncio.StreamReader,
+        writer: asyncio.StreamWriter,
+        status: int,
+        reason: str,
+        headers: dict,
+        reused: bool,
+    ):
+        self.reader = reader
+        self.writer = writer
+        self.status = status
+        self.reason = reason
+        self.headers = headers
+        self.reused = reused
+        # 正文按长度或分块读到结尾后为 True，连接才能放回连接池。
+        self.complete = False
+
+    @property
+    def chunked(self) -> bool:
+        return self.headers.get("transfer-encoding", "").lower() == "chunked"
+
+    @property
+    def will_close(self) -> bool:
+        framed = self.chunked or "content-length" in self.headers
+        return not framed or self.headers.get("connection", "").lower() == "close"
+
+
+async def _body_chunks(response: _AsyncResponse, timeout: float) -> AsyncIterator[bytes]:
+    """Yield the body as it arrives, framed by chunked encoding or Content-Length.
+
+    Each read waits at most ``timeout`` seconds.
+    """
+    reader = response.reader
+    if response.chunked:
+        while True:
+            size_line = await asyncio.wait_for(reader.readline(), timeout)
+            size = int(size_line.split(b";", 1)[0].strip() or b"0", 16)
+            if size == 0:
+                # 跳过可能存在的 trailer，直到空行。
+                while (await asyncio.wait_for(reader.readline(), timeout)).strip():
+                    pass
+                break
+            yield await asyncio.wait_for(reader.readexactly(size), timeout)
+            await asyncio.wait_for(reader.readexactly(2), timeout)
+    elif "content-length" in response.headers:
+        remaining = int(response.headers["content-length"])
+        while remaining:
+            data = await asyncio.wait_for(reader.read(min(remaining, 65536)), timeout)
+            if not data:
+                raise asyncio.IncompleteReadError(b"", remaining)
+            remaining -= len(data)
+            yield data
+    else:
+        # 没有长度信息，正文读到服务端关闭连接为止。
+        while data := await asyncio.wait_for(reader.read(65536), timeout):
+            yield data
+    response.complete = True
+
+
+async def _read_body(response: _AsyncResponse, timeout: float) -> bytes:
+    return b"".join([data async for data in _body_chunks(response, timeout)])
+
+
+async def _read_lines(response: _AsyncResponse, timeout: float) -> AsyncIterator[bytes]:
+    """Yield body lines as they arrive."""
+    buffer = b""
+    async with aclosing(_body_chunks(response, timeout)) as chunks:
+        async for data in chunks:
+            buffer += data
+            *lines, buffer = buffer.split(b"\n")
+            for line in lines:
+                yield line + b"\n"
+    if buffer:
+        yield buffer
+
+
+async def _apost(endpoint: dict, body: bytes) -> tuple[int, str, bytes]:
+    """POST ``body`` over a pooled asyncio connection and return (status, reason, body)."""
+    timeout = getattr(settings, "AI_TIMEOUT", 120)
+    async with get_client(endpoint).apost(body, _headers(endpoint)) as response:
+        return response.status, response.reason, await _read_body(response, timeout)
+
+
+async def _astream(endpoint: dict, body: bytes) -> AsyncIterator[str]:
+    timeout = getattr(settings, "AI_TIMEOUT", 120)
+    try:
+        async with get_client(endpoint).apost(body, _headers(endpoint)) as response:
+            if response.status >= 400:
+                raise _http_error(response.status, response.reason, await _read_body(response, timeout))
+            finished = False
+            async with aclosing(_read_lines(response, timeout)) as lines:
+                async for raw_line in lines:
+                    if finished:
+                        # 读完剩余的结束标记，连接才能放回连接池复用。
+                        continue
+                    delta = parse_stream_line(raw_line.decode("utf-8", errors="ignore"))
+                    if delta is None:
+                        finished = True
+                    elif delta:
+                        yield delta
+    except asyncio.IncompleteReadError as exc:
+        raise _connection_error(exc, timed_out=False) from exc
+    except Exception as exc:
+        raise _transport_error(exc) from exc
+
+
+async def _apost_completion(endpoint: dict, body: bytes) -> str:
+    timeout = getattr(settings, "AI_TIMEOUT", 120)
+    try:
+        status, reason, raw = await asyncio.wait_for(_apost(endpoint, body), timeout)
+    except asyncio.TimeoutError as exc:
+        raise _connection_error(exc, timed_out=True) from exc
+    except (OSError, ssl.SSLError, asyncio.IncompleteReadError) as exc:
+        raise _connection_error(exc, timed_out=False) from exc
+    except Exception as exc:
+        raise AIServiceError("AI 请求出现异常，请稍后重试。") from exc
+    if status >= 400:
+        raise _http_error(status, reason, raw)
+    return _parse_completion(raw.decode("utf-8"))
+
+
+async def acall_ai(
+    provider: str,
+    messages: list,
+    model_override: str | None = None,
+    max_tokens: int | None = None,
+) -> str:
+    """Async counterpart of ``call_ai`` that never blocks the event loop."""
+    config = _get_provider(provider)
+
+    async def send(endpoint: dict) -> str:
+        body = _build_body(endpoint, messages, model_override, max_tokens)
+        return await _apost_completion(endpoint, body)
+
+    return await get_router().acall(config["endpoints"], send)
+
+
+async def astream_ai(
+    provider: str,
+    messages: list,
+    model_override: str | None = None,
+    max_tokens: int | None = None,
+) -> AsyncIterator[str]:
+    """Async counterpart of ``stream_ai``: pieces are relayed as they arrive
+    without holding a worker thread, with the same failover rules.
+    """
+    config = _get_provider(provider)
+    router = get_router()
+    error = None
+    for attempt in range(router.config["RETRIES"] + 1):
+        if attempt:
+            await asyncio.sleep(router.backoff(attempt))
+        endpoint = router.pick(config["endpoints"], attempt)
+        if endpoint is None:
+            break
+        state = router.state(endpoint)
+        body = _build_body(endpoint, messages, model_override, max_tokens, stream=True)
+        started = time.perf_counter()
+        first = True
+        try:
+            async with aclosing(_astream(endpoint, body)) as pieces:
+                async for delta in pieces:
+                    if first:
+                        state.record(time.perf_counter() - started)
+                        first = False
+                    yield delta
+        except AIServiceError as exc:
+            if not first:
+                if exc.retryable:
+                    state.breaker.record_failure()
+                raise
+            state.record(None, exc)
+            error = exc
+            if not exc.retryable:
+                raise
+            continue
+        except BaseException:
+            # 客户端断开（GeneratorExit / CancelledError）时没有结论，只交还试探名额。
+            state.breaker.release()
+            raise
+        if first:
+            state.record(time.perf_counter() - started)
+        return
+    raise _unavailable(error)
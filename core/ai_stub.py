@@ -0,0 +1,176 @@
+"""Local OpenAI-compatible chat-completions server for tests and load runs.
+
+``StubAIServer`` answers ``POST`` requests on any path with a fixed reply,
+streamed or not. Its latency, streaming rate and failures can be configured,
+so tests and load runs can exercise timeouts, retries, failover and hedging
+without network access::
+
+    with StubAIServer(reply="你好", delay=lognormal_delay(0.8, 0.5)) as stub:
+        providers = {"stub": {"base_url": stub.url, "api_key_env": "STUB_AI_KEY", "model": "m"}}
+
+``manage.py run_ai_stub`` serves one in the foreground for manual testing.
+"""
+from __future__ import annotations
+
+import json
+import math
+import random
+import sys
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Callable
+
+# 负载测试用的典型回复长度（约 80 字）。
+SAMPLE_REPLY = (
+    "听起来您最近睡得不太好，这在上了年纪以后很常见。可以试着固定起床时间，"
+    "白天多晒太阳、适当活动，睡前少喝茶和咖啡。如果持续两周以上，建议和医生聊一聊。"
+)
+
+
+class _Handler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+    server: "_Server"
+
+    def log_message(self, *args):
+        pass
+
+    def do_POST(self):
+        stub = self.server.stub
+        payload = json.loads(self.rfile.read(int(self.headers.get("Content-Length", 0))) or b"{}")
+        index, failing = stub._next_request()
+        delay = stub.delay(index) if callable(stub.delay) else stub.delay
+        if delay:
+            time.sleep(delay)
+        if failing:
+            if stub.fail_status is None:
+                # 模拟连接被重置：不返回任何响应直接断开。
+                self.close_connection = True
+                self.connection.close()
+                return
+            self._send(stub.fail_status, json.dumps({"error": {"message": "stub failure"}}))
+            return
+        reply = stub.reply(payload) if callable(stub.reply) else stub.reply
+        if payload.get("stream"):
+            size = stub.chunk_chars
+            pieces = [reply[i : i + size] for i in range(0, len(reply), size)]
+            events = [{"choices": [{"delta": {"content": piece}}]} for piece in pieces]
+            lines = [f"data: {json.dumps(event, ensure_ascii=False)}\n\n" for event in events]
+            interval = size / stub.chars_per_second if stub.chars_per_second else 0.0
+            self._send(200, lines + ["data: [DONE]\n\n"], "text/event-stream", interval)
+            return
+        self._send(200, json.dumps({"choices": [{"message": {"content": reply}}]}, ensure_ascii=False))
+
+    def _send(
+        self,
+        status: int,
+        body: str | list[str],
+        content_type: str = "application/json",
+        interval: float = 0.0,
+    ):
+        parts = [part.encode("utf-8") for part in ([body] if isinstance(body, str) else body)]
+        self.send_response(status)
+        self.send_header("Content-Type", content_type)
+        self.send_header("Content-Length", str(sum(len(part) for part in parts)))
+        self.end_headers()
+        for index, part in enumerate(parts):
+            if index and interval:
+                time.sleep(interval)
+            self.wfile.write(part)
+
+
+class _Server(ThreadingHTTPServer):
+    daemon_threads = True
+    stub: "StubAIServer"
+
+    def handle_error(self, request, client_address):
+        # 被对冲取消或超时放弃的请求，客户端会先断开，忽略写回时的断连错误。
+        if not isinstance(sys.exc_info()[1], ConnectionError):
+            super().handle_error(request, client_address)
+
+
+def lognormal_delay(median: float, sigma: float = 0.5, seed: int | None = None) -> Callable[[int], float]:
+    """Delay function with a long right tail, like real model latency.
+
+    ``median`` is in seconds; with ``sigma=0.5`` p95 is about 2.3 × median.
+    """
+    rng = random.Random(seed)
+    lock = threading.Lock()
+
+    def delay(index: int) -> float:
+        with lock:
+            return median * math.exp(rng.gauss(0.0, sigma))
+
+    return delay
+
+
+class StubAIServer:
+    """Background HTTP server; ``delay`` and ``reply`` may be callables.
+
+    ``delay(index)`` receives the zero-based request number and
+    ``reply(payload)`` the decoded request body. The first ``fail_times``
+    requests, and after them a random ``error_rate`` share, fail with
+    ``fail_status``, or with a dropped connection when it is ``None``.
+    Streamed replies are sent ``chunk_chars`` characters per event, paced at
+    ``chars_per_second`` when it is set.
+    """
+
+    def __init__(
+        self,
+        reply: str | Callable[[dict], str] = "你好",
+        delay: float | Callable[[int], float] = 0.0,
+        fail_times: int = 0,
+        fail_status: int | None = 503,
+        error_rate: float = 0.0,
+        chunk_chars: int = 2,
+        chars_per_second: float | None = None,
+        seed: int | None = None,
+        host: str = "127.0.0.1",
+        port: int = 0,
+    ):
+        self.reply = reply
+        self.delay = delay
+        self.fail_times = fail_times
+        self.fail_status = fail_status
+        self.error_rate = error_rate
+        self.chunk_chars = chunk_chars
+        self.chars_per_second = chars_per_second
+        self.requests = 0
+        self.failures = 0
+        self._random = random.Random(seed)
+        self._lock = threading.Lock()
+        self._server = _Server((host, port), _Handler)
+        self._server.stub = self
+        self._thread: threading.Thread | None = None
+
+    @property
+    def url(self) -> str:
+        host, port = self._server.server_address[:2]
+        return f"http://{host}:{port}/v1/chat/completions"
+
+    def _next_request(self) -> tuple[int, bool]:
+        with self._lock:
+            index = self.requests
+            self.requests += 1
+            failing = index < self.fail_times or (
+                self.error_rate > 0 and self._random.random() < self.error_rate
+            )
+            self.failures += int(failing)
+            return index, failing
+
+    def start(self) -> "StubAIServer":
+        self._thread = threading.Thread(
+            target=self._server.serve_forever, kwargs={"poll_interval": 0.05}, daemon=True
+        )
+        self._thread.start()
+        return self
+
+    def stop(self) -> None:
+        self._server.shutdown()
+        self._server.server_close()
+
+    def __enter__(self) -> "StubAIServer":
+        return self.start()
+
+    def __exit__(self, *exc_info) -> None:
+        self.stop()
@@ -0,0 +1,43 @@
+from datetime import timedelta
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from django.utils import timezone
+
+from core.services.chat_archive import archive_chat_logs
+
+
+class Command(BaseCommand):
+    help = "Move old AI chat logs into compressed archive segments."
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--days",
+            type=int,
+            default=None,
+            help="Archive logs older than this many days (default from settings).",
+        )
+        parser.add_argument("--dir", help="Archive directory (default from settings).")
+        parser.add_argument("--block-rows", type=int, default=None)
+        parser.add_argument(
+            "--keep", action="store_true", help="Write the segment but keep rows in the database."
+        )
+
+    def handle(self, *args, **options):
+        days = options["days"]
+        if days is None:
+            days = settings.CHATLOG_ARCHIVE.get("DAYS", 90)
+        before = timezone.now() - timedelta(days=days)
+        path, archived = archive_chat_logs(
+            before,
+            directory=options["dir"],
+            block_rows=options["block_rows"],
+            delete=not options["keep"],
+        )
+        if path is None:
+            self.stdout.write("No chat logs to archive.")
+            return
+        size = path.stat().st_size
+        self.stdout.write(
+            self.style.SUCCESS(f"Archived {archived} chat logs to {path} ({size} bytes).")
+        )
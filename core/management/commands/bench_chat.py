@@ -0,0 +1,190 @@
+import asyncio
+import logging
+import os
+import random
+import statistics
+import time
+from collections import Counter
+
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.core.management.base import BaseCommand
+from django.test import AsyncClient, override_settings
+from django.urls import reverse
+from django.utils import timezone
+
+from core.ai import router_stats
+from core.ai_stub import SAMPLE_REPLY, StubAIServer, lognormal_delay
+from core.models import ChatConversation, ChatLog
+from core.services.chat_log_writer import get_chat_log_writer
+from core.services.rate_limit import get_rate_limiter
+from core.services.reply_cache import get_reply_cache
+
+QUESTIONS = [
+    "最近晚上总是睡不好，半夜醒了就睡不着，怎么办？",
+    "孩子们工作忙很少回家，我该怎么调节心情？",
+    "老伴走了以后总觉得家里空荡荡的。",
+    "膝盖疼不想出门，一个人在家很闷。",
+    "记性越来越差，会不会是老年痴呆？",
+    "退休以后不知道每天该做些什么。",
+    "和儿媳妇有点矛盾，心里不痛快。",
+    "吃了降压药以后总觉得没精神。",
+]
+FOLLOW_UPS = ["能再具体一点吗？", "那我先试试看。", "要是还不行呢？", "谢谢，我记下了。"]
+RISKY = ["活着没什么意思，不想活了", "攒了好多安眠药", "真想一了百了"]
+BENCH_KEY_ENV = "BENCH_AI_KEY"
+LAG_TICK = 0.01
+
+
+def _rounded(stats: dict) -> dict:
+    return {key: round(value, 1) if isinstance(value, float) else value for key, value in stats.items()}
+
+
+def _percentile(values, q):
+    values = sorted(values)
+    return values[min(len(values) - 1, int(len(values) * q))] if values else 0.0
+
+
+class Command(BaseCommand):
+    help = "Load-test api_chat in-process against a local AI stub and report latency and contention."
+
+    def add_arguments(self, parser):
+        parser.add_argument("--sessions", type=int, default=50, help="Simulated users, one conversation each.")
+        parser.add_argument("--concurrency", type=int, default=10, help="Sessions running at once.")
+        parser.add_argument("--turns", type=int, default=4)
+        parser.add_argument("--think-ms", type=float, default=500, help="Max random pause between turns.")
+        parser.add_argument("--median-ms", type=float, default=800, help="Stub median latency.")
+        parser.add_argument("--sigma", type=float, default=0.5, help="Stub log-normal latency spread.")
+        parser.add_argument("--error-rate", type=float, default=0.0, help="Share of stub requests that fail.")
+        parser.add_argument("--risk-ratio", type=float, default=0.05, help="Share of risky messages.")
+        parser.add_argument("--no-rate-limit", action="store_true")
+        parser.add_argument("--keep", action="store_true", help="Keep the bench users and their chat logs.")
+        parser.add_argument("--seed", type=int, default=7)
+
+    def handle(self, *args, **options):
+        stub = StubAIServer(
+            reply=SAMPLE_REPLY,
+            delay=lognormal_delay(options["median_ms"] / 1000, options["sigma"], options["seed"]),
+            error_rate=options["error_rate"],
+            seed=options["seed"],
+        )
+        overrides = {
+            "AI_PROVIDERS": {"deepseek": {"base_url": stub.url, "api_key_env": BENCH_KEY_ENV, "model": "bench"}},
+            "ALLOWED_HOSTS": [*settings.ALLOWED_HOSTS, "testserver"],
+            # 压测用户的风险对话不应进入真实咨询队列。
+            "RISK_ESCALATION": {**settings.RISK_ESCALATION, "ENABLED": False},
+        }
+        if options["no_rate_limit"]:
+            overrides["AI_RATE_LIMIT"] = {**settings.AI_RATE_LIMIT, "ENABLED": False}
+        os.environ.setdefault(BENCH_KEY_ENV, "bench")
+
+        run_id = int(time.time())
+        User = get_user_model()
+        users = [User.objects.create_user(f"bench-{run_id}-{index}") for index in range(options["sessions"])]
+        # 429 和 AI 错误是压测的预期结果，不逐条打印警告。
+        request_logger = logging.getLogger("django.request")
+        level = request_logger.level
+        request_logger.setLevel(logging.ERROR)
+        try:
+            with stub, override_settings(**overrides):
+                report = asyncio.run(self._run(users, options))
+                writer = get_chat_log_writer()
+                if writer is not None:
+                    writer.flush()
+                # 标记为已处理，--keep 保留的记录也不会被补偿扫描转成工单。
+                ChatLog.objects.filter(user__in=users, risk_flag=True, escalated_at__isnull=True).update(
+                    escalated_at=timezone.now()
+                )
+                report["chat_logs"] = ChatLog.objects.filter(user__in=users).count()
+                report["stub"] = (stub.requests, stub.failures)
+                report["router"] = router_stats()
+                self._report(report, options)
+        finally:
+            request_logger.setLevel(level)
+            if not options["keep"]:
+                ChatConversation.objects.filter(user__in=users).delete()
+                ChatLog.objects.filter(user__in=users).delete()
+                User.objects.filter(pk__in=[user.pk for user in users]).delete()
+
+    async def _run(self, users, options) -> dict:
+        rng = random.Random(options["seed"])
+        gate = asyncio.Semaphore(options["concurrency"])
+        results: list[tuple[int, float, bool]] = []
+        lags: list[float] = []
+        load = {"in_flight": 0, "peak": 0}
+        done = asyncio.Event()
+
+        async def watch_loop():
+            # 事件循环延迟：同步调用或 CPU 占满时，定时器会明显迟到。
+            while not done.is_set():
+                started = time.perf_counter()
+                await asyncio.sleep(LAG_TICK)
+                lags.append(time.perf_counter() - started - LAG_TICK)
+
+        async def session(user, seed):
+            session_rng = random.Random(seed)
+            async with gate:
+                client = AsyncClient()
+                await client.aforce_login(user)
+                for turn in range(options["turns"]):
+                    if turn and options["think_ms"]:
+                        await asyncio.sleep(session_rng.uniform(0, options["think_ms"]) / 1000)
+                    if session_rng.random() < options["risk_ratio"]:
+                        message = session_rng.choice(RISKY)
+                    else:
+                        message = session_rng.choice(FOLLOW_UPS if turn else QUESTIONS)
+                    load["in_flight"] += 1
+                    load["peak"] = max(load["peak"], load["in_flight"])
+                    started = time.perf_counter()
+                    response = await client.post(
+                        reverse("api_chat"),
+                        {"provider": "deepseek", "message": message, "new_conversation": turn == 0},
+                        content_type="application/json",
+                    )
+                    elapsed = time.perf_counter() - started
+                    load["in_flight"] -= 1
+                    results.append((response.status_code, elapsed, bool(response.json().get("risk"))))
+
+        watcher = asyncio.ensure_future(watch_loop())
+        started = time.perf_counter()
+        await asyncio.gather(*(session(user, rng.random()) for user in users))
+        wall = time.perf_counter() - started
+        done.set()
+        await watcher
+        return {"results": results, "wall": wall, "lags": lags, "peak": load["peak"]}
+
+    def _report(self, report, options):
+        results, wall = report["results"], report["wall"]
+        statuses = Counter(status for status, _, _ in results)
+        answered = [elapsed for status, elapsed, risk in results if status == 200 and not risk]
+        out = self.stdout.write
+
+        out(
+            f"requests: n={len(results)} wall={wall:.2f} s throughput={len(results) / wall:.1f} req/s "
+            f"statuses={dict(sorted(statuses.items()))} risk={sum(risk for _, _, risk in results)}"
+        )
+        if answered:
+            out(
+                f"latency (AI replies): n={len(answered)} mean={statistics.mean(answered) * 1000:.0f} ms "
+                f"p50={_percentile(answered, 0.5) * 1000:.0f} ms p95={_percentile(answered, 0.95) * 1000:.0f} ms "
+                f"p99={_percentile(answered, 0.99) * 1000:.0f} ms max={max(answered) * 1000:.0f} ms"
+            )
+        lags = report["lags"]
+        out(
+            f"saturation: peak_in_flight={report['peak']}/{options['concurrency']} "
+            f"loop_lag_p99={_percentile(lags, 0.99) * 1000:.1f} ms "
+            f"loop_lag_max={max(lags, default=0) * 1000:.1f} ms"
+        )
+        limiter = get_rate_limiter()
+        if limiter is not None:
+            out(f"rate_limit: {_rounded(limiter.stats())}")
+        writer = get_chat_log_writer()
+        writer_stats = _rounded(writer.stats()) if writer is not None else "disabled"
+        out(f"chat_log: rows={report['chat_logs']} writer={writer_stats}")
+        cache = get_reply_cache()
+        if cache is not None:
+            out(f"reply_cache: {_rounded(cache.stats())}")
+        requests, failures = report["stub"]
+        out(f"upstream: stub_requests={requests} injected_failures={failures}")
+        for url, stats in report["router"].items():
+            out(f"  {url}: {_rounded(stats)}")
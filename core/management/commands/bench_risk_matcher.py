@@ -0,0 +1,47 @@
+import random
+import time
+
+from django.core.management.base import BaseCommand
+
+from core.services.risk_matcher import KeywordMatcher
+
+CJK_START = 0x4E00
+CJK_SIZE = 0x9FFF - 0x4E00
+
+
+class Command(BaseCommand):
+    help = "Benchmark the risk keyword automaton against a naive per-keyword scan."
+
+    def add_arguments(self, parser):
+        parser.add_argument("--keywords", default="10,1000,5000", help="Comma separated keyword counts.")
+        parser.add_argument("--lengths", default="200,2000,20000", help="Comma separated text lengths.")
+        parser.add_argument("--repeat", type=int, default=5)
+        parser.add_argument("--seed", type=int, default=7)
+
+    def handle(self, *args, **options):
+        rng = random.Random(options["seed"])
+        keyword_counts = [int(value) for value in options["keywords"].split(",")]
+        lengths = [int(value) for value in options["lengths"].split(",")]
+        repeat = options["repeat"]
+
+        def random_text(size):
+            return "".join(chr(CJK_START + rng.randrange(CJK_SIZE)) for _ in range(size))
+
+        texts = {length: random_text(length) for length in lengths}
+        self.stdout.write(f"{'keywords':>9} {'chars':>7} {'automaton ms':>13} {'ns/char':>8} {'naive ms':>10}")
+        for count in keyword_counts:
+            keywords = {random_text(rng.randint(2, 6)): "bench" for _ in range(count)}
+            matcher = KeywordMatcher(keywords)
+            for length, text in texts.items():
+                started = time.perf_counter()
+                for _ in range(repeat):
+                    matcher.search(text)
+                automaton = (time.perf_counter() - started) / repeat
+                started = time.perf_counter()
+                for _ in range(repeat):
+                    any(keyword in text for keyword in keywords)
+                naive = (time.perf_counter() - started) / repeat
+                self.stdout.write(
+                    f"{count:>9} {length:>7} {automaton * 1000:>13.3f} "
+                    f"{automaton * 1e9 / length:>8.1f} {naive * 1000:>10.3f}"
+                )
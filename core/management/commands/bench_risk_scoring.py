@@ -0,0 +1,75 @@
+import random
+import statistics
+import time
+
+from django.core.cache import cache
+from django.core.management.base import BaseCommand
+
+from core.services.risk_scoring import assess_conversation, get_risk_scorer
+
+FILLERS = [
+    "最近晚上总是睡不好",
+    "孩子们工作忙很少回家",
+    "医生说要按时服药",
+    "今天去公园散步了",
+    "膝盖有点疼，走路不太方便",
+    "和老伙计下了一盘棋",
+    "有时候觉得挺孤单的",
+]
+RISKY = [
+    "有时候真想消失",
+    "我没有想过自杀",
+    "活不下去了",
+    "偷偷多服药会怎样",
+]
+
+
+class Command(BaseCommand):
+    help = "Benchmark per-message risk scoring on a synthetic chat corpus."
+
+    def add_arguments(self, parser):
+        parser.add_argument("--messages", type=int, default=5000)
+        parser.add_argument("--turns", type=int, default=8)
+        parser.add_argument("--seed", type=int, default=7)
+
+    def handle(self, *args, **options):
+        rng = random.Random(options["seed"])
+        scorer = get_risk_scorer()
+
+        def message():
+            parts = [rng.choice(FILLERS) for _ in range(rng.randint(1, 12))]
+            if rng.random() < 0.2:
+                parts.insert(rng.randrange(len(parts) + 1), rng.choice(RISKY))
+            return "，".join(parts) + "。"
+
+        corpus = [message() for _ in range(options["messages"])]
+        timings = []
+        for text in corpus:
+            started = time.perf_counter()
+            scorer.score_message(text)
+            timings.append(time.perf_counter() - started)
+        self._report("score_message", timings, sum(len(text) for text in corpus) / len(corpus))
+
+        cache.clear()
+        timings = []
+        conversations = max(1, options["messages"] // options["turns"])
+        for conversation in range(conversations):
+            messages = []
+            for _ in range(options["turns"]):
+                messages.append({"role": "user", "content": rng.choice(corpus)})
+                started = time.perf_counter()
+                assess_conversation(f"bench-{conversation}", messages)
+                timings.append(time.perf_counter() - started)
+                messages.append({"role": "assistant", "content": "嗯，我在听。"})
+        self._report(f"assess_conversation ({options['turns']} turns)", timings)
+
+    def _report(self, label, timings, avg_chars=None):
+        timings = sorted(timings)
+        p99 = timings[min(len(timings) - 1, int(len(timings) * 0.99))]
+        line = (
+            f"{label}: n={len(timings)} mean={statistics.mean(timings) * 1000:.3f} ms "
+            f"p99={p99 * 1000:.3f} ms"
+        )
+        if avg_chars:
+            line += f" avg_chars={avg_chars:.0f}"
+        self.stdout.write(line)
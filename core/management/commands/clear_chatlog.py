@@ -1,11 +1,55 @@
-from django.core.management.base import BaseCommand
+from pathlib import Path
 
-from core.models import ChatLog
+from django.core.management.base import BaseCommand, CommandError
+from django.utils import timezone
+
+from core.services.chat_retention import build_rules, purge_chat_logs
 
 
 class Command(BaseCommand):
-    help = "Clear all AI chat logs."
+    help = "Delete AI chat logs past their retention period, in small chunks."
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--days",
+            type=int,
+            default=None,
+            help="Keep logs newer than this many days (0 deletes everything; default from settings).",
+        )
+        parser.add_argument("--user", help="Only apply retention to this username.")
+        parser.add_argument("--chunk-size", type=int, default=1000)
+        parser.add_argument(
+            "--sleep", type=float, default=0.05, help="Seconds to pause between chunks."
+        )
+        parser.add_argument(
+            "--archive-dir", help="Write deleted rows to a gzipped JSONL file in this directory first."
+        )
+        parser.add_argument("--dry-run", action="store_true", help="Count without deleting.")
 
     def handle(self, *args, **options):
-        deleted, _ = ChatLog.objects.all().delete()
-        self.stdout.write(self.style.SUCCESS(f"Deleted {deleted} chat logs."))
+        try:
+            rules = build_rules(days=options["days"], only_user=options["user"])
+        except ValueError as exc:
+            raise CommandError(str(exc)) from exc
+
+        archive_path = None
+        if options["archive_dir"]:
+            archive_dir = Path(options["archive_dir"])
+            archive_dir.mkdir(parents=True, exist_ok=True)
+            archive_path = archive_dir / f"chatlog-{timezone.now():%Y%m%d-%H%M%S}.jsonl.gz"
+
+        def progress(label, deleted):
+            self.stdout.write(f"[{label}] {deleted} chat logs processed")
+
+        deleted = purge_chat_logs(
+            rules,
+            chunk_size=options["chunk_size"],
+            pause=options["sleep"],
+            archive_path=archive_path,
+            dry_run=options["dry_run"],
+            progress=progress if options["verbosity"] > 1 else None,
+        )
+        verb = "Would delete" if options["dry_run"] else "Deleted"
+        self.stdout.write(self.style.SUCCESS(f"{verb} {deleted} chat logs."))
+        if archive_path is not None and deleted:
+            self.stdout.write(f"Archived to {archive_path}")
@@ -0,0 +1,17 @@
+from django.core.management.base import BaseCommand
+
+from core.services.risk_escalation import catch_up
+
+
+class Command(BaseCommand):
+    help = "Escalate risk-flagged chat turns that never reached the consultation queue."
+
+    def add_arguments(self, parser):
+        parser.add_argument("--batch-size", type=int, default=None)
+
+    def handle(self, *args, **options):
+        total = 0
+        # 一批全部失败时停止，避免反复重试同一批记录。
+        while handled := catch_up(options["batch_size"]):
+            total += handled
+        self.stdout.write(self.style.SUCCESS(f"Escalated {total} risk chat turns."))
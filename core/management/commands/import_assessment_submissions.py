@@ -0,0 +1,42 @@
+import time
+from pathlib import Path
+
+from django.core.management.base import BaseCommand, CommandError
+
+from core.services.assessment_import import import_submissions, read_records
+
+
+class Command(BaseCommand):
+    help = "Import paper assessment submissions from a CSV or JSONL file."
+
+    def add_arguments(self, parser):
+        parser.add_argument("path", help="CSV file, or JSONL when the name ends in .jsonl.")
+        parser.add_argument("--assessment", default="", help="Slug for records without an assessment column.")
+        parser.add_argument("--chunk-size", type=int, default=500, help="Records per transaction.")
+        parser.add_argument(
+            "--create-users", action="store_true", help="Create login-disabled accounts for unknown usernames."
+        )
+        parser.add_argument("--dry-run", action="store_true", help="Validate and score without writing.")
+
+    def handle(self, *args, **options):
+        path = Path(options["path"])
+        if not path.is_file():
+            raise CommandError(f"File not found: {path}")
+        started = time.perf_counter()
+        report = import_submissions(
+            read_records(path, options["assessment"]),
+            chunk_size=max(1, options["chunk_size"]),
+            create_users=options["create_users"],
+            dry_run=options["dry_run"],
+        )
+        elapsed = time.perf_counter() - started
+        for line, message in sorted(report.errors):
+            self.stderr.write(f"line {line}: {message}")
+        prefix = "Would import" if options["dry_run"] else "Imported"
+        summary = (
+            f"{prefix} {report.imported} submissions in {elapsed:.2f} s "
+            f"({report.imported / elapsed if elapsed else 0:.0f}/s), skipped {len(report.errors)}"
+        )
+        if report.created_users:
+            summary += f", new users {report.created_users}"
+        self.stdout.write(self.style.SUCCESS(summary + "."))
@@ -0,0 +1,14 @@
+from django.core.management.base import BaseCommand
+
+from core.services.ticket_queue import rank_tickets
+
+
+class Command(BaseCommand):
+    help = "Recompute the risk priority and queue order of every consultation ticket."
+
+    def add_arguments(self, parser):
+        parser.add_argument("--chunk-size", type=int, default=500, help="Tickets updated per query.")
+
+    def handle(self, *args, **options):
+        ranked = rank_tickets(chunk_size=max(1, options["chunk_size"]))
+        self.stdout.write(self.style.SUCCESS(f"Ranked {ranked} tickets."))
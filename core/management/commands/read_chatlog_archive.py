@@ -0,0 +1,52 @@
+import json
+from dataclasses import asdict
+from datetime import datetime, time
+
+from django.contrib.auth import get_user_model
+from django.core.management.base import BaseCommand, CommandError
+from django.core.serializers.json import DjangoJSONEncoder
+from django.utils import timezone
+
+from core.services.chat_archive import iter_archived_logs
+
+
+def _parse_date(value: str) -> datetime:
+    try:
+        day = datetime.strptime(value, "%Y-%m-%d").date()
+    except ValueError as exc:
+        raise CommandError(f"日期格式应为 YYYY-MM-DD：{value}") from exc
+    return timezone.make_aware(datetime.combine(day, time.min))
+
+
+class Command(BaseCommand):
+    help = "Print archived AI chat logs as JSON lines, filtered by user, date and risk flag."
+
+    def add_arguments(self, parser):
+        parser.add_argument("--dir", help="Archive directory (default from settings).")
+        parser.add_argument("--user", help="Username to filter by.")
+        parser.add_argument("--since", help="First day to include (YYYY-MM-DD).")
+        parser.add_argument("--until", help="First day to exclude (YYYY-MM-DD).")
+        risk = parser.add_mutually_exclusive_group()
+        risk.add_argument("--risk", dest="risk_flag", action="store_const", const=True)
+        risk.add_argument("--no-risk", dest="risk_flag", action="store_const", const=False)
+
+    def handle(self, *args, **options):
+        user_id = None
+        if options["user"]:
+            user_id = (
+                get_user_model()
+                .objects.filter(username=options["user"])
+                .values_list("id", flat=True)
+                .first()
+            )
+            if user_id is None:
+                raise CommandError(f"未找到用户：{options['user']}")
+        logs = iter_archived_logs(
+            options["dir"],
+            user_id=user_id,
+            since=_parse_date(options["since"]) if options["since"] else None,
+            until=_parse_date(options["until"]) if options["until"] else None,
+            risk_flag=options["risk_flag"],
+        )
+        for log in logs:
+            self.stdout.write(json.dumps(asdict(log), cls=DjangoJSONEncoder, ensure_ascii=False))
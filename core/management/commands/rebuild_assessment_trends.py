@@ -0,0 +1,14 @@
+from django.core.management.base import BaseCommand
+
+from core.services.assessment_trends import rebuild_trends
+
+
+class Command(BaseCommand):
+    help = "Recompute every user's assessment score trend from the stored submissions."
+
+    def add_arguments(self, parser):
+        parser.add_argument("--chunk-size", type=int, default=2000, help="Submissions read per query.")
+
+    def handle(self, *args, **options):
+        read = rebuild_trends(chunk_size=max(1, options["chunk_size"]))
+        self.stdout.write(self.style.SUCCESS(f"Rebuilt trends from {read} submissions."))
@@ -0,0 +1,17 @@
+from django.core.management.base import BaseCommand
+
+from core.services.ticket_stats import reconcile_counters
+
+
+class Command(BaseCommand):
+    help = "Recompute the consultation ticket status counters and SLA totals from the tickets."
+
+    def add_arguments(self, parser):
+        parser.add_argument("--dry-run", action="store_true", help="Report drift without rewriting the counters.")
+
+    def handle(self, *args, **options):
+        drift = reconcile_counters(dry_run=options["dry_run"])
+        for name, (stored, actual) in drift.items():
+            self.stdout.write(f"{name}: {stored} -> {actual}")
+        verb = "Found" if options["dry_run"] else "Fixed"
+        self.stdout.write(self.style.SUCCESS(f"{verb} {len(drift)} drifted counters."))
@@ -0,0 +1,22 @@
+from django.core.management.base import BaseCommand
+
+from core.services.assessment_analytics import rebuild_rollups, refresh_rollups
+
+
+class Command(BaseCommand):
+    help = "Fold new assessment submissions into the analytics rollups."
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--rebuild",
+            action="store_true",
+            help="Recompute every rollup from scratch (after deletions or profile region changes).",
+        )
+        parser.add_argument("--batch-size", type=int, default=None)
+
+    def handle(self, *args, **options):
+        if options["rebuild"]:
+            folded = rebuild_rollups()
+        else:
+            folded = refresh_rollups(options["batch_size"])
+        self.stdout.write(self.style.SUCCESS(f"Rolled up {folded} submissions."))
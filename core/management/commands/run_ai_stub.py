@@ -0,0 +1,40 @@
+import time
+
+from django.core.management.base import BaseCommand
+
+from core.ai_stub import SAMPLE_REPLY, StubAIServer, lognormal_delay
+
+
+class Command(BaseCommand):
+    help = "Serve a local OpenAI-compatible stand-in for the AI provider (for load tests)."
+
+    def add_arguments(self, parser):
+        parser.add_argument("--host", default="127.0.0.1")
+        parser.add_argument("--port", type=int, default=8808)
+        parser.add_argument("--median-ms", type=float, default=800, help="Median reply latency.")
+        parser.add_argument("--sigma", type=float, default=0.5, help="Log-normal spread of latency.")
+        parser.add_argument("--chars-per-second", type=float, default=40, help="Streaming rate, 0 = at once.")
+        parser.add_argument("--error-rate", type=float, default=0.0)
+        parser.add_argument("--error-status", type=int, default=503, help="0 drops the connection.")
+        parser.add_argument("--seed", type=int, default=None)
+
+    def handle(self, *args, **options):
+        stub = StubAIServer(
+            reply=SAMPLE_REPLY,
+            delay=lognormal_delay(options["median_ms"] / 1000, options["sigma"], options["seed"]),
+            fail_status=options["error_status"] or None,
+            error_rate=options["error_rate"],
+            chars_per_second=options["chars_per_second"] or None,
+            seed=options["seed"],
+            host=options["host"],
+            port=options["port"],
+        )
+        with stub:
+            self.stdout.write(f"AI stub listening on {stub.url}")
+            self.stdout.write("Point DEEPSEEK_BASE_URL at it and set any DEEPSEEK_API_KEY. Ctrl-C to stop.")
+            try:
+                while True:
+                    time.sleep(1)
+            except KeyboardInterrupt:
+                pass
+        self.stdout.write(f"Served {stub.requests} requests ({stub.failures} injected failures).")
@@ -0,0 +1,60 @@
+import re
+
+from django.db import migrations
+
+# 以下为写迁移时 core.services.knowledge_search 的快照：迁移不导入随代码变化的模块，
+# 之后切词规则有调整时执行 manage.py rebuild_search_index 重建。
+FTS_TABLE = "core_article_fts"
+INDEXED_FIELDS = ("title", "summary", "tags", "content")
+CJK_RUN_RE = re.compile(r"[㐀-䶿一-鿿豈-﫿]+|[0-9A-Za-z]+")
+CJK_CHAR_RE = re.compile(r"[㐀-䶿一-鿿豈-﫿]")
+
+
+def segment(text):
+    terms = []
+    for run in CJK_RUN_RE.findall(text or ""):
+        if not CJK_CHAR_RE.match(run):
+            terms.append(run.lower())
+            continue
+        if len(run) == 1:
+            terms.append(run)
+            continue
+        terms.extend(run[i : i + 2] for i in range(len(run) - 1))
+        terms.append(run[-1])
+    return terms
+
+
+def create_article_fts(apps, schema_editor):
+    connection = schema_editor.connection
+    if connection.vendor != "sqlite":
+        return
+    Article = apps.get_model("core", "Article")
+    columns = ", ".join(INDEXED_FIELDS)
+    placeholders = ", ".join(["%s"] * (len(INDEXED_FIELDS) + 1))
+    with connection.cursor() as cursor:
+        cursor.execute(f"DROP TABLE IF EXISTS {FTS_TABLE}")
+        cursor.execute(f"CREATE VIRTUAL TABLE {FTS_TABLE} USING fts5({columns}, tokenize='unicode61')")
+        rows = Article.objects.using(connection.alias).values("id", *INDEXED_FIELDS).order_by("id")
+        for row in rows.iterator():
+            cursor.execute(
+                f"INSERT INTO {FTS_TABLE} (rowid, {columns}) VALUES ({placeholders})",
+                [row["id"], *(" ".join(segment(str(row[field] or ""))) for field in INDEXED_FIELDS)],
+            )
+
+
+def drop_article_fts(apps, schema_editor):
+    if schema_editor.connection.vendor != "sqlite":
+        return
+    with schema_editor.connection.cursor() as cursor:
+        cursor.execute(f"DROP TABLE IF EXISTS {FTS_TABLE}")
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("core", "0004_article_article_pub_created_idx_and_more"),
+    ]
+
+    operations = [
+        migrations.RunPython(create_article_fts, drop_article_fts),
+    ]
@@ -0,0 +1,23 @@
+# Generated by Django 5.2.9 on 2026-10-18 18:59
+
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0005_article_fts_index'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='assessmentsubmission',
+            index=models.Index(fields=['user', 'created_at'], name='submission_user_created_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='consultationticket',
+            index=models.Index(fields=['created_at'], name='ticket_created_idx'),
+        ),
+    ]
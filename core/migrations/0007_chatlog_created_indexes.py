@@ -0,0 +1,23 @@
+# Generated by Django 5.2.9 on 2026-10-18 19:10
+
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0006_keyset_pagination_indexes'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='chatlog',
+            index=models.Index(fields=['created_at'], name='chatlog_created_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='chatlog',
+            index=models.Index(fields=['user', 'created_at'], name='chatlog_user_created_idx'),
+        ),
+    ]
@@ -0,0 +1,51 @@
+# Generated by Django 5.2.9 on 2026-10-18 19:15
+
+import django.db.models.deletion
+import django.utils.timezone
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0007_chatlog_created_indexes'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='chatlog',
+            name='created_at',
+            field=models.DateTimeField(default=django.utils.timezone.now),
+        ),
+        migrations.CreateModel(
+            name='ChatConversation',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('provider', models.CharField(max_length=20)),
+                ('turn_count', models.PositiveIntegerField(default=0)),
+                ('risk_flag', models.BooleanField(default=False)),
+                ('tail_digest', models.CharField(blank=True, max_length=40)),
+                ('started_at', models.DateTimeField(default=django.utils.timezone.now)),
+                ('last_turn_at', models.DateTimeField(default=django.utils.timezone.now)),
+                ('user', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='chat_conversations', to=settings.AUTH_USER_MODEL)),
+            ],
+            options={
+                'ordering': ['-last_turn_at'],
+            },
+        ),
+        migrations.AddField(
+            model_name='chatlog',
+            name='conversation',
+            field=models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.CASCADE, related_name='turns', to='core.chatconversation'),
+        ),
+        migrations.AddIndex(
+            model_name='chatconversation',
+            index=models.Index(fields=['user', 'tail_digest'], name='conversation_user_tail_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='chatconversation',
+            index=models.Index(fields=['last_turn_at'], name='conversation_last_turn_idx'),
+        ),
+    ]
@@ -0,0 +1,120 @@
+import hashlib
+import json
+
+from django.db import migrations
+
+BATCH_SIZE = 500
+# 写迁移时 CHAT_HISTORY_LIMIT 的取值，回滚时按它还原每轮的消息窗口。
+HISTORY_LIMIT = 8
+
+
+# split_new_messages / tail_digest 为写迁移时 core.services.conversations 的快照，
+# 迁移不导入随代码变化的模块。
+def split_new_messages(messages):
+    """Split a window into (context already answered, trailing new messages)."""
+    last_reply = max(
+        (index for index, msg in enumerate(messages) if msg.get("role") == "assistant"),
+        default=-1,
+    )
+    return messages[: last_reply + 1], messages[last_reply + 1 :]
+
+
+def tail_digest(messages):
+    pairs = [[msg.get("role"), str(msg.get("content", ""))] for msg in messages[-2:]]
+    return hashlib.sha1(json.dumps(pairs, ensure_ascii=False).encode("utf-8")).hexdigest()
+
+
+def _overlap(previous, current):
+    """Length of the longest suffix of ``previous`` that starts ``current``."""
+    for start in range(len(previous)):
+        length = len(previous) - start
+        if length <= len(current) and previous[start:] == current[:length]:
+            return length
+    return 0
+
+
+def split_into_conversations(apps, schema_editor):
+    """Group legacy per-turn windows into conversations and keep only deltas.
+
+    A row continues the previous row of the same user when its window starts
+    with the tail of that row's window plus reply; otherwise it opens a new
+    conversation and keeps its whole window.
+    """
+    db = schema_editor.connection.alias
+    ChatLog = apps.get_model("core", "ChatLog")
+    ChatConversation = apps.get_model("core", "ChatConversation")
+
+    pending_rows = []
+    touched = {}
+    last_user = object()
+    conversation = None
+    context = []
+
+    def flush():
+        ChatLog.objects.using(db).bulk_update(pending_rows, ["conversation", "messages_json"])
+        ChatConversation.objects.using(db).bulk_update(
+            list(touched.values()), ["turn_count", "risk_flag", "tail_digest", "last_turn_at"]
+        )
+        pending_rows.clear()
+        touched.clear()
+
+    rows = ChatLog.objects.using(db).order_by("user_id", "created_at", "id")
+    for row in rows.iterator(chunk_size=BATCH_SIZE):
+        messages = row.messages_json if isinstance(row.messages_json, list) else []
+        shared = _overlap(context, messages) if row.user_id == last_user and conversation else 0
+        if shared:
+            row.messages_json = messages[shared:]
+            conversation.turn_count += 1
+            conversation.risk_flag = conversation.risk_flag or row.risk_flag
+            conversation.last_turn_at = row.created_at
+        else:
+            conversation = ChatConversation.objects.using(db).create(
+                provider=row.provider,
+                user_id=row.user_id,
+                turn_count=1,
+                risk_flag=row.risk_flag,
+                started_at=row.created_at,
+                last_turn_at=row.created_at,
+            )
+        _, new = split_new_messages(messages)
+        conversation.tail_digest = tail_digest(new + [{"role": "assistant", "content": row.response_text}])
+        touched[conversation.pk] = conversation
+        context = messages + [{"role": "assistant", "content": row.response_text}]
+        last_user = row.user_id
+        row.conversation_id = conversation.pk
+        pending_rows.append(row)
+        if len(pending_rows) >= BATCH_SIZE:
+            flush()
+    flush()
+
+
+def restore_windows(apps, schema_editor):
+    db = schema_editor.connection.alias
+    ChatLog = apps.get_model("core", "ChatLog")
+    limit = HISTORY_LIMIT
+    pending_rows = []
+    history = []
+    current = None
+    rows = ChatLog.objects.using(db).exclude(conversation=None).order_by("conversation_id", "created_at", "id")
+    for row in rows.iterator(chunk_size=BATCH_SIZE):
+        if row.conversation_id != current:
+            current, history = row.conversation_id, []
+        window = history + (row.messages_json if isinstance(row.messages_json, list) else [])
+        history = window + [{"role": "assistant", "content": row.response_text}]
+        row.messages_json = window[-limit:]
+        pending_rows.append(row)
+        if len(pending_rows) >= BATCH_SIZE:
+            ChatLog.objects.using(db).bulk_update(pending_rows, ["messages_json"])
+            pending_rows.clear()
+    ChatLog.objects.using(db).bulk_update(pending_rows, ["messages_json"])
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("core", "0008_chat_conversations"),
+    ]
+
+    operations = [
+        migrations.RunPython(split_into_conversations, restore_windows),
+    ]
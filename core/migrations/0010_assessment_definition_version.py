@@ -0,0 +1,18 @@
+# Generated by Django 5.2.9 on 2026-10-18 19:34
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0009_chatlog_to_conversations'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='assessment',
+            name='definition_version',
+            field=models.PositiveBigIntegerField(default=0, editable=False),
+        ),
+    ]
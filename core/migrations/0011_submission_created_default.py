@@ -0,0 +1,19 @@
+# Generated by Django 5.2.9 on 2026-10-18 19:36
+
+import django.utils.timezone
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0010_assessment_definition_version'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='assessmentsubmission',
+            name='created_at',
+            field=models.DateTimeField(default=django.utils.timezone.now),
+        ),
+    ]
@@ -0,0 +1,39 @@
+# Generated by Django 5.2.9 on 2026-10-18 19:38
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0011_submission_created_default'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='RollupWatermark',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('name', models.CharField(max_length=60, unique=True)),
+                ('last_id', models.PositiveBigIntegerField(default=0)),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+            ],
+        ),
+        migrations.CreateModel(
+            name='AssessmentRollup',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('month', models.DateField()),
+                ('province', models.CharField(blank=True, max_length=50)),
+                ('city', models.CharField(blank=True, max_length=50)),
+                ('total_score', models.IntegerField()),
+                ('count', models.PositiveIntegerField(default=0)),
+                ('assessment', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='rollups', to='core.assessment')),
+            ],
+            options={
+                'ordering': ['assessment', 'month', 'total_score'],
+                'constraints': [models.UniqueConstraint(fields=('assessment', 'month', 'province', 'city', 'total_score'), name='rollup_bucket_unique')],
+            },
+        ),
+    ]
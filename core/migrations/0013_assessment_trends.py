@@ -0,0 +1,37 @@
+# Generated by Django 5.2.9 on 2026-10-18 19:41
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0012_assessment_rollups'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='AssessmentTrend',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('points', models.JSONField(default=list)),
+                ('last_score', models.IntegerField(blank=True, null=True)),
+                ('last_at', models.DateTimeField(blank=True, null=True)),
+                ('delta', models.IntegerField(blank=True, null=True)),
+                ('worsened', models.BooleanField(default=False)),
+                ('improved', models.BooleanField(default=False)),
+                ('tier_change', models.SmallIntegerField(default=0)),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+                ('assessment', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='trends', to='core.assessment')),
+                ('user', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='assessment_trends', to=settings.AUTH_USER_MODEL)),
+            ],
+            options={
+                'ordering': ['-last_at'],
+                'indexes': [models.Index(fields=['worsened', 'last_at'], name='trend_worsened_idx')],
+                'constraints': [models.UniqueConstraint(fields=('user', 'assessment'), name='trend_user_assessment_unique')],
+            },
+        ),
+    ]
@@ -0,0 +1,42 @@
+# Generated by Django 5.2.9 on 2026-10-18 19:44
+
+from django.conf import settings
+from django.db import migrations, models
+
+
+def rank_existing_tickets(apps, schema_editor):
+    # 迁移不依赖随代码变化的风险评分：已有工单先按创建时间排队（优先级 0），
+    # 需要按风险重新排序时执行 manage.py rank_ticket_queue。
+    ConsultationTicket = apps.get_model("core", "ConsultationTicket")
+    ConsultationTicket.objects.using(schema_editor.connection.alias).update(queue_rank=models.F("created_at"))
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0013_assessment_trends'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='consultationticket',
+            name='claimed_at',
+            field=models.DateTimeField(blank=True, editable=False, null=True),
+        ),
+        migrations.AddField(
+            model_name='consultationticket',
+            name='priority',
+            field=models.PositiveSmallIntegerField(default=0, editable=False),
+        ),
+        migrations.AddField(
+            model_name='consultationticket',
+            name='queue_rank',
+            field=models.DateTimeField(blank=True, editable=False, null=True),
+        ),
+        migrations.AddIndex(
+            model_name='consultationticket',
+            index=models.Index(fields=['status', 'queue_rank'], name='ticket_status_rank_idx'),
+        ),
+        migrations.RunPython(rank_existing_tickets, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,18 @@
+# Generated by Django 5.2.9 on 2026-10-18 19:47
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0014_ticket_queue'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='consultationticket',
+            name='source',
+            field=models.CharField(choices=[('form', '用户提交'), ('risk_chat', 'AI 对话风险')], default='form', max_length=20),
+        ),
+    ]
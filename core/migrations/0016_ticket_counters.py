@@ -0,0 +1,72 @@
+# Generated by Django 5.2.9 on 2026-10-18 19:55
+
+from collections import Counter
+
+from django.db import migrations, models
+
+# 写迁移时的工单状态与默认时效目标（分钟）。迁移不读取随代码和环境变化的定义；
+# 部署时改过 TICKET_SLA 的，迁移后执行 manage.py reconcile_ticket_counters 按新目标重算。
+STATUSES = ("new", "assigned", "in_progress", "resolved", "closed")
+TARGETS = {"assign": 60, "resolve": 3 * 24 * 60}
+
+
+def _timing(kind, started, finished):
+    if started is None or finished is None:
+        return Counter()
+    seconds = max(0, int((finished - started).total_seconds()))
+    within = seconds <= TARGETS[kind] * 60
+    return Counter({f"{kind}:count": 1, f"{kind}:seconds": seconds, f"{kind}:within": int(within)})
+
+
+def counter_values(tickets):
+    values = Counter({f"status:{status}": 0 for status in STATUSES})
+    for kind in TARGETS:
+        values.update({f"{kind}:count": 0, f"{kind}:seconds": 0, f"{kind}:within": 0})
+    rows = tickets.order_by().values_list("status", "created_at", "first_assigned_at", "resolved_at")
+    for status, created_at, first_assigned_at, resolved_at in rows.iterator(chunk_size=2000):
+        values[f"status:{status}"] += 1
+        values.update(_timing("assign", created_at, first_assigned_at))
+        values.update(_timing("resolve", created_at, resolved_at))
+    return values
+
+
+def backfill_ticket_counters(apps, schema_editor):
+    db = schema_editor.connection.alias
+    ConsultationTicket = apps.get_model("core", "ConsultationTicket")
+    TicketCounter = apps.get_model("core", "TicketCounter")
+    tickets = ConsultationTicket.objects.using(db)
+    # 旧工单只能近似：领取时间视为首次分配，已解决/已关闭工单的最后更新时间视为解决时间。
+    tickets.filter(claimed_at__isnull=False).update(first_assigned_at=models.F("claimed_at"))
+    tickets.filter(status__in=["resolved", "closed"]).update(resolved_at=models.F("updated_at"))
+    TicketCounter.objects.using(db).bulk_create(
+        [TicketCounter(name=name, value=value) for name, value in sorted(counter_values(tickets).items())]
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0015_ticket_source'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='TicketCounter',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('name', models.CharField(max_length=40, unique=True)),
+                ('value', models.BigIntegerField(default=0)),
+            ],
+        ),
+        migrations.AddField(
+            model_name='consultationticket',
+            name='first_assigned_at',
+            field=models.DateTimeField(blank=True, editable=False, null=True),
+        ),
+        migrations.AddField(
+            model_name='consultationticket',
+            name='resolved_at',
+            field=models.DateTimeField(blank=True, editable=False, null=True),
+        ),
+        migrations.RunPython(backfill_ticket_counters, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,28 @@
+# Generated by Django 5.2.9 on 2026-10-18 20:08
+
+from django.db import migrations, models
+
+
+def start_escalation_watermark(apps, schema_editor):
+    # 升级前的风险对话已由旧流程处理（或已无法补做），补偿扫描从现有最后一条记录之后开始。
+    db = schema_editor.connection.alias
+    ChatLog = apps.get_model("core", "ChatLog")
+    RollupWatermark = apps.get_model("core", "RollupWatermark")
+    last_id = ChatLog.objects.using(db).order_by("-id").values_list("id", flat=True).first() or 0
+    RollupWatermark.objects.using(db).update_or_create(name="risk_escalation", defaults={"last_id": last_id})
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0016_ticket_counters'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='chatlog',
+            name='escalated_at',
+            field=models.DateTimeField(blank=True, editable=False, null=True),
+        ),
+        migrations.RunPython(start_escalation_watermark, migrations.RunPython.noop),
+    ]
@@ -1,5 +1,6 @@
 from django.conf import settings
-from django.db import models
+from django.db import models, transaction
+from django.utils import timezone
 from django.utils.text import slugify
 
 
@@ -34,13 +35,6 @@ class Article(models.Model):
 
     class Meta:
         ordering = ["-created_at"]
-        indexes = [
-            models.Index(fields=["user", "created_at"], name="submission_user_created_idx"),
-        ]
-        indexes = [
-            models.Index(fields=["user", "created_at"], name="chatlog_user_created_idx"),
-            models.Index(fields=["provider", "created_at"], name="chatlog_provider_created_idx"),
-        ]
         indexes = [
             models.Index(fields=["is_published", "created_at"], name="article_pub_created_idx"),
             models.Index(fields=["category", "is_published"], name="article_cat_pub_idx"),
@@ -70,6 +64,14 @@ class ConsultationTicket(models.Model):
         (STATUS_CLOSED, "已关闭"),
     ]
 
+    SOURCE_FORM = "form"
+    SOURCE_RISK_CHAT = "risk_chat"
+
+    SOURCE_CHOICES = [
+        (SOURCE_FORM, "用户提交"),
+        (SOURCE_RISK_CHAT, "AI 对话风险"),
+    ]
+
     user = models.ForeignKey(
         settings.AUTH_USER_MODEL,
         on_delete=models.SET_NULL,
@@ -83,6 +85,7 @@ class ConsultationTicket(models.Model):
     contact_phone = models.CharField(max_length=30, blank=True)
     contact_email = models.EmailField(blank=True)
     status = models.CharField(max_length=20, choices=STATUS_CHOICES, default=STATUS_NEW)
+    source = models.CharField(max_length=20, choices=SOURCE_CHOICES, default=SOURCE_FORM)
     assigned_to = models.ForeignKey(
         settings.AUTH_USER_MODEL,
         on_delete=models.SET_NULL,
@@ -90,6 +93,14 @@ class ConsultationTicket(models.Model):
         blank=True,
         related_name="assigned_tickets",
     )
+    # 队列优先级：priority 为标题与内容的风险关键词得分；queue_rank 为“折算后的排队时间”，
+    # 即创建时间减去 priority × TICKET_QUEUE["MINUTES_PER_POINT"]，越早越先被领取。
+    priority = models.PositiveSmallIntegerField(default=0, editable=False)
+    queue_rank = models.DateTimeField(null=True, blank=True, editable=False)
+    claimed_at = models.DateTimeField(null=True, blank=True, editable=False)
+    # SLA 时间点：首次有人负责（离开“新建”或被指派）与首次解决/关闭，只记录第一次。
+    first_assigned_at = models.DateTimeField(null=True, blank=True, editable=False)
+    resolved_at = models.DateTimeField(null=True, blank=True, editable=False)
     created_at = models.DateTimeField(auto_now_add=True)
     updated_at = models.DateTimeField(auto_now=True)
 
@@ -98,12 +109,29 @@ class ConsultationTicket(models.Model):
             models.Index(fields=["user", "created_at"], name="ticket_user_created_idx"),
             models.Index(fields=["status", "created_at"], name="ticket_status_created_idx"),
             models.Index(fields=["assigned_to", "status"], name="ticket_assigned_status_idx"),
+            models.Index(fields=["created_at"], name="ticket_created_idx"),
+            models.Index(fields=["status", "queue_rank"], name="ticket_status_rank_idx"),
         ]
 
+    def save(self, *args, **kwargs):
+        # 状态计数器在 pre_save/post_save 信号中更新，需与工单本身在同一事务内提交。
+        with transaction.atomic(using=kwargs.get("using")):
+            super().save(*args, **kwargs)
+
     def __str__(self):
         return f"{self.title} ({self.get_status_display()})"
 
 
+class TicketCounter(models.Model):
+    """A maintained ticket count or SLA total, e.g. ``status:new`` or ``assign:seconds``."""
+
+    name = models.CharField(max_length=40, unique=True)
+    value = models.BigIntegerField(default=0)
+
+    def __str__(self):
+        return f"{self.name}: {self.value}"
+
+
 class ConsultationNote(models.Model):
     ticket = models.ForeignKey(ConsultationTicket, on_delete=models.CASCADE, related_name="notes")
     author = models.ForeignKey(settings.AUTH_USER_MODEL, on_delete=models.SET_NULL, null=True)
@@ -118,6 +146,33 @@ class ConsultationNote(models.Model):
         return f"Note for {self.ticket_id}"
 
 
+class ChatConversation(models.Model):
+    provider = models.CharField(max_length=20)
+    user = models.ForeignKey(
+        settings.AUTH_USER_MODEL,
+        on_delete=models.SET_NULL,
+        null=True,
+        blank=True,
+        related_name="chat_conversations",
+    )
+    turn_count = models.PositiveIntegerField(default=0)
+    risk_flag = models.BooleanField(default=False)
+    # 最近一轮（用户消息 + 回复）的摘要，用来把下一轮请求归到这段对话。
+    tail_digest = models.CharField(max_length=40, blank=True)
+    started_at = models.DateTimeField(default=timezone.now)
+    last_turn_at = models.DateTimeField(default=timezone.now)
+
+    class Meta:
+        ordering = ["-last_turn_at"]
+        indexes = [
+            models.Index(fields=["user", "tail_digest"], name="conversation_user_tail_idx"),
+            models.Index(fields=["last_turn_at"], name="conversation_last_turn_idx"),
+        ]
+
+    def __str__(self):
+        return f"Conversation {self.pk}"
+
+
 class ChatLog(models.Model):
     PROVIDER_DEEPSEEK = "deepseek"
 
@@ -129,13 +184,27 @@ class ChatLog(models.Model):
         blank=True,
         related_name="chat_logs",
     )
+    conversation = models.ForeignKey(
+        ChatConversation,
+        on_delete=models.CASCADE,
+        null=True,
+        blank=True,
+        related_name="turns",
+    )
+    # 只保存本轮新增的消息（通常是一条用户消息），完整上下文按对话回放得到。
     messages_json = models.JSONField()
     response_text = models.TextField()
     risk_flag = models.BooleanField(default=False)
-    created_at = models.DateTimeField(auto_now_add=True)
+    # 风险轮次转为咨询工单（或追加处理记录）的时间，补偿扫描据此跳过已处理的轮次。
+    escalated_at = models.DateTimeField(null=True, blank=True, editable=False)
+    created_at = models.DateTimeField(default=timezone.now)
 
     class Meta:
         ordering = ["-created_at"]
+        indexes = [
+            models.Index(fields=["created_at"], name="chatlog_created_idx"),
+            models.Index(fields=["user", "created_at"], name="chatlog_user_created_idx"),
+        ]
 
     def __str__(self):
         return f"{self.provider} chat at {self.created_at:%Y-%m-%d %H:%M}"
@@ -174,6 +243,8 @@ class Assessment(models.Model):
     description = models.TextField(blank=True)
     instructions = models.TextField(blank=True)
     is_published = models.BooleanField(default=True)
+    # 量表、题目、选项或结果区间每次变更都换一个新值，评分用的编译缓存据此判断是否过期。
+    definition_version = models.PositiveBigIntegerField(default=0, editable=False)
     created_at = models.DateTimeField(auto_now_add=True)
     updated_at = models.DateTimeField(auto_now=True)
 
@@ -249,10 +320,14 @@ class AssessmentSubmission(models.Model):
     result_title = models.CharField(max_length=120, blank=True)
     result_summary = models.TextField(blank=True)
     result_advice = models.TextField(blank=True)
-    created_at = models.DateTimeField(auto_now_add=True)
+    # 批量导入纸质问卷时保留填写日期，因此不用 auto_now_add。
+    created_at = models.DateTimeField(default=timezone.now)
 
     class Meta:
         ordering = ["-created_at"]
+        indexes = [
+            models.Index(fields=["user", "created_at"], name="submission_user_created_idx"),
+        ]
 
     def __str__(self):
         return f"{self.user} - {self.assessment.name}"
@@ -274,6 +349,80 @@ class AssessmentAnswer(models.Model):
         return f"Answer {self.submission_id} - {self.question_id}"
 
 
+class AssessmentRollup(models.Model):
+    """Submission count for one assessment, month, region and total score."""
+
+    assessment = models.ForeignKey(
+        Assessment, on_delete=models.CASCADE, related_name="rollups"
+    )
+    month = models.DateField()
+    province = models.CharField(max_length=50, blank=True)
+    city = models.CharField(max_length=50, blank=True)
+    total_score = models.IntegerField()
+    count = models.PositiveIntegerField(default=0)
+
+    class Meta:
+        ordering = ["assessment", "month", "total_score"]
+        constraints = [
+            models.UniqueConstraint(
+                fields=["assessment", "month", "province", "city", "total_score"],
+                name="rollup_bucket_unique",
+            )
+        ]
+
+    def __str__(self):
+        return f"{self.assessment_id} {self.month:%Y-%m} {self.province}{self.city} {self.total_score}"
+
+
+class RollupWatermark(models.Model):
+    """Named id cursor: the highest source row id a background job has processed.
+
+    Shared by several jobs, one row each: ``assessment_rollups`` (submissions
+    folded into ``AssessmentRollup``) and ``risk_escalation`` (chat turns the
+    risk catch-up scan has checked).
+    """
+
+    name = models.CharField(max_length=60, unique=True)
+    last_id = models.PositiveBigIntegerField(default=0)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    def __str__(self):
+        return f"{self.name}: {self.last_id}"
+
+
+class AssessmentTrend(models.Model):
+    """One user's score series for one assessment, kept in step with submissions."""
+
+    user = models.ForeignKey(
+        settings.AUTH_USER_MODEL, on_delete=models.CASCADE, related_name="assessment_trends"
+    )
+    assessment = models.ForeignKey(
+        Assessment, on_delete=models.CASCADE, related_name="trends"
+    )
+    # 按时间排序的 [时间戳（秒）, 总分, 结果等级, 提交 id]；等级为结果区间序号，从 1 开始，0 表示未分级。
+    points = models.JSONField(default=list)
+    last_score = models.IntegerField(null=True, blank=True)
+    last_at = models.DateTimeField(null=True, blank=True)
+    # 最近一次相对上一次的分数变化；分数越高表示状况越差。
+    delta = models.IntegerField(null=True, blank=True)
+    worsened = models.BooleanField(default=False)
+    improved = models.BooleanField(default=False)
+    tier_change = models.SmallIntegerField(default=0)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        ordering = ["-last_at"]
+        constraints = [
+            models.UniqueConstraint(fields=["user", "assessment"], name="trend_user_assessment_unique")
+        ]
+        indexes = [
+            models.Index(fields=["worsened", "last_at"], name="trend_worsened_idx"),
+        ]
+
+    def __str__(self):
+        return f"{self.user} - {self.assessment.name}"
+
+
 class Institution(models.Model):
     REGION_LOCAL = "local"
     REGION_PROVINCE = "province"
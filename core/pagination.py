@@ -1,8 +1,17 @@
 from __future__ import annotations
 
+import base64
+import hashlib
+from datetime import datetime
+
+from django.conf import settings
+from django.core.cache import cache
 from django.core.paginator import Paginator
+from django.db.models import Q
 from django.http import HttpRequest
 
+CURSOR_PARAMS = ("page", "after", "before")
+
 
 def paginate_queryset(request: HttpRequest, queryset, per_page: int):
     paginator = Paginator(queryset, per_page)
@@ -12,3 +21,111 @@ def paginate_queryset(request: HttpRequest, queryset, per_page: int):
     params.pop("page", None)
     querystring = params.urlencode()
     return page_obj, querystring
+
+
+def encode_cursor(created_at: datetime, pk: int) -> str:
+    raw = f"{created_at.isoformat()}|{pk}".encode("utf-8")
+    return base64.urlsafe_b64encode(raw).decode("ascii").rstrip("=")
+
+
+def decode_cursor(token: str) -> tuple[datetime, int] | None:
+    try:
+        padded = token + "=" * (-len(token) % 4)
+        raw = base64.urlsafe_b64decode(padded.encode("ascii")).decode("utf-8")
+        created_at, pk = raw.rsplit("|", 1)
+        return datetime.fromisoformat(created_at), int(pk)
+    except (ValueError, UnicodeError):
+        return None
+
+
+class KeysetPage:
+    """One page of a ``(created_at, id)`` keyset walk, newest first.
+
+    Mirrors the parts of Django's ``Page`` that templates use; instead of page
+    numbers it exposes opaque ``next_cursor``/``previous_cursor`` tokens.
+    """
+
+    is_keyset = True
+
+    def __init__(self, object_list, has_next: bool, has_previous: bool, total_count=None):
+        self.object_list = object_list
+        self.has_next_page = has_next
+        self.has_previous_page = has_previous
+        self.total_count = total_count
+
+    def __iter__(self):
+        return iter(self.object_list)
+
+    def __len__(self):
+        return len(self.object_list)
+
+    def __getitem__(self, index):
+        return self.object_list[index]
+
+    def has_next(self) -> bool:
+        return self.has_next_page
+
+    def has_previous(self) -> bool:
+        return self.has_previous_page
+
+    def has_other_pages(self) -> bool:
+        return self.has_next_page or self.has_previous_page
+
+    @property
+    def next_cursor(self) -> str:
+        if not self.has_next_page or not self.object_list:
+            return ""
+        last = self.object_list[-1]
+        return encode_cursor(last.created_at, last.pk)
+
+    @property
+    def previous_cursor(self) -> str:
+        if not self.has_previous_page or not self.object_list:
+            return ""
+        first = self.object_list[0]
+        return encode_cursor(first.created_at, first.pk)
+
+
+def _approximate_count(queryset) -> int:
+    key = "pagination-count:" + hashlib.md5(str(queryset.query).encode("utf-8")).hexdigest()
+    return cache.get_or_set(key, queryset.count, settings.PAGINATION_COUNT_CACHE_SECONDS)
+
+
+def paginate_keyset(request: HttpRequest, queryset, per_page: int, with_total: bool = False):
+    """Paginate ``queryset`` newest-first by ``(created_at, id)`` without OFFSET.
+
+    ``?after=`` walks to older rows and ``?before=`` back to newer ones, so every
+    page is a bounded range scan on a ``created_at`` index. With ``with_total``
+    the page carries a row count cached for ``PAGINATION_COUNT_CACHE_SECONDS``.
+    """
+    base_queryset = queryset
+    after = decode_cursor(request.GET.get("after") or "")
+    before = None if after else decode_cursor(request.GET.get("before") or "")
+
+    if before:
+        created_at, pk = before
+        rows = list(
+            queryset.filter(Q(created_at__gt=created_at) | Q(created_at=created_at, id__gt=pk))
+            .order_by("created_at", "id")[: per_page + 1]
+        )
+        has_previous = len(rows) > per_page
+        rows = rows[:per_page][::-1]
+        has_next = True
+    else:
+        if after:
+            created_at, pk = after
+            queryset = queryset.filter(
+                Q(created_at__lt=created_at) | Q(created_at=created_at, id__lt=pk)
+            )
+        rows = list(queryset.order_by("-created_at", "-id")[: per_page + 1])
+        has_next = len(rows) > per_page
+        rows = rows[:per_page]
+        has_previous = after is not None
+
+    total_count = _approximate_count(base_queryset.order_by()) if with_total else None
+    page_obj = KeysetPage(rows, has_next, has_previous, total_count)
+    params = request.GET.copy()
+    for key in CURSOR_PARAMS:
+        params.pop(key, None)
+    querystring = params.urlencode()
+    return page_obj, querystring
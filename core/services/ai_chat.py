@@ -1,11 +1,18 @@
 from __future__ import annotations
 
 from dataclasses import dataclass
+from typing import AsyncIterator, Iterator
 
+from asgiref.sync import sync_to_async
 from django.conf import settings
 
-from core.ai import AIServiceError, call_ai
+from core.ai import AIServiceError, acall_ai, astream_ai, call_ai, stream_ai
 from core.models import ChatLog
+from core.services.chat_context import fit_to_budget, message_tokens
+from core.services.chat_log_writer import get_chat_log_writer, save_turns
+from core.services.conversations import arecord_turn, record_turn
+from core.services.reply_cache import get_reply_cache, make_key
+from core.services.risk_matcher import get_risk_matcher
 
 
 @dataclass
@@ -13,11 +20,27 @@ class AIChatPayload:
     provider: str
     deep_think: bool
     messages: list[dict]
+    # 只发来一条新消息时为 True，上下文由服务端按会话补全。
+    server_context: bool = False
+    new_conversation: bool = False
 
 
 def parse_ai_payload(payload: dict) -> AIChatPayload:
     provider = payload.get("provider") or "deepseek"
     deep_think = payload.get("deep_think") is True
+    if "message" in payload:
+        message = payload.get("message")
+        if not isinstance(message, str) or not message.strip():
+            raise ValueError("消息格式不正确")
+        if len(message) > settings.AI_MAX_INPUT_CHARS:
+            raise ValueError("内容过长")
+        return AIChatPayload(
+            provider=provider,
+            deep_think=deep_think,
+            messages=[{"role": "user", "content": message.strip()}],
+            server_context=True,
+            new_conversation=payload.get("new_conversation") is True,
+        )
     messages = payload.get("messages") or []
     if not isinstance(messages, list) or not messages:
         raise ValueError("消息格式不正确")
@@ -38,29 +61,138 @@ def parse_ai_payload(payload: dict) -> AIChatPayload:
 
 
 def contains_risk(text: str) -> bool:
-    return any(keyword in text for keyword in settings.AI_RISK_KEYWORDS)
+    return get_risk_matcher().search(text)
 
 
 def build_messages(messages: list[dict]) -> list[dict]:
+    """System prompt plus as much recent history as ``AI_CONTEXT`` allows."""
     system_message = {"role": "system", "content": settings.AI_SYSTEM_PROMPT}
-    return [system_message] + messages
+    budget = settings.AI_CONTEXT["MAX_TOKENS"] - message_tokens(system_message)
+    return [system_message] + fit_to_budget(messages, budget)
+
+
+def select_model(payload: AIChatPayload) -> str:
+    return settings.AI_REASONER_MODEL if payload.deep_think else settings.AI_CHAT_MODEL
+
+
+def reply_cache_key(payload: AIChatPayload) -> str | None:
+    """Cache key for single-turn, risk-free questions; ``None`` means bypass."""
+    cache = get_reply_cache()
+    if cache is None:
+        return None
+    if len(payload.messages) != 1 or contains_risk(str(payload.messages[0].get("content", ""))):
+        cache.record_bypass()
+        return None
+    return make_key(
+        f"{payload.provider}:{select_model(payload)}", settings.AI_SYSTEM_PROMPT, payload.messages
+    )
+
+
+def _cached_reply(key: str | None) -> str | None:
+    return get_reply_cache().get(key) if key else None
+
+
+def _store_reply(key: str | None, reply: str) -> None:
+    if key and reply and not contains_risk(reply):
+        get_reply_cache().set(key, reply)
+
+
+async def _acached_reply(key: str | None) -> str | None:
+    return await get_reply_cache().aget(key) if key else None
+
+
+async def _astore_reply(key: str | None, reply: str) -> None:
+    if key and reply and not contains_risk(reply):
+        await get_reply_cache().aset(key, reply)
 
 
 def generate_ai_reply(payload: AIChatPayload) -> str:
-    model = settings.AI_REASONER_MODEL if payload.deep_think else settings.AI_CHAT_MODEL
-    return call_ai(
+    key = reply_cache_key(payload)
+    cached = _cached_reply(key)
+    if cached is not None:
+        return cached
+    reply = call_ai(
         payload.provider,
         build_messages(payload.messages),
-        model_override=model,
+        model_override=select_model(payload),
         max_tokens=settings.AI_MAX_TOKENS,
     )
+    _store_reply(key, reply)
+    return reply
 
 
-def log_chat(provider: str, user, messages: list[dict], reply: str, risk: bool) -> None:
-    ChatLog.objects.create(
-        provider=provider,
-        user=user,
-        messages_json=messages,
-        response_text=reply,
-        risk_flag=risk,
+async def agenerate_ai_reply(payload: AIChatPayload) -> str:
+    key = reply_cache_key(payload)
+    cached = await _acached_reply(key)
+    if cached is not None:
+        return cached
+    reply = await acall_ai(
+        payload.provider,
+        build_messages(payload.messages),
+        model_override=select_model(payload),
+        max_tokens=settings.AI_MAX_TOKENS,
     )
+    await _astore_reply(key, reply)
+    return reply
+
+
+def stream_ai_reply(payload: AIChatPayload) -> Iterator[str]:
+    key = reply_cache_key(payload)
+    cached = _cached_reply(key)
+    if cached is not None:
+        yield cached
+        return
+    parts = []
+    for piece in stream_ai(
+        payload.provider,
+        build_messages(payload.messages),
+        model_override=select_model(payload),
+        max_tokens=settings.AI_MAX_TOKENS,
+    ):
+        parts.append(piece)
+        yield piece
+    _store_reply(key, "".join(parts).strip())
+
+
+async def astream_ai_reply(payload: AIChatPayload) -> AsyncIterator[str]:
+    key = reply_cache_key(payload)
+    cached = await _acached_reply(key)
+    if cached is not None:
+        yield cached
+        return
+    parts = []
+    async for piece in astream_ai(
+        payload.provider,
+        build_messages(payload.messages),
+        model_override=select_model(payload),
+        max_tokens=settings.AI_MAX_TOKENS,
+    ):
+        parts.append(piece)
+        yield piece
+    await _astore_reply(key, "".join(parts).strip())
+
+
+def log_chat(
+    provider: str, user, messages: list[dict], reply: str, risk: bool, conversation_id: int | None = None
+) -> ChatLog:
+    """Record a chat turn and return its ``ChatLog``.
+
+    Risk-flagged turns are always written synchronously, so the returned row
+    has an id the escalation worker can stamp; other turns may still be
+    waiting in the buffered writer.
+    """
+    record = record_turn(provider, user, messages, reply, risk, conversation_id)
+    writer = None if risk else get_chat_log_writer()
+    if writer is None or not writer.enqueue(record):
+        save_turns([record])
+    return record
+
+
+async def alog_chat(
+    provider: str, user, messages: list[dict], reply: str, risk: bool, conversation_id: int | None = None
+) -> ChatLog:
+    record = await arecord_turn(provider, user, messages, reply, risk, conversation_id)
+    writer = None if risk else get_chat_log_writer()
+    if writer is None or not writer.enqueue(record):
+        await sync_to_async(save_turns)([record])
+    return record
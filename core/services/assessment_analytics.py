@@ -0,0 +1,153 @@
+"""Pre-aggregated assessment analytics.
+
+``AssessmentRollup`` counts submissions per assessment, month (site time
+zone), region (the submitter's profile province and city) and total score.
+Counts, means, score and result distributions and monthly trends on the
+staff dashboard are all derived from those rows, so the pages cost
+O(buckets) however many submissions exist.
+
+``refresh_rollups`` folds in submissions whose id is above a high-water mark
+kept in ``RollupWatermark``. It runs after each submission commits, after
+bulk imports, and from ``manage.py refresh_assessment_rollups``. The region
+is read when a submission is folded in. Deleted submissions stay counted
+until the next ``--rebuild``.
+"""
+from __future__ import annotations
+
+from dataclasses import dataclass
+
+from django.conf import settings
+from django.db import transaction
+from django.db.models import Count, DateField, F, Sum, Value
+from django.db.models.functions import Coalesce, TruncMonth
+
+from core.models import Assessment, AssessmentRollup, AssessmentSubmission, RollupWatermark
+from core.services.assessment_scoring import get_compiled
+
+WATERMARK = "assessment_rollups"
+BUCKET_FIELDS = ("assessment_id", "month", "province", "city", "total_score")
+
+
+def _buckets(lower: int, upper: int):
+    return (
+        AssessmentSubmission.objects.filter(id__gt=lower, id__lte=upper)
+        .order_by()
+        .values(
+            "assessment_id",
+            "total_score",
+            month=TruncMonth("created_at", output_field=DateField()),
+            province=Coalesce("user__profile__province", Value("")),
+            city=Coalesce("user__profile__city", Value("")),
+        )
+        .annotate(submissions=Count("id"))
+    )
+
+
+def _apply(buckets) -> None:
+    for bucket in buckets:
+        key = {name: bucket[name] for name in BUCKET_FIELDS}
+        updated = AssessmentRollup.objects.filter(**key).update(count=F("count") + bucket["submissions"])
+        if not updated:
+            AssessmentRollup.objects.create(count=bucket["submissions"], **key)
+
+
+def refresh_rollups(batch_size: int | None = None) -> int:
+    """Fold submissions above the watermark into the rollups; returns how many were added.
+
+    Each batch moves the watermark with a conditional UPDATE in the same
+    transaction as its increments, so concurrent refreshes never count a
+    submission twice: the one that loses the race stops.
+    """
+    batch_size = batch_size or settings.ASSESSMENT_ANALYTICS["BATCH_SIZE"]
+    folded = 0
+    while True:
+        with transaction.atomic():
+            mark, _ = RollupWatermark.objects.get_or_create(name=WATERMARK)
+            ids = list(
+                AssessmentSubmission.objects.filter(id__gt=mark.last_id)
+                .order_by("id")
+                .values_list("id", flat=True)[:batch_size]
+            )
+            if not ids:
+                return folded
+            claimed = RollupWatermark.objects.filter(name=WATERMARK, last_id=mark.last_id).update(
+                last_id=ids[-1]
+            )
+            if not claimed:
+                return folded
+            _apply(_buckets(mark.last_id, ids[-1]))
+        folded += len(ids)
+
+
+def rebuild_rollups() -> int:
+    with transaction.atomic():
+        AssessmentRollup.objects.all().delete()
+        RollupWatermark.objects.filter(name=WATERMARK).delete()
+        return refresh_rollups()
+
+
+@dataclass
+class AssessmentAnalytics:
+    total: int
+    mean: float | None
+    months: list[dict]
+    regions: list[dict]
+    scores: list[dict]
+    results: list[dict]
+    provinces: list[str]
+
+
+def _with_share(rows: list[dict]) -> list[dict]:
+    # share 为相对最大值的百分比，用作条形图宽度。
+    peak = max((row["count"] for row in rows), default=0)
+    for row in rows:
+        row["share"] = round(row["count"] * 100 / peak) if peak else 0
+    return rows
+
+
+def _summarize(rows, *fields) -> list[dict]:
+    summary = []
+    # 注解不能与字段 count 同名，否则 F("count") 会指向聚合结果。
+    for row in rows.values(*fields).annotate(
+        submissions=Sum("count"), score_sum=Sum(F("count") * F("total_score"))
+    ):
+        row["count"] = row.pop("submissions")
+        row["mean"] = row.pop("score_sum") / row["count"] if row["count"] else None
+        summary.append(row)
+    return summary
+
+
+def assessment_analytics(assessment: Assessment, province: str = "") -> AssessmentAnalytics:
+    """Dashboard figures for one assessment, optionally limited to a province."""
+    rollups = AssessmentRollup.objects.filter(assessment=assessment)
+    provinces = list(
+        rollups.exclude(province="").order_by("province").values_list("province", flat=True).distinct()
+    )
+    if province:
+        rollups = rollups.filter(province=province)
+    months = _summarize(rollups.order_by("month"), "month")
+    regions = sorted(_summarize(rollups.order_by(), "province", "city"), key=lambda row: -row["count"])
+    scores = [
+        {"total_score": score, "count": count}
+        for score, count in rollups.order_by("total_score")
+        .values("total_score")
+        .annotate(submissions=Sum("count"))
+        .values_list("total_score", "submissions")
+    ]
+    compiled = get_compiled(assessment)
+    results: dict[str, int] = {}
+    for row in scores:
+        result = compiled.result_for(row["total_score"])
+        title = result.title if result else "未分级"
+        results[title] = results.get(title, 0) + row["count"]
+    total = sum(row["count"] for row in scores)
+    score_sum = sum(row["count"] * row["total_score"] for row in scores)
+    return AssessmentAnalytics(
+        total=total,
+        mean=score_sum / total if total else None,
+        months=_with_share(months),
+        regions=_with_share(regions),
+        scores=_with_share(scores),
+        results=_with_share([{"title": title, "count": count} for title, count in results.items()]),
+        provinces=provinces,
+    )
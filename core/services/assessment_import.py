@@ -0,0 +1,257 @@
+"""Bulk import of paper assessment sheets collected at screening events.
+
+Each record names a user, an assessment slug and the chosen option of every
+question as its position on the sheet (1 = first option), in question order.
+CSV files have ``username``, ``assessment``, optional ``created_at`` and one
+``q1``, ``q2``, … column per question; JSONL lines carry the same keys with
+the positions in an ``answers`` list. Records are scored with
+``score_batch`` and written with ``bulk_create``, one transaction per chunk
+that also extends the users' score trends.
+"""
+from __future__ import annotations
+
+import csv
+import json
+import re
+from dataclasses import dataclass, field
+from datetime import datetime, time
+from itertools import islice
+from pathlib import Path
+from typing import Iterable, Iterator
+
+from django.contrib.auth import get_user_model
+from django.contrib.auth.hashers import make_password
+from django.db import transaction
+from django.utils import timezone
+from django.utils.dateparse import parse_date, parse_datetime
+
+from core.models import Assessment, AssessmentAnswer, AssessmentSubmission
+from core.services.assessment_analytics import refresh_rollups
+from core.services.assessment_scoring import (
+    DEFAULT_RESULT_SUMMARY,
+    DEFAULT_RESULT_TITLE,
+    CompiledAssessment,
+    get_compiled,
+    score_batch,
+)
+from core.services.assessment_trends import record_submissions
+
+ANSWER_COLUMN = re.compile(r"^q(\d+)$", re.IGNORECASE)
+
+
+@dataclass
+class ImportRecord:
+    line: int
+    username: str
+    assessment: str
+    answers: list[int | None]
+    created_at: datetime | None = None
+    error: str = ""
+
+
+@dataclass
+class ImportReport:
+    imported: int = 0
+    created_users: int = 0
+    errors: list[tuple[int, str]] = field(default_factory=list)
+
+
+def _position(value) -> int | None:
+    try:
+        return int(str(value).strip())
+    except (TypeError, ValueError):
+        return None
+
+
+def _timestamp(value) -> datetime | None:
+    """Parse an ISO date or datetime; naive values are in the site time zone."""
+    value = str(value or "").strip()
+    if not value:
+        return None
+    parsed = parse_datetime(value)
+    if parsed is None:
+        day = parse_date(value)
+        if day is None:
+            raise ValueError(f"无法识别的日期：{value}")
+        parsed = datetime.combine(day, time(12, 0))
+    if timezone.is_naive(parsed):
+        parsed = timezone.make_aware(parsed)
+    return parsed
+
+
+def _record(line: int, data: dict, answers: list, default_assessment: str) -> ImportRecord:
+    record = ImportRecord(
+        line=line,
+        username=str(data.get("username") or "").strip(),
+        assessment=str(data.get("assessment") or default_assessment or "").strip(),
+        answers=[_position(value) for value in answers],
+    )
+    try:
+        record.created_at = _timestamp(data.get("created_at"))
+    except ValueError as exc:
+        record.error = str(exc)
+    if not record.username:
+        record.error = "缺少 username"
+    elif not record.assessment:
+        record.error = "缺少 assessment"
+    return record
+
+
+def read_csv(path: Path, default_assessment: str = "") -> Iterator[ImportRecord]:
+    with path.open(newline="", encoding="utf-8-sig") as handle:
+        reader = csv.DictReader(handle)
+        columns = sorted(
+            (int(match.group(1)), name)
+            for name in reader.fieldnames or []
+            if (match := ANSWER_COLUMN.match(name.strip()))
+        )
+        for row in reader:
+            answers = [row[name] for _, name in columns]
+            # 纸质问卷题数可能少于表头列数，行尾的空列不算作答案。
+            while answers and not (answers[-1] or "").strip():
+                answers.pop()
+            yield _record(reader.line_num, row, answers, default_assessment)
+
+
+def read_jsonl(path: Path, default_assessment: str = "") -> Iterator[ImportRecord]:
+    with path.open(encoding="utf-8") as handle:
+        for line, text in enumerate(handle, start=1):
+            if not text.strip():
+                continue
+            try:
+                data = json.loads(text)
+                answers = list(data.get("answers") or [])
+            except (json.JSONDecodeError, AttributeError, TypeError):
+                yield ImportRecord(line, "", "", [], error="不是有效的 JSON 对象")
+                continue
+            yield _record(line, data, answers, default_assessment)
+
+
+def read_records(path: Path, default_assessment: str = "") -> Iterator[ImportRecord]:
+    reader = read_jsonl if path.suffix.lower() in (".jsonl", ".ndjson") else read_csv
+    return reader(path, default_assessment)
+
+
+class _Importer:
+    def __init__(self, create_users: bool, dry_run: bool):
+        self.create_users = create_users
+        self.dry_run = dry_run
+        self.report = ImportReport()
+        self.assessments: dict[str, tuple[Assessment, CompiledAssessment] | None] = {}
+
+    def _load_assessments(self, slugs: set[str]) -> None:
+        missing = slugs - self.assessments.keys()
+        if not missing:
+            return
+        found = {item.slug: item for item in Assessment.objects.filter(slug__in=missing)}
+        for slug in missing:
+            assessment = found.get(slug)
+            self.assessments[slug] = (assessment, get_compiled(assessment)) if assessment else None
+
+    def _load_users(self, usernames: set[str]) -> dict[str, int]:
+        User = get_user_model()
+        users = dict(User.objects.filter(username__in=usernames).values_list("username", "id"))
+        unknown = usernames - users.keys()
+        if not unknown or not self.create_users:
+            return users
+        if self.dry_run:
+            users.update(dict.fromkeys(unknown))
+        else:
+            # 现场筛查的参与者不一定注册过；建立无法登录的账号，之后可由工作人员重设密码。
+            User.objects.bulk_create(
+                [User(username=name, password=make_password(None)) for name in sorted(unknown)],
+                ignore_conflicts=True,
+            )
+            users.update(User.objects.filter(username__in=unknown).values_list("username", "id"))
+        self.report.created_users += len(unknown)
+        return users
+
+    def _fail(self, record: ImportRecord, message: str) -> None:
+        self.report.errors.append((record.line, message))
+
+    def run_chunk(self, records: list[ImportRecord]) -> None:
+        valid = []
+        for record in records:
+            if record.error:
+                self._fail(record, record.error)
+            else:
+                valid.append(record)
+        self._load_assessments({record.assessment for record in valid})
+        users = self._load_users({record.username for record in valid})
+
+        groups: dict[str, list[ImportRecord]] = {}
+        for record in valid:
+            if self.assessments[record.assessment] is None:
+                self._fail(record, f"找不到量表：{record.assessment}")
+            elif record.username not in users:
+                self._fail(record, f"找不到用户：{record.username}")
+            else:
+                groups.setdefault(record.assessment, []).append(record)
+
+        submissions: list[AssessmentSubmission] = []
+        choices: list[list] = []
+        now = timezone.now()
+        for slug, group in groups.items():
+            assessment, compiled = self.assessments[slug]
+            scores = score_batch(compiled, [record.answers for record in group])
+            for index, record in enumerate(group):
+                if index in scores.errors:
+                    self._fail(record, scores.errors[index])
+                    continue
+                result = scores.results[index]
+                submissions.append(
+                    AssessmentSubmission(
+                        assessment=assessment,
+                        user_id=users[record.username],
+                        total_score=scores.totals[index],
+                        result_title=result.title if result else DEFAULT_RESULT_TITLE,
+                        result_summary=result.summary if result else DEFAULT_RESULT_SUMMARY,
+                        result_advice=result.advice if result else "",
+                        created_at=record.created_at or now,
+                    )
+                )
+                choices.append(
+                    [
+                        compiled.option_at(question_index, position)
+                        for question_index, position in enumerate(record.answers)
+                    ]
+                )
+        if submissions and not self.dry_run:
+            with transaction.atomic():
+                AssessmentSubmission.objects.bulk_create(submissions)
+                AssessmentAnswer.objects.bulk_create(
+                    [
+                        AssessmentAnswer(
+                            submission_id=submission.pk,
+                            question_id=option.question_id,
+                            option_id=option.id,
+                            score=option.score,
+                        )
+                        for submission, options in zip(submissions, choices)
+                        for option in options
+                    ],
+                    batch_size=1000,
+                )
+                record_submissions(submissions)
+        self.report.imported += len(submissions)
+
+
+def import_submissions(
+    records: Iterable[ImportRecord],
+    chunk_size: int = 500,
+    create_users: bool = False,
+    dry_run: bool = False,
+) -> ImportReport:
+    """Score and store ``records``; invalid records are skipped and reported by line.
+
+    Each chunk is committed on its own, so an interrupted import keeps the
+    chunks already written.
+    """
+    importer = _Importer(create_users=create_users, dry_run=dry_run)
+    records = iter(records)
+    while chunk := list(islice(records, chunk_size)):
+        importer.run_chunk(chunk)
+    if importer.report.imported and not dry_run:
+        # bulk_create 不触发保存信号，导入结束后统一汇总一次。
+        refresh_rollups()
+    return importer.report
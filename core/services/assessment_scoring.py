@@ -1,10 +1,51 @@
+"""Assessment scoring from compiled, cached definitions.
+
+Questions, options and result ranges are read once per definition version
+and compiled into lookup tables; scoring a submission then runs no
+definition queries. ``Assessment.definition_version`` is replaced whenever
+the assessment or one of its questions, options or results is saved or
+deleted (see ``core.signals``), so every process notices an admin edit the
+next time it loads the assessment row.
+"""
 from __future__ import annotations
 
+import threading
+import time
+from bisect import bisect_left, bisect_right
 from dataclasses import dataclass
+from itertools import accumulate
+from operator import add
+from typing import Sequence
+
+from core.models import Assessment, AssessmentOption, AssessmentQuestion, AssessmentResult
+
+INVALID_OPTION = "提交包含无效选项"
+DEFAULT_RESULT_TITLE = "评估结果"
+DEFAULT_RESULT_SUMMARY = "请结合自身情况，选择合适的放松与支持方式。"
+
+
+@dataclass(frozen=True)
+class CompiledOption:
+    id: int
+    question_id: int
+    text: str
+    score: int
+
 
-from django.db.models import QuerySet
+@dataclass(frozen=True)
+class CompiledQuestion:
+    id: int
+    text: str
+    options: tuple[CompiledOption, ...]
 
-from core.models import Assessment, AssessmentOption, AssessmentResult
+
+@dataclass(frozen=True)
+class CompiledResult:
+    min_score: int
+    max_score: int
+    title: str
+    summary: str
+    advice: str
 
 
 @dataclass
@@ -13,43 +54,180 @@ class AssessmentScoreResult:
     result_title: str
     result_summary: str
     result_advice: str
-    option_map: dict[int, AssessmentOption]
+    option_map: dict[int, CompiledOption]
 
 
-def score_assessment(assessment: Assessment, selected: dict[str, str]) -> AssessmentScoreResult:
-    option_ids = list(selected.values())
-    options = {
-        option.id: option
-        for option in AssessmentOption.objects.filter(
-            id__in=option_ids, question__assessment=assessment
-        ).select_related("question")
-    }
-    if len(options) != len(option_ids):
-        raise ValueError("提交包含无效选项")
-
-    total_score = 0
-    for question in assessment.questions.all():
-        option_id = selected.get(str(question.id))
-        option = options.get(int(option_id)) if option_id else None
-        if not option or option.question_id != question.id:
-            raise ValueError("提交包含无效选项")
-        total_score += option.score
-
-    result = (
-        AssessmentResult.objects.filter(
-            assessment=assessment, min_score__lte=total_score, max_score__gte=total_score
+def _option_id(value) -> int | None:
+    try:
+        return int(value)
+    except (TypeError, ValueError):
+        return None
+
+
+class CompiledAssessment:
+    """Read-only scoring tables for one version of an assessment."""
+
+    def __init__(self, assessment_id: int, version: int, questions, results):
+        self.assessment_id = assessment_id
+        self.version = version
+        self.questions: tuple[CompiledQuestion, ...] = tuple(questions)
+        self.options = {option.id: option for question in self.questions for option in question.options}
+        # 题目 → 合法选项 → 分值。
+        self.scores = {
+            question.id: {option.id: option.score for option in question.options}
+            for question in self.questions
+        }
+        # 按题目顺序，选项序号（从 1 开始，即纸质问卷上的第几项）→ 分值，供批量评分按列查表。
+        self.position_scores = [
+            {position: option.score for position, option in enumerate(question.options, start=1)}
+            for question in self.questions
+        ]
+        self.results: tuple[CompiledResult, ...] = tuple(sorted(results, key=lambda item: item.min_score))
+        self._starts = [result.min_score for result in self.results]
+        # 前缀最大 max_score：与原查询一样，在所有覆盖该分数的区间里取 min_score 最小的一个。
+        self._reach = list(accumulate((result.max_score for result in self.results), max))
+
+    def tier_for(self, total: int) -> int:
+        """1-based position of the result range for ``total``; 0 when none covers it."""
+        end = bisect_right(self._starts, total)
+        index = bisect_left(self._reach, total, 0, end)
+        return index + 1 if index < end else 0
+
+    def result_for(self, total: int) -> CompiledResult | None:
+        tier = self.tier_for(total)
+        return self.results[tier - 1] if tier else None
+
+    @property
+    def max_score(self) -> int:
+        return sum(max((option.score for option in question.options), default=0) for question in self.questions)
+
+    def option_at(self, question_index: int, position: int) -> CompiledOption:
+        return self.questions[question_index].options[position - 1]
+
+    def select(self, selected: dict[str, str]) -> dict[int, CompiledOption]:
+        """Validate ``{question_id: option_id}`` and return the chosen options by id."""
+        chosen = {}
+        for value in selected.values():
+            option = self.options.get(_option_id(value))
+            if option is None or option.id in chosen:
+                raise ValueError(INVALID_OPTION)
+            chosen[option.id] = option
+        for question in self.questions:
+            option = self.options.get(_option_id(selected.get(str(question.id))))
+            if option is None or option.question_id != question.id:
+                raise ValueError(INVALID_OPTION)
+        return chosen
+
+    def score(self, selected: dict[str, str]) -> AssessmentScoreResult:
+        options = self.select(selected)
+        total_score = sum(
+            self.scores[question.id][int(selected[str(question.id)])] for question in self.questions
         )
-        .order_by("min_score")
-        .first()
-    )
-    result_title = result.title if result else "评估结果"
-    result_summary = result.summary if result else "请结合自身情况，选择合适的放松与支持方式。"
-    result_advice = result.advice if result else ""
-
-    return AssessmentScoreResult(
-        total_score=total_score,
-        result_title=result_title,
-        result_summary=result_summary,
-        result_advice=result_advice,
-        option_map=options,
+        result = self.result_for(total_score)
+        return AssessmentScoreResult(
+            total_score=total_score,
+            result_title=result.title if result else DEFAULT_RESULT_TITLE,
+            result_summary=result.summary if result else DEFAULT_RESULT_SUMMARY,
+            result_advice=result.advice if result else "",
+            option_map=options,
+        )
+
+
+def compile_assessment(assessment_id: int, version: int) -> CompiledAssessment:
+    options: dict[int, list[CompiledOption]] = {}
+    rows = AssessmentOption.objects.filter(question__assessment_id=assessment_id).values_list(
+        "id", "question_id", "text", "score"
     )
+    for row in rows.order_by("order", "id"):
+        options.setdefault(row[1], []).append(CompiledOption(*row))
+    questions = [
+        CompiledQuestion(question_id, text, tuple(options.get(question_id, ())))
+        for question_id, text in AssessmentQuestion.objects.filter(assessment_id=assessment_id)
+        .order_by("order", "id")
+        .values_list("id", "text")
+    ]
+    results = [
+        CompiledResult(*row)
+        for row in AssessmentResult.objects.filter(assessment_id=assessment_id)
+        .order_by("min_score", "id")
+        .values_list("min_score", "max_score", "title", "summary", "advice")
+    ]
+    return CompiledAssessment(assessment_id, version, questions, results)
+
+
+_compiled: dict[int, CompiledAssessment] = {}
+_compiled_lock = threading.Lock()
+
+
+def get_compiled(assessment: Assessment) -> CompiledAssessment:
+    """Compiled definition for ``assessment``, rebuilt when its version changed."""
+    compiled = _compiled.get(assessment.pk)
+    if compiled is None or compiled.version != assessment.definition_version:
+        compiled = compile_assessment(assessment.pk, assessment.definition_version)
+        with _compiled_lock:
+            _compiled[assessment.pk] = compiled
+    return compiled
+
+
+def reset_compiled_assessments() -> None:
+    with _compiled_lock:
+        _compiled.clear()
+
+
+def new_definition_version() -> int:
+    # 用时间戳而不是自增：数据重建后重用的主键也不会撞上进程里旧的编译结果。
+    return time.time_ns()
+
+
+def touch_definition(**filters) -> None:
+    """Give the matching assessments a new definition version."""
+    Assessment.objects.filter(**filters).update(definition_version=new_definition_version())
+
+
+def score_assessment(assessment: Assessment, selected: dict[str, str]) -> AssessmentScoreResult:
+    return get_compiled(assessment).score(selected)
+
+
+@dataclass
+class BatchScores:
+    totals: list[int | None]
+    results: list[CompiledResult | None]
+    # 行号（从 0 开始）→ 无效原因；无效行的 total 与 result 为 None。
+    errors: dict[int, str]
+
+
+def score_batch(compiled: CompiledAssessment, answers: Sequence[Sequence[int | None]]) -> BatchScores:
+    """Score many submissions given as option positions (1 = first option) in question order.
+
+    Works a question at a time: each answer column is mapped through that
+    question's position → score table and added to the running totals, and
+    result ranges are looked up once per distinct total.
+    """
+    expected = len(compiled.questions)
+    errors = {
+        index: f"应有 {expected} 个答案，实际为 {len(row)} 个"
+        for index, row in enumerate(answers)
+        if len(row) != expected
+    }
+    blank = (None,) * expected
+    columns = zip(*(blank if index in errors else row for index, row in enumerate(answers)))
+    totals: list[int] = [0] * len(answers)
+    for number, (table, column) in enumerate(zip(compiled.position_scores, columns), start=1):
+        scores = list(map(table.get, column))
+        if None in scores:
+            for index, score in enumerate(scores):
+                if score is None:
+                    errors.setdefault(index, f"第 {number} 题的答案无效")
+        totals = list(map(add, totals, (score or 0 for score in scores)))
+
+    ranges: dict[int, CompiledResult | None] = {}
+    results: list[CompiledResult | None] = []
+    for index, total in enumerate(totals):
+        if index in errors:
+            totals[index] = None
+            results.append(None)
+            continue
+        if total not in ranges:
+            ranges[total] = compiled.result_for(total)
+        results.append(ranges[total])
+    return BatchScores(totals=totals, results=results, errors=errors)
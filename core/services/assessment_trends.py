@@ -0,0 +1,179 @@
+"""Per-user assessment score series.
+
+``AssessmentTrend`` keeps every submission of one user for one assessment as
+a compact ``[timestamp, score, tier, submission_id]`` point, sorted by time,
+together with change flags for the latest point. Submissions are merged in
+once their transaction commits or when they are imported, and removed when
+deleted (see ``core.signals``), so trend charts and "worsened" lists never
+scan ``AssessmentSubmission``.
+"""
+from __future__ import annotations
+
+from dataclasses import dataclass
+from datetime import datetime, timezone as dt_timezone
+from typing import Iterable
+
+from django.conf import settings
+from django.db import transaction
+from django.utils import timezone
+
+from core.models import Assessment, AssessmentSubmission, AssessmentTrend
+from core.services.assessment_scoring import CompiledAssessment, get_compiled
+
+FLAG_FIELDS = [
+    "points",
+    "last_score",
+    "last_at",
+    "delta",
+    "worsened",
+    "improved",
+    "tier_change",
+    "updated_at",
+]
+
+
+def _point(submission: AssessmentSubmission, compiled: CompiledAssessment) -> list[int]:
+    return [
+        int(submission.created_at.timestamp()),
+        submission.total_score,
+        compiled.tier_for(submission.total_score),
+        submission.pk,
+    ]
+
+
+def _refresh_flags(trend: AssessmentTrend) -> None:
+    config = settings.ASSESSMENT_TRENDS
+    limit = config["MAX_POINTS"]
+    points = sorted(trend.points, key=lambda point: (point[0], point[3]))
+    trend.points = points[-limit:] if limit else points
+    trend.last_score = trend.last_at = trend.delta = None
+    trend.worsened = trend.improved = False
+    trend.tier_change = 0
+    if not trend.points:
+        return
+    timestamp, score, tier, _ = trend.points[-1]
+    trend.last_score = score
+    trend.last_at = datetime.fromtimestamp(timestamp, tz=dt_timezone.utc)
+    if len(trend.points) < 2:
+        return
+    _, previous_score, previous_tier, _ = trend.points[-2]
+    trend.delta = score - previous_score
+    # 分数越高表示状况越差：升高达到阈值记为“加重”，降低达到阈值记为“好转”。
+    trend.worsened = trend.delta >= config["CHANGE_THRESHOLD"]
+    trend.improved = -trend.delta >= config["CHANGE_THRESHOLD"]
+    trend.tier_change = tier - previous_tier if tier and previous_tier else 0
+
+
+def record_submissions(submissions: Iterable[AssessmentSubmission]) -> int:
+    """Merge saved submissions into their users' trends; returns how many trends changed."""
+    groups: dict[tuple[int, int], list[AssessmentSubmission]] = {}
+    for submission in submissions:
+        groups.setdefault((submission.user_id, submission.assessment_id), []).append(submission)
+    if not groups:
+        return 0
+    assessments = Assessment.objects.in_bulk({assessment_id for _, assessment_id in groups})
+    compiled = {pk: get_compiled(assessment) for pk, assessment in assessments.items()}
+    user_ids = {user_id for user_id, _ in groups}
+    with transaction.atomic():
+        # 先插入缺失的空序列，再统一加行锁读取，并发提交不会互相覆盖。
+        AssessmentTrend.objects.bulk_create(
+            [AssessmentTrend(user_id=user_id, assessment_id=assessment_id) for user_id, assessment_id in groups],
+            ignore_conflicts=True,
+        )
+        trends = [
+            trend
+            for trend in AssessmentTrend.objects.select_for_update().filter(
+                user_id__in=user_ids, assessment_id__in=assessments.keys()
+            )
+            if (trend.user_id, trend.assessment_id) in groups
+        ]
+        for trend in trends:
+            known = {point[3] for point in trend.points}
+            trend.points = trend.points + [
+                _point(submission, compiled[trend.assessment_id])
+                for submission in groups[(trend.user_id, trend.assessment_id)]
+                if submission.pk not in known
+            ]
+            _refresh_flags(trend)
+            trend.updated_at = timezone.now()
+        AssessmentTrend.objects.bulk_update(trends, FLAG_FIELDS, batch_size=500)
+    return len(trends)
+
+
+def remove_submission(submission: AssessmentSubmission) -> None:
+    with transaction.atomic():
+        trend = (
+            AssessmentTrend.objects.select_for_update()
+            .filter(user_id=submission.user_id, assessment_id=submission.assessment_id)
+            .first()
+        )
+        if trend is None:
+            return
+        trend.points = [point for point in trend.points if point[3] != submission.pk]
+        if not trend.points:
+            trend.delete()
+            return
+        _refresh_flags(trend)
+        trend.save(update_fields=FLAG_FIELDS)
+
+
+def rebuild_trends(chunk_size: int = 2000) -> int:
+    """Recompute every trend from the submissions; returns the number of submissions read."""
+    with transaction.atomic():
+        AssessmentTrend.objects.all().delete()
+        last_id = 0
+        total = 0
+        while True:
+            chunk = list(
+                AssessmentSubmission.objects.filter(id__gt=last_id)
+                .order_by("id")
+                .only("id", "user_id", "assessment_id", "total_score", "created_at")[:chunk_size]
+            )
+            if not chunk:
+                return total
+            record_submissions(chunk)
+            last_id = chunk[-1].id
+            total += len(chunk)
+
+
+@dataclass
+class TrendChart:
+    width: int
+    height: int
+    # SVG polyline 的 points 属性，以及每个点的坐标与提示信息。
+    polyline: str
+    markers: list[dict]
+    max_score: int
+
+
+def trend_chart(trend: AssessmentTrend, width: int = 320, height: int = 120, pad: int = 10) -> TrendChart:
+    """Lay out ``trend.points`` on an SVG canvas: time on x, score on y (higher is worse)."""
+    compiled = get_compiled(trend.assessment)
+    points = trend.points
+    top = max([compiled.max_score] + [point[1] for point in points]) or 1
+    first, last = (points[0][0], points[-1][0]) if points else (0, 0)
+    span = last - first
+    markers = []
+    for index, (timestamp, score, tier, submission_id) in enumerate(points):
+        if span:
+            x = pad + (timestamp - first) * (width - 2 * pad) / span
+        else:
+            x = pad + index * (width - 2 * pad) / max(len(points) - 1, 1)
+        y = height - pad - score * (height - 2 * pad) / top
+        markers.append(
+            {
+                "x": round(x, 1),
+                "y": round(y, 1),
+                "score": score,
+                "tier": tier,
+                "submission_id": submission_id,
+                "at": datetime.fromtimestamp(timestamp, tz=dt_timezone.utc),
+            }
+        )
+    return TrendChart(
+        width=width,
+        height=height,
+        polyline=" ".join(f"{marker['x']},{marker['y']}" for marker in markers),
+        markers=markers,
+        max_score=top,
+    )
@@ -0,0 +1,335 @@
+"""Append-only, compressed segment files for historical ChatLog rows.
+
+Segment layout::
+
+    MAGIC
+    block*        each block = zlib(meta columns JSON) + zlib(body columns JSON)
+    footer        zlib(JSON list of per-block offsets and statistics)
+    footer length (8 bytes, big endian) + MAGIC
+
+Rows are sorted by (user, created_at, id) before they are cut into blocks, so
+one user's turns sit next to each other. Each turn's ``messages_json`` is
+stored as a reference to the previous turn of the same user in the block
+(its messages plus its reply) and only the messages that were not already
+there. The footer keeps per-block time range, user ids and risk counts,
+so readers skip blocks without decompressing them, and they only inflate the
+body columns of a block when at least one of its rows passed the filter.
+Turns keep their ``conversation_id``; segments written before that column
+existed read back with ``None``.
+"""
+from __future__ import annotations
+
+import json
+import os
+import struct
+import zlib
+from dataclasses import dataclass
+from datetime import datetime, timezone as dt_timezone
+from pathlib import Path
+from typing import Iterator
+
+from django.conf import settings
+
+from core.models import ChatLog
+from core.services.conversations import delete_finished_conversations
+
+MAGIC = b"CHATSEG1"
+SUFFIX = ".chatseg"
+META_COLUMNS = ("id", "user_id", "conversation_id", "created_at", "risk_flag", "provider")
+BODY_COLUMNS = ("ref", "start", "tail", "response")
+_FOOTER_SIZE = struct.Struct(">Q")
+
+
+@dataclass
+class ArchivedChatLog:
+    id: int
+    provider: str
+    user_id: int | None
+    conversation_id: int | None
+    messages: list[dict]
+    response_text: str
+    risk_flag: bool
+    created_at: datetime
+
+
+def _to_micros(value: datetime) -> int:
+    return int(value.timestamp() * 1_000_000)
+
+
+def _from_micros(value: int) -> datetime:
+    return datetime.fromtimestamp(value / 1_000_000, tz=dt_timezone.utc)
+
+
+def _pack(columns: dict) -> bytes:
+    raw = json.dumps(columns, ensure_ascii=False, separators=(",", ":")).encode("utf-8")
+    return zlib.compress(raw, 9)
+
+
+def _unpack(data: bytes) -> dict:
+    return json.loads(zlib.decompress(data).decode("utf-8"))
+
+
+def _context(messages: list[dict], response: str) -> list[dict]:
+    """What the next turn of the same conversation is expected to start with."""
+    if not isinstance(messages, list):
+        return []
+    return messages + [{"role": "assistant", "content": response}]
+
+
+def _overlap(previous: list[dict], current: list[dict]) -> tuple[int, int]:
+    """Longest ``previous[start:]`` that is a prefix of ``current``.
+
+    ``messages_json`` is a sliding window of ``CHAT_HISTORY_LIMIT`` messages,
+    so the shared part is a suffix of the previous turn, not all of it.
+    Returns ``(start, length)``; ``length == 0`` means nothing is shared.
+    """
+    for start in range(len(previous)):
+        length = len(previous) - start
+        if length <= len(current) and previous[start:] == current[:length]:
+            return start, length
+    return 0, 0
+
+
+class _BlockEncoder:
+    def __init__(self):
+        self.meta = {name: [] for name in META_COLUMNS}
+        self.body = {name: [] for name in BODY_COLUMNS}
+        self._last_by_user: dict[int | None, tuple[int, list[dict]]] = {}
+
+    def __len__(self) -> int:
+        return len(self.meta["id"])
+
+    def add(self, row: dict) -> None:
+        index = len(self)
+        messages = row["messages_json"]
+        ref, start, shared = -1, 0, 0
+        previous = self._last_by_user.get(row["user_id"])
+        if previous is not None and isinstance(messages, list):
+            start, shared = _overlap(previous[1], messages)
+            if shared:
+                ref = previous[0]
+        self.meta["id"].append(row["id"])
+        self.meta["user_id"].append(row["user_id"])
+        self.meta["conversation_id"].append(row["conversation_id"])
+        self.meta["created_at"].append(_to_micros(row["created_at"]))
+        self.meta["risk_flag"].append(1 if row["risk_flag"] else 0)
+        self.meta["provider"].append(row["provider"])
+        self.body["ref"].append(ref)
+        self.body["start"].append(start)
+        self.body["tail"].append(messages[shared:] if shared else messages)
+        self.body["response"].append(row["response_text"])
+        self._last_by_user[row["user_id"]] = (index, _context(messages, row["response_text"]))
+
+    def encode(self) -> tuple[bytes, bytes, dict]:
+        created = self.meta["created_at"]
+        stats = {
+            "rows": len(self),
+            "min_created": min(created),
+            "max_created": max(created),
+            "users": sorted({uid for uid in self.meta["user_id"] if uid is not None}),
+            "risk_rows": sum(self.meta["risk_flag"]),
+            "min_id": min(self.meta["id"]),
+            "max_id": max(self.meta["id"]),
+        }
+        return _pack(self.meta), _pack(self.body), stats
+
+
+class SegmentWriter:
+    """Writes one segment file; rows must arrive sorted by (user, created_at, id).
+
+    Data is written to a temporary file and renamed into place by ``close()``,
+    so a segment either exists completely or not at all.
+    """
+
+    def __init__(self, path: Path, block_rows: int = 512):
+        self.path = Path(path)
+        self.block_rows = block_rows
+        self.rows = 0
+        self.ids: list[int] = []
+        self._tmp = self.path.with_name(self.path.name + ".tmp")
+        self._file = open(self._tmp, "wb")
+        self._file.write(MAGIC)
+        self._blocks: list[dict] = []
+        self._block = _BlockEncoder()
+
+    def write(self, row: dict) -> None:
+        self._block.add(row)
+        self.ids.append(row["id"])
+        self.rows += 1
+        if len(self._block) >= self.block_rows:
+            self._flush_block()
+
+    def _flush_block(self) -> None:
+        if not len(self._block):
+            return
+        meta, body, stats = self._block.encode()
+        stats.update(offset=self._file.tell(), meta_length=len(meta), body_length=len(body))
+        self._file.write(meta)
+        self._file.write(body)
+        self._blocks.append(stats)
+        self._block = _BlockEncoder()
+
+    def close(self) -> Path:
+        self._flush_block()
+        footer = _pack({"version": 1, "blocks": self._blocks})
+        self._file.write(footer)
+        self._file.write(_FOOTER_SIZE.pack(len(footer)))
+        self._file.write(MAGIC)
+        self._file.flush()
+        os.fsync(self._file.fileno())
+        self._file.close()
+        os.replace(self._tmp, self.path)
+        return self.path
+
+    def abort(self) -> None:
+        self._file.close()
+        self._tmp.unlink(missing_ok=True)
+
+
+class Segment:
+    """Random-access reader for one segment file; holds at most one block in memory."""
+
+    def __init__(self, path: Path):
+        self.path = Path(path)
+        with open(self.path, "rb") as handle:
+            if handle.read(len(MAGIC)) != MAGIC:
+                raise ValueError(f"不是对话归档文件：{self.path}")
+            tail_size = _FOOTER_SIZE.size + len(MAGIC)
+            handle.seek(-tail_size, os.SEEK_END)
+            tail = handle.read(tail_size)
+            if tail[_FOOTER_SIZE.size :] != MAGIC:
+                raise ValueError(f"对话归档文件不完整：{self.path}")
+            (footer_length,) = _FOOTER_SIZE.unpack(tail[: _FOOTER_SIZE.size])
+            handle.seek(-(tail_size + footer_length), os.SEEK_END)
+            self.blocks: list[dict] = _unpack(handle.read(footer_length))["blocks"]
+
+    @property
+    def rows(self) -> int:
+        return sum(block["rows"] for block in self.blocks)
+
+    @staticmethod
+    def _block_may_match(block, user_id, since, until, risk_flag) -> bool:
+        if since is not None and block["max_created"] < since:
+            return False
+        if until is not None and block["min_created"] >= until:
+            return False
+        if risk_flag is True and not block["risk_rows"]:
+            return False
+        if risk_flag is False and block["risk_rows"] == block["rows"]:
+            return False
+        if user_id is not None and user_id not in block["users"]:
+            return False
+        return True
+
+    def iter_logs(
+        self,
+        user_id: int | None = None,
+        since: datetime | None = None,
+        until: datetime | None = None,
+        risk_flag: bool | None = None,
+    ) -> Iterator[ArchivedChatLog]:
+        """Yield rows matching every given filter; ``until`` is exclusive."""
+        since_us = _to_micros(since) if since is not None else None
+        until_us = _to_micros(until) if until is not None else None
+        with open(self.path, "rb") as handle:
+            for block in self.blocks:
+                if not self._block_may_match(block, user_id, since_us, until_us, risk_flag):
+                    continue
+                handle.seek(block["offset"])
+                meta = _unpack(handle.read(block["meta_length"]))
+                wanted = [
+                    index
+                    for index in range(block["rows"])
+                    if (user_id is None or meta["user_id"][index] == user_id)
+                    and (since_us is None or meta["created_at"][index] >= since_us)
+                    and (until_us is None or meta["created_at"][index] < until_us)
+                    and (risk_flag is None or bool(meta["risk_flag"][index]) == risk_flag)
+                ]
+                if not wanted:
+                    continue
+                body = _unpack(handle.read(block["body_length"]))
+                yield from self._decode(meta, body, wanted)
+
+    @staticmethod
+    def _decode(meta: dict, body: dict, wanted: list[int]) -> Iterator[ArchivedChatLog]:
+        # 引用总是指向同一用户的上一行，所以每个用户只需保留最近一轮的上下文。
+        contexts: dict[int | None, list[dict]] = {}
+        wanted_set = set(wanted)
+        conversation_ids = meta.get("conversation_id") or [None] * len(meta["id"])
+        for index in range(max(wanted) + 1):
+            user_id = meta["user_id"][index]
+            if body["ref"][index] >= 0:
+                messages = contexts[user_id][body["start"][index] :] + body["tail"][index]
+            else:
+                messages = body["tail"][index]
+            response = body["response"][index]
+            contexts[user_id] = _context(messages, response)
+            if index in wanted_set:
+                yield ArchivedChatLog(
+                    id=meta["id"][index],
+                    provider=meta["provider"][index],
+                    user_id=meta["user_id"][index],
+                    conversation_id=conversation_ids[index],
+                    messages=messages,
+                    response_text=response,
+                    risk_flag=bool(meta["risk_flag"][index]),
+                    created_at=_from_micros(meta["created_at"][index]),
+                )
+
+
+def archive_dir() -> Path:
+    return Path(settings.CHATLOG_ARCHIVE["DIR"])
+
+
+def list_segments(directory: Path | None = None) -> list[Path]:
+    directory = Path(directory or archive_dir())
+    return sorted(directory.glob(f"*{SUFFIX}")) if directory.exists() else []
+
+
+def iter_archived_logs(directory: Path | None = None, **filters) -> Iterator[ArchivedChatLog]:
+    """Stream matching rows from every segment in ``directory``, oldest segment first."""
+    for path in list_segments(directory):
+        yield from Segment(path).iter_logs(**filters)
+
+
+def archive_chat_logs(
+    before: datetime,
+    directory: Path | None = None,
+    block_rows: int | None = None,
+    delete: bool = True,
+    chunk_size: int = 1000,
+) -> tuple[Path | None, int]:
+    """Move ``ChatLog`` rows older than ``before`` into a new segment file.
+
+    Rows are deleted from the database only after the segment has been fully
+    written and renamed into place, in chunks of ``chunk_size``, followed by
+    the conversations that no longer have turns. Returns
+    ``(segment path, rows archived)``.
+    """
+    directory = Path(directory or archive_dir())
+    directory.mkdir(parents=True, exist_ok=True)
+    block_rows = block_rows or settings.CHATLOG_ARCHIVE.get("BLOCK_ROWS", 512)
+    rows = (
+        ChatLog.objects.filter(created_at__lt=before)
+        .order_by("user_id", "created_at", "id")
+        .values(
+            "id", "provider", "user_id", "conversation_id", "messages_json", "response_text", "risk_flag", "created_at"
+        )
+    )
+    path = directory / f"chatlog-{before:%Y%m%d%H%M%S}-{os.getpid()}{SUFFIX}"
+    writer = SegmentWriter(path, block_rows=block_rows)
+    try:
+        for row in rows.iterator(chunk_size=chunk_size):
+            writer.write(row)
+    except BaseException:
+        writer.abort()
+        raise
+    if not writer.rows:
+        writer.abort()
+        return None, 0
+    writer.close()
+    if delete:
+        for offset in range(0, len(writer.ids), chunk_size):
+            ChatLog.objects.filter(id__in=writer.ids[offset : offset + chunk_size]).delete()
+        delete_finished_conversations(before, chunk_size=chunk_size)
+    return path, writer.rows
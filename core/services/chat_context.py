@@ -0,0 +1,83 @@
+"""Token estimates and token-budgeted history trimming for AI requests."""
+from __future__ import annotations
+
+import math
+import re
+
+from django.conf import settings
+
+# 中日韩文字、全角标点：按字计；其余字符（英文、数字、空格）按字符比例折算。
+_CJK = re.compile(
+    "[\u3000-\u303f\u3040-\u30ff\u3400-\u4dbf\u4e00-\u9fff"
+    "\uac00-\ud7af\uf900-\ufaff\uff00-\uffef]"
+)
+SUMMARY_PREFIX = "此前对话摘要（较早的内容已省略）："
+SUMMARY_ITEM_CHARS = 40
+
+
+def estimate_tokens(text: str) -> int:
+    """Rough provider-agnostic token count: CJK characters cost more than ASCII."""
+    if not text:
+        return 0
+    config = settings.AI_CONTEXT
+    cjk = len(_CJK.findall(text))
+    other = len(text) - cjk
+    return math.ceil(cjk * config["CJK_TOKENS_PER_CHAR"] + other * config["OTHER_TOKENS_PER_CHAR"])
+
+
+def message_tokens(message: dict) -> int:
+    return estimate_tokens(str(message.get("content", ""))) + settings.AI_CONTEXT["MESSAGE_OVERHEAD_TOKENS"]
+
+
+def _take_newest(messages: list[dict], budget: int) -> list[dict]:
+    kept: list[dict] = []
+    used = 0
+    for message in reversed(messages):
+        cost = message_tokens(message)
+        # 最新一条总是保留，超长输入已由 AI_MAX_INPUT_CHARS 限制。
+        if kept and used + cost > budget:
+            break
+        kept.append(message)
+        used += cost
+    kept.reverse()
+    while len(kept) > 1 and kept[0].get("role") != "user":
+        kept.pop(0)
+    return kept
+
+
+def summarize(messages: list[dict], budget: int) -> dict | None:
+    """Extractive note listing the user's earlier points, newest kept first."""
+    overhead = estimate_tokens(SUMMARY_PREFIX) + settings.AI_CONTEXT["MESSAGE_OVERHEAD_TOKENS"]
+    points: list[str] = []
+    used = overhead
+    for message in reversed(messages):
+        if message.get("role") != "user":
+            continue
+        point = str(message.get("content", "")).strip()
+        if len(point) > SUMMARY_ITEM_CHARS:
+            point = point[:SUMMARY_ITEM_CHARS] + "…"
+        cost = estimate_tokens(point) + 1
+        if used + cost > budget:
+            break
+        points.append(point)
+        used += cost
+    if not points:
+        return None
+    return {"role": "system", "content": SUMMARY_PREFIX + "；".join(reversed(points))}
+
+
+def fit_to_budget(messages: list[dict], budget: int | None = None) -> list[dict]:
+    """Keep the newest messages that fit ``budget`` tokens.
+
+    If older messages had to be dropped, up to ``SUMMARY_TOKENS`` of the
+    budget goes to a short system note recapping what the user said in them.
+    """
+    config = settings.AI_CONTEXT
+    budget = config["MAX_TOKENS"] if budget is None else budget
+    kept = _take_newest(messages, budget)
+    if len(kept) == len(messages) or not config["SUMMARY_TOKENS"]:
+        return kept
+    kept = _take_newest(messages, budget - config["SUMMARY_TOKENS"])
+    room = budget - sum(message_tokens(message) for message in kept)
+    summary = summarize(messages[: len(messages) - len(kept)], room)
+    return ([summary] if summary else []) + kept
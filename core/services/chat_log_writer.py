@@ -0,0 +1,335 @@
+"""Buffered, batched ChatLog writes off the request path.
+
+Turns are saved with ``save_turns``, which also folds them into their
+``ChatConversation`` rows, so the conversation bookkeeping is batched too.
+"""
+from __future__ import annotations
+
+import atexit
+import logging
+import queue
+import threading
+import time
+
+from django.conf import settings
+from django.db import OperationalError, connection, transaction
+from django.db.models import Case, F, Value, When
+from django.db.models.functions import Greatest
+
+from core.models import ChatConversation, ChatLog
+
+logger = logging.getLogger(__name__)
+
+
+def _conversation_updates(turns: list[ChatLog]) -> dict:
+    last = max(turns, key=lambda turn: turn.created_at)
+    updates = {
+        "turn_count": F("turn_count") + len(turns),
+        "last_turn_at": Greatest(F("last_turn_at"), Value(last.created_at)),
+    }
+    digest = getattr(last, "_tail_digest", None)
+    if digest:
+        # 直接保存的风险轮次可能比缓冲区里的轮次新，摘要只随更晚的轮次更新。
+        updates["tail_digest"] = Case(
+            When(last_turn_at__lte=last.created_at, then=Value(digest)), default=F("tail_digest")
+        )
+    if any(turn.risk_flag for turn in turns):
+        updates["risk_flag"] = True
+    return updates
+
+
+def _recreated(conversation_id: int, turns: list[ChatLog]) -> ChatConversation:
+    last = max(turns, key=lambda turn: turn.created_at)
+    return ChatConversation(
+        pk=conversation_id,
+        provider=last.provider,
+        user_id=last.user_id,
+        turn_count=len(turns),
+        risk_flag=any(turn.risk_flag for turn in turns),
+        tail_digest=getattr(last, "_tail_digest", None) or "",
+        started_at=min(turn.created_at for turn in turns),
+        last_turn_at=last.created_at,
+    )
+
+
+def save_turns(records: list[ChatLog]) -> None:
+    """Insert ``records`` and fold them into their conversations in one transaction.
+
+    Each conversation gets a single UPDATE however many of its turns are in
+    the batch. A conversation deleted while its turns were queued is
+    recreated under the same id.
+    """
+    by_conversation: dict[int, list[ChatLog]] = {}
+    for record in records:
+        if record.conversation_id is not None:
+            by_conversation.setdefault(record.conversation_id, []).append(record)
+    with transaction.atomic():
+        ChatLog.objects.bulk_create(records)
+        missing = [
+            _recreated(conversation_id, turns)
+            for conversation_id, turns in by_conversation.items()
+            if not ChatConversation.objects.filter(pk=conversation_id).update(**_conversation_updates(turns))
+        ]
+        if missing:
+            ChatConversation.objects.bulk_create(missing)
+
+
+def _unsaved(records: list[ChatLog]) -> None:
+    # 事务回滚后，bulk_create 已分配的主键作废，下次重新插入。
+    for record in records:
+        record.pk = None
+        record._state.adding = True
+
+
+class ChatLogWriter:
+    """Queues ``ChatLog`` rows in-process and inserts them with ``bulk_create``.
+
+    A daemon thread flushes when ``batch_size`` rows are waiting or every
+    ``flush_interval`` seconds, and ``close()`` (registered with ``atexit``)
+    drains the rest. ``created_at`` is set when the turn is recorded, so
+    rows keep turn order even though they are inserted later.
+
+    A batch that fails with ``OperationalError`` (e.g. "database is locked")
+    is kept and retried after ``retry_delay`` seconds, doubling up to
+    ``max_retry_delay``; after ``max_retries`` attempts, or on any other
+    error, its rows are saved one by one so a single bad row only loses
+    itself.
+    """
+
+    def __init__(
+        self,
+        batch_size: int,
+        flush_interval: float,
+        max_queue: int,
+        autostart: bool = True,
+        retry_delay: float = 1.0,
+        max_retry_delay: float = 30.0,
+        max_retries: int = 5,
+    ):
+        self.batch_size = batch_size
+        self.autostart = autostart
+        self.flush_interval = flush_interval
+        self.retry_delay = retry_delay
+        self.max_retry_delay = max_retry_delay
+        self.max_retries = max_retries
+        self._queue: queue.Queue[ChatLog] = queue.Queue(maxsize=max_queue)
+        # [(到期时间（monotonic）, 已尝试次数, 一批记录)]
+        self._retries: list[tuple[float, int, list[ChatLog]]] = []
+        # flush 已取出、还没写完或放回重试的记录，按 id() 索引。
+        self._taken: dict[int, ChatLog] = {}
+        self._wakeup = threading.Event()
+        self._stopped = threading.Event()
+        self._thread: threading.Thread | None = None
+        self._lock = threading.Lock()
+        self._flush_lock = threading.Lock()
+        self.enqueued = 0
+        self.written = 0
+        self.retried = 0
+        self.failed = 0
+        self.flushes = 0
+        self.flush_seconds = 0.0
+        self.max_flush_seconds = 0.0
+
+    def enqueue(self, record: ChatLog) -> bool:
+        """Queue ``record``; returns ``False`` when the buffer is full or closed."""
+        if self._stopped.is_set():
+            return False
+        try:
+            self._queue.put_nowait(record)
+        except queue.Full:
+            return False
+        with self._lock:
+            self.enqueued += 1
+        if self.autostart:
+            self._ensure_thread()
+        if self._queue.qsize() >= self.batch_size:
+            self._wakeup.set()
+        return True
+
+    def _ensure_thread(self) -> None:
+        if self._thread is not None and self._thread.is_alive():
+            return
+        with self._lock:
+            if self._thread is None or not self._thread.is_alive():
+                self._thread = threading.Thread(
+                    target=self._run, name="chatlog-writer", daemon=True
+                )
+                self._thread.start()
+
+    def _run(self) -> None:
+        try:
+            while not self._stopped.is_set():
+                self._wakeup.wait(self.flush_interval)
+                self._wakeup.clear()
+                self.flush()
+        finally:
+            connection.close()
+
+    def _drain(self) -> list[ChatLog]:
+        batch = []
+        with self._lock:
+            while len(batch) < self.batch_size:
+                try:
+                    batch.append(self._queue.get_nowait())
+                except queue.Empty:
+                    break
+            self._taken.update((id(record), record) for record in batch)
+        return batch
+
+    def _due(self, everything: bool) -> list[tuple[int, list[ChatLog]]]:
+        now = time.monotonic()
+        with self._lock:
+            due = [(attempts, batch) for at, attempts, batch in self._retries if everything or at <= now]
+            self._retries = [item for item in self._retries if not everything and item[0] > now]
+            for _, batch in due:
+                self._taken.update((id(record), record) for record in batch)
+        return due
+
+    def _settle(self, batch: list[ChatLog]) -> None:
+        with self._lock:
+            for record in batch:
+                self._taken.pop(id(record), None)
+
+    def _hold(self, batch: list[ChatLog], attempts: int, delay: float) -> None:
+        with self._lock:
+            self._retries.append((time.monotonic() + delay, attempts, batch))
+
+    def _write_rows(self, batch: list[ChatLog]) -> int:
+        written = 0
+        for record in batch:
+            try:
+                save_turns([record])
+            except Exception:
+                _unsaved([record])
+                logger.exception("Dropping chat log of user %s after it failed to save", record.user_id)
+                with self._lock:
+                    self.failed += 1
+                continue
+            written += 1
+        with self._lock:
+            self.written += written
+        return written
+
+    def _write(self, batch: list[ChatLog], attempts: int, final: bool) -> int | None:
+        """Save one batch; returns rows written, or ``None`` when it was put back for a retry."""
+        started = time.perf_counter()
+        try:
+            save_turns(batch)
+        except OperationalError:
+            _unsaved(batch)
+            if final or attempts >= self.max_retries:
+                logger.exception(
+                    "Chat log batch of %d failed %d times, saving rows one by one", len(batch), attempts + 1
+                )
+                return self._write_rows(batch)
+            logger.warning("Chat log batch of %d failed, retrying", len(batch), exc_info=True)
+            self._hold(batch, attempts + 1, min(self.max_retry_delay, self.retry_delay * 2**attempts))
+            with self._lock:
+                self.retried += len(batch)
+            return None
+        except Exception:
+            _unsaved(batch)
+            logger.exception("Chat log batch of %d failed, saving rows one by one", len(batch))
+            return self._write_rows(batch)
+        elapsed = time.perf_counter() - started
+        with self._lock:
+            self.written += len(batch)
+            self.flushes += 1
+            self.flush_seconds += elapsed
+            self.max_flush_seconds = max(self.max_flush_seconds, elapsed)
+        return len(batch)
+
+    def flush(self, final: bool = False) -> int:
+        """Write retries that are due and everything queued so far in ``batch_size`` chunks.
+
+        Stops at the first batch that has to wait for a retry, since the
+        database is most likely still busy. ``final`` (used by ``close()``)
+        takes every held batch and saves failures row by row instead of
+        holding them again.
+        """
+        written = 0
+        with self._flush_lock:
+            pending = self._due(final)
+            while True:
+                if pending:
+                    attempts, batch = pending.pop(0)
+                else:
+                    attempts, batch = 0, self._drain()
+                    if not batch:
+                        break
+                result = self._write(batch, attempts, final)
+                self._settle(batch)
+                if result is None:
+                    for attempts, batch in pending:
+                        self._hold(batch, attempts, 0)
+                        self._settle(batch)
+                    break
+                written += result
+        return written
+
+    def pending(self) -> list[ChatLog]:
+        """Turns not known to be saved: queued, held for a retry or being written.
+
+        Lets readers see recent turns without forcing a flush. A turn that is
+        being written may already be in the database; its ``pk`` is set then.
+        """
+        with self._lock:
+            with self._queue.mutex:
+                queued = list(self._queue.queue)
+            held = [record for _, _, batch in self._retries for record in batch]
+            records = [*self._taken.values(), *held, *queued]
+        return list({id(record): record for record in records}.values())
+
+    def close(self, timeout: float = 5.0) -> None:
+        self._stopped.set()
+        self._wakeup.set()
+        if self._thread is not None:
+            self._thread.join(timeout)
+        self.flush(final=True)
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {
+                "queue_depth": self._queue.qsize(),
+                "retrying": sum(len(batch) for _, _, batch in self._retries),
+                "enqueued": self.enqueued,
+                "written": self.written,
+                "retried": self.retried,
+                "failed": self.failed,
+                "flushes": self.flushes,
+                "avg_flush_ms": self.flush_seconds * 1000 / self.flushes if self.flushes else 0.0,
+                "max_flush_ms": self.max_flush_seconds * 1000,
+            }
+
+
+_writer: ChatLogWriter | None = None
+_writer_lock = threading.Lock()
+
+
+def get_chat_log_writer() -> ChatLogWriter | None:
+    """Return the process-wide writer, or ``None`` when buffering is disabled."""
+    global _writer
+    config = settings.AI_CHATLOG_BUFFER
+    if not config.get("ENABLED", True):
+        return None
+    with _writer_lock:
+        if _writer is None:
+            _writer = ChatLogWriter(
+                batch_size=config.get("BATCH_SIZE", 50),
+                flush_interval=config.get("FLUSH_INTERVAL", 2.0),
+                max_queue=config.get("MAX_QUEUE", 10000),
+                retry_delay=config.get("RETRY_DELAY", 1.0),
+                max_retry_delay=config.get("MAX_RETRY_DELAY", 30.0),
+                max_retries=config.get("MAX_RETRIES", 5),
+            )
+            atexit.register(_writer.close)
+        return _writer
+
+
+def reset_chat_log_writer() -> None:
+    global _writer
+    with _writer_lock:
+        writer, _writer = _writer, None
+    if writer is not None:
+        atexit.unregister(writer.close)
+        writer.close()
@@ -0,0 +1,125 @@
+"""Chunked ChatLog retention: age/per-user policies, optional archive, throttling."""
+from __future__ import annotations
+
+import gzip
+import json
+import time
+from dataclasses import dataclass
+from datetime import datetime, timedelta
+from pathlib import Path
+from typing import Callable
+
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.core.serializers.json import DjangoJSONEncoder
+from django.db.models import Q
+from django.utils import timezone
+
+from core.models import ChatLog
+from core.services.conversations import delete_finished_conversations
+
+ARCHIVE_FIELDS = (
+    "id",
+    "provider",
+    "user_id",
+    "conversation_id",
+    "messages_json",
+    "response_text",
+    "risk_flag",
+    "created_at",
+)
+
+
+@dataclass
+class RetentionRule:
+    label: str
+    cutoff: datetime
+    condition: Q
+
+
+def build_rules(
+    days: int | None = None,
+    user_days: dict[str, int] | None = None,
+    only_user: str | None = None,
+    now: datetime | None = None,
+) -> list[RetentionRule]:
+    """Turn a default age and per-username overrides into delete rules.
+
+    ``days == 0`` means "everything up to now". Users with an override are
+    excluded from the default rule and get their own cutoff.
+    """
+    config = settings.CHATLOG_RETENTION
+    days = config.get("DAYS", 0) if days is None else days
+    user_days = dict(config.get("USER_DAYS", {}) if user_days is None else user_days)
+    now = now or timezone.now()
+    User = get_user_model()
+    override_ids = dict(
+        User.objects.filter(username__in=user_days).values_list("username", "id")
+    )
+
+    if only_user is not None:
+        user_id = User.objects.filter(username=only_user).values_list("id", flat=True).first()
+        if user_id is None:
+            raise ValueError(f"未找到用户：{only_user}")
+        user_cutoff = user_days.get(only_user, days)
+        return [RetentionRule(only_user, now - timedelta(days=user_cutoff), Q(user_id=user_id))]
+
+    default_condition = ~Q(user_id__in=override_ids.values()) if override_ids else Q()
+    rules = [RetentionRule("default", now - timedelta(days=days), default_condition)]
+    for username, user_id in override_ids.items():
+        rules.append(
+            RetentionRule(username, now - timedelta(days=user_days[username]), Q(user_id=user_id))
+        )
+    return rules
+
+
+def _archive(path: Path, rows: list[dict]) -> None:
+    with gzip.open(path, "at", encoding="utf-8") as handle:
+        for row in rows:
+            handle.write(json.dumps(row, cls=DjangoJSONEncoder, ensure_ascii=False) + "\n")
+
+
+def purge_rule(
+    rule: RetentionRule,
+    chunk_size: int = 1000,
+    pause: float = 0.0,
+    archive_path: Path | None = None,
+    dry_run: bool = False,
+    progress: Callable[[str, int], None] | None = None,
+) -> int:
+    """Delete rows matched by ``rule`` in primary-key ranges of ``chunk_size``.
+
+    Each chunk is its own short autocommit statement, so SQLite's write lock
+    is released between chunks; ``pause`` seconds of sleep lets other
+    requests through. ``dry_run`` only counts: nothing is archived or deleted.
+    """
+    matching = ChatLog.objects.filter(rule.condition, created_at__lt=rule.cutoff)
+    deleted = 0
+    last_id = 0
+    while True:
+        ids = list(
+            matching.filter(id__gt=last_id).order_by("id").values_list("id", flat=True)[:chunk_size]
+        )
+        if not ids:
+            break
+        last_id = ids[-1]
+        chunk = matching.filter(id__gte=ids[0], id__lte=last_id)
+        if dry_run:
+            # 演练只统计，不写归档也不删除。
+            deleted += len(ids)
+        else:
+            if archive_path is not None:
+                _archive(archive_path, list(chunk.values(*ARCHIVE_FIELDS)))
+            deleted += chunk.delete()[0]
+        if progress:
+            progress(rule.label, deleted)
+        if pause:
+            time.sleep(pause)
+    if not dry_run:
+        # 最后一轮也已过期的对话此时已没有记录，同样分批删除。
+        delete_finished_conversations(rule.cutoff, rule.condition, chunk_size, pause)
+    return deleted
+
+
+def purge_chat_logs(rules: list[RetentionRule], **options) -> int:
+    return sum(purge_rule(rule, **options) for rule in rules)
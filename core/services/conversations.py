@@ -0,0 +1,262 @@
+"""Conversation-level chat storage and server-held context.
+
+Each ``ChatLog`` row keeps only the messages that are new in that turn and
+points at a ``ChatConversation``; the window is rebuilt on read by replaying
+the turns. Clients that send a single new message get their context from the
+session's conversation (``load_context``). Clients that still resend the
+whole window are matched to a conversation through ``tail_digest``, the
+digest of the previous turn's last user message and reply.
+
+Recording a turn does not write the conversation row: the turn count, last
+turn time, digest and risk flag are folded in when the turn itself is saved
+(``chat_log_writer.save_turns``), one UPDATE per conversation per batch.
+Until then, digest lookups and context replays also read the writer's
+pending turns, so they never have to force a flush.
+"""
+from __future__ import annotations
+
+import hashlib
+import json
+import time
+from datetime import datetime
+
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.core.cache import cache
+from django.db.models import Q
+from django.utils import timezone
+
+from core.models import ChatConversation, ChatLog
+from core.services.chat_log_writer import get_chat_log_writer
+
+
+def split_new_messages(messages: list[dict]) -> tuple[list[dict], list[dict]]:
+    """Split a window into (context already answered, trailing new messages)."""
+    last_reply = max(
+        (index for index, msg in enumerate(messages) if msg.get("role") == "assistant"),
+        default=-1,
+    )
+    return messages[: last_reply + 1], messages[last_reply + 1 :]
+
+
+def tail_digest(messages: list[dict]) -> str:
+    pairs = [[msg.get("role"), str(msg.get("content", ""))] for msg in messages[-2:]]
+    return hashlib.sha1(json.dumps(pairs, ensure_ascii=False).encode("utf-8")).hexdigest()
+
+
+def _turn_plan(messages: list[dict], reply: str):
+    context, new = split_new_messages(messages)
+    digest = tail_digest(new + [{"role": "assistant", "content": reply}])
+    lookup = tail_digest(context) if context else None
+    return new, digest, lookup
+
+
+def _turn(provider: str, user, conversation_id: int, new: list[dict], reply: str, risk: bool, now, digest: str):
+    turn = ChatLog(
+        provider=provider,
+        user=user,
+        conversation_id=conversation_id,
+        messages_json=new,
+        response_text=reply,
+        risk_flag=risk,
+        created_at=now,
+    )
+    # save_turns 据此更新对话的 tail_digest。
+    turn._tail_digest = digest
+    return turn
+
+
+def _context_key(conversation_id: int) -> str:
+    return f"chat-context:{conversation_id}"
+
+
+def _context_after(messages: list[dict], reply: str) -> list[dict]:
+    window = messages + [{"role": "assistant", "content": reply}]
+    return window[-settings.AI_CONTEXT["MAX_MESSAGES"] :]
+
+
+def _remember_context(conversation_id: int, messages: list[dict], reply: str) -> None:
+    cache.set(
+        _context_key(conversation_id),
+        _context_after(messages, reply),
+        settings.AI_CONTEXT["CACHE_SECONDS"],
+    )
+
+
+async def _aremember_context(conversation_id: int, messages: list[dict], reply: str) -> None:
+    await cache.aset(
+        _context_key(conversation_id),
+        _context_after(messages, reply),
+        settings.AI_CONTEXT["CACHE_SECONDS"],
+    )
+
+
+def _tail_key(user, digest: str) -> str:
+    return f"chat-tail:{user.pk}:{digest}"
+
+
+def _pending_turns() -> list[ChatLog]:
+    writer = get_chat_log_writer()
+    return writer.pending() if writer is not None else []
+
+
+def _find_by_tail(user, digest: str) -> int | None:
+    # 还在缓冲区里的轮次尚未把摘要写进对话行，先在其中找。
+    queued = [
+        turn
+        for turn in _pending_turns()
+        if turn.user_id == user.pk and getattr(turn, "_tail_digest", None) == digest
+    ]
+    if queued:
+        return max(queued, key=lambda turn: turn.created_at).conversation_id
+    candidates = ChatConversation.objects.filter(user=user, tail_digest=digest)
+    return candidates.order_by("-last_turn_at").values_list("id", flat=True).first()
+
+
+def _new_conversation(provider: str, user, now) -> ChatConversation:
+    # 轮数、摘要和风险标记在保存这一轮时计入。
+    return ChatConversation(provider=provider, user=user, started_at=now, last_turn_at=now)
+
+
+def record_turn(
+    provider: str, user, messages: list[dict], reply: str, risk: bool, conversation_id: int | None = None
+) -> ChatLog:
+    """Attach this turn to its conversation and return the unsaved ``ChatLog``.
+
+    ``messages`` is the full window the reply answered. Without
+    ``conversation_id`` the conversation is found through ``tail_digest``,
+    in the cache first. Only starting a conversation writes to the database
+    here; the returned turn can be saved with ``save_turns`` or handed to the
+    buffered writer, which updates the conversation row.
+    """
+    now = timezone.now()
+    new, digest, lookup = _turn_plan(messages, reply)
+    if conversation_id is None and lookup and user is not None:
+        conversation_id = cache.get(_tail_key(user, lookup)) or _find_by_tail(user, lookup)
+    if conversation_id is None:
+        # 找不到上一轮（新对话或早于本功能的对话）时保存完整窗口，信息不丢失。
+        new = messages
+        conversation = _new_conversation(provider, user, now)
+        conversation.save()
+        conversation_id = conversation.pk
+    _remember_context(conversation_id, messages, reply)
+    if user is not None:
+        cache.set(_tail_key(user, digest), conversation_id, settings.AI_CONTEXT["CACHE_SECONDS"])
+    return _turn(provider, user, conversation_id, new, reply, risk, now, digest)
+
+
+async def arecord_turn(
+    provider: str, user, messages: list[dict], reply: str, risk: bool, conversation_id: int | None = None
+) -> ChatLog:
+    now = timezone.now()
+    new, digest, lookup = _turn_plan(messages, reply)
+    if conversation_id is None and lookup and user is not None:
+        conversation_id = await cache.aget(_tail_key(user, lookup))
+        if conversation_id is None:
+            conversation_id = await sync_to_async(_find_by_tail)(user, lookup)
+    if conversation_id is None:
+        new = messages
+        conversation = _new_conversation(provider, user, now)
+        await conversation.asave()
+        conversation_id = conversation.pk
+    await _aremember_context(conversation_id, messages, reply)
+    if user is not None:
+        await cache.aset(_tail_key(user, digest), conversation_id, settings.AI_CONTEXT["CACHE_SECONDS"])
+    return _turn(provider, user, conversation_id, new, reply, risk, now, digest)
+
+
+def replay(turns) -> list[dict]:
+    """Flatten ``(messages_json, response_text)`` pairs into one message list."""
+    history: list[dict] = []
+    for messages, reply in turns:
+        history.extend(messages if isinstance(messages, list) else [])
+        history.append({"role": "assistant", "content": reply})
+    return history
+
+
+def conversation_messages(conversation_id: int, limit: int | None = None) -> list[dict]:
+    """Full history of a conversation, or its last ``limit`` messages.
+
+    With ``limit`` only the newest ``limit`` turns are read, because every
+    turn contributes at least one message.
+    """
+    turns = ChatLog.objects.filter(conversation_id=conversation_id)
+    if limit is None:
+        rows = turns.order_by("created_at", "id").values_list("messages_json", "response_text")
+        return replay(rows)
+    rows = turns.order_by("-created_at", "-id").values_list("messages_json", "response_text")[:limit]
+    return replay(reversed(list(rows)))[-limit:]
+
+
+def start_conversation(provider: str, user, conversation_id: int | None = None) -> int:
+    """Return ``conversation_id`` if it is one of ``user``'s conversations, else a new one."""
+    owned = ChatConversation.objects.filter(pk=conversation_id, user=user)
+    if conversation_id is not None and owned.exists():
+        return conversation_id
+    return ChatConversation.objects.create(provider=provider, user=user).pk
+
+
+async def astart_conversation(provider: str, user, conversation_id: int | None = None) -> int:
+    owned = ChatConversation.objects.filter(pk=conversation_id, user=user)
+    if conversation_id is not None and await owned.aexists():
+        return conversation_id
+    return (await ChatConversation.objects.acreate(provider=provider, user=user)).pk
+
+
+def _replay_recent(conversation_id: int) -> list[dict]:
+    """Like ``conversation_messages(limit=...)``, plus turns still in the writer's buffer."""
+    limit = settings.AI_CONTEXT["MAX_MESSAGES"]
+    rows = list(
+        ChatLog.objects.filter(conversation_id=conversation_id)
+        .order_by("-created_at", "-id")
+        .values_list("id", "created_at", "messages_json", "response_text")[:limit]
+    )
+    saved = {row[0] for row in rows}
+    # 正在写入的轮次可能已经提交，按主键去重。
+    turns = [row[1:] for row in reversed(rows)] + [
+        (turn.created_at, turn.messages_json, turn.response_text)
+        for turn in _pending_turns()
+        if turn.conversation_id == conversation_id and turn.pk not in saved
+    ]
+    turns.sort(key=lambda turn: turn[0])
+    return replay((messages, reply) for _, messages, reply in turns[-limit:])[-limit:]
+
+
+def load_context(conversation_id: int) -> list[dict]:
+    """Recent messages of a conversation, from the cache or replayed from the database."""
+    context = cache.get(_context_key(conversation_id))
+    if context is None:
+        context = _replay_recent(conversation_id)
+        cache.set(_context_key(conversation_id), context, settings.AI_CONTEXT["CACHE_SECONDS"])
+    return context
+
+
+async def aload_context(conversation_id: int) -> list[dict]:
+    context = await cache.aget(_context_key(conversation_id))
+    if context is None:
+        context = await sync_to_async(_replay_recent)(conversation_id)
+        await cache.aset(_context_key(conversation_id), context, settings.AI_CONTEXT["CACHE_SECONDS"])
+    return context
+
+
+def delete_finished_conversations(
+    before: datetime, condition: Q | None = None, chunk_size: int = 1000, pause: float = 0.0
+) -> int:
+    """Delete conversations whose last turn is older than ``before`` and that have no turns left.
+
+    Runs in primary-key chunks, each its own short statement, like the chat
+    log retention; call it after the turns themselves were archived or purged.
+    """
+    finished = ChatConversation.objects.filter(condition or Q(), last_turn_at__lt=before, turns__isnull=True)
+    deleted = 0
+    last_id = 0
+    while True:
+        ids = list(finished.filter(id__gt=last_id).order_by("id").values_list("id", flat=True)[:chunk_size])
+        if not ids:
+            break
+        last_id = ids[-1]
+        # 删除前再确认没有新写入的轮次，避免级联删掉它们。
+        deleted += ChatConversation.objects.filter(id__in=ids, turns__isnull=True).delete()[0]
+        if pause:
+            time.sleep(pause)
+    return deleted
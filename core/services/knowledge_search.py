@@ -0,0 +1,214 @@
+"""Full-text search over knowledge articles backed by an SQLite FTS5 index."""
+from __future__ import annotations
+
+import re
+
+from django.conf import settings
+from django.db import connections, router
+from django.db.models import FloatField, Q, QuerySet
+from django.db.models.expressions import RawSQL
+from django.utils.html import escape
+from django.utils.safestring import SafeString, mark_safe
+
+from core.models import Article
+
+FTS_TABLE = "core_article_fts"
+INDEXED_FIELDS = ("title", "summary", "tags", "content")
+SNIPPET_WIDTH = 90
+
+# 允许用户用空格/逗号/顿号等分隔多个关键词，避免“睡眠、焦虑”搜不到的误解。
+QUERY_SPLIT_RE = re.compile(r"[\s,，、;；]+")
+# 连续的汉字按二元组切分，字母数字按整词切分，其余字符视为分隔符。
+CJK_RUN_RE = re.compile(r"[㐀-䶿一-鿿豈-﫿]+|[0-9A-Za-z]+")
+CJK_CHAR_RE = re.compile(r"[㐀-䶿一-鿿豈-﫿]")
+
+
+def split_query(raw_query: str) -> list[str]:
+    return [token for token in QUERY_SPLIT_RE.split(raw_query or "") if token]
+
+
+def segment(text: str, for_query: bool = False) -> list[str]:
+    """Split text into FTS terms: CJK bigrams and lower-cased latin words.
+
+    When indexing, the last character of every CJK run is also emitted as a
+    unigram so that a single-character query (matched as a prefix) can find
+    characters that never start a bigram.
+    """
+    terms: list[str] = []
+    for run in CJK_RUN_RE.findall(text or ""):
+        if not CJK_CHAR_RE.match(run):
+            terms.append(run.lower())
+            continue
+        if len(run) == 1:
+            terms.append(run)
+            continue
+        terms.extend(run[i : i + 2] for i in range(len(run) - 1))
+        if not for_query:
+            terms.append(run[-1])
+    return terms
+
+
+def build_match_expression(tokens: list[str]) -> str:
+    """Build an FTS5 MATCH expression OR-ing one phrase per query token."""
+    phrases = []
+    for token in tokens:
+        terms = segment(token, for_query=True)
+        if not terms:
+            continue
+        if len(terms) == 1 and len(terms[0]) == 1:
+            phrases.append(f'"{terms[0]}"*')
+        else:
+            phrases.append('"' + " ".join(terms).replace('"', '""') + '"')
+    return " OR ".join(phrases)
+
+
+def _index_values(row: dict) -> list[str]:
+    return [" ".join(segment(str(row.get(field) or ""))) for field in INDEXED_FIELDS]
+
+
+def uses_fts(using: str | None = None) -> bool:
+    alias = using or router.db_for_read(Article)
+    return connections[alias].vendor == "sqlite"
+
+
+def create_index(connection) -> None:
+    columns = ", ".join(INDEXED_FIELDS)
+    with connection.cursor() as cursor:
+        cursor.execute(
+            f"CREATE VIRTUAL TABLE IF NOT EXISTS {FTS_TABLE} "
+            f"USING fts5({columns}, tokenize='unicode61')"
+        )
+
+
+def drop_index(connection) -> None:
+    with connection.cursor() as cursor:
+        cursor.execute(f"DROP TABLE IF EXISTS {FTS_TABLE}")
+
+
+def index_rows(connection, rows) -> int:
+    """Insert or replace index entries for ``rows`` (dicts with id + indexed fields)."""
+    placeholders = ", ".join(["%s"] * (len(INDEXED_FIELDS) + 1))
+    sql = f"INSERT OR REPLACE INTO {FTS_TABLE} (rowid, {', '.join(INDEXED_FIELDS)}) VALUES ({placeholders})"
+    count = 0
+    with connection.cursor() as cursor:
+        for row in rows:
+            cursor.execute(sql, [row["id"], *_index_values(row)])
+            count += 1
+    return count
+
+
+def rebuild_index(using: str | None = None, queryset: QuerySet | None = None) -> int:
+    alias = using or router.db_for_write(Article)
+    connection = connections[alias]
+    if connection.vendor != "sqlite":
+        return 0
+    queryset = queryset if queryset is not None else Article.objects.using(alias)
+    drop_index(connection)
+    create_index(connection)
+    return index_rows(
+        connection, queryset.values("id", *INDEXED_FIELDS).order_by("id").iterator()
+    )
+
+
+def index_article(article: Article, using: str | None = None) -> None:
+    alias = using or router.db_for_write(Article)
+    connection = connections[alias]
+    if connection.vendor != "sqlite":
+        return
+    row = {"id": article.pk, **{field: getattr(article, field) for field in INDEXED_FIELDS}}
+    index_rows(connection, [row])
+
+
+def remove_article(article_id: int, using: str | None = None) -> None:
+    alias = using or router.db_for_write(Article)
+    connection = connections[alias]
+    if connection.vendor != "sqlite":
+        return
+    with connection.cursor() as cursor:
+        cursor.execute(f"DELETE FROM {FTS_TABLE} WHERE rowid = %s", [article_id])
+
+
+def _rank_expression() -> str:
+    weights = settings.KNOWLEDGE_SEARCH_WEIGHTS
+    args = ", ".join(str(float(weights.get(field, 1.0))) for field in INDEXED_FIELDS)
+    return f"bm25({FTS_TABLE}, {args})"
+
+
+def search_articles(queryset: QuerySet, raw_query: str) -> QuerySet:
+    """Restrict ``queryset`` to articles matching any token of ``raw_query``.
+
+    On SQLite the FTS index drives the query and results are ordered by BM25
+    relevance (field-weighted, best first); elsewhere it falls back to
+    ``icontains`` filters ordered by recency.
+    """
+    tokens = split_query(raw_query)
+    if not tokens:
+        return queryset.order_by("-created_at")
+    if not uses_fts(queryset.db):
+        query_filter = Q()
+        for token in tokens:
+            for field in INDEXED_FIELDS:
+                query_filter |= Q(**{f"{field}__icontains": token})
+        return queryset.filter(query_filter).order_by("-created_at")
+    match = build_match_expression(tokens)
+    if not match:
+        return queryset.none()
+    table = connections[queryset.db].ops.quote_name(queryset.model._meta.db_table)
+    matching = RawSQL(f"SELECT rowid FROM {FTS_TABLE} WHERE {FTS_TABLE} MATCH %s", [match])
+    # bm25() 只能在带 MATCH 的查询里计算，用关联子查询按文章取分。
+    rank = RawSQL(
+        f"SELECT {_rank_expression()} FROM {FTS_TABLE} WHERE {FTS_TABLE} MATCH %s AND rowid = {table}.id",
+        [match],
+        output_field=FloatField(),
+    )
+    return (
+        queryset.filter(id__in=matching)
+        .annotate(search_rank=rank)
+        .order_by("search_rank", "-created_at")
+    )
+
+
+def highlight(text: str, tokens: list[str], width: int | None = None) -> SafeString:
+    """Escape ``text`` and wrap query tokens in ``<mark>``.
+
+    With ``width`` set, only a window of that many characters around the first
+    match is kept; an empty string is returned when nothing matches.
+    """
+    text = text or ""
+    needles = sorted({token.lower() for token in tokens if token}, key=len, reverse=True)
+    if not needles:
+        return mark_safe("")
+    pattern = re.compile("|".join(re.escape(needle) for needle in needles), re.IGNORECASE)
+    first = pattern.search(text)
+    if first is None:
+        return mark_safe("") if width else mark_safe(escape(text))
+
+    prefix = suffix = ""
+    if width:
+        start = max(0, first.start() - width // 4)
+        end = min(len(text), start + width)
+        prefix = "…" if start > 0 else ""
+        suffix = "…" if end < len(text) else ""
+        text = text[start:end]
+
+    parts = []
+    position = 0
+    for found in pattern.finditer(text):
+        parts.append(escape(text[position : found.start()]))
+        parts.append(f"<mark>{escape(found.group())}</mark>")
+        position = found.end()
+    parts.append(escape(text[position:]))
+    return mark_safe(prefix + "".join(parts) + suffix)
+
+
+def attach_highlights(articles, raw_query: str) -> None:
+    """Set a highlighted ``search_snippet`` on already-fetched articles."""
+    tokens = split_query(raw_query)
+    if not tokens:
+        return
+    for article in articles:
+        for field in ("summary", "content", "tags"):
+            snippet = highlight(getattr(article, field), tokens, width=SNIPPET_WIDTH)
+            if snippet:
+                article.search_snippet = snippet
+                break
@@ -0,0 +1,336 @@
+"""Token-bucket rate limits and concurrency slots for the AI chat endpoints.
+
+Each request needs one token from the user's bucket and one from the global
+bucket, then one concurrency slot for the user and one for the whole site. A
+request that cannot get its slots waits up to ``QUEUE_TIMEOUT`` seconds for
+one to free up before it is rejected. Buckets and slots are kept in a
+backend: ``MemoryLimiterBackend`` works for a single process, and
+``SQLiteLimiterBackend`` shares state between processes on one host through
+a small SQLite file. Slots expire after ``SLOT_TTL`` seconds, so a crashed
+worker can't hold one forever.
+"""
+from __future__ import annotations
+
+import asyncio
+import sqlite3
+import threading
+import time
+import uuid
+from contextlib import contextmanager
+from pathlib import Path
+
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.utils.module_loading import import_string
+
+REASON_USER_RATE = "user_rate"
+REASON_GLOBAL_RATE = "global_rate"
+REASON_USER_CONCURRENCY = "user_concurrency"
+REASON_GLOBAL_CONCURRENCY = "global_concurrency"
+QUEUE_POLL_SECONDS = 0.05
+
+
+class RateLimited(Exception):
+    def __init__(self, reason: str, retry_after: float):
+        super().__init__(reason)
+        self.reason = reason
+        self.retry_after = retry_after
+
+
+class LimiterBackend:
+    """Stores buckets and slots. Both calls are all-or-nothing across their keys."""
+
+    # 为 True 时异步视图会把调用放到线程里执行，避免阻塞事件循环。
+    blocking = False
+
+    def __init__(self, **options):
+        pass
+
+    def take(self, buckets: list[tuple[str, float, float]], now: float) -> tuple[str | None, float]:
+        """Take one token from every ``(key, rate, burst)`` bucket.
+
+        Returns ``(None, 0)`` on success, otherwise the first empty bucket's
+        key and the seconds until it has a token again.
+        """
+        raise NotImplementedError
+
+    def acquire(self, slots: list[tuple[str, int]], token: str, expires_at: float, now: float) -> str | None:
+        """Hold a slot under every ``(key, limit)``; returns the first full key or ``None``."""
+        raise NotImplementedError
+
+    def release(self, keys: list[str], token: str) -> None:
+        raise NotImplementedError
+
+
+def _refill(tokens: float, updated: float, rate: float, burst: float, now: float) -> float:
+    return min(burst, tokens + max(0.0, now - updated) * rate)
+
+
+class MemoryLimiterBackend(LimiterBackend):
+    def __init__(self, **options):
+        super().__init__(**options)
+        self._lock = threading.Lock()
+        self._buckets: dict[str, tuple[float, float]] = {}
+        self._slots: dict[str, dict[str, float]] = {}
+
+    def take(self, buckets, now):
+        with self._lock:
+            levels = {}
+            for key, rate, burst in buckets:
+                tokens, updated = self._buckets.get(key, (burst, now))
+                level = _refill(tokens, updated, rate, burst, now)
+                if level < 1:
+                    return key, (1 - level) / rate
+                levels[key] = level
+            for key, level in levels.items():
+                self._buckets[key] = (level - 1, now)
+            return None, 0.0
+
+    def acquire(self, slots, token, expires_at, now):
+        with self._lock:
+            for key, limit in slots:
+                held = self._slots.setdefault(key, {})
+                for stale in [item for item, expiry in held.items() if expiry <= now]:
+                    del held[stale]
+                if len(held) >= limit:
+                    return key
+            for key, _ in slots:
+                self._slots[key][token] = expires_at
+            return None
+
+    def release(self, keys, token):
+        with self._lock:
+            for key in keys:
+                self._slots.get(key, {}).pop(token, None)
+
+
+class SQLiteLimiterBackend(LimiterBackend):
+    """Shared state for several worker processes on one host.
+
+    Every call runs in one ``BEGIN IMMEDIATE`` transaction, so checking and
+    updating is atomic across processes.
+    """
+
+    blocking = True
+
+    def __init__(self, path=None, **options):
+        super().__init__(**options)
+        self.path = Path(path or Path(settings.BASE_DIR) / "var" / "ratelimit.sqlite3")
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        self._local = threading.local()
+        with self._transaction() as db:
+            db.execute(
+                "CREATE TABLE IF NOT EXISTS buckets (key TEXT PRIMARY KEY, tokens REAL, updated REAL)"
+            )
+            db.execute(
+                "CREATE TABLE IF NOT EXISTS slots "
+                "(key TEXT, token TEXT, expires REAL, PRIMARY KEY (key, token))"
+            )
+
+    def _connection(self) -> sqlite3.Connection:
+        db = getattr(self._local, "db", None)
+        if db is None:
+            db = sqlite3.connect(self.path, timeout=5, isolation_level=None)
+            db.execute("PRAGMA journal_mode=WAL")
+            self._local.db = db
+        return db
+
+    @contextmanager
+    def _transaction(self):
+        db = self._connection()
+        db.execute("BEGIN IMMEDIATE")
+        try:
+            yield db
+        except BaseException:
+            db.execute("ROLLBACK")
+            raise
+        db.execute("COMMIT")
+
+    def take(self, buckets, now):
+        with self._transaction() as db:
+            levels = {}
+            for key, rate, burst in buckets:
+                row = db.execute("SELECT tokens, updated FROM buckets WHERE key = ?", (key,)).fetchone()
+                tokens, updated = row if row else (burst, now)
+                level = _refill(tokens, updated, rate, burst, now)
+                if level < 1:
+                    return key, (1 - level) / rate
+                levels[key] = level
+            db.executemany(
+                "INSERT OR REPLACE INTO buckets (key, tokens, updated) VALUES (?, ?, ?)",
+                [(key, level - 1, now) for key, level in levels.items()],
+            )
+            return None, 0.0
+
+    def acquire(self, slots, token, expires_at, now):
+        with self._transaction() as db:
+            for key, limit in slots:
+                db.execute("DELETE FROM slots WHERE key = ? AND expires <= ?", (key, now))
+                (held,) = db.execute("SELECT COUNT(*) FROM slots WHERE key = ?", (key,)).fetchone()
+                if held >= limit:
+                    return key
+            db.executemany(
+                "INSERT INTO slots (key, token, expires) VALUES (?, ?, ?)",
+                [(key, token, expires_at) for key, _ in slots],
+            )
+            return None
+
+    def release(self, keys, token):
+        with self._transaction() as db:
+            db.executemany("DELETE FROM slots WHERE key = ? AND token = ?", [(key, token) for key in keys])
+
+
+class Admission:
+    """Concurrency slots held by one request; ``release()``/``arelease()`` are idempotent."""
+
+    def __init__(self, limiter: "ChatRateLimiter", keys: list[str], token: str):
+        self.limiter = limiter
+        self.keys = keys
+        self.token = token
+        self.released = False
+
+    def release(self) -> None:
+        if self.released:
+            return
+        self.released = True
+        self.limiter.backend.release(self.keys, self.token)
+        self.limiter._count("in_flight", -1)
+
+    async def arelease(self) -> None:
+        if self.released:
+            return
+        self.released = True
+        await self.limiter._run(self.limiter.backend.release, self.keys, self.token)
+        self.limiter._count("in_flight", -1)
+
+
+class ChatRateLimiter:
+    def __init__(self, backend: LimiterBackend, config: dict):
+        self.backend = backend
+        self.config = config
+        self._lock = threading.Lock()
+        self.counters = {
+            "admitted": 0,
+            "queued": 0,
+            "in_flight": 0,
+            REASON_USER_RATE: 0,
+            REASON_GLOBAL_RATE: 0,
+            REASON_USER_CONCURRENCY: 0,
+            REASON_GLOBAL_CONCURRENCY: 0,
+        }
+        self.queue_wait_seconds = 0.0
+        self.max_queue_wait_seconds = 0.0
+
+    def _count(self, name: str, delta: int = 1) -> None:
+        with self._lock:
+            self.counters[name] += delta
+
+    def _buckets(self, user_id) -> list[tuple[str, float, float]]:
+        config = self.config
+        return [
+            (f"user:{user_id}", config["USER_RATE"], config["USER_BURST"]),
+            ("global", config["GLOBAL_RATE"], config["GLOBAL_BURST"]),
+        ]
+
+    def _slots(self, user_id) -> list[tuple[str, int]]:
+        return [
+            (f"user:{user_id}", self.config["USER_CONCURRENCY"]),
+            ("global", self.config["GLOBAL_CONCURRENCY"]),
+        ]
+
+    def _take(self, user_id) -> None:
+        denied, retry_after = self.backend.take(self._buckets(user_id), time.time())
+        if denied is not None:
+            reason = REASON_GLOBAL_RATE if denied == "global" else REASON_USER_RATE
+            self._count(reason)
+            raise RateLimited(reason, retry_after)
+
+    def _acquire(self, user_id, token: str) -> str | None:
+        now = time.time()
+        return self.backend.acquire(self._slots(user_id), token, now + self.config["SLOT_TTL"], now)
+
+    def _admitted(self, user_id, token: str, waited: float | None) -> Admission:
+        with self._lock:
+            self.counters["admitted"] += 1
+            self.counters["in_flight"] += 1
+            if waited is not None:
+                self.queue_wait_seconds += waited
+                self.max_queue_wait_seconds = max(self.max_queue_wait_seconds, waited)
+        return Admission(self, [key for key, _ in self._slots(user_id)], token)
+
+    def _rejected(self, denied: str) -> RateLimited:
+        reason = REASON_GLOBAL_CONCURRENCY if denied == "global" else REASON_USER_CONCURRENCY
+        self._count(reason)
+        return RateLimited(reason, QUEUE_POLL_SECONDS)
+
+    def admit(self, user_id) -> Admission:
+        """Spend a rate token and wait (briefly) for concurrency slots; raises ``RateLimited``."""
+        self._take(user_id)
+        token = uuid.uuid4().hex
+        denied = self._acquire(user_id, token)
+        if denied is None:
+            return self._admitted(user_id, token, None)
+        self._count("queued")
+        started = time.monotonic()
+        deadline = started + self.config["QUEUE_TIMEOUT"]
+        while time.monotonic() < deadline:
+            time.sleep(QUEUE_POLL_SECONDS)
+            denied = self._acquire(user_id, token)
+            if denied is None:
+                return self._admitted(user_id, token, time.monotonic() - started)
+        raise self._rejected(denied)
+
+    async def _run(self, func, *args):
+        if self.backend.blocking:
+            return await sync_to_async(func, thread_sensitive=False)(*args)
+        return func(*args)
+
+    async def aadmit(self, user_id) -> Admission:
+        await self._run(self._take, user_id)
+        token = uuid.uuid4().hex
+        denied = await self._run(self._acquire, user_id, token)
+        if denied is None:
+            return self._admitted(user_id, token, None)
+        self._count("queued")
+        started = time.monotonic()
+        deadline = started + self.config["QUEUE_TIMEOUT"]
+        while time.monotonic() < deadline:
+            await asyncio.sleep(QUEUE_POLL_SECONDS)
+            denied = await self._run(self._acquire, user_id, token)
+            if denied is None:
+                return self._admitted(user_id, token, time.monotonic() - started)
+        raise self._rejected(denied)
+
+    def stats(self) -> dict:
+        with self._lock:
+            waited = self.counters["queued"]
+            return {
+                **self.counters,
+                "avg_queue_wait_ms": self.queue_wait_seconds * 1000 / waited if waited else 0.0,
+                "max_queue_wait_ms": self.max_queue_wait_seconds * 1000,
+            }
+
+
+_limiter: ChatRateLimiter | None = None
+_limiter_lock = threading.Lock()
+
+
+def get_rate_limiter() -> ChatRateLimiter | None:
+    """Return the configured limiter, or ``None`` when limiting is disabled."""
+    global _limiter
+    config = settings.AI_RATE_LIMIT
+    if not config.get("ENABLED", True):
+        return None
+    with _limiter_lock:
+        if _limiter is None:
+            backend = import_string(
+                config.get("BACKEND", "core.services.rate_limit.MemoryLimiterBackend")
+            )
+            _limiter = ChatRateLimiter(backend(**config.get("OPTIONS", {})), config)
+        return _limiter
+
+
+def reset_rate_limiter() -> None:
+    global _limiter
+    with _limiter_lock:
+        _limiter = None
@@ -0,0 +1,250 @@
+"""Cache for AI replies to repeated single-turn questions."""
+from __future__ import annotations
+
+import hashlib
+import json
+import os
+import re
+import threading
+import time
+import unicodedata
+from collections import OrderedDict
+from pathlib import Path
+
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.core.cache import caches
+from django.utils.module_loading import import_string
+
+TRAILING_PUNCTUATION = "?!.~。…"
+
+
+def normalize_text(text: str) -> str:
+    """Fold width/case and whitespace so near-identical questions share a key."""
+    text = unicodedata.normalize("NFKC", str(text)).lower()
+    text = re.sub(r"\s+", " ", text).strip()
+    return text.rstrip(TRAILING_PUNCTUATION + " ")
+
+
+def make_key(model: str, system_prompt: str, messages: list[dict]) -> str:
+    normalized = [
+        [msg.get("role"), normalize_text(msg.get("content", ""))] for msg in messages
+    ]
+    raw = json.dumps([model, system_prompt, normalized], ensure_ascii=False)
+    return hashlib.sha256(raw.encode("utf-8")).hexdigest()
+
+
+class ReplyCache:
+    """Base class: subclasses implement ``_get``/``_set``; counters live here."""
+
+    def __init__(self, ttl: int, max_entries: int, **options):
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self.hits = 0
+        self.misses = 0
+        self.stores = 0
+        self.bypassed = 0
+        self._stats_lock = threading.Lock()
+
+    def get(self, key: str) -> str | None:
+        return self._looked_up(self._get(key))
+
+    def set(self, key: str, reply: str) -> None:
+        self._set(key, reply)
+        self._stored()
+
+    def _looked_up(self, reply: str | None) -> str | None:
+        with self._stats_lock:
+            if reply is None:
+                self.misses += 1
+            else:
+                self.hits += 1
+        return reply
+
+    def _stored(self) -> None:
+        with self._stats_lock:
+            self.stores += 1
+
+    async def aget(self, key: str) -> str | None:
+        """``get`` for async views; backends doing I/O run it in a worker thread."""
+        return await sync_to_async(self.get, thread_sensitive=False)(key)
+
+    async def aset(self, key: str, reply: str) -> None:
+        await sync_to_async(self.set, thread_sensitive=False)(key, reply)
+
+    def record_bypass(self) -> None:
+        with self._stats_lock:
+            self.bypassed += 1
+
+    def stats(self) -> dict:
+        with self._stats_lock:
+            lookups = self.hits + self.misses
+            return {
+                "hits": self.hits,
+                "misses": self.misses,
+                "stores": self.stores,
+                "bypassed": self.bypassed,
+                "hit_ratio": self.hits / lookups if lookups else 0.0,
+            }
+
+    def _get(self, key: str) -> str | None:
+        raise NotImplementedError
+
+    def _set(self, key: str, reply: str) -> None:
+        raise NotImplementedError
+
+
+class MemoryReplyCache(ReplyCache):
+    """Per-process LRU dict with expiry timestamps."""
+
+    def __init__(self, ttl: int, max_entries: int, **options):
+        super().__init__(ttl, max_entries, **options)
+        self._entries: OrderedDict[str, tuple[float, str]] = OrderedDict()
+        self._lock = threading.Lock()
+
+    def _get(self, key: str) -> str | None:
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return None
+            expires_at, reply = entry
+            if expires_at < time.monotonic():
+                del self._entries[key]
+                return None
+            self._entries.move_to_end(key)
+            return reply
+
+    def _set(self, key: str, reply: str) -> None:
+        with self._lock:
+            self._entries[key] = (time.monotonic() + self.ttl, reply)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    # 只操作内存，直接在事件循环里执行。
+    async def aget(self, key: str) -> str | None:
+        return self.get(key)
+
+    async def aset(self, key: str, reply: str) -> None:
+        self.set(key, reply)
+
+
+class FileReplyCache(ReplyCache):
+    """One JSON file per key; file mtime doubles as the LRU clock.
+
+    Shared by every process on the host, so cache hits survive restarts.
+    Each process counts the files it adds and only scans the directory when
+    the count passes ``max_entries``; it then evicts the least recently used
+    files down to ``EVICT_TO`` of the limit, so a scan happens once per batch
+    of writes. Other processes' writes are picked up by that scan, so the
+    directory can briefly exceed the limit by what they added meanwhile.
+    """
+
+    EVICT_TO = 0.9
+
+    def __init__(self, ttl: int, max_entries: int, path=None, **options):
+        super().__init__(ttl, max_entries, **options)
+        self.path = Path(path or Path(settings.BASE_DIR) / "var" / "ai_reply_cache")
+        self.path.mkdir(parents=True, exist_ok=True)
+        self._count: int | None = None
+        self._count_lock = threading.Lock()
+
+    def _file(self, key: str) -> Path:
+        return self.path / f"{key}.json"
+
+    def _get(self, key: str) -> str | None:
+        file = self._file(key)
+        try:
+            entry = json.loads(file.read_text(encoding="utf-8"))
+        except (OSError, ValueError):
+            return None
+        if entry.get("expires_at", 0) < time.time():
+            file.unlink(missing_ok=True)
+            return None
+        os.utime(file)
+        return entry.get("reply")
+
+    def _set(self, key: str, reply: str) -> None:
+        file = self._file(key)
+        added = not file.exists()
+        tmp = file.with_suffix(f".{os.getpid()}.{threading.get_ident()}.tmp")
+        tmp.write_text(
+            json.dumps({"expires_at": time.time() + self.ttl, "reply": reply}, ensure_ascii=False),
+            encoding="utf-8",
+        )
+        os.replace(tmp, file)
+        if not added:
+            return
+        with self._count_lock:
+            if self._count is None:
+                self._count = sum(1 for _ in self.path.glob("*.json"))
+            else:
+                self._count += 1
+            if self._count > self.max_entries:
+                self._evict(keep=file)
+
+    def _evict(self, keep: Path) -> None:
+        entries = []
+        with os.scandir(self.path) as scan:
+            for item in scan:
+                if not item.name.endswith(".json") or item.path == str(keep):
+                    continue
+                try:
+                    entries.append((item.stat().st_mtime, item.path))
+                except OSError:
+                    continue
+        entries.sort()
+        # 刚写入的文件不参与淘汰，留下的总数（含它）为 EVICT_TO × max_entries。
+        target = max(1, int(self.max_entries * self.EVICT_TO))
+        stale = entries[: max(0, len(entries) + 1 - target)]
+        for _, path in stale:
+            Path(path).unlink(missing_ok=True)
+        self._count = len(entries) + 1 - len(stale)
+
+
+class DjangoReplyCache(ReplyCache):
+    """Delegates storage, expiry and eviction to a configured Django cache."""
+
+    def __init__(self, ttl: int, max_entries: int, alias: str = "default", **options):
+        super().__init__(ttl, max_entries, **options)
+        self.cache = caches[alias]
+
+    def _get(self, key: str) -> str | None:
+        return self.cache.get(f"ai-reply:{key}")
+
+    def _set(self, key: str, reply: str) -> None:
+        self.cache.set(f"ai-reply:{key}", reply, self.ttl)
+
+    async def aget(self, key: str) -> str | None:
+        return self._looked_up(await self.cache.aget(f"ai-reply:{key}"))
+
+    async def aset(self, key: str, reply: str) -> None:
+        await self.cache.aset(f"ai-reply:{key}", reply, self.ttl)
+        self._stored()
+
+
+_reply_cache: ReplyCache | None = None
+_reply_cache_lock = threading.Lock()
+
+
+def get_reply_cache() -> ReplyCache | None:
+    """Return the configured cache, or ``None`` when caching is disabled."""
+    global _reply_cache
+    config = settings.AI_REPLY_CACHE
+    if not config.get("ENABLED", True):
+        return None
+    with _reply_cache_lock:
+        if _reply_cache is None:
+            backend = import_string(config.get("BACKEND", "core.services.reply_cache.MemoryReplyCache"))
+            _reply_cache = backend(
+                ttl=config.get("TTL", 3600),
+                max_entries=config.get("MAX_ENTRIES", 512),
+                **config.get("OPTIONS", {}),
+            )
+        return _reply_cache
+
+
+def reset_reply_cache() -> None:
+    global _reply_cache
+    with _reply_cache_lock:
+        _reply_cache = None
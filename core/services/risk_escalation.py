@@ -0,0 +1,422 @@
+"""Turn risk-flagged chat turns into consultation tickets off the request path.
+
+The chat views only put a ``RiskEvent`` on an in-process queue; a daemon
+thread wakes up for each event (or every ``FLUSH_INTERVAL`` seconds) and opens a
+``ConsultationTicket`` (source ``risk_chat``) for the user. A user who
+already has an open escalated ticket from the last ``WINDOW_MINUTES`` gets a
+note on that ticket instead of a new one, so repeating a phrase does not
+flood the queue. The ticket's risk words give it a high queue priority (see
+``core.services.ticket_queue``).
+
+Each user is escalated in its own transaction; when one fails (for example
+"database is locked") only that user's events go back on the queue, retried
+with exponential backoff. The risk turn itself is saved synchronously as a
+``ChatLog`` with ``risk_flag`` set, and escalating it stamps ``escalated_at``.
+``catch_up`` escalates risk turns above a watermark that are still unstamped
+``CATCH_UP_GRACE`` seconds later, so events lost with the in-memory queue (a
+restart or crash) are picked up by the worker's periodic scan or by
+``manage.py escalate_risk_chats``.
+"""
+from __future__ import annotations
+
+import atexit
+import logging
+import queue
+import threading
+import time
+from dataclasses import dataclass, field
+from datetime import datetime, timedelta
+
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.db import connection, transaction
+from django.utils import timezone
+
+from core.models import ChatLog, ConsultationNote, ConsultationTicket, RollupWatermark
+
+logger = logging.getLogger(__name__)
+
+OPEN_STATUSES = (
+    ConsultationTicket.STATUS_NEW,
+    ConsultationTicket.STATUS_ASSIGNED,
+    ConsultationTicket.STATUS_IN_PROGRESS,
+)
+TIER_LABELS = {"high": "高风险", "medium": "中风险", "low": "低风险"}
+WATERMARK = "risk_escalation"
+
+
+@dataclass
+class RiskEvent:
+    user_id: int
+    tier: str
+    text: str
+    conversation_id: int | None = None
+    created_at: datetime = field(default_factory=timezone.now)
+    chat_log_id: int | None = None
+    attempts: int = 0
+
+
+def _excerpt(messages: list[dict]) -> str:
+    texts = [str(msg.get("content", "")) for msg in messages if msg.get("role") == "user"]
+    return (texts[-1] if texts else "")[: settings.RISK_ESCALATION["EXCERPT_CHARS"]]
+
+
+def _describe(event: RiskEvent) -> str:
+    where = f"对话 #{event.conversation_id}" if event.conversation_id else "AI 对话"
+    label = TIER_LABELS.get(event.tier, event.tier)
+    return f"{event.created_at:%Y-%m-%d %H:%M} {where}触发{label}提示：{event.text}"
+
+
+def _claim(events: list[RiskEvent]) -> list[RiskEvent]:
+    """Stamp the events' chat turns; drops events whose turn was already escalated."""
+    now = timezone.now()
+    return [
+        event
+        for event in events
+        if event.chat_log_id is None
+        or ChatLog.objects.filter(pk=event.chat_log_id, escalated_at__isnull=True).update(escalated_at=now)
+    ]
+
+
+def _escalate_user(user_id: int, events: list[RiskEvent]) -> bool:
+    """Open or extend one user's ticket; returns True when a ticket was created."""
+    window = timedelta(minutes=settings.RISK_ESCALATION["WINDOW_MINUTES"])
+    with transaction.atomic():
+        # 先写入处理标记：补偿扫描与后台线程同时处理同一轮对话时只有一方生效。
+        events = _claim(events)
+        user = get_user_model().objects.filter(pk=user_id).first()
+        if not events or user is None:
+            return False
+        ticket = (
+            ConsultationTicket.objects.select_for_update()
+            .filter(
+                user_id=user_id,
+                source=ConsultationTicket.SOURCE_RISK_CHAT,
+                status__in=OPEN_STATUSES,
+                created_at__gte=events[0].created_at - window,
+            )
+            .order_by("-created_at")
+            .first()
+        )
+        created = ticket is None
+        if created:
+            first = events[0]
+            ticket = ConsultationTicket.objects.create(
+                user=user,
+                source=ConsultationTicket.SOURCE_RISK_CHAT,
+                title=f"AI 对话{TIER_LABELS.get(first.tier, first.tier)}提醒：{user.get_username()}",
+                message=first.text,
+                contact_name=user.get_full_name() or user.get_username(),
+                contact_email=user.email,
+            )
+            events = events[1:]
+        if events:
+            ConsultationNote.objects.create(
+                ticket=ticket,
+                note="\n".join(_describe(event) for event in events),
+                is_internal=True,
+            )
+    return created
+
+
+def escalate(events: list[RiskEvent], failed: list[RiskEvent] | None = None) -> int:
+    """Open or extend tickets for ``events``; returns how many tickets were created.
+
+    Users are handled independently: when one user's escalation raises, the
+    error is logged, that user's events are appended to ``failed`` and the
+    other users still go through.
+    """
+    by_user: dict[int, list[RiskEvent]] = {}
+    for event in events:
+        by_user.setdefault(event.user_id, []).append(event)
+    created = 0
+    for user_id, user_events in by_user.items():
+        try:
+            created += _escalate_user(user_id, user_events)
+        except Exception:
+            logger.exception("Failed to escalate %d risk events for user %s", len(user_events), user_id)
+            if failed is not None:
+                failed.extend(user_events)
+    return created
+
+
+def _tier_for_reply(reply: str) -> str:
+    # 干预回复按等级固定，据此还原当时的风险等级；无法识别时按高风险处理。
+    for tier, text in settings.AI_RISK_REPLIES.items():
+        if text == reply:
+            return tier
+    return "high"
+
+
+def catch_up(batch_size: int | None = None) -> int:
+    """Escalate risk turns that were never escalated; returns how many turns were handled.
+
+    Only turns older than ``CATCH_UP_GRACE`` seconds are taken, so events
+    still on a worker's queue are left to it. The watermark stops before the
+    oldest turn that is still unstamped, and never passes the newest id seen
+    before the scan.
+    """
+    config = settings.RISK_ESCALATION
+    if not config.get("ENABLED", True):
+        return 0
+    batch_size = batch_size or config["CATCH_UP_BATCH"]
+    cutoff = timezone.now() - timedelta(seconds=config["CATCH_UP_GRACE"])
+    mark, _ = RollupWatermark.objects.get_or_create(name=WATERMARK)
+    # 扫描前取上界：之后才提交的轮次 id 更大，留给下一轮，不会被水位线跳过。
+    upper = ChatLog.objects.order_by("-id").values_list("id", flat=True).first() or 0
+    pending = ChatLog.objects.filter(id__gt=mark.last_id, risk_flag=True, escalated_at__isnull=True)
+    rows = list(
+        pending.filter(created_at__lt=cutoff)
+        .order_by("id")
+        .values_list("id", "user_id", "conversation_id", "messages_json", "response_text", "created_at")[
+            :batch_size
+        ]
+    )
+    events = []
+    skipped = []
+    for chat_log_id, user_id, conversation_id, messages, reply, created_at in rows:
+        tier = _tier_for_reply(reply)
+        if user_id is None or tier not in config["TIERS"]:
+            skipped.append(chat_log_id)
+            continue
+        text = _excerpt(messages if isinstance(messages, list) else [])
+        events.append(RiskEvent(user_id, tier, text, conversation_id, created_at, chat_log_id))
+    if skipped:
+        ChatLog.objects.filter(id__in=skipped).update(escalated_at=timezone.now())
+    failed: list[RiskEvent] = []
+    escalate(events, failed)
+    oldest = pending.filter(id__lte=upper).order_by("id").values_list("id", flat=True).first()
+    last_id = upper if oldest is None else oldest - 1
+    RollupWatermark.objects.filter(name=WATERMARK, last_id__lt=last_id).update(last_id=last_id)
+    return len(rows) - len(failed)
+
+
+class EscalationWorker:
+    """Queues ``RiskEvent`` objects and escalates them from a daemon thread.
+
+    Failed events are retried after ``retry_delay`` seconds, doubling up to
+    ``max_retry_delay``; after ``max_retries`` attempts they are left to
+    ``catch_up``, which the thread also runs every ``catch_up_interval``
+    seconds.
+    """
+
+    def __init__(
+        self,
+        flush_interval: float,
+        max_queue: int,
+        autostart: bool = True,
+        retry_delay: float = 1.0,
+        max_retry_delay: float = 60.0,
+        max_retries: int = 8,
+        catch_up_interval: float | None = None,
+    ):
+        self.flush_interval = flush_interval
+        self.autostart = autostart
+        self.retry_delay = retry_delay
+        self.max_retry_delay = max_retry_delay
+        self.max_retries = max_retries
+        self.catch_up_interval = catch_up_interval
+        self._queue: queue.Queue[RiskEvent] = queue.Queue(maxsize=max_queue)
+        # [(到期时间（monotonic）, 事件)]
+        self._retries: list[tuple[float, RiskEvent]] = []
+        self._wakeup = threading.Event()
+        self._stopped = threading.Event()
+        self._thread: threading.Thread | None = None
+        self._lock = threading.Lock()
+        self._flush_lock = threading.Lock()
+        self.submitted = 0
+        self.created = 0
+        self.failed = 0
+        self.abandoned = 0
+        self.caught_up = 0
+
+    def submit(self, event: RiskEvent) -> bool:
+        """Queue ``event``; returns ``False`` when the queue is full or closed."""
+        if self._stopped.is_set():
+            return False
+        try:
+            self._queue.put_nowait(event)
+        except queue.Full:
+            return False
+        with self._lock:
+            self.submitted += 1
+        if self.autostart:
+            self._ensure_thread()
+        self._wakeup.set()
+        return True
+
+    def _ensure_thread(self) -> None:
+        if self._thread is not None and self._thread.is_alive():
+            return
+        with self._lock:
+            if self._thread is None or not self._thread.is_alive():
+                self._thread = threading.Thread(target=self._run, name="risk-escalation", daemon=True)
+                self._thread.start()
+
+    def _run(self) -> None:
+        next_catch_up = time.monotonic()
+        try:
+            while not self._stopped.is_set():
+                self._wakeup.wait(self.flush_interval)
+                self._wakeup.clear()
+                self.flush()
+                if self.catch_up_interval and time.monotonic() >= next_catch_up:
+                    self.run_catch_up()
+                    next_catch_up = time.monotonic() + self.catch_up_interval
+        finally:
+            connection.close()
+
+    def _take(self, everything: bool = False) -> list[RiskEvent]:
+        events = []
+        while True:
+            try:
+                events.append(self._queue.get_nowait())
+            except queue.Empty:
+                break
+        now = time.monotonic()
+        with self._lock:
+            due = [event for at, event in self._retries if everything or at <= now]
+            self._retries = [(at, event) for at, event in self._retries if not (everything or at <= now)]
+        return due + events
+
+    def _retry(self, events: list[RiskEvent]) -> None:
+        now = time.monotonic()
+        with self._lock:
+            self.failed += len(events)
+            for event in events:
+                event.attempts += 1
+                if event.attempts > self.max_retries:
+                    # 对话记录已落库，放弃内存重试后仍会被补偿扫描处理。
+                    self.abandoned += 1
+                    logger.error(
+                        "Leaving risk event of user %s to catch-up after %d attempts", event.user_id, event.attempts
+                    )
+                    continue
+                delay = min(self.max_retry_delay, self.retry_delay * 2 ** (event.attempts - 1))
+                self._retries.append((now + delay, event))
+
+    def flush(self, everything: bool = False) -> int:
+        """Escalate queued events and retries that are due; returns how many tickets were created."""
+        with self._flush_lock:
+            events = self._take(everything)
+            if not events:
+                return 0
+            failed: list[RiskEvent] = []
+            created = escalate(events, failed)
+            if failed:
+                self._retry(failed)
+            with self._lock:
+                self.created += created
+            return created
+
+    def run_catch_up(self) -> None:
+        try:
+            handled = catch_up()
+        except Exception:
+            logger.exception("Risk escalation catch-up failed")
+            return
+        with self._lock:
+            self.caught_up += handled
+
+    def close(self, timeout: float = 5.0) -> None:
+        self._stopped.set()
+        self._wakeup.set()
+        if self._thread is not None:
+            self._thread.join(timeout)
+        self.flush(everything=True)
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {
+                "queue_depth": self._queue.qsize(),
+                "retrying": len(self._retries),
+                "submitted": self.submitted,
+                "tickets_created": self.created,
+                "failed": self.failed,
+                "abandoned": self.abandoned,
+                "caught_up": self.caught_up,
+            }
+
+
+_worker: EscalationWorker | None = None
+_worker_lock = threading.Lock()
+
+
+def get_escalation_worker() -> EscalationWorker | None:
+    """Return the process-wide worker, or ``None`` when escalation runs inline or is off."""
+    global _worker
+    config = settings.RISK_ESCALATION
+    if not config.get("ENABLED", True) or not config.get("BACKGROUND", True):
+        return None
+    with _worker_lock:
+        if _worker is None:
+            _worker = EscalationWorker(
+                flush_interval=config.get("FLUSH_INTERVAL", 1.0),
+                max_queue=config.get("MAX_QUEUE", 1000),
+                retry_delay=config.get("RETRY_DELAY", 1.0),
+                max_retry_delay=config.get("MAX_RETRY_DELAY", 60.0),
+                max_retries=config.get("MAX_RETRIES", 8),
+                catch_up_interval=config.get("CATCH_UP_INTERVAL"),
+            )
+            atexit.register(_worker.close)
+        return _worker
+
+
+def reset_escalation_worker() -> None:
+    global _worker
+    with _worker_lock:
+        worker, _worker = _worker, None
+    if worker is not None:
+        atexit.unregister(worker.close)
+        worker.close()
+
+
+def _event(
+    user_id: int, tier: str, messages: list[dict], conversation_id: int | None, chat_log_id: int | None
+) -> RiskEvent | None:
+    config = settings.RISK_ESCALATION
+    if not config.get("ENABLED", True) or tier not in config["TIERS"]:
+        return None
+    return RiskEvent(
+        user_id=user_id,
+        tier=tier,
+        text=_excerpt(messages),
+        conversation_id=conversation_id,
+        chat_log_id=chat_log_id,
+    )
+
+
+def report_risk(
+    user_id: int,
+    tier: str,
+    messages: list[dict],
+    conversation_id: int | None = None,
+    chat_log_id: int | None = None,
+) -> None:
+    """Hand a risk-flagged turn to the worker; escalates inline only when it cannot queue.
+
+    ``chat_log_id`` is the saved risk turn; an inline failure is logged and
+    left to ``catch_up``.
+    """
+    event = _event(user_id, tier, messages, conversation_id, chat_log_id)
+    if event is None:
+        return
+    worker = get_escalation_worker()
+    if worker is None or not worker.submit(event):
+        escalate([event])
+
+
+async def areport_risk(
+    user_id: int,
+    tier: str,
+    messages: list[dict],
+    conversation_id: int | None = None,
+    chat_log_id: int | None = None,
+) -> None:
+    event = _event(user_id, tier, messages, conversation_id, chat_log_id)
+    if event is None:
+        return
+    worker = get_escalation_worker()
+    if worker is None or not worker.submit(event):
+        await sync_to_async(escalate)([event])
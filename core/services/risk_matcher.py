@@ -0,0 +1,125 @@
+"""Multi-pattern (Aho–Corasick) matching for AI risk keywords."""
+from __future__ import annotations
+
+import threading
+from collections import deque
+from dataclasses import dataclass
+
+from django.conf import settings
+
+DEFAULT_CATEGORY = "general"
+
+
+@dataclass(frozen=True)
+class KeywordMatch:
+    start: int
+    end: int
+    keyword: str
+    category: str
+
+
+class KeywordMatcher:
+    """Aho–Corasick automaton over a fixed phrase → category mapping.
+
+    Scanning is a single left-to-right pass, so the cost depends on the text
+    length (plus matches reported), not on how many phrases are loaded.
+    Matching is case-insensitive.
+    """
+
+    def __init__(self, keywords: dict[str, str]):
+        self.keywords: list[tuple[str, str]] = []
+        self._goto: list[dict[str, int]] = [{}]
+        self._fail: list[int] = [0]
+        self._output: list[tuple[int, ...]] = [()]
+        for phrase, category in keywords.items():
+            phrase = phrase.strip().lower()
+            if phrase:
+                self._add(phrase, len(self.keywords))
+                self.keywords.append((phrase, category))
+        self._link()
+
+    def __len__(self) -> int:
+        return len(self.keywords)
+
+    def _add(self, phrase: str, index: int) -> None:
+        state = 0
+        for char in phrase:
+            next_state = self._goto[state].get(char)
+            if next_state is None:
+                next_state = len(self._goto)
+                self._goto[state][char] = next_state
+                self._goto.append({})
+                self._fail.append(0)
+                self._output.append(())
+            state = next_state
+        self._output[state] = self._output[state] + (index,)
+
+    def _link(self) -> None:
+        queue = deque(self._goto[0].values())
+        while queue:
+            state = queue.popleft()
+            for char, next_state in self._goto[state].items():
+                queue.append(next_state)
+                fallback = self._fail[state]
+                while fallback and char not in self._goto[fallback]:
+                    fallback = self._fail[fallback]
+                target = self._goto[fallback].get(char, 0)
+                self._fail[next_state] = target if target != next_state else 0
+                self._output[next_state] = self._output[next_state] + self._output[
+                    self._fail[next_state]
+                ]
+
+    def _scan(self, text: str):
+        goto, fail, output = self._goto, self._fail, self._output
+        state = 0
+        for position, char in enumerate(text.lower()):
+            while state and char not in goto[state]:
+                state = fail[state]
+            state = goto[state].get(char, 0)
+            if output[state]:
+                yield position, output[state]
+
+    def search(self, text: str) -> bool:
+        for _ in self._scan(text or ""):
+            return True
+        return False
+
+    def find_all(self, text: str) -> list[KeywordMatch]:
+        matches = []
+        for position, indexes in self._scan(text or ""):
+            for index in indexes:
+                phrase, category = self.keywords[index]
+                matches.append(
+                    KeywordMatch(position - len(phrase) + 1, position + 1, phrase, category)
+                )
+        return matches
+
+    def categories(self, text: str) -> set[str]:
+        return {match.category for match in self.find_all(text)}
+
+
+def keyword_map(config) -> dict[str, str]:
+    """Accept either a flat phrase list or a ``{category: [phrases]}`` mapping."""
+    if isinstance(config, dict):
+        return {phrase: category for category, phrases in config.items() for phrase in phrases}
+    return {phrase: DEFAULT_CATEGORY for phrase in config}
+
+
+_matcher: KeywordMatcher | None = None
+_matcher_lock = threading.Lock()
+
+
+def get_risk_matcher() -> KeywordMatcher:
+    """Automaton for ``settings.AI_RISK_KEYWORDS``, compiled once per process."""
+    global _matcher
+    if _matcher is None:
+        with _matcher_lock:
+            if _matcher is None:
+                _matcher = KeywordMatcher(keyword_map(settings.AI_RISK_KEYWORDS))
+    return _matcher
+
+
+def reset_risk_matcher() -> None:
+    global _matcher
+    with _matcher_lock:
+        _matcher = None
@@ -0,0 +1,163 @@
+"""Weighted, context-aware risk scoring for AI chat messages."""
+from __future__ import annotations
+
+import hashlib
+import threading
+from dataclasses import dataclass, field
+
+from django.conf import settings
+from django.core.cache import cache
+
+from core.services.risk_matcher import KeywordMatch, KeywordMatcher, keyword_map
+
+NEGATION = "__negation__"
+BENIGN = "__benign__"
+TIER_NONE = "none"
+
+
+@dataclass
+class MessageScore:
+    score: float
+    matches: list[KeywordMatch] = field(default_factory=list)
+
+
+@dataclass
+class RiskAssessment:
+    message_score: float
+    running_score: float
+    tier: str
+    matches: list[KeywordMatch]
+
+    @property
+    def intervene(self) -> bool:
+        return self.tier in settings.AI_RISK_SCORING["INTERVENE_TIERS"]
+
+
+class RiskScorer:
+    """Scores one message from a single automaton pass.
+
+    Risk phrases carry weights (per phrase, else per category). A phrase
+    covered by a benign context (``按时服药``) is ignored, and one preceded by
+    a negation cue within ``NEGATION_WINDOW`` characters is down-weighted.
+    """
+
+    def __init__(self, keywords: dict[str, str], config: dict):
+        self.config = config
+        self.weights = {
+            phrase.lower(): float(
+                config["PHRASE_WEIGHTS"].get(phrase, config["CATEGORY_WEIGHTS"].get(category, 1))
+            )
+            for phrase, category in keywords.items()
+        }
+        patterns = dict(keywords)
+        patterns.update({phrase: NEGATION for phrase in config["NEGATIONS"]})
+        patterns.update({phrase: BENIGN for phrase in config["BENIGN_CONTEXTS"]})
+        self.matcher = KeywordMatcher(patterns)
+        self.tiers = sorted(config["TIERS"], reverse=True)
+
+    def score_message(self, text: str) -> MessageScore:
+        found = self.matcher.find_all(text)
+        negations = [match for match in found if match.category == NEGATION]
+        benign = [match for match in found if match.category == BENIGN]
+        window = self.config["NEGATION_WINDOW"]
+        result = MessageScore(score=0.0)
+        for match in found:
+            if match.category in (NEGATION, BENIGN):
+                continue
+            if any(span.start <= match.start and match.end <= span.end for span in benign):
+                continue
+            weight = self.weights.get(match.keyword, 1.0)
+            if any(match.start - window <= cue.start and cue.end <= match.start for cue in negations):
+                weight *= self.config["NEGATION_FACTOR"]
+            result.score += weight
+            result.matches.append(match)
+        return result
+
+    def tier_for(self, score: float) -> str:
+        for threshold, tier in self.tiers:
+            if score >= threshold:
+                return tier
+        return TIER_NONE
+
+    def accumulate(self, previous: float, score: float) -> float:
+        return previous * self.config["DECAY"] + score
+
+
+_scorer: RiskScorer | None = None
+_scorer_lock = threading.Lock()
+
+
+def get_risk_scorer() -> RiskScorer:
+    global _scorer
+    if _scorer is None:
+        with _scorer_lock:
+            if _scorer is None:
+                _scorer = RiskScorer(
+                    keyword_map(settings.AI_RISK_KEYWORDS), settings.AI_RISK_SCORING
+                )
+    return _scorer
+
+
+def reset_risk_scorer() -> None:
+    global _scorer
+    with _scorer_lock:
+        _scorer = None
+
+
+def _user_texts(messages: list[dict]) -> list[str]:
+    return [str(msg.get("content", "")) for msg in messages if msg.get("role") == "user"]
+
+
+def _conversation_key(user_id, texts: list[str]) -> str:
+    digest = hashlib.sha1("\x1e".join(texts).encode("utf-8")).hexdigest()
+    return f"risk-score:{user_id}:{digest}"
+
+
+def _assess(texts: list[str], previous: float | None) -> RiskAssessment:
+    scorer = get_risk_scorer()
+    if previous is None:
+        # 缓存未命中（如服务重启）时回放此前的用户消息，结果与增量计算一致。
+        previous = 0.0
+        for text in texts[:-1]:
+            previous = scorer.accumulate(previous, scorer.score_message(text).score)
+    latest = scorer.score_message(texts[-1] if texts else "")
+    running = scorer.accumulate(previous, latest.score)
+    return RiskAssessment(
+        message_score=latest.score,
+        running_score=running,
+        tier=scorer.tier_for(running),
+        matches=latest.matches,
+    )
+
+
+def assess_conversation(user_id, messages: list[dict]) -> RiskAssessment:
+    """Score the newest user message on top of the cached running score.
+
+    The running score for a conversation is cached under a digest of its user
+    messages, so each turn scans only the message that was just added.
+    """
+    texts = _user_texts(messages)
+    previous = cache.get(_conversation_key(user_id, texts[:-1])) if len(texts) > 1 else 0.0
+    assessment = _assess(texts, previous)
+    cache.set(
+        _conversation_key(user_id, texts),
+        assessment.running_score,
+        settings.AI_RISK_SCORING["CACHE_SECONDS"],
+    )
+    return assessment
+
+
+async def aassess_conversation(user_id, messages: list[dict]) -> RiskAssessment:
+    texts = _user_texts(messages)
+    previous = await cache.aget(_conversation_key(user_id, texts[:-1])) if len(texts) > 1 else 0.0
+    assessment = _assess(texts, previous)
+    await cache.aset(
+        _conversation_key(user_id, texts),
+        assessment.running_score,
+        settings.AI_RISK_SCORING["CACHE_SECONDS"],
+    )
+    return assessment
+
+
+def risk_reply(tier: str) -> str:
+    return settings.AI_RISK_REPLIES.get(tier) or settings.AI_RISK_REPLIES["high"]
@@ -0,0 +1,266 @@
+"""Live consultation ticket updates for staff pages.
+
+Ticket creations and changes and new notes are published after their
+transaction commits, with the table rows already rendered, to an event log
+kept by a backend: ``SQLiteEventBackend`` (the default) shares events
+between worker processes on one host, and ``MemoryEventBackend`` only suits
+a single process. ``/manage/tickets/events/`` relays the log as server-sent
+events under ASGI, and the open staff pages patch only the rows that changed
+instead of reloading.
+Events carry increasing ids, so a reconnecting ``EventSource`` resumes from
+``Last-Event-ID``; a client that fell behind the kept window is told to
+reload once.
+"""
+from __future__ import annotations
+
+import asyncio
+import json
+import sqlite3
+import threading
+import time
+from collections import deque
+from pathlib import Path
+
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.db import transaction
+from django.template.loader import render_to_string
+from django.utils.module_loading import import_string
+
+from core.models import ConsultationNote, ConsultationTicket
+
+KIND_CREATED = "created"
+KIND_UPDATED = "updated"
+KIND_NOTE = "note"
+KIND_RESET = "reset"
+
+
+class EventBackend:
+    """Append-only event log keyed by increasing integer ids."""
+
+    # True when calls touch the disk and should run off the event loop.
+    blocking = False
+
+    def __init__(self, buffer: int = 500, **options):
+        self.buffer = buffer
+
+    def publish(self, payload: dict) -> int:
+        raise NotImplementedError
+
+    def since(self, after: int) -> tuple[list[tuple[int, dict]], bool]:
+        """Events with id above ``after``, and whether the client missed some.
+
+        A client has missed events when ones right after ``after`` were already
+        dropped, or when ``after`` is ahead of the log (the log was reset).
+        """
+        raise NotImplementedError
+
+    def latest(self) -> int:
+        raise NotImplementedError
+
+
+class MemoryEventBackend(EventBackend):
+    """Per-process event log for tests and single-process servers.
+
+    With several workers each keeps its own ids, so a client reconnecting to
+    another worker is told it missed events and reloads over and over.
+    """
+
+    def __init__(self, buffer: int = 500, **options):
+        super().__init__(buffer, **options)
+        self._events: deque[tuple[int, dict]] = deque(maxlen=buffer)
+        self._last = 0
+        self._lock = threading.Lock()
+
+    def publish(self, payload):
+        with self._lock:
+            self._last += 1
+            self._events.append((self._last, payload))
+            return self._last
+
+    def since(self, after):
+        with self._lock:
+            events = [event for event in self._events if event[0] > after]
+            first = self._events[0][0] if self._events else self._last + 1
+            return events, after + 1 < first or after > self._last
+
+    def latest(self):
+        with self._lock:
+            return self._last
+
+
+class SQLiteEventBackend(EventBackend):
+    """Event log shared by several worker processes through a small SQLite file."""
+
+    blocking = True
+
+    def __init__(self, buffer: int = 500, path=None, **options):
+        super().__init__(buffer, **options)
+        self.path = Path(path or Path(settings.BASE_DIR) / "var" / "ticket_events.sqlite3")
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        self._local = threading.local()
+        self._connection().execute(
+            "CREATE TABLE IF NOT EXISTS events (id INTEGER PRIMARY KEY AUTOINCREMENT, payload TEXT)"
+        )
+
+    def _connection(self) -> sqlite3.Connection:
+        db = getattr(self._local, "db", None)
+        if db is None:
+            db = sqlite3.connect(self.path, timeout=5, isolation_level=None)
+            db.execute("PRAGMA journal_mode=WAL")
+            self._local.db = db
+        return db
+
+    def publish(self, payload):
+        db = self._connection()
+        db.execute("BEGIN IMMEDIATE")
+        try:
+            event_id = db.execute(
+                "INSERT INTO events (payload) VALUES (?)", (json.dumps(payload, ensure_ascii=False),)
+            ).lastrowid
+            db.execute("DELETE FROM events WHERE id <= ?", (event_id - self.buffer,))
+        except BaseException:
+            db.execute("ROLLBACK")
+            raise
+        db.execute("COMMIT")
+        return event_id
+
+    def since(self, after):
+        db = self._connection()
+        rows = db.execute("SELECT id, payload FROM events WHERE id > ? ORDER BY id", (after,)).fetchall()
+        first = db.execute("SELECT MIN(id) FROM events").fetchone()[0]
+        last = self.latest()
+        missed = after > last or (first is not None and after + 1 < first)
+        return [(event_id, json.loads(payload)) for event_id, payload in rows], missed
+
+    def latest(self):
+        row = self._connection().execute("SELECT seq FROM sqlite_sequence WHERE name = 'events'").fetchone()
+        return row[0] if row else 0
+
+
+_backend: EventBackend | None = None
+_backend_lock = threading.Lock()
+
+
+def get_event_backend() -> EventBackend | None:
+    """Return the configured backend, or ``None`` when live updates are disabled."""
+    global _backend
+    config = settings.TICKET_EVENTS
+    if not config.get("ENABLED", True):
+        return None
+    with _backend_lock:
+        if _backend is None:
+            backend = import_string(config.get("BACKEND", "core.services.ticket_events.SQLiteEventBackend"))
+            _backend = backend(buffer=config.get("BUFFER", 500), **config.get("OPTIONS", {}))
+        return _backend
+
+
+def reset_event_backend() -> None:
+    global _backend
+    with _backend_lock:
+        _backend = None
+
+
+def _ticket_payload(ticket: ConsultationTicket, kind: str) -> dict:
+    context = {"ticket": ticket, "urgent_priority": settings.TICKET_QUEUE["URGENT_PRIORITY"]}
+    return {
+        "kind": kind,
+        "ticket": ticket.id,
+        "status": ticket.get_status_display(),
+        "assigned_to": ticket.assigned_to.get_username() if ticket.assigned_to else "",
+        "waiting": ticket.status == ConsultationTicket.STATUS_NEW and ticket.assigned_to_id is None,
+        "row": render_to_string("manage/partials/ticket_row.html", context),
+        "queue_row": render_to_string("manage/partials/queue_row.html", context),
+    }
+
+
+def _publish_tickets(ticket_ids: list[int], kind: str) -> None:
+    backend = get_event_backend()
+    if backend is None:
+        return
+    for ticket in ConsultationTicket.objects.filter(id__in=ticket_ids).select_related("assigned_to"):
+        backend.publish(_ticket_payload(ticket, kind))
+
+
+def tickets_changed(ticket_ids, kind: str = KIND_UPDATED) -> None:
+    """Publish ``ticket_ids`` once the current transaction commits.
+
+    Publishing is best effort: a failing backend is logged and never fails the
+    save that triggered it, including ``claim()``, whose callback runs inline.
+    """
+    ticket_ids = list(ticket_ids)
+    if ticket_ids and settings.TICKET_EVENTS.get("ENABLED", True):
+        transaction.on_commit(lambda: _publish_tickets(ticket_ids, kind), robust=True)
+
+
+def _publish_note(note_id: int) -> None:
+    backend = get_event_backend()
+    note = ConsultationNote.objects.select_related("author").filter(pk=note_id).first()
+    if backend is None or note is None:
+        return
+    backend.publish(
+        {
+            "kind": KIND_NOTE,
+            "ticket": note.ticket_id,
+            "note": render_to_string("manage/partials/ticket_note.html", {"note": note}),
+        }
+    )
+
+
+def note_added(note: ConsultationNote) -> None:
+    if settings.TICKET_EVENTS.get("ENABLED", True):
+        transaction.on_commit(lambda: _publish_note(note.pk), robust=True)
+
+
+def _sse(event_id: int | None, kind: str, payload: dict) -> str:
+    head = f"id: {event_id}\n" if event_id is not None else ""
+    return f"{head}event: {kind}\ndata: {json.dumps(payload, ensure_ascii=False)}\n\n"
+
+
+def _frames(events: list[tuple[int, dict]], missed: bool, after: int) -> tuple[list[str], int]:
+    if missed:
+        # 客户端落后于保留的事件窗口，无法逐行补齐，通知其整页刷新一次。
+        last = events[-1][0] if events else after
+        return [_sse(last, KIND_RESET, {})], last
+    frames = [_sse(event_id, payload["kind"], payload) for event_id, payload in events]
+    return frames, events[-1][0] if events else after
+
+
+def latest_event_id() -> int:
+    """Id to hand a freshly rendered page, so its stream starts where the page was rendered."""
+    backend = get_event_backend()
+    return backend.latest() if backend else 0
+
+
+def start_cursor(backend: EventBackend, *candidates: str | None) -> int:
+    """First usable id among ``Last-Event-ID`` and ``?after=``, else the newest event."""
+    for value in candidates:
+        try:
+            return max(0, int(value))
+        except (TypeError, ValueError):
+            continue
+    return backend.latest()
+
+
+async def aevent_stream(backend: EventBackend, after: int):
+    """Server-sent events after ``after`` for up to ``STREAM_SECONDS``; the browser then reconnects.
+
+    Polls every ``POLL_INTERVAL`` seconds without holding a thread.
+    """
+    config = settings.TICKET_EVENTS
+    since = sync_to_async(backend.since, thread_sensitive=False)
+    yield f"retry: {int(config['RETRY_SECONDS'] * 1000)}\n\n"
+    deadline = time.monotonic() + config["STREAM_SECONDS"]
+    idle = 0.0
+    while time.monotonic() < deadline:
+        events, missed = await since(after) if backend.blocking else backend.since(after)
+        frames, after = _frames(events, missed, after)
+        if frames:
+            idle = 0.0
+            yield "".join(frames)
+            continue
+        if idle >= config["KEEPALIVE_SECONDS"]:
+            idle = 0.0
+            yield ": keepalive\n\n"
+        await asyncio.sleep(config["POLL_INTERVAL"])
+        idle += config["POLL_INTERVAL"]
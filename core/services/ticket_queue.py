@@ -0,0 +1,191 @@
+"""Staff work queue for consultation tickets.
+
+Waiting tickets (``new`` and unassigned) are served in ``queue_rank`` order:
+the creation time moved earlier by ``MINUTES_PER_POINT`` for every point of
+risk found in the title and message, so urgency and waiting time combine in
+one indexed column (``ticket_status_rank_idx``). Tickets are taken with a
+conditional UPDATE on ``(status, assigned_to)``: when two staff members race
+for the same row only one update matches, and the other moves on to the next
+candidate. Changes made this way bypass model signals, so they update the
+status counters (``core.services.ticket_stats``) in the same transaction
+and are published to open staff pages (``core.services.ticket_events``) here.
+"""
+from __future__ import annotations
+
+from dataclasses import dataclass, field
+from datetime import datetime, timedelta
+
+from django.conf import settings
+from django.db import transaction
+from django.db.models import Count, Min
+from django.utils import timezone
+
+from core.models import ConsultationTicket
+from core.services import ticket_stats
+from core.services.risk_scoring import get_risk_scorer
+from core.services.ticket_events import tickets_changed
+
+WAITING = ConsultationTicket.STATUS_NEW
+CLAIMED = ConsultationTicket.STATUS_ASSIGNED
+HELD = (ConsultationTicket.STATUS_ASSIGNED, ConsultationTicket.STATUS_IN_PROGRESS)
+
+
+def ticket_priority(title: str, message: str) -> int:
+    score = get_risk_scorer().score_message(f"{title}\n{message}").score
+    return min(round(score), settings.TICKET_QUEUE["MAX_PRIORITY"])
+
+
+def queue_rank(created_at: datetime, priority: int) -> datetime:
+    return created_at - timedelta(minutes=priority * settings.TICKET_QUEUE["MINUTES_PER_POINT"])
+
+
+def prepare_ticket(ticket: ConsultationTicket) -> None:
+    """Set ``priority`` and ``queue_rank`` before the ticket is saved."""
+    ticket.priority = ticket_priority(ticket.title, ticket.message)
+    ticket.queue_rank = queue_rank(ticket.created_at or timezone.now(), ticket.priority)
+
+
+def rank_tickets(chunk_size: int = 500) -> int:
+    """Recompute ``priority`` and ``queue_rank`` of every ticket; returns how many were ranked.
+
+    Used after the risk keywords change and for tickets that predate the queue.
+    """
+    ranked = 0
+    last_id = 0
+    while True:
+        tickets = list(
+            ConsultationTicket.objects.filter(id__gt=last_id)
+            .order_by("id")
+            .only("title", "message", "created_at")[:chunk_size]
+        )
+        if not tickets:
+            return ranked
+        for ticket in tickets:
+            ticket.priority = ticket_priority(ticket.title, ticket.message)
+            ticket.queue_rank = queue_rank(ticket.created_at, ticket.priority)
+        ConsultationTicket.objects.bulk_update(tickets, ["priority", "queue_rank"])
+        ranked += len(tickets)
+        last_id = tickets[-1].id
+
+
+def waiting_tickets():
+    return ConsultationTicket.objects.filter(status=WAITING, assigned_to__isnull=True)
+
+
+def release_stale_claims(now: datetime | None = None) -> int:
+    """Put claimed tickets nobody started within ``CLAIM_TIMEOUT_MINUTES`` back in the queue."""
+    timeout = settings.TICKET_QUEUE["CLAIM_TIMEOUT_MINUTES"]
+    if not timeout:
+        return 0
+    now = now or timezone.now()
+    stale = ConsultationTicket.objects.filter(status=CLAIMED, claimed_at__lt=now - timedelta(minutes=timeout))
+    ids = list(stale.values_list("id", flat=True))
+    if not ids:
+        return 0
+    with transaction.atomic():
+        released = stale.filter(id__in=ids).update(
+            status=WAITING, assigned_to=None, claimed_at=None, updated_at=now
+        )
+        ticket_stats.moved(released, CLAIMED, WAITING)
+    tickets_changed(ids)
+    return released
+
+
+def claim(ticket_id: int, staff, now: datetime | None = None) -> bool:
+    """Take one waiting ticket; False when someone else got it first."""
+    now = now or timezone.now()
+    with transaction.atomic():
+        claimed = (
+            waiting_tickets()
+            .filter(pk=ticket_id)
+            .update(status=CLAIMED, assigned_to=staff, claimed_at=now, updated_at=now)
+        )
+        if claimed:
+            ticket_stats.moved(claimed, WAITING, CLAIMED)
+            ticket_stats.stamp_assigned([ticket_id], now)
+    if claimed:
+        tickets_changed([ticket_id])
+    return bool(claimed)
+
+
+def claim_next(staff) -> ConsultationTicket | None:
+    """Take the first waiting ticket in queue order, or None when the queue is empty.
+
+    Each round reads the first ``CLAIM_CANDIDATES`` ids from the index and
+    tries them in order, so concurrent claimers rarely need a second read.
+    """
+    now = timezone.now()
+    release_stale_claims(now)
+    config = settings.TICKET_QUEUE
+    for _ in range(config["CLAIM_ROUNDS"]):
+        candidates = list(
+            waiting_tickets().order_by("queue_rank", "id").values_list("id", flat=True)[: config["CLAIM_CANDIDATES"]]
+        )
+        if not candidates:
+            return None
+        for ticket_id in candidates:
+            if claim(ticket_id, staff, now):
+                return ConsultationTicket.objects.get(pk=ticket_id)
+    return None
+
+
+def release(ticket_id: int, staff) -> bool:
+    """Return a ticket ``staff`` claimed but has not started."""
+    with transaction.atomic():
+        released = ConsultationTicket.objects.filter(pk=ticket_id, status=CLAIMED, assigned_to=staff).update(
+            status=WAITING, assigned_to=None, claimed_at=None, updated_at=timezone.now()
+        )
+        ticket_stats.moved(released, CLAIMED, WAITING)
+    if released:
+        tickets_changed([ticket_id])
+    return bool(released)
+
+
+def _percentile(values: list[float], fraction: float) -> float | None:
+    if not values:
+        return None
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(fraction * len(ordered)))]
+
+
+@dataclass
+class QueueMetrics:
+    depth: int
+    urgent: int
+    oldest_wait: float | None
+    claimed: int
+    wait_p50: float | None
+    wait_p90: float | None
+    # [(用户名, 已领取, 处理中)]
+    held: list[tuple[str, int, int]] = field(default_factory=list)
+
+
+def queue_metrics(now: datetime | None = None) -> QueueMetrics:
+    """Queue depth and waiting times; times are in seconds."""
+    now = now or timezone.now()
+    config = settings.TICKET_QUEUE
+    waiting = waiting_tickets().order_by().aggregate(depth=Count("id"), oldest=Min("created_at"))
+    urgent = waiting_tickets().filter(priority__gte=config["URGENT_PRIORITY"]).count()
+    waits = [
+        (claimed_at - created_at).total_seconds()
+        for created_at, claimed_at in ConsultationTicket.objects.filter(
+            claimed_at__gte=now - timedelta(hours=config["METRICS_WINDOW_HOURS"])
+        ).values_list("created_at", "claimed_at")[: config["METRICS_SAMPLE"]]
+    ]
+    held: dict[str, list[int]] = {}
+    for username, status, count in (
+        ConsultationTicket.objects.filter(status__in=HELD, assigned_to__isnull=False)
+        .order_by()
+        .values_list("assigned_to__username", "status")
+        .annotate(count=Count("id"))
+    ):
+        held.setdefault(username, [0, 0])[HELD.index(status)] = count
+    return QueueMetrics(
+        depth=waiting["depth"],
+        urgent=urgent,
+        oldest_wait=(now - waiting["oldest"]).total_seconds() if waiting["oldest"] else None,
+        claimed=len(waits),
+        wait_p50=_percentile(waits, 0.5),
+        wait_p90=_percentile(waits, 0.9),
+        held=sorted(((name, *counts) for name, counts in held.items()), key=lambda row: -sum(row[1:])),
+    )
@@ -0,0 +1,212 @@
+"""Maintained consultation ticket counters and SLA timings.
+
+``TicketCounter`` keeps one row per ticket status plus running totals for
+two SLA timings: time to first assignment (``first_assigned_at``, stamped
+when a waiting ticket first gets a handler or leaves 新建) and time to
+resolution (``resolved_at``, stamped when it first becomes 已解决 or 已关闭).
+Saves and deletes adjust the counters inside the ticket's own transaction
+(see ``core.signals``); the queue's conditional UPDATEs bypass signals and
+call ``moved`` and ``stamp_assigned`` themselves. The staff metrics page
+reads a handful of counter rows instead of grouping every ticket, and
+``manage.py reconcile_ticket_counters`` recomputes them if they drift.
+"""
+from __future__ import annotations
+
+from collections import Counter
+from dataclasses import dataclass
+from datetime import datetime
+
+from django.conf import settings
+from django.db import transaction
+from django.db.models import F
+from django.utils import timezone
+
+from core.models import ConsultationTicket, TicketCounter
+
+ASSIGN = "assign"
+RESOLVE = "resolve"
+DONE = (ConsultationTicket.STATUS_RESOLVED, ConsultationTicket.STATUS_CLOSED)
+OPEN = (
+    ConsultationTicket.STATUS_NEW,
+    ConsultationTicket.STATUS_ASSIGNED,
+    ConsultationTicket.STATUS_IN_PROGRESS,
+)
+STATE_FIELDS = ("status", "assigned_to_id", "created_at", "first_assigned_at", "resolved_at")
+
+
+def status_key(status: str) -> str:
+    return f"status:{status}"
+
+
+def _targets() -> dict[str, int]:
+    config = settings.TICKET_SLA
+    return {ASSIGN: config["ASSIGN_TARGET_MINUTES"], RESOLVE: config["RESOLVE_TARGET_MINUTES"]}
+
+
+def _timing(kind: str, started: datetime | None, finished: datetime | None) -> Counter:
+    if started is None or finished is None:
+        return Counter()
+    seconds = max(0, int((finished - started).total_seconds()))
+    within = seconds <= _targets()[kind] * 60
+    return Counter({f"{kind}:count": 1, f"{kind}:seconds": seconds, f"{kind}:within": int(within)})
+
+
+def contribution(status, created_at, first_assigned_at, resolved_at) -> Counter:
+    """What one ticket in this state adds to the counters."""
+    values = Counter({status_key(status): 1})
+    values.update(_timing(ASSIGN, created_at, first_assigned_at))
+    values.update(_timing(RESOLVE, created_at, resolved_at))
+    return values
+
+
+def _bump(deltas: Counter, using: str | None = None) -> None:
+    counters = TicketCounter.objects.using(using)
+    for name, delta in sorted(deltas.items()):
+        if not delta:
+            continue
+        updated = counters.filter(name=name).update(value=F("value") + delta)
+        if not updated:
+            counters.create(name=name, value=delta)
+
+
+def before_save(ticket: ConsultationTicket, using: str | None = None) -> None:
+    """Remember the stored state and stamp SLA times for the transition being saved."""
+    previous = None
+    if not ticket._state.adding:
+        previous = (
+            ConsultationTicket.objects.using(using).filter(pk=ticket.pk).values_list(*STATE_FIELDS).first()
+        )
+    ticket._stats_previous = previous
+    if previous is not None:
+        # 这两个时间只由这里写入；实例读出后被队列更新过时，以库中的值为准。
+        ticket.first_assigned_at = ticket.first_assigned_at or previous[3]
+        ticket.resolved_at = ticket.resolved_at or previous[4]
+    was_waiting = previous is None or (previous[0] == ConsultationTicket.STATUS_NEW and previous[1] is None)
+    was_done = previous is not None and previous[0] in DONE
+    now = timezone.now()
+    assigned = ticket.assigned_to_id is not None or ticket.status != ConsultationTicket.STATUS_NEW
+    if ticket.first_assigned_at is None and assigned and was_waiting:
+        ticket.first_assigned_at = now
+    if ticket.resolved_at is None and ticket.status in DONE and not was_done:
+        ticket.resolved_at = now
+
+
+def after_save(ticket: ConsultationTicket, using: str | None = None) -> None:
+    deltas = contribution(ticket.status, ticket.created_at, ticket.first_assigned_at, ticket.resolved_at)
+    previous = ticket.__dict__.pop("_stats_previous", None)
+    if previous is not None:
+        status, _, created_at, first_assigned_at, resolved_at = previous
+        deltas.subtract(contribution(status, created_at, first_assigned_at, resolved_at))
+    _bump(deltas, using)
+
+
+def after_delete(ticket: ConsultationTicket, using: str | None = None) -> None:
+    deltas = Counter()
+    deltas.subtract(contribution(ticket.status, ticket.created_at, ticket.first_assigned_at, ticket.resolved_at))
+    _bump(deltas, using)
+
+
+def moved(count: int, from_status: str, to_status: str) -> None:
+    """Record ``count`` tickets moved by a conditional UPDATE; call it in the same transaction."""
+    if count:
+        _bump(Counter({status_key(from_status): -count, status_key(to_status): count}))
+
+
+def stamp_assigned(ticket_ids, now: datetime) -> None:
+    """Stamp ``first_assigned_at`` on tickets that never had a handler and count their wait."""
+    rows = list(
+        ConsultationTicket.objects.filter(id__in=ticket_ids, first_assigned_at__isnull=True).values_list(
+            "id", "created_at"
+        )
+    )
+    if not rows:
+        return
+    ConsultationTicket.objects.filter(id__in=[ticket_id for ticket_id, _ in rows]).update(first_assigned_at=now)
+    deltas = Counter()
+    for _, created_at in rows:
+        deltas.update(_timing(ASSIGN, created_at, now))
+    _bump(deltas)
+
+
+def counter_values(tickets) -> Counter:
+    """Counters recomputed from ``tickets`` (a ticket queryset)."""
+    values = Counter({status_key(status): 0 for status, _ in ConsultationTicket.STATUS_CHOICES})
+    for kind in (ASSIGN, RESOLVE):
+        values.update({f"{kind}:count": 0, f"{kind}:seconds": 0, f"{kind}:within": 0})
+    rows = tickets.order_by().values_list("status", "created_at", "first_assigned_at", "resolved_at")
+    for row in rows.iterator(chunk_size=2000):
+        values.update(contribution(*row))
+    return values
+
+
+def reconcile_counters(dry_run: bool = False) -> dict[str, tuple[int, int]]:
+    """Rewrite the counters from the tickets; returns ``{name: (stored, actual)}`` for those that differed."""
+    with transaction.atomic():
+        stored = dict(TicketCounter.objects.select_for_update().values_list("name", "value"))
+        actual = counter_values(ConsultationTicket.objects.all())
+        names = sorted(set(stored) | set(actual))
+        drift = {
+            name: (stored.get(name, 0), actual.get(name, 0))
+            for name in names
+            if stored.get(name, 0) != actual.get(name, 0)
+        }
+        if not dry_run:
+            TicketCounter.objects.all().delete()
+            TicketCounter.objects.bulk_create(
+                [TicketCounter(name=name, value=value) for name, value in sorted(actual.items())]
+            )
+    return drift
+
+
+@dataclass
+class SlaTiming:
+    count: int
+    mean: float | None
+    # 达标率（百分比）与目标时长（分钟）。
+    within: float | None
+    target: int
+
+
+@dataclass
+class TicketStats:
+    # [(状态, 中文名, 数量)]
+    statuses: list[tuple[str, str, int]]
+    total: int
+    open: int
+    oldest_unassigned: float | None
+    assign: SlaTiming
+    resolve: SlaTiming
+
+
+def _sla(values: dict[str, int], kind: str) -> SlaTiming:
+    count = values.get(f"{kind}:count", 0)
+    return SlaTiming(
+        count=count,
+        mean=values.get(f"{kind}:seconds", 0) / count if count else None,
+        within=values.get(f"{kind}:within", 0) * 100 / count if count else None,
+        target=_targets()[kind],
+    )
+
+
+def ticket_stats(now: datetime | None = None) -> TicketStats:
+    """Status counts and SLA averages from the counters; times are in seconds."""
+    now = now or timezone.now()
+    values = dict(TicketCounter.objects.values_list("name", "value"))
+    statuses = [
+        (status, label, values.get(status_key(status), 0)) for status, label in ConsultationTicket.STATUS_CHOICES
+    ]
+    # (status, created_at) 索引上的一次定位，不随工单数量增长。
+    oldest = (
+        ConsultationTicket.objects.filter(status=ConsultationTicket.STATUS_NEW, assigned_to__isnull=True)
+        .order_by("created_at")
+        .values_list("created_at", flat=True)
+        .first()
+    )
+    return TicketStats(
+        statuses=statuses,
+        total=sum(count for _, _, count in statuses),
+        open=sum(count for status, _, count in statuses if status in OPEN),
+        oldest_unassigned=(now - oldest).total_seconds() if oldest else None,
+        assign=_sla(values, ASSIGN),
+        resolve=_sla(values, RESOLVE),
+    )
@@ -0,0 +1,157 @@
+from django.conf import settings
+from django.core.signals import setting_changed
+from django.db import transaction
+from django.db.models.signals import post_delete, post_save, pre_save
+from django.dispatch import receiver
+
+from . import ai
+from .models import (
+    Article,
+    Assessment,
+    AssessmentOption,
+    AssessmentQuestion,
+    AssessmentResult,
+    AssessmentSubmission,
+    ConsultationNote,
+    ConsultationTicket,
+)
+from .services import (
+    assessment_analytics,
+    assessment_scoring,
+    assessment_trends,
+    chat_log_writer,
+    knowledge_search,
+    rate_limit,
+    reply_cache,
+    risk_escalation,
+    risk_matcher,
+    risk_scoring,
+    ticket_events,
+    ticket_queue,
+    ticket_stats,
+)
+
+
+@receiver(post_save, sender=Article)
+def index_saved_article(sender, instance, using=None, **kwargs):
+    knowledge_search.index_article(instance, using=using)
+
+
+@receiver(post_delete, sender=Article)
+def unindex_deleted_article(sender, instance, using=None, **kwargs):
+    knowledge_search.remove_article(instance.pk, using=using)
+
+
+@receiver(pre_save, sender=Assessment)
+def version_saved_assessment(sender, instance, **kwargs):
+    instance.definition_version = assessment_scoring.new_definition_version()
+
+
+@receiver(pre_save, sender=ConsultationTicket)
+def rank_saved_ticket(sender, instance, **kwargs):
+    ticket_queue.prepare_ticket(instance)
+
+
+@receiver(pre_save, sender=ConsultationTicket)
+def stamp_saved_ticket(sender, instance, using=None, **kwargs):
+    ticket_stats.before_save(instance, using)
+
+
+@receiver(post_save, sender=ConsultationTicket)
+def count_saved_ticket(sender, instance, using=None, **kwargs):
+    ticket_stats.after_save(instance, using)
+
+
+@receiver(post_delete, sender=ConsultationTicket)
+def count_deleted_ticket(sender, instance, using=None, **kwargs):
+    ticket_stats.after_delete(instance, using)
+
+
+@receiver(post_save, sender=ConsultationTicket)
+def publish_saved_ticket(sender, instance, created, **kwargs):
+    ticket_events.tickets_changed(
+        [instance.pk], ticket_events.KIND_CREATED if created else ticket_events.KIND_UPDATED
+    )
+
+
+@receiver(post_save, sender=ConsultationNote)
+def publish_new_note(sender, instance, created, **kwargs):
+    if created:
+        ticket_events.note_added(instance)
+
+
+@receiver(post_save, sender=AssessmentQuestion)
+@receiver(post_delete, sender=AssessmentQuestion)
+@receiver(post_save, sender=AssessmentResult)
+@receiver(post_delete, sender=AssessmentResult)
+def version_changed_definition(sender, instance, **kwargs):
+    assessment_scoring.touch_definition(pk=instance.assessment_id)
+
+
+@receiver(post_save, sender=AssessmentOption)
+@receiver(post_delete, sender=AssessmentOption)
+def version_changed_option(sender, instance, **kwargs):
+    assessment_scoring.touch_definition(questions__id=instance.question_id)
+
+
+@receiver(post_save, sender=AssessmentSubmission)
+def roll_up_new_submission(sender, instance, created, **kwargs):
+    if created and settings.ASSESSMENT_ANALYTICS.get("REFRESH_ON_SAVE", True):
+        # robust：汇总失败只记日志，不影响已提交的答卷，下次汇总或定时任务会补上。
+        transaction.on_commit(assessment_analytics.refresh_rollups, robust=True)
+
+
+@receiver(post_save, sender=AssessmentSubmission)
+def extend_assessment_trend(sender, instance, created, **kwargs):
+    if created:
+        # 与汇总一样在事务提交后合并；失败时可用 rebuild_assessment_trends 重建。
+        transaction.on_commit(lambda: assessment_trends.record_submissions([instance]), robust=True)
+
+
+@receiver(post_delete, sender=AssessmentSubmission)
+def shrink_assessment_trend(sender, instance, **kwargs):
+    assessment_trends.remove_submission(instance)
+
+
+@receiver(setting_changed)
+def reset_reply_cache_on_setting_change(sender, setting, **kwargs):
+    if setting == "AI_REPLY_CACHE":
+        reply_cache.reset_reply_cache()
+
+
+@receiver(setting_changed)
+def reset_risk_matcher_on_setting_change(sender, setting, **kwargs):
+    if setting == "AI_RISK_KEYWORDS":
+        risk_matcher.reset_risk_matcher()
+    if setting in ("AI_RISK_KEYWORDS", "AI_RISK_SCORING"):
+        risk_scoring.reset_risk_scorer()
+
+
+@receiver(setting_changed)
+def reset_chat_log_writer_on_setting_change(sender, setting, **kwargs):
+    if setting == "AI_CHATLOG_BUFFER":
+        chat_log_writer.reset_chat_log_writer()
+
+
+@receiver(setting_changed)
+def reset_rate_limiter_on_setting_change(sender, setting, **kwargs):
+    if setting == "AI_RATE_LIMIT":
+        rate_limit.reset_rate_limiter()
+
+
+@receiver(setting_changed)
+def reset_ai_router_on_setting_change(sender, setting, **kwargs):
+    if setting in ("AI_ROUTER", "AI_PROVIDERS"):
+        ai.reset_router()
+
+
+@receiver(setting_changed)
+def reset_escalation_worker_on_setting_change(sender, setting, **kwargs):
+    if setting == "RISK_ESCALATION":
+        risk_escalation.reset_escalation_worker()
+
+
+@receiver(setting_changed)
+def reset_ticket_events_on_setting_change(sender, setting, **kwargs):
+    if setting == "TICKET_EVENTS":
+        ticket_events.reset_event_backend()
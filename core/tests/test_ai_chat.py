@@ -1,6 +1,16 @@
+import asyncio
+import json
+import os
+from unittest.mock import AsyncMock, patch
+
+from asgiref.sync import async_to_sync
 from django.conf import settings
-from django.test import TestCase
+from django.contrib.auth.models import User
+from django.test import AsyncClient, TestCase, override_settings
+from django.urls import reverse
 
+from core.ai import AIServiceError, acall_ai, parse_stream_line
+from core.models import ChatLog, ConsultationTicket
 from core.services.ai_chat import parse_ai_payload, contains_risk
 
 
@@ -30,3 +40,124 @@ class AIChatTests(TestCase):
     def test_contains_risk(self):
         self.assertTrue(contains_risk("我想自杀"))
         self.assertFalse(contains_risk("今天心情还好"))
+
+
+async def _pieces(*pieces):
+    for piece in pieces:
+        yield piece
+
+
+SYNC_CHAT_LOGS = {"ENABLED": False}
+NO_RATE_LIMIT = {"ENABLED": False}
+INLINE_ESCALATION = {**settings.RISK_ESCALATION, "BACKGROUND": False}
+
+
+@override_settings(
+    AI_CHATLOG_BUFFER=SYNC_CHAT_LOGS, AI_RATE_LIMIT=NO_RATE_LIMIT, RISK_ESCALATION=INLINE_ESCALATION
+)
+class AIStreamTests(TestCase):
+    def setUp(self):
+        self.user = User.objects.create_user(username="chatter", password="pass12345")
+        self.client.login(username="chatter", password="pass12345")
+
+    def post_stream(self, content):
+        client = AsyncClient()
+
+        async def read():
+            await client.aforce_login(self.user)
+            response = await client.post(
+                reverse("api_chat_stream"),
+                data=json.dumps({"messages": [{"role": "user", "content": content}]}),
+                content_type="application/json",
+            )
+            if not response.streaming:
+                return response, ""
+            return response, "".join([chunk.decode("utf-8") async for chunk in response.streaming_content])
+
+        return async_to_sync(read)()
+
+    def test_parse_stream_line(self):
+        line = 'data: {"choices": [{"delta": {"content": "你好"}}]}'
+        self.assertEqual(parse_stream_line(line), "你好")
+        self.assertEqual(parse_stream_line(": keep-alive"), "")
+        self.assertIsNone(parse_stream_line("data: [DONE]"))
+        with self.assertRaises(AIServiceError):
+            parse_stream_line("data: {not json")
+
+    @patch("core.views.astream_ai_reply", return_value=_pieces("慢慢", "来"))
+    def test_stream_relays_deltas_and_logs_full_reply(self, _stream):
+        response, body = self.post_stream("睡不着怎么办")
+        self.assertEqual(response["Content-Type"], "text/event-stream")
+        self.assertTrue(response.is_async)
+        self.assertIn('event: delta\ndata: {"text": "慢慢"}', body)
+        self.assertTrue(body.endswith('event: done\ndata: {"risk": false}\n\n'))
+        log = ChatLog.objects.get()
+        self.assertEqual(log.response_text, "慢慢来")
+        self.assertFalse(log.risk_flag)
+
+    def test_stream_short_circuits_risk(self):
+        _, body = self.post_stream("我不想活了")
+        self.assertIn('"risk": true', body)
+        self.assertTrue(ChatLog.objects.get().risk_flag)
+        self.assertEqual(ConsultationTicket.objects.get().source, ConsultationTicket.SOURCE_RISK_CHAT)
+
+    def test_stream_requires_login(self):
+        self.client.logout()
+        response = self.client.post(
+            reverse("api_chat_stream"),
+            data=json.dumps({"messages": [{"role": "user", "content": "你好"}]}),
+            content_type="application/json",
+        )
+        self.assertEqual(response.status_code, 401)
+
+
+@override_settings(AI_CHATLOG_BUFFER=SYNC_CHAT_LOGS, AI_RATE_LIMIT=NO_RATE_LIMIT)
+class AsyncChatTests(TestCase):
+    def setUp(self):
+        self.user = User.objects.create_user(username="async", password="pass12345")
+        self.client.login(username="async", password="pass12345")
+
+    def post_chat(self, content):
+        return self.client.post(
+            reverse("api_chat"),
+            data=json.dumps({"messages": [{"role": "user", "content": content}]}),
+            content_type="application/json",
+        )
+
+    @patch("core.views.agenerate_ai_reply", new_callable=AsyncMock, return_value="多晒太阳")
+    def test_async_chat_returns_and_logs_reply(self, _generate):
+        response = self.post_chat("心情不好")
+        self.assertEqual(response.json(), {"reply": "多晒太阳", "risk": False})
+        self.assertEqual(ChatLog.objects.get().user, self.user)
+
+    def test_async_chat_requires_login(self):
+        self.client.logout()
+        self.assertEqual(self.post_chat("你好").status_code, 401)
+
+    def test_acall_ai_reads_chunked_response(self):
+        body = json.dumps({"choices": [{"message": {"content": " 你好 "}}]}).encode("utf-8")
+        chunked = b"%x\r\n%s\r\n0\r\n\r\n" % (len(body), body)
+
+        async def handle(reader, writer):
+            await reader.readuntil(b"\r\n\r\n")
+            writer.write(b"HTTP/1.1 200 OK\r\nTransfer-Encoding: chunked\r\n\r\n" + chunked)
+            await writer.drain()
+            writer.close()
+
+        async def run():
+            server = await asyncio.start_server(handle, "127.0.0.1", 0)
+            port = server.sockets[0].getsockname()[1]
+            providers = {
+                "stub": {
+                    "base_url": f"http://127.0.0.1:{port}/v1/chat/completions",
+                    "api_key_env": "STUB_AI_KEY",
+                    "model": "stub",
+                }
+            }
+            async with server:
+                with override_settings(AI_PROVIDERS=providers), patch.dict(
+                    os.environ, {"STUB_AI_KEY": "key"}
+                ):
+                    return await acall_ai("stub", [{"role": "user", "content": "hi"}])
+
+        self.assertEqual(asyncio.run(run()), "你好")
@@ -0,0 +1,122 @@
+import json
+import os
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from unittest.mock import patch
+
+from django.test import SimpleTestCase, override_settings
+
+from core.ai import (
+    AIServiceError,
+    ProviderClient,
+    acall_ai,
+    astream_ai,
+    call_ai,
+    close_clients,
+    pool_stats,
+    stream_ai,
+)
+
+
+class _StubHandler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+
+    def log_message(self, *args):
+        pass
+
+    def do_POST(self):
+        payload = json.loads(self.rfile.read(int(self.headers["Content-Length"])))
+        if payload["messages"][-1]["content"] == "fail":
+            body = json.dumps({"error": {"message": "bad key"}}).encode("utf-8")
+            self.send_response(401)
+        elif payload.get("stream"):
+            events = [
+                {"choices": [{"delta": {"content": "慢慢"}}]},
+                {"choices": [{"delta": {"content": "来"}}]},
+            ]
+            lines = [f"data: {json.dumps(event)}\n\n" for event in events] + ["data: [DONE]\n\n"]
+            body = "".join(lines).encode("utf-8")
+            self.send_response(200)
+            if payload["messages"][-1]["content"] == "chunked":
+                # 分块边界故意落在一行中间。
+                self.send_header("Transfer-Encoding", "chunked")
+                self.end_headers()
+                for start in range(0, len(body), 7):
+                    part = body[start : start + 7]
+                    self.wfile.write(f"{len(part):x}\r\n".encode("ascii") + part + b"\r\n")
+                self.wfile.write(b"0\r\n\r\n")
+                return
+        else:
+            body = json.dumps({"choices": [{"message": {"content": "你好"}}]}).encode("utf-8")
+            self.send_response(200)
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+
+@patch.dict(os.environ, {"STUB_AI_KEY": "key"})
+class ProviderClientTests(SimpleTestCase):
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.server = ThreadingHTTPServer(("127.0.0.1", 0), _StubHandler)
+        threading.Thread(target=cls.server.serve_forever, daemon=True).start()
+        cls.base_url = f"http://127.0.0.1:{cls.server.server_address[1]}/v1/chat/completions"
+
+    @classmethod
+    def tearDownClass(cls):
+        cls.server.shutdown()
+        cls.server.server_close()
+        super().tearDownClass()
+
+    def setUp(self):
+        close_clients()
+        self.addCleanup(close_clients)
+        providers = {"stub": {"base_url": self.base_url, "api_key_env": "STUB_AI_KEY", "model": "m"}}
+        settings_override = override_settings(AI_PROVIDERS=providers)
+        settings_override.enable()
+        self.addCleanup(settings_override.disable)
+
+    def test_connections_are_reused(self):
+        messages = [{"role": "user", "content": "hi"}]
+        self.assertEqual(call_ai("stub", messages), "你好")
+        self.assertEqual("".join(stream_ai("stub", messages)), "慢慢来")
+        self.assertEqual(call_ai("stub", messages), "你好")
+        stats = pool_stats()[self.base_url]
+        self.assertEqual(stats["requests"], 3)
+        self.assertEqual(stats["connects"], 1)
+        self.assertAlmostEqual(stats["reuse_ratio"], 2 / 3)
+
+    async def test_async_stream_reads_plain_and_chunked_bodies(self):
+        for content in ("hi", "chunked"):
+            pieces = [piece async for piece in astream_ai("stub", [{"role": "user", "content": content}])]
+            self.assertEqual(pieces, ["慢慢", "来"])
+        with self.assertRaisesMessage(AIServiceError, "401"):
+            async for _ in astream_ai("stub", [{"role": "user", "content": "fail"}]):
+                pass
+
+    async def test_async_connections_are_reused(self):
+        messages = [{"role": "user", "content": "hi"}]
+        self.assertEqual(await acall_ai("stub", messages), "你好")
+        self.assertEqual([piece async for piece in astream_ai("stub", messages)], ["慢慢", "来"])
+        chunked = [{"role": "user", "content": "chunked"}]
+        self.assertEqual([piece async for piece in astream_ai("stub", chunked)], ["慢慢", "来"])
+        self.assertEqual(await acall_ai("stub", messages), "你好")
+        stats = pool_stats()[self.base_url]
+        self.assertEqual(stats["requests"], 4)
+        self.assertEqual(stats["connects"], 1)
+        self.assertEqual(stats["idle"], 1)
+
+    def test_http_errors_carry_provider_detail(self):
+        with self.assertRaisesMessage(AIServiceError, "401"):
+            call_ai("stub", [{"role": "user", "content": "fail"}])
+        self.assertEqual(call_ai("stub", [{"role": "user", "content": "hi"}]), "你好")
+
+    def test_pool_keeps_at_most_pool_size_idle(self):
+        client = ProviderClient(self.base_url, pool_size=1, timeout=5)
+        body = json.dumps({"messages": [{"role": "user", "content": "hi"}]}).encode("utf-8")
+        with client.post(body, {}) as first, client.post(body, {}) as second:
+            first.read()
+            second.read()
+        self.assertEqual(client.stats()["idle"], 1)
+        client.close()
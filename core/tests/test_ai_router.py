@@ -0,0 +1,188 @@
+import asyncio
+import os
+import time
+from unittest.mock import patch
+
+from django.test import SimpleTestCase, override_settings
+
+from core.ai import (
+    AIServiceError,
+    CircuitBreaker,
+    ProviderRouter,
+    acall_ai,
+    astream_ai,
+    call_ai,
+    close_clients,
+    router_stats,
+    stream_ai,
+)
+from core.ai_stub import StubAIServer
+
+ROUTER = {
+    "RETRIES": 2,
+    "BACKOFF_BASE": 0.0,
+    "BACKOFF_MAX": 0.0,
+    "BREAKER_FAILURES": 2,
+    "BREAKER_COOLDOWN": 60,
+    "HEDGE": False,
+    "HEDGE_QUANTILE": 0.95,
+    "HEDGE_MIN_SAMPLES": 5,
+    "HEDGE_MIN_DELAY": 0.05,
+    "LATENCY_WINDOW": 50,
+    "HEDGE_WORKERS": 4,
+}
+MESSAGES = [{"role": "user", "content": "你好"}]
+
+
+@patch.dict(os.environ, {"STUB_AI_KEY": "key"})
+class ProviderRouterTests(SimpleTestCase):
+    def _serve(self, **kwargs) -> StubAIServer:
+        stub = StubAIServer(**kwargs).start()
+        self.addCleanup(stub.stop)
+        return stub
+
+    def _route(self, primary: StubAIServer, fallback: StubAIServer, **router):
+        close_clients()
+        self.addCleanup(close_clients)
+        providers = {
+            "stub": {
+                "base_url": primary.url,
+                "api_key_env": "STUB_AI_KEY",
+                "model": "m",
+                "fallbacks": [{"base_url": fallback.url}],
+            }
+        }
+        settings_override = override_settings(AI_PROVIDERS=providers, AI_ROUTER={**ROUTER, **router})
+        settings_override.enable()
+        self.addCleanup(settings_override.disable)
+
+    def test_retryable_errors_fail_over_to_fallback(self):
+        for fail_status in (503, None):
+            with self.subTest(fail_status=fail_status):
+                primary = self._serve(reply="主", fail_times=100, fail_status=fail_status)
+                fallback = self._serve(reply="备")
+                self._route(primary, fallback)
+                self.assertEqual(call_ai("stub", MESSAGES), "备")
+                self.assertEqual(primary.requests, 1)
+
+    def test_client_errors_are_not_retried(self):
+        primary = self._serve(fail_times=100, fail_status=401)
+        fallback = self._serve()
+        self._route(primary, fallback)
+        with self.assertRaisesMessage(AIServiceError, "401"):
+            call_ai("stub", MESSAGES)
+        self.assertEqual((primary.requests, fallback.requests), (1, 0))
+        self.assertEqual(router_stats()[primary.url]["state"], CircuitBreaker.CLOSED)
+
+    def test_breaker_skips_failing_endpoint(self):
+        primary = self._serve(fail_times=100)
+        fallback = self._serve(reply="备")
+        self._route(primary, fallback)
+        for _ in range(3):
+            self.assertEqual(call_ai("stub", MESSAGES), "备")
+        self.assertEqual(primary.requests, 2)
+        stats = router_stats()
+        self.assertEqual(stats[primary.url]["state"], CircuitBreaker.OPEN)
+        self.assertEqual(stats[fallback.url]["requests"], 3)
+
+    def test_all_endpoints_failing_raises_last_error(self):
+        primary = self._serve(fail_times=100)
+        fallback = self._serve(fail_times=100)
+        self._route(primary, fallback, RETRIES=1)
+        with self.assertRaisesMessage(AIServiceError, "503"):
+            call_ai("stub", MESSAGES)
+        self.assertEqual((primary.requests, fallback.requests), (1, 1))
+
+    def test_hedged_request_cuts_tail_latency(self):
+        # 前 5 次请求很快，用来积累延迟样本；第 6 次卡住 1 秒。
+        primary = self._serve(reply="主", delay=lambda index: 1.0 if index == 5 else 0.0)
+        fallback = self._serve(reply="备")
+        self._route(primary, fallback, HEDGE=True)
+        for _ in range(5):
+            self.assertEqual(call_ai("stub", MESSAGES), "主")
+        started = time.perf_counter()
+        self.assertEqual(call_ai("stub", MESSAGES), "备")
+        self.assertLess(time.perf_counter() - started, 0.5)
+        self.assertEqual(router_stats()[primary.url]["hedges"], 1)
+
+    def test_stream_fails_over_before_first_piece(self):
+        primary = self._serve(fail_times=100)
+        fallback = self._serve(reply="慢慢来吧")
+        self._route(primary, fallback)
+        self.assertEqual(list(stream_ai("stub", MESSAGES)), ["慢慢", "来吧"])
+        self.assertEqual(primary.requests, 1)
+
+    async def test_async_stream_fails_over_before_first_piece(self):
+        primary = self._serve(fail_times=100)
+        fallback = self._serve(reply="慢慢来吧")
+        self._route(primary, fallback)
+        self.assertEqual([piece async for piece in astream_ai("stub", MESSAGES)], ["慢慢", "来吧"])
+        self.assertEqual(primary.requests, 1)
+
+    async def test_async_failover_and_hedging(self):
+        primary = self._serve(reply="主", fail_times=1, delay=lambda index: 1.0 if index == 6 else 0.0)
+        fallback = self._serve(reply="备")
+        self._route(primary, fallback, HEDGE=True)
+        self.assertEqual(await acall_ai("stub", MESSAGES), "备")
+        for _ in range(5):
+            self.assertEqual(await acall_ai("stub", MESSAGES), "主")
+        started = time.perf_counter()
+        self.assertEqual(await acall_ai("stub", MESSAGES), "备")
+        self.assertLess(time.perf_counter() - started, 0.5)
+
+
+class CircuitBreakerTests(SimpleTestCase):
+    def test_half_open_allows_one_trial(self):
+        breaker = CircuitBreaker(threshold=2, cooldown=0.05)
+        breaker.record_failure()
+        self.assertTrue(breaker.allow())
+        breaker.record_failure()
+        self.assertFalse(breaker.allow())
+        time.sleep(0.06)
+        self.assertEqual(breaker.state, CircuitBreaker.HALF_OPEN)
+        self.assertTrue(breaker.allow())
+        self.assertFalse(breaker.allow())
+        breaker.record_failure()
+        self.assertEqual(breaker.state, CircuitBreaker.OPEN)
+        time.sleep(0.06)
+        self.assertTrue(breaker.allow())
+        breaker.record_success()
+        self.assertEqual(breaker.state, CircuitBreaker.CLOSED)
+
+    def test_release_hands_back_the_trial(self):
+        breaker = CircuitBreaker(threshold=1, cooldown=0.05)
+        breaker.record_failure()
+        time.sleep(0.06)
+        self.assertTrue(breaker.allow())
+        breaker.release()
+        self.assertEqual(breaker.state, CircuitBreaker.HALF_OPEN)
+        self.assertTrue(breaker.allow())
+
+
+class TrialOutcomeTests(SimpleTestCase):
+    def setUp(self):
+        self.router = ProviderRouter({**ROUTER, "BREAKER_FAILURES": 1, "BREAKER_COOLDOWN": 0.05})
+        self.endpoint = {"base_url": "http://primary"}
+        self.breaker = self.router.state(self.endpoint).breaker
+        self.breaker.record_failure()
+        time.sleep(0.06)
+
+    def test_client_error_ends_the_trial(self):
+        def send(endpoint):
+            raise AIServiceError("400", retryable=False)
+
+        with self.assertRaisesMessage(AIServiceError, "400"):
+            self.router.call([self.endpoint], send)
+        self.assertEqual(self.breaker.state, CircuitBreaker.CLOSED)
+
+    async def test_cancelled_trial_is_released(self):
+        async def send(endpoint):
+            await asyncio.sleep(10)
+
+        task = asyncio.ensure_future(self.router.acall([self.endpoint], send))
+        await asyncio.sleep(0.01)
+        self.assertFalse(self.breaker.allow())
+        task.cancel()
+        with self.assertRaises(asyncio.CancelledError):
+            await task
+        self.assertTrue(self.breaker.allow())
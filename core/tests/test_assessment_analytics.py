@@ -0,0 +1,112 @@
+from datetime import datetime
+from io import StringIO
+from unittest import mock
+
+from django.contrib.auth import get_user_model
+from django.core.management import call_command
+from django.db import OperationalError, connection
+from django.test import TestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+from django.utils import timezone
+
+from core.models import (
+    Assessment,
+    AssessmentOption,
+    AssessmentQuestion,
+    AssessmentResult,
+    AssessmentRollup,
+    AssessmentSubmission,
+    UserProfile,
+)
+from core.services.assessment_analytics import assessment_analytics, rebuild_rollups, refresh_rollups
+
+
+def _at(year, month, day):
+    return timezone.make_aware(datetime(year, month, day, 12, 0))
+
+
+@override_settings(ASSESSMENT_ANALYTICS={"REFRESH_ON_SAVE": False, "BATCH_SIZE": 2})
+class AssessmentRollupTests(TestCase):
+    def setUp(self):
+        self.assessment = Assessment.objects.create(name="焦虑筛查", slug="gad", is_published=True)
+        AssessmentResult.objects.create(assessment=self.assessment, min_score=0, max_score=4, title="正常", summary="")
+        AssessmentResult.objects.create(assessment=self.assessment, min_score=5, max_score=21, title="关注", summary="")
+        User = get_user_model()
+        self.zhang = User.objects.create_user("zhang")
+        UserProfile.objects.create(user=self.zhang, province="浙江", city="杭州")
+        self.li = User.objects.create_user("li")
+
+    def _submit(self, user, score, when):
+        return AssessmentSubmission.objects.create(
+            assessment=self.assessment, user=user, total_score=score, result_title="", created_at=when
+        )
+
+    def test_refresh_aggregates_and_is_incremental(self):
+        self._submit(self.zhang, 3, _at(2026, 8, 3))
+        self._submit(self.zhang, 3, _at(2026, 8, 20))
+        self._submit(self.li, 8, _at(2026, 9, 1))
+        self.assertEqual(refresh_rollups(), 3)
+        self.assertEqual(refresh_rollups(), 0)
+        self.assertEqual(AssessmentRollup.objects.get(province="浙江", total_score=3).count, 2)
+
+        self._submit(self.zhang, 3, _at(2026, 9, 2))
+        self.assertEqual(refresh_rollups(), 1)
+        incremental = sorted(AssessmentRollup.objects.values_list("month", "province", "city", "total_score", "count"))
+        self.assertEqual(rebuild_rollups(), 4)
+        rebuilt = sorted(AssessmentRollup.objects.values_list("month", "province", "city", "total_score", "count"))
+        self.assertEqual(incremental, rebuilt)
+
+        analytics = assessment_analytics(self.assessment)
+        self.assertEqual(analytics.total, 4)
+        self.assertAlmostEqual(analytics.mean, 17 / 4)
+        self.assertEqual([(row["month"].month, row["count"]) for row in analytics.months], [(8, 2), (9, 2)])
+        self.assertEqual({row["title"]: row["count"] for row in analytics.results}, {"正常": 3, "关注": 1})
+        self.assertEqual(analytics.provinces, ["浙江"])
+        self.assertEqual(assessment_analytics(self.assessment, "浙江").total, 3)
+
+    def test_dashboard_reads_rollups_only(self):
+        self._submit(self.li, 8, _at(2026, 9, 1))
+        call_command("refresh_assessment_rollups", stdout=StringIO())
+        staff = get_user_model().objects.create_user("staff", password="pw", is_staff=True)
+        self.client.force_login(staff)
+        url = reverse("manage_assessment_analytics")
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get(url, {"assessment": "gad"})
+        self.assertFalse([query for query in queries if "core_assessmentsubmission" in query["sql"]])
+        self.assertContains(response, "共 1 份测评")
+        self.assertContains(response, "关注")
+
+        self.client.force_login(self.li)
+        response = self.client.get(url)
+        self.assertEqual(response.status_code, 302)
+
+
+class RollupOnSaveTests(TestCase):
+    def test_submission_is_rolled_up_after_commit(self):
+        assessment = Assessment.objects.create(name="睡眠量表", slug="isi", is_published=True)
+        user = get_user_model().objects.create_user("wang")
+        with self.captureOnCommitCallbacks(execute=True):
+            AssessmentSubmission.objects.create(assessment=assessment, user=user, total_score=6, result_title="")
+        self.assertEqual(AssessmentRollup.objects.get(assessment=assessment).count, 1)
+
+    def test_failed_refresh_does_not_fail_the_submission(self):
+        assessment = Assessment.objects.create(name="睡眠量表", slug="isi", is_published=True)
+        question = AssessmentQuestion.objects.create(assessment=assessment, order=1, text="Q1")
+        option = AssessmentOption.objects.create(question=question, order=1, text="偶尔", score=2)
+        user = get_user_model().objects.create_user("wang")
+        self.client.force_login(user)
+        url = reverse("assessment_detail", args=[assessment.slug])
+        calls = []
+
+        def refresh_rollups():
+            calls.append(AssessmentSubmission.objects.get(user=user).answers.count())
+            raise OperationalError("database is locked")
+
+        with mock.patch("core.services.assessment_analytics.refresh_rollups", refresh_rollups):
+            with self.assertLogs("django.test", "ERROR"), self.captureOnCommitCallbacks(execute=True):
+                response = self.client.post(url, {f"question_{question.id}": str(option.id)})
+        self.assertEqual(response.status_code, 302)
+        # 回调运行时答案已经写入。
+        self.assertEqual(calls, [1])
+        self.assertEqual(AssessmentSubmission.objects.get(user=user).answers.count(), 1)
@@ -0,0 +1,103 @@
+import json
+import random
+import shutil
+import tempfile
+from io import StringIO
+from pathlib import Path
+
+from django.contrib.auth import get_user_model
+from django.core.management import call_command
+from django.test import TestCase
+from django.utils import timezone
+
+from core.models import (
+    Assessment,
+    AssessmentAnswer,
+    AssessmentOption,
+    AssessmentQuestion,
+    AssessmentResult,
+    AssessmentSubmission,
+    AssessmentTrend,
+)
+from core.services.assessment_scoring import compile_assessment, score_assessment, score_batch
+
+
+class AssessmentImportTests(TestCase):
+    def setUp(self):
+        self.assessment = Assessment.objects.create(name="抑郁筛查", slug="phq", is_published=True)
+        self.questions = []
+        for order in range(1, 4):
+            question = AssessmentQuestion.objects.create(
+                assessment=self.assessment, order=order, text=f"Q{order}"
+            )
+            for score in range(4):
+                AssessmentOption.objects.create(question=question, order=score, text=str(score), score=score)
+            self.questions.append(question)
+        AssessmentResult.objects.create(assessment=self.assessment, min_score=0, max_score=4, title="正常", summary="")
+        AssessmentResult.objects.create(assessment=self.assessment, min_score=5, max_score=9, title="关注", summary="")
+        self.user = get_user_model().objects.create_user("zhang")
+        self.tmp = Path(tempfile.mkdtemp())
+        self.addCleanup(shutil.rmtree, self.tmp)
+
+    def test_batch_matches_single_scoring(self):
+        compiled = compile_assessment(self.assessment.pk, 0)
+        rng = random.Random(3)
+        answers = [[rng.randint(1, 4) for _ in self.questions] for _ in range(200)]
+        answers += [[1, 2], [1, 9, 1]]
+        batch = score_batch(compiled, answers)
+        self.assertEqual(sorted(batch.errors), [200, 201])
+        self.assertIn("第 2 题", batch.errors[201])
+        for index, positions in enumerate(answers[:200]):
+            selected = {
+                str(question.id): str(compiled.option_at(number, position).id)
+                for number, (question, position) in enumerate(zip(self.questions, positions))
+            }
+            single = score_assessment(self.assessment, selected)
+            self.assertEqual(batch.totals[index], single.total_score)
+            self.assertEqual(batch.results[index].title, single.result_title)
+
+    def test_import_csv_in_chunks(self):
+        path = self.tmp / "sheets.csv"
+        path.write_text(
+            "username,assessment,created_at,q1,q2,q3\n"
+            "zhang,phq,2026-09-01,1,2,3\n"
+            "li,phq,2026-09-01 10:30,4,4,4\n"
+            "zhang,missing,,1,1,1\n"
+            "zhang,phq,,1,,1\n",
+            encoding="utf-8",
+        )
+        err = StringIO()
+        call_command(
+            "import_assessment_submissions",
+            str(path),
+            chunk_size=2,
+            create_users=True,
+            stdout=StringIO(),
+            stderr=err,
+        )
+        self.assertIn("line 4: 找不到量表：missing", err.getvalue())
+        self.assertIn("line 5: 第 2 题的答案无效", err.getvalue())
+        submissions = AssessmentSubmission.objects.order_by("total_score")
+        self.assertEqual(
+            [(item.user.username, item.total_score, item.result_title) for item in submissions],
+            [("zhang", 3, "正常"), ("li", 9, "关注")],
+        )
+        self.assertEqual(timezone.localdate(submissions[0].created_at).isoformat(), "2026-09-01")
+        self.assertEqual(AssessmentAnswer.objects.count(), 6)
+        self.assertFalse(get_user_model().objects.get(username="li").has_usable_password())
+        self.assertEqual(
+            sorted(AssessmentTrend.objects.values_list("user__username", "last_score")), [("li", 9), ("zhang", 3)]
+        )
+
+    def test_import_jsonl_dry_run_writes_nothing(self):
+        path = self.tmp / "sheets.jsonl"
+        rows = [{"username": "zhang", "answers": [2, 2, 2]}, {"username": "wang", "answers": [1, 1, 1]}]
+        path.write_text("\n".join(json.dumps(row) for row in rows) + "\nnot json\n", encoding="utf-8")
+        out, err = StringIO(), StringIO()
+        call_command(
+            "import_assessment_submissions", str(path), assessment="phq", dry_run=True, stdout=out, stderr=err
+        )
+        self.assertIn("Would import 1 submissions", out.getvalue())
+        self.assertIn("line 2: 找不到用户：wang", err.getvalue())
+        self.assertIn("line 3:", err.getvalue())
+        self.assertFalse(AssessmentSubmission.objects.exists())
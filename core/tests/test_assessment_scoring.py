@@ -1,7 +1,15 @@
+from django.contrib.auth import get_user_model
 from django.test import TestCase
+from django.urls import reverse
 
-from core.models import Assessment, AssessmentOption, AssessmentQuestion
-from core.services.assessment_scoring import score_assessment
+from core.models import (
+    Assessment,
+    AssessmentOption,
+    AssessmentQuestion,
+    AssessmentResult,
+    AssessmentSubmission,
+)
+from core.services.assessment_scoring import compile_assessment, score_assessment
 
 
 class AssessmentScoringTests(TestCase):
@@ -26,3 +34,64 @@ class AssessmentScoringTests(TestCase):
         selected = {str(self.q1.id): str(other_o.id), str(self.q2.id): str(self.o21.id)}
         with self.assertRaises(ValueError):
             score_assessment(self.assessment, selected)
+
+    def test_scoring_runs_no_definition_queries(self):
+        selected = {str(self.q1.id): str(self.o11.id), str(self.q2.id): str(self.o21.id)}
+        score_assessment(self.assessment, selected)
+        with self.assertNumQueries(0):
+            self.assertEqual(score_assessment(self.assessment, selected).total_score, 2)
+
+    def test_definition_edit_invalidates_compiled_cache(self):
+        selected = {str(self.q1.id): str(self.o12.id), str(self.q2.id): str(self.o21.id)}
+        self.assertEqual(score_assessment(self.assessment, selected).total_score, 3)
+        self.o12.score = 5
+        self.o12.save()
+        AssessmentResult.objects.create(
+            assessment=self.assessment, min_score=6, max_score=9, title="偏高", summary="s"
+        )
+        assessment = Assessment.objects.get(pk=self.assessment.pk)
+        self.assertNotEqual(assessment.definition_version, self.assessment.definition_version)
+        result = score_assessment(assessment, selected)
+        self.assertEqual((result.total_score, result.result_title), (6, "偏高"))
+
+    def test_result_lookup_matches_range_query(self):
+        ranges = [(0, 4), (3, 10), (5, 6), (12, 20), (12, 14)]
+        for low, high in ranges:
+            AssessmentResult.objects.create(
+                assessment=self.assessment, min_score=low, max_score=high, title=f"{low}-{high}", summary=""
+            )
+        compiled = compile_assessment(self.assessment.pk, 0)
+        for total in range(-1, 23):
+            expected = (
+                AssessmentResult.objects.filter(
+                    assessment=self.assessment, min_score__lte=total, max_score__gte=total
+                )
+                .order_by("min_score", "id")
+                .first()
+            )
+            found = compiled.result_for(total)
+            self.assertEqual(found.title if found else None, expected.title if expected else None, total)
+
+
+class AssessmentDetailViewTests(TestCase):
+    def setUp(self):
+        self.user = get_user_model().objects.create_user("tester", password="pw")
+        self.client.force_login(self.user)
+        self.assessment = Assessment.objects.create(name="睡眠量表", slug="sleep", is_published=True)
+        self.question = AssessmentQuestion.objects.create(assessment=self.assessment, order=1, text="Q1")
+        self.option = AssessmentOption.objects.create(question=self.question, order=1, text="偶尔", score=2)
+        AssessmentResult.objects.create(
+            assessment=self.assessment, min_score=0, max_score=3, title="轻度", summary="s"
+        )
+
+    def test_submission_records_answers(self):
+        url = reverse("assessment_detail", args=[self.assessment.slug])
+        self.assertContains(self.client.get(url), "偶尔")
+        response = self.client.post(url, {f"question_{self.question.id}": str(self.option.id)})
+        submission = AssessmentSubmission.objects.get(user=self.user)
+        self.assertRedirects(
+            response, reverse("assessment_result", args=[self.assessment.slug, submission.id])
+        )
+        self.assertEqual((submission.total_score, submission.result_title), (2, "轻度"))
+        answer = submission.answers.get()
+        self.assertEqual((answer.option_id, answer.score), (self.option.id, 2))
@@ -0,0 +1,72 @@
+from datetime import datetime
+from io import StringIO
+
+from django.contrib.auth import get_user_model
+from django.core.management import call_command
+from django.db import connection
+from django.test import TestCase
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+from django.utils import timezone
+
+from core.models import Assessment, AssessmentResult, AssessmentSubmission, AssessmentTrend
+
+
+def _at(year, month, day):
+    return timezone.make_aware(datetime(year, month, day, 9, 0))
+
+
+class AssessmentTrendTests(TestCase):
+    def setUp(self):
+        self.assessment = Assessment.objects.create(name="抑郁筛查", slug="phq", is_published=True)
+        AssessmentResult.objects.create(assessment=self.assessment, min_score=0, max_score=4, title="正常", summary="")
+        AssessmentResult.objects.create(assessment=self.assessment, min_score=5, max_score=27, title="关注", summary="")
+        self.user = get_user_model().objects.create_user("zhang", password="pw")
+
+    def _submit(self, score, when):
+        with self.captureOnCommitCallbacks(execute=True):
+            return AssessmentSubmission.objects.create(
+                assessment=self.assessment, user=self.user, total_score=score, result_title="", created_at=when
+            )
+
+    def _trend(self):
+        return AssessmentTrend.objects.get(user=self.user, assessment=self.assessment)
+
+    def test_series_and_flags_follow_submissions(self):
+        first = self._submit(2, _at(2026, 9, 1))
+        trend = self._trend()
+        self.assertEqual(trend.points, [[int(first.created_at.timestamp()), 2, 1, first.id]])
+        self.assertIsNone(trend.delta)
+
+        second = self._submit(9, _at(2026, 9, 15))
+        trend = self._trend()
+        self.assertEqual(trend.delta, 7)
+        self.assertTrue(trend.worsened)
+        self.assertEqual(trend.tier_change, 1)
+
+        # 补录的较早记录按时间插入，不改变“最近一次”的比较对象。
+        self._submit(4, _at(2026, 9, 10))
+        trend = self._trend()
+        self.assertEqual([point[1] for point in trend.points], [2, 4, 9])
+        self.assertEqual(trend.delta, 5)
+        self.assertTrue(trend.worsened)
+
+        second.delete()
+        trend = self._trend()
+        self.assertEqual(trend.last_score, 4)
+        self.assertFalse(trend.worsened)
+
+        incremental = trend.points
+        call_command("rebuild_assessment_trends", stdout=StringIO())
+        self.assertEqual(self._trend().points, incremental)
+
+    def test_trend_page_reads_series_only(self):
+        self._submit(8, _at(2026, 8, 1))
+        self._submit(1, _at(2026, 9, 1))
+        self.client.force_login(self.user)
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get(reverse("assessment_trends"))
+        self.assertFalse([query for query in queries if "core_assessmentsubmission" in query["sql"]])
+        self.assertContains(response, "分数明显下降")
+        self.assertContains(response, "<polyline")
+        self.assertEqual(response.content.decode().count("<circle"), 2)
@@ -0,0 +1,62 @@
+import os
+import time
+from io import StringIO
+from unittest.mock import patch
+
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.core.management import call_command
+from django.test import SimpleTestCase, TransactionTestCase, override_settings
+
+from core.ai import AIServiceError, call_ai, close_clients, stream_ai
+from core.ai_stub import StubAIServer
+from core.models import ChatLog
+
+
+@override_settings(AI_CHATLOG_BUFFER={"ENABLED": False})
+class BenchChatCommandTests(TransactionTestCase):
+    def test_reports_latency_and_cleans_up(self):
+        out = StringIO()
+        call_command(
+            "bench_chat",
+            sessions=3,
+            concurrency=2,
+            turns=2,
+            think_ms=0,
+            median_ms=5,
+            risk_ratio=0,
+            no_rate_limit=True,
+            stdout=out,
+        )
+        report = out.getvalue()
+        self.assertIn("statuses={200: 6}", report)
+        self.assertIn("p95=", report)
+        self.assertIn("chat_log: rows=6", report)
+        self.assertFalse(get_user_model().objects.filter(username__startswith="bench-").exists())
+        self.assertFalse(ChatLog.objects.exists())
+
+
+@patch.dict(os.environ, {"STUB_AI_KEY": "key"})
+class StubAIServerTests(SimpleTestCase):
+    def test_error_injection_and_stream_pacing(self):
+        close_clients()
+        self.addCleanup(close_clients)
+        with StubAIServer(reply="一二三四五六", error_rate=0.5, chars_per_second=40, seed=1) as stub:
+            providers = {"stub": {"base_url": stub.url, "api_key_env": "STUB_AI_KEY", "model": "m"}}
+            router = {"RETRIES": 0, "BREAKER_FAILURES": 1000}
+            with override_settings(AI_PROVIDERS=providers, AI_ROUTER={**settings.AI_ROUTER, **router}):
+                outcomes = []
+                for _ in range(20):
+                    try:
+                        outcomes.append(call_ai("stub", [{"role": "user", "content": "hi"}]))
+                    except AIServiceError:
+                        outcomes.append(None)
+                self.assertEqual(outcomes.count(None), stub.failures)
+                self.assertTrue(0 < stub.failures < 20)
+
+                stub.error_rate = 0
+                started = time.perf_counter()
+                pieces = list(stream_ai("stub", [{"role": "user", "content": "hi"}]))
+                self.assertEqual(pieces, ["一二", "三四", "五六"])
+                # 三段之间各间隔 2 / 40 秒。
+                self.assertGreaterEqual(time.perf_counter() - started, 0.1)
\ No newline at end of file
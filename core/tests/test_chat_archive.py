@@ -0,0 +1,115 @@
+import tempfile
+from datetime import timedelta
+from io import StringIO
+from pathlib import Path
+
+from django.contrib.auth.models import User
+from django.core.management import call_command
+from django.test import TestCase
+from django.utils import timezone
+
+from core.models import ChatConversation, ChatLog
+from core.services.chat_archive import Segment, archive_chat_logs, iter_archived_logs
+
+
+def conversation_turns(user, turns, start, risk_turn=None, limit=4):
+    history = []
+    logs = []
+    conversation = ChatConversation.objects.create(
+        provider="deepseek",
+        user=user,
+        turn_count=turns,
+        started_at=start,
+        last_turn_at=start + timedelta(hours=turns),
+    )
+    for turn in range(turns):
+        history.append({"role": "user", "content": f"{user.username} 问题 {turn}"})
+        window = history[-limit:]
+        log = ChatLog.objects.create(
+            provider="deepseek",
+            user=user,
+            conversation=conversation,
+            messages_json=window,
+            response_text=f"回复 {turn}",
+            risk_flag=turn == risk_turn,
+        )
+        ChatLog.objects.filter(pk=log.pk).update(created_at=start + timedelta(hours=turn))
+        history.append({"role": "assistant", "content": f"回复 {turn}"})
+        logs.append(log.pk)
+    return logs
+
+
+class ChatArchiveTests(TestCase):
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.addCleanup(self.tmp.cleanup)
+        self.dir = Path(self.tmp.name)
+        self.alice = User.objects.create(username="alice")
+        self.bob = User.objects.create(username="bob")
+        self.start = timezone.now() - timedelta(days=100)
+        conversation_turns(self.alice, 12, self.start, risk_turn=5)
+        conversation_turns(self.bob, 6, self.start)
+        self.expected = {
+            log.pk: (log.messages_json, log.response_text, log.risk_flag, log.created_at)
+            for log in ChatLog.objects.all()
+        }
+
+    def test_round_trip_and_delete(self):
+        recent = ChatConversation.objects.create(provider="deepseek", user=self.alice)
+        before = timezone.now() - timedelta(days=1)
+        path, archived = archive_chat_logs(before, self.dir, block_rows=5, chunk_size=4)
+        self.assertEqual(archived, 18)
+        self.assertFalse(ChatLog.objects.exists())
+        # 轮次归档后，只留下最近开始、尚无记录的对话。
+        self.assertEqual(list(ChatConversation.objects.all()), [recent])
+        conversations = {log.user_id: log.conversation_id for log in iter_archived_logs(self.dir)}
+        self.assertEqual(len(set(conversations.values())), 2)
+        self.assertNotIn(None, conversations.values())
+        segment = Segment(path)
+        self.assertEqual(segment.rows, 18)
+        self.assertEqual(len(segment.blocks), 4)
+        restored = {
+            log.id: (log.messages, log.response_text, log.risk_flag, log.created_at)
+            for log in iter_archived_logs(self.dir)
+        }
+        self.assertEqual(restored.keys(), self.expected.keys())
+        for pk, (messages, reply, risk, created_at) in self.expected.items():
+            self.assertEqual(restored[pk][:3], (messages, reply, risk))
+            self.assertLess(abs(restored[pk][3] - created_at), timedelta(milliseconds=1))
+
+    def test_repeated_prefixes_are_stored_once(self):
+        path, _ = archive_chat_logs(timezone.now(), self.dir, delete=False)
+        raw_size = sum(
+            len(str(messages)) for messages, *_ in self.expected.values()
+        )
+        self.assertLess(path.stat().st_size, raw_size / 2)
+
+    def test_filters(self):
+        archive_chat_logs(timezone.now(), self.dir, block_rows=4)
+        bob_logs = list(iter_archived_logs(self.dir, user_id=self.bob.pk))
+        self.assertEqual(len(bob_logs), 6)
+        risky = list(iter_archived_logs(self.dir, risk_flag=True))
+        self.assertEqual([log.response_text for log in risky], ["回复 5"])
+        window = list(
+            iter_archived_logs(
+                self.dir,
+                user_id=self.alice.pk,
+                since=self.start + timedelta(hours=3),
+                until=self.start + timedelta(hours=6),
+            )
+        )
+        self.assertEqual([log.response_text for log in window], ["回复 3", "回复 4", "回复 5"])
+
+    def test_keeps_recent_logs_and_commands(self):
+        out = StringIO()
+        call_command("archive_chatlog", "--days", "365", "--dir", str(self.dir), stdout=out)
+        self.assertIn("No chat logs to archive.", out.getvalue())
+        call_command("archive_chatlog", "--days", "30", "--dir", str(self.dir), stdout=out)
+        self.assertFalse(ChatLog.objects.exists())
+        out = StringIO()
+        call_command(
+            "read_chatlog_archive", "--dir", str(self.dir), "--user", "alice", "--risk", stdout=out
+        )
+        lines = out.getvalue().splitlines()
+        self.assertEqual(len(lines), 1)
+        self.assertIn("回复 5", lines[0])
@@ -0,0 +1,98 @@
+import json
+from unittest.mock import AsyncMock, patch
+
+from django.contrib.auth.models import User
+from django.test import TestCase, override_settings
+from django.urls import reverse
+
+from core.models import ChatConversation
+from core.services.ai_chat import build_messages, parse_ai_payload
+from core.services.chat_context import SUMMARY_PREFIX, estimate_tokens, fit_to_budget
+
+CONTEXT = {
+    "MAX_TOKENS": 60,
+    "SUMMARY_TOKENS": 30,
+    "MAX_MESSAGES": 40,
+    "CJK_TOKENS_PER_CHAR": 0.6,
+    "OTHER_TOKENS_PER_CHAR": 0.3,
+    "MESSAGE_OVERHEAD_TOKENS": 4,
+    "CACHE_SECONDS": 60,
+}
+
+
+def turns(count):
+    messages = []
+    for turn in range(count):
+        messages.append({"role": "user", "content": f"第{turn}个问题是关于睡眠"})
+        messages.append({"role": "assistant", "content": "好的"})
+    return messages
+
+
+@override_settings(AI_CONTEXT=CONTEXT)
+class TokenBudgetTests(TestCase):
+    def test_estimate_tokens_weights_cjk(self):
+        self.assertEqual(estimate_tokens(""), 0)
+        self.assertEqual(estimate_tokens("你好"), 2)
+        self.assertEqual(estimate_tokens("hello world"), 4)
+        self.assertGreater(estimate_tokens("睡眠" * 10), estimate_tokens("sleep" * 4))
+
+    def test_keeps_everything_within_budget(self):
+        messages = turns(2)
+        self.assertEqual(fit_to_budget(messages, 1000), messages)
+
+    def test_trims_oldest_and_adds_summary(self):
+        messages = turns(6) + [{"role": "user", "content": "现在呢"}]
+        trimmed = fit_to_budget(messages, 60)
+        self.assertEqual(trimmed[-1], messages[-1])
+        self.assertEqual(trimmed[0]["role"], "system")
+        self.assertTrue(trimmed[0]["content"].startswith(SUMMARY_PREFIX))
+        self.assertEqual(trimmed[1]["role"], "user")
+        self.assertLess(len(trimmed), len(messages))
+        self.assertLessEqual(
+            sum(estimate_tokens(msg["content"]) + 4 for msg in trimmed), 60
+        )
+
+    def test_latest_message_always_kept(self):
+        latest = {"role": "user", "content": "很长" * 100}
+        self.assertEqual(fit_to_budget(turns(1) + [latest], 10), [latest])
+
+    def test_build_messages_budget_includes_system_prompt(self):
+        with self.settings(AI_SYSTEM_PROMPT="提示" * 10):
+            built = build_messages(turns(6) + [{"role": "user", "content": "现在呢"}])
+        self.assertEqual(built[0]["content"], "提示" * 10)
+        self.assertLessEqual(sum(estimate_tokens(msg["content"]) + 4 for msg in built), 60)
+
+    def test_parse_single_message(self):
+        parsed = parse_ai_payload({"message": " 你好 ", "new_conversation": True})
+        self.assertTrue(parsed.server_context)
+        self.assertTrue(parsed.new_conversation)
+        self.assertEqual(parsed.messages, [{"role": "user", "content": "你好"}])
+        with self.assertRaises(ValueError):
+            parse_ai_payload({"message": "  "})
+
+
+@override_settings(AI_CHATLOG_BUFFER={"ENABLED": False}, AI_RATE_LIMIT={"ENABLED": False})
+class ServerContextViewTests(TestCase):
+    def setUp(self):
+        self.user = User.objects.create_user(username="ctx", password="pass12345")
+        self.client.login(username="ctx", password="pass12345")
+
+    def send(self, text, new=False):
+        return self.client.post(
+            reverse("api_chat"),
+            data=json.dumps({"message": text, "new_conversation": new}),
+            content_type="application/json",
+        )
+
+    @patch("core.views.agenerate_ai_reply", new_callable=AsyncMock, side_effect=["答一", "答二", "答三"])
+    def test_context_comes_from_session(self, generate):
+        self.send("问一", new=True)
+        self.send("问二")
+        sent = generate.call_args.args[0].messages
+        self.assertEqual([msg["content"] for msg in sent], ["问一", "答一", "问二"])
+        conversation = ChatConversation.objects.get()
+        self.assertEqual(conversation.turn_count, 2)
+
+        self.send("问三", new=True)
+        self.assertEqual([msg["content"] for msg in generate.call_args.args[0].messages], ["问三"])
+        self.assertEqual(ChatConversation.objects.count(), 2)
@@ -0,0 +1,91 @@
+import time
+from unittest import mock
+
+from django.contrib.auth.models import User
+from django.db import OperationalError
+from django.test import TestCase, TransactionTestCase, override_settings
+
+from core.models import ChatLog
+from core.services.ai_chat import log_chat
+from core.services import chat_log_writer
+from core.services.chat_log_writer import ChatLogWriter, get_chat_log_writer
+
+BUFFERED = {"ENABLED": True, "BATCH_SIZE": 3, "FLUSH_INTERVAL": 60, "MAX_QUEUE": 4}
+
+
+def record(text="hi"):
+    return ChatLog(provider="deepseek", messages_json=[], response_text=text)
+
+
+class ChatLogWriterTests(TestCase):
+    def test_flush_writes_in_batches_and_counts(self):
+        writer = ChatLogWriter(batch_size=2, flush_interval=60, max_queue=10, autostart=False)
+        for index in range(5):
+            self.assertTrue(writer.enqueue(record(str(index))))
+        self.assertEqual(writer.stats()["queue_depth"], 5)
+        self.assertEqual(writer.flush(), 5)
+        stats = writer.stats()
+        self.assertEqual((stats["written"], stats["flushes"], stats["queue_depth"]), (5, 3, 0))
+        self.assertEqual(ChatLog.objects.count(), 5)
+
+    def test_full_queue_rejects(self):
+        writer = ChatLogWriter(batch_size=10, flush_interval=60, max_queue=1, autostart=False)
+        self.assertTrue(writer.enqueue(record()))
+        self.assertFalse(writer.enqueue(record()))
+
+    def test_failed_batch_is_retried_later(self):
+        writer = ChatLogWriter(batch_size=5, flush_interval=60, max_queue=10, autostart=False, retry_delay=0)
+        for index in range(3):
+            writer.enqueue(record(str(index)))
+        save_turns = chat_log_writer.save_turns
+        with mock.patch.object(
+            chat_log_writer, "save_turns", side_effect=[OperationalError("database is locked"), save_turns]
+        ), self.assertLogs("core.services.chat_log_writer", "WARNING"):
+            self.assertEqual(writer.flush(), 0)
+        self.assertEqual(writer.stats()["retrying"], 3)
+        writer.enqueue(record("3"))
+        self.assertEqual(sorted(turn.response_text for turn in writer.pending()), ["0", "1", "2", "3"])
+        self.assertFalse(ChatLog.objects.exists())
+        self.assertEqual(writer.flush(), 4)
+        self.assertEqual(writer.pending(), [])
+        stats = writer.stats()
+        self.assertEqual((stats["written"], stats["retrying"], stats["failed"]), (4, 0, 0))
+        self.assertEqual(ChatLog.objects.count(), 4)
+
+    def test_bad_row_only_loses_itself(self):
+        writer = ChatLogWriter(batch_size=5, flush_interval=60, max_queue=10, autostart=False)
+        for text in ("ok", "bad", "ok"):
+            writer.enqueue(record(text))
+        save_turns = chat_log_writer.save_turns
+
+        def failing(records):
+            if any(turn.response_text == "bad" for turn in records):
+                raise ValueError("bad row")
+            save_turns(records)
+
+        with mock.patch.object(chat_log_writer, "save_turns", side_effect=failing), self.assertLogs(
+            "core.services.chat_log_writer", "ERROR"
+        ):
+            self.assertEqual(writer.flush(), 2)
+        self.assertEqual(writer.stats()["failed"], 1)
+        self.assertEqual(sorted(ChatLog.objects.values_list("response_text", flat=True)), ["ok", "ok"])
+
+    @override_settings(AI_CHATLOG_BUFFER=BUFFERED)
+    def test_risk_flagged_logs_are_written_synchronously(self):
+        user = User.objects.create(username="risk")
+        log_chat("deepseek", user, [], "reply", True)
+        self.assertTrue(ChatLog.objects.get().risk_flag)
+        self.assertEqual(get_chat_log_writer().stats()["enqueued"], 0)
+
+
+@override_settings(AI_CHATLOG_BUFFER=BUFFERED)
+class ChatLogWriterThreadTests(TransactionTestCase):
+    def test_background_thread_flushes_full_batches(self):
+        for index in range(3):
+            log_chat("deepseek", None, [], str(index), False)
+        # 轮询写入计数而不是查表：测试用的内存库在后台线程写入期间会锁表。
+        deadline = time.monotonic() + 5
+        while get_chat_log_writer().stats()["written"] < 3 and time.monotonic() < deadline:
+            time.sleep(0.02)
+        self.assertEqual(get_chat_log_writer().stats()["written"], 3)
+        self.assertEqual(ChatLog.objects.count(), 3)
@@ -0,0 +1,87 @@
+import gzip
+import json
+import tempfile
+from datetime import timedelta
+from io import StringIO
+from pathlib import Path
+
+from django.contrib.auth.models import User
+from django.core.management import call_command
+from django.db.models import Q
+from django.test import TestCase
+from django.utils import timezone
+
+from core.models import ChatConversation, ChatLog
+from core.services.chat_retention import build_rules, purge_chat_logs
+from core.services.conversations import delete_finished_conversations
+
+
+class ChatRetentionTests(TestCase):
+    def setUp(self):
+        self.alice = User.objects.create(username="alice")
+        self.bob = User.objects.create(username="bob")
+        now = timezone.now()
+        for user in (self.alice, self.bob, None):
+            for age in (1, 10, 40):
+                log = ChatLog.objects.create(
+                    provider="deepseek", user=user, messages_json=[], response_text=f"{age}"
+                )
+                ChatLog.objects.filter(pk=log.pk).update(created_at=now - timedelta(days=age))
+
+    def remaining(self, user):
+        return sorted(
+            int(text) for text in ChatLog.objects.filter(user=user).values_list("response_text", flat=True)
+        )
+
+    def test_age_policy_with_per_user_override(self):
+        rules = build_rules(days=7, user_days={"alice": 30})
+        deleted = purge_chat_logs(rules, chunk_size=2)
+        self.assertEqual(deleted, 5)
+        self.assertEqual(self.remaining(self.alice), [1, 10])
+        self.assertEqual(self.remaining(self.bob), [1])
+        self.assertEqual(self.remaining(None), [1])
+
+    def test_single_user_run_and_dry_run(self):
+        rules = build_rules(days=7, user_days={}, only_user="bob")
+        self.assertEqual(purge_chat_logs(rules, dry_run=True), 2)
+        self.assertEqual(ChatLog.objects.count(), 9)
+        self.assertEqual(purge_chat_logs(rules, chunk_size=1), 2)
+        self.assertEqual(self.remaining(self.alice), [1, 10, 40])
+
+    def test_archive_before_delete(self):
+        with tempfile.TemporaryDirectory() as tmp:
+            path = Path(tmp) / "archive.jsonl.gz"
+            purge_chat_logs(build_rules(days=30, user_days={}), chunk_size=2, archive_path=path)
+            with gzip.open(path, "rt", encoding="utf-8") as handle:
+                rows = [json.loads(line) for line in handle]
+        self.assertEqual(sorted(row["response_text"] for row in rows), ["40", "40", "40"])
+
+    def test_dry_run_writes_no_archive(self):
+        with tempfile.TemporaryDirectory() as tmp:
+            path = Path(tmp) / "archive.jsonl.gz"
+            rules = build_rules(days=30, user_days={})
+            self.assertEqual(purge_chat_logs(rules, archive_path=path, dry_run=True), 3)
+            self.assertFalse(path.exists())
+        self.assertEqual(ChatLog.objects.count(), 9)
+
+    def test_expired_conversations_are_deleted_in_chunks(self):
+        now = timezone.now()
+        for age in (40, 41, 42, 1):
+            ChatConversation.objects.create(
+                provider="deepseek",
+                user=self.bob,
+                started_at=now - timedelta(days=age),
+                last_turn_at=now - timedelta(days=age),
+            )
+        kept = ChatConversation.objects.create(provider="deepseek", user=self.bob, last_turn_at=now - timedelta(days=50))
+        ChatLog.objects.create(provider="deepseek", user=self.bob, conversation=kept, messages_json=[], response_text="")
+        self.assertEqual(delete_finished_conversations(now - timedelta(days=30), Q(user=self.bob), chunk_size=2), 3)
+        # 仍有记录的对话不会被级联删除。
+        self.assertEqual(ChatConversation.objects.count(), 2)
+        self.assertTrue(ChatLog.objects.filter(conversation=kept).exists())
+
+    def test_command_defaults_to_clearing_everything(self):
+        out = StringIO()
+        call_command("clear_chatlog", "--sleep", "0", stdout=out)
+        self.assertIn("Deleted 9 chat logs.", out.getvalue())
+        self.assertFalse(ChatLog.objects.exists())
@@ -0,0 +1,163 @@
+import json
+from unittest.mock import AsyncMock, patch
+
+from django.contrib.auth.models import User
+from django.core.cache import cache
+from django.test import TestCase, override_settings
+from django.urls import reverse
+
+from core.models import ChatConversation, ChatLog
+from core.services.ai_chat import log_chat
+from core.services.chat_log_writer import ChatLogWriter
+from core.services.conversations import (
+    conversation_messages,
+    load_context,
+    split_new_messages,
+    start_conversation,
+)
+
+
+@override_settings(
+    AI_CHATLOG_BUFFER={"ENABLED": False}, AI_RATE_LIMIT={"ENABLED": False}, CHAT_HISTORY_LIMIT=4
+)
+class ConversationStorageTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.user = User.objects.create_user(username="talker", password="pass12345")
+
+    def chat(self, history, text, reply, risk=False):
+        history.append({"role": "user", "content": text})
+        log_chat("deepseek", self.user, history[-4:], reply, risk)
+        history.append({"role": "assistant", "content": reply})
+
+    def test_split_new_messages(self):
+        window = [
+            {"role": "user", "content": "a"},
+            {"role": "assistant", "content": "b"},
+            {"role": "user", "content": "c"},
+            {"role": "user", "content": "d"},
+        ]
+        context, new = split_new_messages(window)
+        self.assertEqual([msg["content"] for msg in context], ["a", "b"])
+        self.assertEqual([msg["content"] for msg in new], ["c", "d"])
+
+    def test_turns_store_only_new_messages(self):
+        history = []
+        for turn in range(5):
+            self.chat(history, f"问题{turn}", f"回答{turn}", risk=turn == 2)
+        conversation = ChatConversation.objects.get()
+        self.assertEqual(conversation.turn_count, 5)
+        self.assertTrue(conversation.risk_flag)
+        turns = list(conversation.turns.order_by("created_at", "id"))
+        self.assertEqual([len(turn.messages_json) for turn in turns], [1] * 5)
+        self.assertEqual(conversation_messages(conversation.pk), history)
+        self.assertEqual(conversation_messages(conversation.pk, limit=4), history[-4:])
+
+    def test_unknown_context_starts_new_conversation_with_full_window(self):
+        self.chat([], "你好", "你好呀")
+        window = [
+            {"role": "user", "content": "早先的问题"},
+            {"role": "assistant", "content": "早先的回答"},
+            {"role": "user", "content": "继续"},
+        ]
+        log_chat("deepseek", self.user, window, "好的", False)
+        self.assertEqual(ChatConversation.objects.count(), 2)
+        self.assertEqual(ChatLog.objects.latest("created_at").messages_json, window)
+
+    def test_conversations_are_per_user(self):
+        other = User.objects.create_user(username="other", password="pass12345")
+        self.chat([], "你好", "你好呀")
+        window = [
+            {"role": "user", "content": "你好"},
+            {"role": "assistant", "content": "你好呀"},
+            {"role": "user", "content": "在吗"},
+        ]
+        log_chat("deepseek", other, window, "在的", False)
+        self.assertEqual(ChatConversation.objects.filter(user=other).get().turn_count, 1)
+
+    @patch("core.views.agenerate_ai_reply", new_callable=AsyncMock, side_effect=["第一", "第二"])
+    def test_async_view_groups_turns(self, _generate):
+        self.client.login(username="talker", password="pass12345")
+        messages = [{"role": "user", "content": "一"}]
+        for reply in ("第一", "第二"):
+            self.client.post(
+                reverse("api_chat"),
+                data=json.dumps({"messages": messages}),
+                content_type="application/json",
+            )
+            messages = messages + [{"role": "assistant", "content": reply}, {"role": "user", "content": "二"}]
+        conversation = ChatConversation.objects.get()
+        self.assertEqual(conversation.turn_count, 2)
+        self.assertEqual(
+            [msg["content"] for msg in conversation_messages(conversation.pk)],
+            ["一", "第一", "二", "第二"],
+        )
+
+
+@override_settings(AI_RATE_LIMIT={"ENABLED": False})
+class BufferedConversationTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.user = User.objects.create_user(username="buffered", password="pass12345")
+        self.writer = ChatLogWriter(batch_size=50, flush_interval=60, max_queue=100, autostart=False)
+        for target in ("core.services.ai_chat", "core.services.conversations"):
+            patcher = patch(f"{target}.get_chat_log_writer", return_value=self.writer)
+            patcher.start()
+            self.addCleanup(patcher.stop)
+
+    def test_turns_update_conversation_only_when_flushed(self):
+        conversation_id = start_conversation("deepseek", self.user)
+        with self.assertNumQueries(0):
+            log_chat("deepseek", self.user, [{"role": "user", "content": "一"}], "答一", False, conversation_id)
+            log_chat("deepseek", self.user, [{"role": "user", "content": "二"}], "答二", False, conversation_id)
+        self.assertEqual(ChatConversation.objects.get().turn_count, 0)
+
+        self.assertEqual(self.writer.flush(), 2)
+        conversation = ChatConversation.objects.get()
+        self.assertEqual(conversation.turn_count, 2)
+        self.assertEqual(conversation.last_turn_at, ChatLog.objects.latest("created_at").created_at)
+
+        # 直接保存的风险轮次之后才写入的旧轮次，不会把最后时间往回改。
+        log_chat("deepseek", self.user, [{"role": "user", "content": "三"}], "答三", False, conversation_id)
+        risky = log_chat("deepseek", self.user, [{"role": "user", "content": "不想活"}], "在", True, conversation_id)
+        self.writer.flush()
+        conversation.refresh_from_db()
+        self.assertEqual((conversation.turn_count, conversation.risk_flag), (4, True))
+        self.assertEqual(conversation.last_turn_at, risky.created_at)
+
+    def test_resent_window_finds_unflushed_conversation(self):
+        window = [{"role": "user", "content": "你好"}]
+        log_chat("deepseek", self.user, window, "你好呀", False)
+        window = window + [{"role": "assistant", "content": "你好呀"}, {"role": "user", "content": "在吗"}]
+        log_chat("deepseek", self.user, window, "在的", False)
+        self.writer.flush()
+        conversation = ChatConversation.objects.get()
+        self.assertEqual(conversation.turn_count, 2)
+
+    def test_lookups_read_queued_turns_without_flushing(self):
+        window = [{"role": "user", "content": "你好"}]
+        log_chat("deepseek", self.user, window, "你好呀", False)
+        cache.clear()
+        window = window + [{"role": "assistant", "content": "你好呀"}, {"role": "user", "content": "在吗"}]
+        turn = log_chat("deepseek", self.user, window, "在的", False)
+        self.assertEqual(self.writer.stats()["queue_depth"], 2)
+        cache.clear()
+        self.assertEqual(
+            [msg["content"] for msg in load_context(turn.conversation_id)],
+            ["你好", "你好呀", "在吗", "在的"],
+        )
+        self.assertEqual(self.writer.stats()["queue_depth"], 2)
+        self.assertFalse(ChatLog.objects.exists())
+
+        self.writer.flush()
+        cache.clear()
+        self.assertEqual(len(load_context(turn.conversation_id)), 4)
+        self.assertEqual(ChatConversation.objects.get().turn_count, 2)
+
+    def test_deleted_conversation_is_recreated_on_flush(self):
+        conversation_id = start_conversation("deepseek", self.user)
+        log_chat("deepseek", self.user, [{"role": "user", "content": "一"}], "答一", False, conversation_id)
+        ChatConversation.objects.filter(pk=conversation_id).delete()
+        self.writer.flush()
+        self.assertEqual(ChatConversation.objects.get(pk=conversation_id).turn_count, 1)
+        self.assertEqual(ChatLog.objects.get().conversation_id, conversation_id)
@@ -0,0 +1,83 @@
+from django.test import TestCase
+
+from core.models import Article, Category
+from core.services.knowledge_search import (
+    build_match_expression,
+    highlight,
+    search_articles,
+    segment,
+)
+
+
+class KnowledgeSearchTests(TestCase):
+    def setUp(self):
+        self.category = Category.objects.create(name="睡眠与放松")
+        self.sleep = Article.objects.create(
+            category=self.category,
+            title="改善睡眠质量",
+            summary="规律作息",
+            content="晚上少喝浓茶",
+            tags="睡眠,放松",
+        )
+        self.anxiety = Article.objects.create(
+            category=self.category,
+            title="焦虑应对",
+            summary="与焦虑相关",
+            content="深呼吸练习可以缓解紧张",
+            tags="焦虑",
+        )
+
+    def search(self, query):
+        return set(search_articles(Article.objects.all(), query))
+
+    def test_segment_uses_bigrams(self):
+        self.assertEqual(segment("睡眠质量", for_query=True), ["睡眠", "眠质", "质量"])
+        self.assertEqual(segment("睡眠 ABC"), ["睡眠", "眠", "abc"])
+
+    def test_match_expression_ors_tokens(self):
+        self.assertEqual(build_match_expression(["睡眠", "茶"]), '"睡眠" OR "茶"*')
+
+    def test_search_covers_content(self):
+        self.assertEqual(self.search("浓茶"), {self.sleep})
+        self.assertEqual(self.search("深呼吸"), {self.anxiety})
+
+    def test_search_multiple_tokens_and_single_char(self):
+        self.assertEqual(self.search("睡眠、焦虑"), {self.sleep, self.anxiety})
+        self.assertEqual(self.search("茶"), {self.sleep})
+
+    def test_index_follows_updates_and_deletes(self):
+        self.sleep.content = "睡前泡脚"
+        self.sleep.save()
+        self.assertEqual(self.search("浓茶"), set())
+        self.assertEqual(self.search("泡脚"), {self.sleep})
+        Article.objects.filter(pk=self.anxiety.pk).delete()
+        self.assertEqual(self.search("焦虑"), set())
+
+    def test_title_hits_rank_above_content_hits(self):
+        Article.objects.create(
+            category=self.category,
+            title="深呼吸",
+            summary="",
+            content="放松方法",
+        )
+        titles = [article.title for article in search_articles(Article.objects.all(), "深呼吸")]
+        self.assertEqual(titles, ["深呼吸", "焦虑应对"])
+
+    def test_results_stay_composable(self):
+        other = Category.objects.create(name="情绪", slug="mood")
+        Article.objects.create(category=other, title="睡眠日记", summary="", content="")
+        results = search_articles(Article.objects.select_related("category"), "睡眠")
+        self.assertEqual(results.count(), 2)
+        self.assertEqual([article.title for article in results.filter(category=self.category)], ["改善睡眠质量"])
+        self.assertEqual(len(results[1:2]), 1)
+        self.assertIsNotNone(results.first().search_rank)
+
+    def test_highlight_escapes_and_marks(self):
+        self.assertEqual(
+            highlight("<b>睡眠</b>很重要", ["睡眠"]),
+            "&lt;b&gt;<mark>睡眠</mark>&lt;/b&gt;很重要",
+        )
+        snippet = highlight("开头" * 50 + "浓茶" + "结尾" * 50, ["浓茶"], width=20)
+        self.assertTrue(snippet.startswith("…"))
+        self.assertIn("<mark>浓茶</mark>", snippet)
+        self.assertEqual(highlight("无关内容", ["浓茶"], width=20), "")
@@ -0,0 +1,54 @@
+from datetime import timedelta
+
+from django.test import RequestFactory, TestCase
+from django.utils import timezone
+
+from core.models import ConsultationTicket
+from core.pagination import decode_cursor, encode_cursor, paginate_keyset
+
+
+class KeysetPaginationTests(TestCase):
+    def setUp(self):
+        self.factory = RequestFactory()
+        base = timezone.now()
+        tickets = [
+            ConsultationTicket.objects.create(title=f"T{i}", message="m") for i in range(7)
+        ]
+        # 两条记录共享同一时间戳，确保 id 作为次序键生效。
+        for index, ticket in enumerate(tickets):
+            ConsultationTicket.objects.filter(pk=ticket.pk).update(
+                created_at=base - timedelta(minutes=min(index, 5))
+            )
+        self.expected = list(
+            ConsultationTicket.objects.order_by("-created_at", "-id").values_list("title", flat=True)
+        )
+
+    def page(self, params):
+        request = self.factory.get("/manage/tickets/", params)
+        return paginate_keyset(request, ConsultationTicket.objects.all(), 3, with_total=True)
+
+    def test_cursor_round_trip(self):
+        now = timezone.now()
+        self.assertEqual(decode_cursor(encode_cursor(now, 42)), (now, 42))
+        self.assertIsNone(decode_cursor("not-a-cursor"))
+
+    def test_walks_forward_and_back(self):
+        first, _ = self.page({})
+        self.assertEqual([t.title for t in first], self.expected[:3])
+        self.assertFalse(first.has_previous())
+        self.assertEqual(first.total_count, 7)
+
+        second, _ = self.page({"after": first.next_cursor})
+        third, _ = self.page({"after": second.next_cursor})
+        self.assertEqual([t.title for t in second], self.expected[3:6])
+        self.assertEqual([t.title for t in third], self.expected[6:])
+        self.assertFalse(third.has_next())
+
+        back, _ = self.page({"before": third.previous_cursor})
+        self.assertEqual([t.title for t in back], self.expected[3:6])
+        self.assertTrue(back.has_previous())
+
+    def test_querystring_drops_cursor_params(self):
+        first, _ = self.page({})
+        _, querystring = self.page({"after": first.next_cursor, "status": "new", "page": "2"})
+        self.assertEqual(querystring, "status=new")
@@ -53,3 +53,11 @@ class PublicPagesTests(TestCase):
         html = response.content.decode("utf-8")
         self.assertIn("睡眠建议", html)
         self.assertIn("焦虑应对", html)
+
+    def test_knowledge_search_highlights_matches(self):
+        User.objects.create_user(username="tester", password="pass12345")
+        self.client.login(username="tester", password="pass12345")
+        response = self.client.get(reverse("knowledge_list"), {"query": "睡眠"})
+        html = response.content.decode("utf-8")
+        self.assertIn("<mark>睡眠</mark>", html)
+        self.assertNotIn("焦虑应对", html)
@@ -0,0 +1,179 @@
+import json
+import tempfile
+import threading
+from pathlib import Path
+from unittest.mock import AsyncMock, patch
+
+from django.contrib.auth.models import User
+from django.test import SimpleTestCase, TestCase, override_settings
+from django.urls import reverse
+
+from core.services.rate_limit import (
+    REASON_USER_CONCURRENCY,
+    REASON_USER_RATE,
+    ChatRateLimiter,
+    MemoryLimiterBackend,
+    RateLimited,
+    SQLiteLimiterBackend,
+)
+
+LIMITS = {
+    "ENABLED": True,
+    "BACKEND": "core.services.rate_limit.MemoryLimiterBackend",
+    "OPTIONS": {},
+    "USER_RATE": 1.0,
+    "USER_BURST": 2,
+    "GLOBAL_RATE": 100.0,
+    "GLOBAL_BURST": 100,
+    "USER_CONCURRENCY": 1,
+    "GLOBAL_CONCURRENCY": 10,
+    "QUEUE_TIMEOUT": 0.2,
+    "SLOT_TTL": 60,
+}
+
+
+async def _reply(text):
+    yield text
+
+
+class BackendContract:
+    def make_backend(self):
+        raise NotImplementedError
+
+    def test_token_bucket(self):
+        backend = self.make_backend()
+        buckets = [("user:1", 1.0, 2), ("global", 100.0, 100)]
+        self.assertEqual(backend.take(buckets, 1000.0), (None, 0.0))
+        self.assertEqual(backend.take(buckets, 1000.0), (None, 0.0))
+        denied, retry_after = backend.take(buckets, 1000.0)
+        self.assertEqual(denied, "user:1")
+        self.assertAlmostEqual(retry_after, 1.0)
+        self.assertEqual(backend.take(buckets, 1001.0), (None, 0.0))
+
+    def test_denied_take_spends_nothing(self):
+        backend = self.make_backend()
+        self.assertIsNone(backend.take([("global", 1.0, 1)], 1000.0)[0])
+        self.assertEqual(backend.take([("user:1", 1.0, 1), ("global", 1.0, 1)], 1000.0)[0], "global")
+        self.assertIsNone(backend.take([("user:1", 1.0, 1)], 1000.0)[0])
+
+    def test_slots_release_and_expire(self):
+        backend = self.make_backend()
+        slots = [("user:1", 1), ("global", 5)]
+        self.assertIsNone(backend.acquire(slots, "a", 1060.0, 1000.0))
+        self.assertEqual(backend.acquire(slots, "b", 1060.0, 1000.0), "user:1")
+        backend.release(["user:1", "global"], "a")
+        self.assertIsNone(backend.acquire(slots, "b", 1060.0, 1000.0))
+        self.assertIsNone(backend.acquire(slots, "c", 1120.0, 1061.0))
+
+
+class MemoryBackendTests(BackendContract, SimpleTestCase):
+    def make_backend(self):
+        return MemoryLimiterBackend()
+
+
+class SQLiteBackendTests(BackendContract, SimpleTestCase):
+    def make_backend(self):
+        tmp = tempfile.TemporaryDirectory()
+        self.addCleanup(tmp.cleanup)
+        return SQLiteLimiterBackend(path=Path(tmp.name) / "limits.sqlite3")
+
+
+class ChatRateLimiterTests(SimpleTestCase):
+    def test_rate_limit_rejects_with_retry_after(self):
+        limiter = ChatRateLimiter(MemoryLimiterBackend(), LIMITS)
+        limiter.admit(1).release()
+        limiter.admit(1).release()
+        with self.assertRaises(RateLimited) as caught:
+            limiter.admit(1)
+        self.assertEqual(caught.exception.reason, REASON_USER_RATE)
+        self.assertGreater(caught.exception.retry_after, 0)
+        limiter.admit(2).release()
+        self.assertEqual(limiter.stats()[REASON_USER_RATE], 1)
+
+    def test_waits_for_a_free_slot_then_gives_up(self):
+        limiter = ChatRateLimiter(MemoryLimiterBackend(), {**LIMITS, "USER_BURST": 10})
+        first = limiter.admit(1)
+        threading.Timer(0.05, first.release).start()
+        second = limiter.admit(1)
+        with self.assertRaises(RateLimited) as caught:
+            limiter.admit(1)
+        self.assertEqual(caught.exception.reason, REASON_USER_CONCURRENCY)
+        second.release()
+        second.release()
+        stats = limiter.stats()
+        self.assertEqual(stats["queued"], 2)
+        self.assertEqual(stats["admitted"], 2)
+        self.assertEqual(stats["in_flight"], 0)
+        self.assertGreater(stats["max_queue_wait_ms"], 0)
+
+    async def test_arelease_runs_blocking_backend_off_the_loop(self):
+        with tempfile.TemporaryDirectory() as tmp:
+            backend = SQLiteLimiterBackend(path=Path(tmp) / "limits.sqlite3")
+            limiter = ChatRateLimiter(backend, LIMITS)
+            admission = await limiter.aadmit(1)
+            loop_thread = threading.get_ident()
+            threads = []
+            release = backend.release
+
+            def recording_release(keys, token):
+                threads.append(threading.get_ident())
+                release(keys, token)
+
+            with patch.object(backend, "release", recording_release):
+                await admission.arelease()
+                await admission.arelease()
+            self.assertEqual(len(threads), 1)
+            self.assertNotEqual(threads[0], loop_thread)
+            self.assertEqual(limiter.stats()["in_flight"], 0)
+
+
+@override_settings(
+    AI_CHATLOG_BUFFER={"ENABLED": False},
+    AI_RATE_LIMIT={**LIMITS, "USER_RATE": 0.01},
+    RISK_ESCALATION={"ENABLED": False},
+)
+class RateLimitedViewTests(TestCase):
+    def setUp(self):
+        self.user = User.objects.create_user(username="burst", password="pass12345", is_staff=True)
+        self.client.login(username="burst", password="pass12345")
+
+    def send(self, text, url="api_chat", new=False):
+        return self.client.post(
+            reverse(url),
+            data=json.dumps({"message": text, "new_conversation": new}),
+            content_type="application/json",
+        )
+
+    @patch("core.views.agenerate_ai_reply", new_callable=AsyncMock, return_value="好的")
+    def test_returns_429_json_when_over_limit(self, _generate):
+        self.assertEqual(self.send("一").status_code, 200)
+        self.assertEqual(self.send("二").status_code, 200)
+        response = self.send("三")
+        self.assertEqual(response.status_code, 429)
+        self.assertEqual(response["Retry-After"], str(response.json()["retry_after"]))
+        self.assertGreater(response.json()["retry_after"], 1)
+        self.assertEqual(response.json()["rate_limited"], REASON_USER_RATE)
+        self.assertIn("reply", response.json())
+
+        risky = self.send("我不想活了")
+        self.assertEqual(risky.status_code, 200)
+        self.assertTrue(risky.json()["risk"])
+
+        # 新对话：不带上一条风险消息的累计分数。
+        stream = self.send("四", url="api_chat_stream", new=True)
+        self.assertEqual(stream.status_code, 429)
+
+        metrics = self.client.get(reverse("manage_ai_metrics")).json()
+        self.assertEqual(metrics["rate_limit"]["admitted"], 2)
+        self.assertEqual(metrics["rate_limit"][REASON_USER_RATE], 2)
+
+    @patch("core.views.astream_ai_reply", return_value=_reply("好"))
+    def test_stream_releases_slot_when_closed_unread(self, _stream):
+        response = self.send("一", url="api_chat_stream")
+        response.close()
+        self.assertEqual(self.client.get(reverse("manage_ai_metrics")).json()["rate_limit"]["in_flight"], 0)
+
+    def test_metrics_require_staff(self):
+        self.user.is_staff = False
+        self.user.save()
+        self.assertEqual(self.client.get(reverse("manage_ai_metrics")).status_code, 302)
@@ -0,0 +1,111 @@
+import os
+import tempfile
+from unittest.mock import patch
+
+from django.test import SimpleTestCase, override_settings
+
+from core.services.ai_chat import AIChatPayload, agenerate_ai_reply, generate_ai_reply
+from core.services.reply_cache import (
+    FileReplyCache,
+    MemoryReplyCache,
+    get_reply_cache,
+    make_key,
+    normalize_text,
+    reset_reply_cache,
+)
+
+MEMORY_CACHE = {
+    "ENABLED": True,
+    "BACKEND": "core.services.reply_cache.MemoryReplyCache",
+    "TTL": 60,
+    "MAX_ENTRIES": 8,
+    "OPTIONS": {},
+}
+
+
+class ReplyCacheBackendTests(SimpleTestCase):
+    def test_normalize_folds_whitespace_width_and_trailing_punctuation(self):
+        self.assertEqual(normalize_text(" 睡不着 怎么办？？ "), normalize_text("睡不着 怎么办"))
+        self.assertEqual(make_key("m", "s", [{"role": "user", "content": "Hello!"}]),
+                         make_key("m", "s", [{"role": "user", "content": "hello"}]))
+        self.assertNotEqual(make_key("m", "s", [{"role": "user", "content": "hi"}]),
+                            make_key("m", "other", [{"role": "user", "content": "hi"}]))
+
+    def test_memory_cache_evicts_least_recently_used(self):
+        cache = MemoryReplyCache(ttl=60, max_entries=2)
+        cache.set("a", "A")
+        cache.set("b", "B")
+        cache.get("a")
+        cache.set("c", "C")
+        self.assertIsNone(cache.get("b"))
+        self.assertEqual(cache.get("a"), "A")
+        self.assertEqual(cache.stats()["hits"], 2)
+
+    def test_memory_cache_expires_entries(self):
+        cache = MemoryReplyCache(ttl=-1, max_entries=2)
+        cache.set("a", "A")
+        self.assertIsNone(cache.get("a"))
+
+    def test_file_cache_round_trip_and_eviction(self):
+        with tempfile.TemporaryDirectory() as path:
+            cache = FileReplyCache(ttl=60, max_entries=1, path=path)
+            cache.set("a", "多晒太阳")
+            self.assertEqual(FileReplyCache(ttl=60, max_entries=1, path=path).get("a"), "多晒太阳")
+            cache.set("b", "B")
+            self.assertEqual(len(list(cache.path.glob("*.json"))), 1)
+
+    def test_file_cache_scans_only_when_full(self):
+        with tempfile.TemporaryDirectory() as path:
+            cache = FileReplyCache(ttl=60, max_entries=10, path=path)
+            with patch("core.services.reply_cache.os.scandir", wraps=os.scandir) as scandir:
+                for index in range(12):
+                    cache.set(str(index), "A")
+            # 首次新增时数一遍目录；第 11 次写入越过上限，一次淘汰到 9 个，之后的写入不再扫描。
+            self.assertEqual(scandir.call_count, 2)
+            self.assertEqual(len(list(cache.path.glob("*.json"))), 10)
+            self.assertEqual(cache.get("11"), "A")
+
+    async def test_async_lookups_are_counted(self):
+        with tempfile.TemporaryDirectory() as path:
+            cache = FileReplyCache(ttl=60, max_entries=4, path=path)
+            await cache.aset("a", "多晒太阳")
+            self.assertEqual(await cache.aget("a"), "多晒太阳")
+            self.assertIsNone(await cache.aget("b"))
+        stats = cache.stats()
+        self.assertEqual((stats["stores"], stats["hits"], stats["misses"]), (1, 1, 1))
+
+
+@override_settings(AI_REPLY_CACHE=MEMORY_CACHE)
+class CachedReplyTests(SimpleTestCase):
+    def setUp(self):
+        reset_reply_cache()
+
+    def payload(self, *contents):
+        roles = ["user", "assistant"]
+        messages = [{"role": roles[i % 2], "content": text} for i, text in enumerate(contents)]
+        return AIChatPayload(provider="deepseek", deep_think=False, messages=messages)
+
+    @patch("core.services.ai_chat.call_ai", return_value="试试睡前泡脚")
+    def test_repeated_question_hits_cache(self, call_ai):
+        self.assertEqual(generate_ai_reply(self.payload("睡不着怎么办")), "试试睡前泡脚")
+        self.assertEqual(generate_ai_reply(self.payload("睡不着怎么办？")), "试试睡前泡脚")
+        self.assertEqual(call_ai.call_count, 1)
+        self.assertEqual(get_reply_cache().stats()["hits"], 1)
+
+    @patch("core.services.ai_chat.call_ai", return_value="好的")
+    def test_multi_turn_bypasses_cache(self, call_ai):
+        payload = self.payload("你好", "你好呀", "睡不着怎么办")
+        generate_ai_reply(payload)
+        generate_ai_reply(payload)
+        self.assertEqual(call_ai.call_count, 2)
+        self.assertEqual(get_reply_cache().stats()["bypassed"], 2)
+
+    @patch("core.services.ai_chat._store_reply", side_effect=AssertionError("blocking cache call"))
+    @patch("core.services.ai_chat._cached_reply", side_effect=AssertionError("blocking cache call"))
+    @patch("core.services.ai_chat.acall_ai")
+    async def test_async_reply_uses_async_cache_calls(self, acall_ai, *blocking):
+        acall_ai.return_value = "试试睡前泡脚"
+        self.assertEqual(await agenerate_ai_reply(self.payload("睡不着怎么办")), "试试睡前泡脚")
+        self.assertEqual(await agenerate_ai_reply(self.payload("睡不着怎么办？")), "试试睡前泡脚")
+        self.assertEqual(acall_ai.call_count, 1)
+        self.assertEqual(get_reply_cache().stats()["hits"], 1)
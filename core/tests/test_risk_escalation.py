@@ -0,0 +1,133 @@
+import json
+from datetime import timedelta
+from unittest.mock import patch
+
+from django.conf import settings
+from django.contrib.auth.models import User
+from django.db import OperationalError
+from django.test import TestCase, override_settings
+from django.urls import reverse
+from django.utils import timezone
+
+from core.models import ChatLog, ConsultationNote, ConsultationTicket, RollupWatermark
+from core.services import risk_escalation
+from core.services.risk_escalation import EscalationWorker, RiskEvent, catch_up, escalate
+
+QUIET = {"ENABLED": False}
+
+
+@override_settings(AI_CHATLOG_BUFFER=QUIET, AI_RATE_LIMIT=QUIET)
+class RiskEscalationTests(TestCase):
+    def setUp(self):
+        self.user = User.objects.create_user(username="elder", password="pass12345")
+
+    def test_repeats_within_window_extend_one_ticket(self):
+        now = timezone.now()
+        events = [RiskEvent(self.user.id, "high", "我不想活了", 7, now + timedelta(seconds=i)) for i in range(3)]
+        self.assertEqual(escalate(events[:1]), 1)
+        self.assertEqual(escalate(events[1:]), 0)
+        ticket = ConsultationTicket.objects.get()
+        self.assertEqual(ticket.source, ConsultationTicket.SOURCE_RISK_CHAT)
+        self.assertEqual(ticket.user, self.user)
+        self.assertGreaterEqual(ticket.priority, settings.TICKET_QUEUE["URGENT_PRIORITY"])
+        note = ConsultationNote.objects.get(ticket=ticket)
+        self.assertEqual(note.note.count("对话 #7"), 2)
+
+        # 工单已结束或超出时间窗口时重新开单。
+        ConsultationTicket.objects.filter(pk=ticket.pk).update(status=ConsultationTicket.STATUS_RESOLVED)
+        self.assertEqual(escalate([RiskEvent(self.user.id, "medium", "想消失")]), 1)
+        later = now + timedelta(minutes=settings.RISK_ESCALATION["WINDOW_MINUTES"] + 1)
+        self.assertEqual(escalate([RiskEvent(self.user.id, "high", "不想活", None, later)]), 1)
+        self.assertEqual(ConsultationTicket.objects.count(), 3)
+
+    def test_chat_view_only_queues_the_event(self):
+        worker = EscalationWorker(flush_interval=60, max_queue=10, autostart=False)
+        self.client.login(username="elder", password="pass12345")
+        with patch("core.services.risk_escalation.get_escalation_worker", return_value=worker):
+            response = self.client.post(
+                reverse("api_chat"),
+                data=json.dumps({"message": "我真的不想活了"}),
+                content_type="application/json",
+            )
+        self.assertTrue(response.json()["risk"])
+        self.assertFalse(ConsultationTicket.objects.exists())
+        self.assertEqual(worker.stats()["queue_depth"], 1)
+
+        self.assertEqual(worker.flush(), 1)
+        ticket = ConsultationTicket.objects.get()
+        self.assertEqual(ticket.message, "我真的不想活了")
+        self.assertEqual(worker.stats()["tickets_created"], 1)
+
+    @override_settings(RISK_ESCALATION={**settings.RISK_ESCALATION, "BACKGROUND": False})
+    def test_low_tier_is_not_escalated(self):
+        self.client.login(username="elder", password="pass12345")
+        with patch("core.views.agenerate_ai_reply", return_value="好的"):
+            self.client.post(
+                reverse("api_chat"),
+                data=json.dumps({"message": "今天忘了服药"}),
+                content_type="application/json",
+            )
+        self.assertFalse(ConsultationTicket.objects.exists())
+
+    def test_failed_user_is_retried_without_blocking_others(self):
+        other = User.objects.create_user(username="other", password="pass12345")
+        worker = EscalationWorker(flush_interval=60, max_queue=10, autostart=False, retry_delay=0)
+        worker.submit(RiskEvent(self.user.id, "high", "不想活了"))
+        worker.submit(RiskEvent(other.id, "high", "想消失"))
+        real = risk_escalation._escalate_user
+
+        def flaky(user_id, events):
+            if user_id == self.user.id:
+                raise OperationalError("database is locked")
+            return real(user_id, events)
+
+        with patch("core.services.risk_escalation._escalate_user", side_effect=flaky), self.assertLogs(
+            "core.services.risk_escalation", "ERROR"
+        ):
+            self.assertEqual(worker.flush(), 1)
+        self.assertEqual(ConsultationTicket.objects.get().user, other)
+        self.assertEqual(worker.stats()["retrying"], 1)
+
+        self.assertEqual(worker.flush(), 1)
+        self.assertEqual(ConsultationTicket.objects.filter(user=self.user).count(), 1)
+        self.assertEqual(worker.stats()["retrying"], 0)
+
+    def test_catch_up_escalates_lost_turns_once(self):
+        old = timezone.now() - timedelta(minutes=10)
+        lost = ChatLog.objects.create(
+            user=self.user,
+            provider="deepseek",
+            messages_json=[{"role": "user", "content": "我不想活了"}],
+            response_text=settings.AI_RISK_REPLIES["high"],
+            risk_flag=True,
+            created_at=old,
+        )
+        # 仍在宽限期内的记录留给后台线程。
+        fresh = ChatLog.objects.create(
+            user=self.user, provider="deepseek", messages_json=[], response_text="", risk_flag=True
+        )
+        self.assertEqual(catch_up(), 1)
+        ticket = ConsultationTicket.objects.get()
+        self.assertEqual(ticket.message, "我不想活了")
+        lost.refresh_from_db()
+        self.assertIsNotNone(lost.escalated_at)
+        self.assertEqual(RollupWatermark.objects.get(name="risk_escalation").last_id, fresh.id - 1)
+
+        # 已由补偿扫描处理的轮次，迟到的队列事件不会重复开单或记录。
+        self.assertEqual(escalate([RiskEvent(self.user.id, "high", "我不想活了", chat_log_id=lost.id)]), 0)
+        self.assertEqual(catch_up(), 0)
+        self.assertFalse(ConsultationNote.objects.exists())
+
+    def test_catch_up_watermark_stops_at_rows_seen_before_the_scan(self):
+        seen = ChatLog.objects.create(user=self.user, provider="deepseek", messages_json=[], response_text="")
+        late = []
+
+        def escalate_while_a_turn_commits(events, failed=None):
+            turn = ChatLog.objects.create(user=self.user, provider="deepseek", messages_json=[], response_text="")
+            late.append(turn)
+            return 0
+
+        with patch.object(risk_escalation, "escalate", escalate_while_a_turn_commits):
+            self.assertEqual(catch_up(), 0)
+        self.assertEqual(RollupWatermark.objects.get(name="risk_escalation").last_id, seen.id)
+        self.assertGreater(late[0].id, seen.id)
@@ -0,0 +1,31 @@
+from django.test import SimpleTestCase, override_settings
+
+from core.services.ai_chat import contains_risk
+from core.services.risk_matcher import KeywordMatch, KeywordMatcher, keyword_map
+
+
+class KeywordMatcherTests(SimpleTestCase):
+    def test_reports_overlapping_matches_with_positions(self):
+        matcher = KeywordMatcher({"he": "a", "she": "b", "his": "c", "hers": "d"})
+        matches = matcher.find_all("ushers")
+        self.assertEqual(
+            sorted(matches, key=lambda match: (match.end, match.keyword)),
+            [
+                KeywordMatch(2, 4, "he", "a"),
+                KeywordMatch(1, 4, "she", "b"),
+                KeywordMatch(2, 6, "hers", "d"),
+            ],
+        )
+
+    def test_categories_and_case_folding(self):
+        matcher = KeywordMatcher(keyword_map({"self_harm": ["不想活"], "english": ["Hopeless"]}))
+        self.assertEqual(matcher.categories("真的不想活了, so HOPELESS"), {"self_harm", "english"})
+        self.assertFalse(matcher.search("今天心情还好"))
+
+    def test_flat_keyword_list_is_supported(self):
+        self.assertEqual(keyword_map(["自杀"]), {"自杀": "general"})
+
+    @override_settings(AI_RISK_KEYWORDS=["想不开"])
+    def test_contains_risk_follows_settings(self):
+        self.assertTrue(contains_risk("我有点想不开"))
+        self.assertFalse(contains_risk("我想自杀"))
@@ -0,0 +1,51 @@
+from unittest.mock import patch
+
+from django.core.cache import cache
+from django.test import SimpleTestCase
+
+from core.services.risk_scoring import RiskScorer, assess_conversation, get_risk_scorer
+
+
+def user_turns(*texts):
+    messages = []
+    for text in texts:
+        messages += [{"role": "user", "content": text}, {"role": "assistant", "content": "嗯"}]
+    return messages[:-1]
+
+
+class RiskScoringTests(SimpleTestCase):
+    def setUp(self):
+        cache.clear()
+        self.scorer = get_risk_scorer()
+
+    def test_benign_context_is_ignored(self):
+        self.assertEqual(self.scorer.score_message("按时服药很重要").score, 0)
+        self.assertEqual(self.scorer.tier_for(self.scorer.score_message("我偷偷服药").score), "low")
+
+    def test_negation_down_weights_phrase(self):
+        plain = self.scorer.score_message("我想自杀").score
+        negated = self.scorer.score_message("我没有想过自杀").score
+        self.assertLess(negated, plain)
+        self.assertEqual(self.scorer.tier_for(plain), "high")
+        self.assertNotEqual(self.scorer.tier_for(negated), "high")
+
+    def test_tiers_drive_intervention(self):
+        self.assertFalse(assess_conversation(1, user_turns("今天天气不错")).intervene)
+        assessment = assess_conversation(2, user_turns("我真的不想活了"))
+        self.assertEqual(assessment.tier, "high")
+        self.assertTrue(assessment.intervene)
+
+    def test_running_score_accumulates_across_turns(self):
+        first = assess_conversation(3, user_turns("有时候想消失"))
+        second = assess_conversation(3, user_turns("有时候想消失", "真的想消失"))
+        self.assertEqual(first.tier, "medium")
+        self.assertEqual(second.tier, "high")
+
+    def test_only_newest_message_is_scanned_on_cache_hit(self):
+        assess_conversation(4, user_turns("睡不好"))
+        original = RiskScorer.score_message
+        with patch.object(
+            RiskScorer, "score_message", autospec=True, side_effect=original
+        ) as score_message:
+            assess_conversation(4, user_turns("睡不好", "还总是做梦"))
+        self.assertEqual(score_message.call_count, 1)
@@ -0,0 +1,137 @@
+import tempfile
+from pathlib import Path
+from unittest.mock import patch
+
+from asgiref.sync import async_to_sync
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.test import AsyncClient, SimpleTestCase, TestCase, override_settings
+from django.urls import reverse
+
+from core.models import ConsultationNote, ConsultationTicket
+from core.services import ticket_queue
+from core.services.ticket_events import (
+    MemoryEventBackend,
+    SQLiteEventBackend,
+    get_event_backend,
+    reset_event_backend,
+)
+
+FAST_EVENTS = {
+    **settings.TICKET_EVENTS,
+    "ENABLED": True,
+    "BACKEND": "core.services.ticket_events.MemoryEventBackend",
+    "POLL_INTERVAL": 0.02,
+    "KEEPALIVE_SECONDS": 0.05,
+    "STREAM_SECONDS": 0.2,
+}
+
+
+class EventBackendTests(SimpleTestCase):
+    def check_backend(self, backend):
+        self.assertEqual(backend.latest(), 0)
+        for number in range(5):
+            backend.publish({"kind": "updated", "ticket": number})
+        events, missed = backend.since(3)
+        self.assertEqual([event_id for event_id, _ in events], [4, 5])
+        self.assertFalse(missed)
+        self.assertEqual(events[0][1]["ticket"], 3)
+        # 只保留最近 3 条：从更早位置续传的客户端需要整页刷新。
+        self.assertTrue(backend.since(0)[1])
+        self.assertTrue(backend.since(9)[1])
+        self.assertEqual(backend.since(5), ([], False))
+
+    def test_memory_backend(self):
+        self.check_backend(MemoryEventBackend(buffer=3))
+
+    def test_sqlite_backend(self):
+        with tempfile.TemporaryDirectory() as tmp:
+            self.check_backend(SQLiteEventBackend(buffer=3, path=Path(tmp) / "events.sqlite3"))
+
+
+@override_settings(TICKET_EVENTS=FAST_EVENTS)
+class TicketEventStreamTests(TestCase):
+    def setUp(self):
+        reset_event_backend()
+        self.staff = get_user_model().objects.create_user("alice", password="pw", is_staff=True)
+
+    def test_changes_are_published_after_commit(self):
+        backend = get_event_backend()
+        with self.captureOnCommitCallbacks(execute=True):
+            ticket = ConsultationTicket.objects.create(title="求助", message="睡不着")
+        with self.captureOnCommitCallbacks(execute=True):
+            ticket_queue.claim(ticket.id, self.staff)
+        with self.captureOnCommitCallbacks(execute=True):
+            ConsultationNote.objects.create(ticket=ticket, author=self.staff, note="已电话联系")
+        events = [payload for _, payload in backend.since(0)[0]]
+        self.assertEqual([payload["kind"] for payload in events], ["created", "updated", "note"])
+        self.assertTrue(events[0]["waiting"])
+        self.assertIn(f'data-ticket-id="{ticket.id}"', events[0]["row"])
+        self.assertFalse(events[1]["waiting"])
+        self.assertEqual(events[1]["assigned_to"], "alice")
+        self.assertIn("已电话联系", events[2]["note"])
+
+    def test_publish_failures_do_not_fail_saves(self):
+        backend = get_event_backend()
+        with patch.object(backend, "publish", side_effect=OSError("disk full")):
+            with self.assertLogs("django.test", "ERROR") as logs:
+                with self.captureOnCommitCallbacks(execute=True):
+                    ticket = ConsultationTicket.objects.create(title="求助", message="睡不着")
+                with self.captureOnCommitCallbacks(execute=True):
+                    self.assertTrue(ticket_queue.claim(ticket.id, self.staff))
+                with self.captureOnCommitCallbacks(execute=True):
+                    ConsultationNote.objects.create(ticket=ticket, author=self.staff, note="已联系")
+        self.assertEqual(len(logs.records), 3)
+        ticket.refresh_from_db()
+        self.assertEqual(ticket.assigned_to, self.staff)
+        self.assertEqual(ticket.notes.count(), 1)
+
+    def _read(self, **kwargs):
+        client = AsyncClient()
+
+        async def read():
+            await client.aforce_login(self.staff)
+            response = await client.get(reverse("manage_ticket_events"), **kwargs)
+            self.assertEqual(response["Content-Type"], "text/event-stream")
+            return "".join([chunk.decode("utf-8") async for chunk in response.streaming_content])
+
+        return async_to_sync(read)()
+
+    def test_stream_resumes_after_cursor(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            ConsultationTicket.objects.create(title="一", message="m")
+            ConsultationTicket.objects.create(title="二", message="m")
+        body = self._read(data={"after": 1})
+        self.assertNotIn("id: 1\n", body)
+        self.assertIn("id: 2\nevent: created\n", body)
+        self.assertIn(": keepalive", body)
+
+    def test_async_stream_polls(self):
+        get_event_backend().publish({"kind": "updated", "ticket": 7})
+        body = self._read(headers={"Last-Event-ID": "0"})
+        self.assertIn('id: 1\nevent: updated\ndata: {"kind": "updated", "ticket": 7}', body)
+
+    def test_sqlite_backend_stream(self):
+        with tempfile.TemporaryDirectory() as tmp:
+            events = {
+                **FAST_EVENTS,
+                "BACKEND": "core.services.ticket_events.SQLiteEventBackend",
+                "OPTIONS": {"path": Path(tmp) / "events.sqlite3"},
+            }
+            with override_settings(TICKET_EVENTS=events):
+                reset_event_backend()
+                get_event_backend().publish({"kind": "updated", "ticket": 7})
+                body = self._read()
+                self.assertNotIn("event: updated", body)
+                self.assertIn(": keepalive", body)
+                reset_event_backend()
+
+    def test_wsgi_requests_get_no_stream(self):
+        # WSGI 下不提供长连接，避免一条连接占住工作线程数分钟。
+        self.client.force_login(self.staff)
+        self.assertEqual(self.client.get(reverse("manage_ticket_events")).status_code, 204)
+
+    def test_staff_only(self):
+        user = get_user_model().objects.create_user("bob", password="pw")
+        self.client.force_login(user)
+        self.assertEqual(self.client.get(reverse("manage_ticket_events")).status_code, 302)
@@ -0,0 +1,94 @@
+from datetime import timedelta
+from io import StringIO
+
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.core.management import call_command
+from django.db.models import F
+from django.test import TestCase, override_settings
+from django.urls import reverse
+from django.utils import timezone
+
+from core.models import ConsultationTicket
+from core.services import ticket_queue
+
+
+class TicketQueueTests(TestCase):
+    def setUp(self):
+        User = get_user_model()
+        self.alice = User.objects.create_user("alice", password="pw", is_staff=True)
+        self.bob = User.objects.create_user("bob", password="pw", is_staff=True)
+
+    def _ticket(self, title, message="想聊聊最近的睡眠", minutes_ago=0):
+        ticket = ConsultationTicket.objects.create(title=title, message=message)
+        if minutes_ago:
+            created_at = timezone.now() - timedelta(minutes=minutes_ago)
+            ConsultationTicket.objects.filter(pk=ticket.pk).update(
+                created_at=created_at, queue_rank=ticket_queue.queue_rank(created_at, ticket.priority)
+            )
+        return ticket
+
+    def test_risk_outranks_waiting_time(self):
+        calm = self._ticket("睡不好", minutes_ago=60)
+        urgent = self._ticket("求助", "最近总觉得活不下去")
+        older_calm = self._ticket("孤独", minutes_ago=600)
+        self.assertEqual(calm.priority, 0)
+        self.assertGreaterEqual(urgent.priority, 8)
+        order = list(ticket_queue.waiting_tickets().order_by("queue_rank", "id").values_list("id", flat=True))
+        self.assertEqual(order, [older_calm.id, urgent.id, calm.id])
+
+    def test_rank_command_reorders_existing_tickets(self):
+        urgent = self._ticket("求助", "最近总觉得活不下去")
+        # 模拟迁移前的工单：按创建时间排队，没有优先级。
+        ConsultationTicket.objects.update(priority=0, queue_rank=F("created_at"))
+        out = StringIO()
+        call_command("rank_ticket_queue", "--chunk-size", "1", stdout=out)
+        self.assertIn("Ranked 1 tickets.", out.getvalue())
+        urgent.refresh_from_db()
+        self.assertGreaterEqual(urgent.priority, 8)
+        self.assertEqual(urgent.queue_rank, ticket_queue.queue_rank(urgent.created_at, urgent.priority))
+
+    def test_claim_is_conditional(self):
+        first = self._ticket("一", minutes_ago=30)
+        second = self._ticket("二", minutes_ago=20)
+        self.assertTrue(ticket_queue.claim(first.id, self.alice))
+        self.assertFalse(ticket_queue.claim(first.id, self.bob))
+        claimed = ticket_queue.claim_next(self.bob)
+        self.assertEqual(claimed.id, second.id)
+        self.assertEqual(claimed.assigned_to, self.bob)
+        self.assertEqual(claimed.status, ConsultationTicket.STATUS_ASSIGNED)
+        self.assertIsNone(ticket_queue.claim_next(self.alice))
+
+        self.assertFalse(ticket_queue.release(first.id, self.bob))
+        self.assertTrue(ticket_queue.release(first.id, self.alice))
+        self.assertEqual(ticket_queue.claim_next(self.bob).id, first.id)
+
+    def test_stale_claims_return_to_queue(self):
+        ticket = self._ticket("一")
+        ticket_queue.claim(ticket.id, self.alice, now=timezone.now() - timedelta(hours=2))
+        metrics = ticket_queue.queue_metrics()
+        self.assertEqual(metrics.depth, 0)
+        self.assertEqual(metrics.held, [("alice", 1, 0)])
+        self.assertEqual(ticket_queue.claim_next(self.bob).id, ticket.id)
+
+    def test_claim_uses_rank_index(self):
+        plan = ticket_queue.waiting_tickets().order_by("queue_rank", "id").values_list("id", flat=True)[:5].explain()
+        self.assertIn("ticket_status_rank_idx", plan)
+
+    @override_settings(TICKET_EVENTS={**settings.TICKET_EVENTS, "BACKEND": "core.services.ticket_events.MemoryEventBackend"})
+    def test_staff_claims_from_list(self):
+        ticket = self._ticket("求助", "不想活了", minutes_ago=5)
+        self.client.force_login(self.alice)
+        response = self.client.get(reverse("manage_ticket_list"))
+        self.assertContains(response, "排队中：1（紧急 1）")
+        response = self.client.post(reverse("manage_ticket_claim"))
+        self.assertRedirects(response, reverse("manage_ticket_detail", args=[ticket.id]))
+        ticket.refresh_from_db()
+        self.assertEqual(ticket.assigned_to, self.alice)
+        self.assertIsNotNone(ticket.claimed_at)
+
+        self.client.force_login(self.bob)
+        response = self.client.post(reverse("manage_ticket_detail", args=[ticket.id]), {"claim": "1"}, follow=True)
+        self.assertContains(response, "该咨询已被其他人领取")
+        response = self.client.post(reverse("manage_ticket_claim"), follow=True)
+        self.assertContains(response, "队列中暂时没有待领取的咨询")
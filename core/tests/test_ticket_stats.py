@@ -0,0 +1,94 @@
+from datetime import timedelta
+from io import StringIO
+
+from django.contrib.auth import get_user_model
+from django.core.management import call_command
+from django.test import TestCase
+from django.urls import reverse
+from django.utils import timezone
+
+from core.models import ConsultationTicket, TicketCounter
+from core.services import ticket_queue, ticket_stats
+
+
+class TicketStatsTests(TestCase):
+    def setUp(self):
+        self.staff = get_user_model().objects.create_user("alice", password="pw", is_staff=True)
+
+    def counters(self):
+        return dict(TicketCounter.objects.values_list("name", "value"))
+
+    def test_saves_move_counters_and_stamp_sla_once(self):
+        ticket = ConsultationTicket.objects.create(title="求助", message="睡不着")
+        self.assertEqual(self.counters()["status:new"], 1)
+        self.assertIsNone(ticket.first_assigned_at)
+
+        ticket.status = ConsultationTicket.STATUS_IN_PROGRESS
+        ticket.save()
+        ticket.status = ConsultationTicket.STATUS_RESOLVED
+        ticket.save()
+        resolved_at = ticket.resolved_at
+        self.assertIsNotNone(ticket.first_assigned_at)
+        self.assertIsNotNone(resolved_at)
+
+        # 重新打开再关闭不改写首次解决时间，也不重复计入时效。
+        ticket.status = ConsultationTicket.STATUS_IN_PROGRESS
+        ticket.save()
+        ticket.status = ConsultationTicket.STATUS_CLOSED
+        ticket.save()
+        self.assertEqual(ticket.resolved_at, resolved_at)
+        counters = self.counters()
+        self.assertEqual(counters["status:new"], 0)
+        self.assertEqual(counters["status:in_progress"], 0)
+        self.assertEqual(counters["status:closed"], 1)
+        self.assertEqual(counters["assign:count"], 1)
+        self.assertEqual(counters["resolve:count"], 1)
+        self.assertEqual(counters["resolve:within"], 1)
+
+        ticket.delete()
+        self.assertFalse(any(self.counters().values()))
+
+    def test_queue_updates_keep_counters_in_step(self):
+        ticket = ConsultationTicket.objects.create(title="一", message="m")
+        stale = ConsultationTicket.objects.get(pk=ticket.pk)
+        self.assertTrue(ticket_queue.claim(ticket.id, self.staff))
+        ticket.refresh_from_db()
+        self.assertEqual(ticket.first_assigned_at, ticket.claimed_at)
+        self.assertTrue(ticket_queue.release(ticket.id, self.staff))
+        self.assertTrue(ticket_queue.claim(ticket.id, self.staff))
+        counters = self.counters()
+        self.assertEqual((counters["status:new"], counters["status:assigned"]), (0, 1))
+        self.assertEqual(counters["assign:count"], 1)
+
+        # 读出后被队列更新过的实例再保存，不会抹掉已记录的首次分配时间。
+        stale.status = ConsultationTicket.STATUS_IN_PROGRESS
+        stale.save()
+        self.assertEqual(stale.first_assigned_at, ticket.first_assigned_at)
+        self.assertEqual(ticket_stats.reconcile_counters(dry_run=True), {})
+
+    def test_reconcile_reports_and_fixes_drift(self):
+        ConsultationTicket.objects.create(title="一", message="m")
+        TicketCounter.objects.filter(name="status:new").update(value=7)
+        out = StringIO()
+        call_command("reconcile_ticket_counters", "--dry-run", stdout=out)
+        self.assertIn("status:new: 7 -> 1", out.getvalue())
+        self.assertEqual(self.counters()["status:new"], 7)
+        call_command("reconcile_ticket_counters", stdout=StringIO())
+        self.assertEqual(self.counters()["status:new"], 1)
+        self.assertEqual(ticket_stats.reconcile_counters(), {})
+
+    def test_metrics_read_counters_only(self):
+        ConsultationTicket.objects.create(title="一", message="m")
+        ConsultationTicket.objects.filter(status=ConsultationTicket.STATUS_NEW).update(
+            created_at=timezone.now() - timedelta(minutes=90)
+        )
+        with self.assertNumQueries(2):
+            stats = ticket_stats.ticket_stats()
+        self.assertEqual((stats.total, stats.open), (1, 1))
+        self.assertGreaterEqual(stats.oldest_unassigned, 90 * 60)
+        self.assertIsNone(stats.assign.mean)
+
+        self.client.force_login(self.staff)
+        response = self.client.get(reverse("manage_ticket_metrics"))
+        self.assertContains(response, "最久未分配：90 分钟")
+        self.assertContains(response, "首次分配（目标 60 分钟）")
@@ -9,6 +9,7 @@ urlpatterns = [
     path("wellness/", views.wellness_home, name="wellness_home"),
     path("wellness/assessments/", views.assessment_list, name="assessment_list"),
     path("wellness/assessments/history/", views.assessment_history, name="assessment_history"),
+    path("wellness/assessments/trends/", views.assessment_trends, name="assessment_trends"),
     path(
         "wellness/assessments/<str:slug>/result/<int:submission_id>/",
         views.assessment_result,
@@ -24,6 +25,16 @@ urlpatterns = [
     path("account/logout/", views.logout, name="logout"),
     path("account/tickets/", views.my_tickets, name="my_tickets"),
     path("manage/tickets/", views.manage_ticket_list, name="manage_ticket_list"),
+    path("manage/tickets/claim/", views.manage_ticket_claim, name="manage_ticket_claim"),
+    path("manage/tickets/events/", views.manage_ticket_events, name="manage_ticket_events"),
+    path("manage/tickets/metrics/", views.manage_ticket_metrics, name="manage_ticket_metrics"),
     path("manage/tickets/<int:ticket_id>/", views.manage_ticket_detail, name="manage_ticket_detail"),
+    path("manage/ai-metrics/", views.manage_ai_metrics, name="manage_ai_metrics"),
+    path(
+        "manage/analytics/assessments/",
+        views.manage_assessment_analytics,
+        name="manage_assessment_analytics",
+    ),
     path("api/chat/", views.api_chat, name="api_chat"),
+    path("api/chat/stream/", views.api_chat_stream, name="api_chat_stream"),
 ]
@@ -1,18 +1,21 @@
 import json
-import re
+import math
 
+from asgiref.sync import sync_to_async
 from django.conf import settings
 from django.contrib import messages as django_messages
 from django.contrib.admin.views.decorators import staff_member_required
 from django.contrib.auth import login as auth_login, logout as auth_logout
 from django.contrib.auth.decorators import login_required
+from django.db import transaction
 from django.db.models import Q, Count
-from django.http import JsonResponse
+from django.core.handlers.asgi import ASGIRequest
+from django.http import HttpResponse, JsonResponse, StreamingHttpResponse
 from django.shortcuts import get_object_or_404, redirect, render
 from django.views.decorators.csrf import ensure_csrf_cookie
 from django.views.decorators.http import require_POST
 
-from .ai import AIServiceError
+from .ai import AIServiceError, pool_stats, router_stats
 from .forms import (
     ArticleSearchForm,
     ConsultationNoteForm,
@@ -25,19 +28,35 @@ from .forms import (
 )
 from .services.ai_chat import (
     AIChatPayload,
-    build_messages,
-    contains_risk,
-    generate_ai_reply,
-    log_chat,
+    agenerate_ai_reply,
+    alog_chat,
+    astream_ai_reply,
     parse_ai_payload,
 )
-from .services.assessment_scoring import score_assessment
-from .pagination import paginate_queryset
+from .services import knowledge_search, ticket_events, ticket_queue, ticket_stats
+from .services.assessment_analytics import assessment_analytics
+from .services.assessment_scoring import get_compiled, score_assessment
+from .services.assessment_trends import trend_chart
+from .services.chat_log_writer import get_chat_log_writer
+from .services.conversations import aload_context, astart_conversation
+from .services.rate_limit import (
+    REASON_GLOBAL_CONCURRENCY,
+    REASON_GLOBAL_RATE,
+    REASON_USER_CONCURRENCY,
+    REASON_USER_RATE,
+    RateLimited,
+    get_rate_limiter,
+)
+from .services.reply_cache import get_reply_cache
+from .services.risk_escalation import areport_risk, get_escalation_worker
+from .services.risk_scoring import aassess_conversation, risk_reply
+from .pagination import paginate_keyset, paginate_queryset
 from .models import (
     Article,
     Assessment,
     AssessmentAnswer,
     AssessmentSubmission,
+    AssessmentTrend,
     Category,
     ConsultationNote,
     ConsultationTicket,
@@ -73,29 +92,24 @@ def knowledge_list(request):
     form = ArticleSearchForm(request.GET or None)
     articles = Article.objects.filter(is_published=True).select_related("category")
     selected_category = None
+    raw_query = ""
     if form.is_valid():
         raw_query = (form.cleaned_data.get("query") or "").strip()
         category_slug = (form.cleaned_data.get("category") or "").strip()
 
-        # 允许用户用空格/逗号/顿号等分隔多个关键词，避免“睡眠、焦虑”搜不到的误解。
-        tokens = [t for t in re.split(r"[\s,，、;；]+", raw_query) if t]
-        if tokens:
-            query_filter = Q()
-            for token in tokens:
-                query_filter |= (
-                    Q(title__icontains=token)
-                    | Q(summary__icontains=token)
-                    | Q(tags__icontains=token)
-                )
-            articles = articles.filter(query_filter)
-
         if category_slug:
             articles = articles.filter(category__slug=category_slug)
             selected_category = Category.objects.filter(slug=category_slug).first()
-    articles = articles.order_by("-created_at")
-    page_obj, querystring = paginate_queryset(
-        request, articles, settings.PAGINATION_PAGE_SIZE
-    )
+    if raw_query:
+        articles = knowledge_search.search_articles(articles, raw_query)
+        page_obj, querystring = paginate_queryset(
+            request, articles, settings.PAGINATION_PAGE_SIZE
+        )
+    else:
+        page_obj, querystring = paginate_keyset(
+            request, articles, settings.PAGINATION_PAGE_SIZE, with_total=True
+        )
+    knowledge_search.attach_highlights(page_obj, raw_query)
     return render(
         request,
         "knowledge_list.html",
@@ -168,9 +182,8 @@ def my_tickets(request):
     tickets = (
         ConsultationTicket.objects.filter(user=request.user)
         .select_related("assigned_to")
-        .order_by("-created_at")
     )
-    page_obj, querystring = paginate_queryset(
+    page_obj, querystring = paginate_keyset(
         request, tickets, settings.PAGINATION_PAGE_SIZE
     )
     return render(
@@ -185,18 +198,70 @@ def manage_ticket_list(request):
     tickets = (
         ConsultationTicket.objects.all()
         .select_related("user", "assigned_to")
-        .order_by("-created_at")
     )
-    page_obj, querystring = paginate_queryset(
-        request, tickets, settings.PAGINATION_PAGE_SIZE
+    page_obj, querystring = paginate_keyset(
+        request, tickets, settings.PAGINATION_PAGE_SIZE, with_total=True
     )
+    queue = ticket_queue.waiting_tickets().order_by("queue_rank", "id")[:5]
     return render(
         request,
         "manage/tickets.html",
-        {"page_obj": page_obj, "querystring": querystring},
+        {
+            "page_obj": page_obj,
+            "querystring": querystring,
+            "queue": queue,
+            "metrics": ticket_queue.queue_metrics(),
+            "stats": ticket_stats.ticket_stats(),
+            "urgent_priority": settings.TICKET_QUEUE["URGENT_PRIORITY"],
+            "events_after": ticket_events.latest_event_id(),
+        },
+    )
+
+
+@staff_member_required
+def manage_ticket_metrics(request):
+    """Ticket status counts and SLA timings, read from the maintained counters."""
+    stats = ticket_stats.ticket_stats()
+    return render(
+        request,
+        "manage/ticket_metrics.html",
+        {"stats": stats, "sla_rows": [("首次分配", stats.assign), ("解决", stats.resolve)]},
     )
 
 
+@staff_member_required
+async def manage_ticket_events(request):
+    """Ticket changes and new notes as server-sent events for the open staff pages.
+
+    Only served under ASGI: a WSGI worker thread would be pinned for the whole
+    stream, so there the page gets 204 and falls back to manual reloads.
+    """
+    backend = ticket_events.get_event_backend()
+    if backend is None or not isinstance(request, ASGIRequest):
+        return HttpResponse(status=204)
+    cursor = (backend, request.headers.get("Last-Event-ID"), request.GET.get("after"))
+    if backend.blocking:
+        after = await sync_to_async(ticket_events.start_cursor, thread_sensitive=False)(*cursor)
+    else:
+        after = ticket_events.start_cursor(*cursor)
+    response = StreamingHttpResponse(ticket_events.aevent_stream(backend, after), content_type="text/event-stream")
+    response["Cache-Control"] = "no-cache"
+    response["X-Accel-Buffering"] = "no"
+    return response
+
+
+@staff_member_required
+@require_POST
+def manage_ticket_claim(request):
+    """Assign the next ticket in queue order to the current staff member."""
+    ticket = ticket_queue.claim_next(request.user)
+    if ticket is None:
+        django_messages.info(request, "队列中暂时没有待领取的咨询。")
+        return redirect("manage_ticket_list")
+    django_messages.success(request, "已领取咨询，请尽快开始处理。")
+    return redirect("manage_ticket_detail", ticket_id=ticket.id)
+
+
 @staff_member_required
 def manage_ticket_detail(request, ticket_id):
     ticket = get_object_or_404(
@@ -208,7 +273,20 @@ def manage_ticket_detail(request, ticket_id):
     status_form = TicketStatusForm(request.POST or None, instance=ticket)
     note_form = ConsultationNoteForm(request.POST or None)
     if request.method == "POST":
+        if "claim" in request.POST:
+            if ticket_queue.claim(ticket.id, request.user):
+                django_messages.success(request, "已领取咨询。")
+            else:
+                django_messages.error(request, "该咨询已被其他人领取。")
+            return redirect("manage_ticket_detail", ticket_id=ticket.id)
+        if "release" in request.POST:
+            if ticket_queue.release(ticket.id, request.user):
+                django_messages.success(request, "咨询已放回队列。")
+            return redirect("manage_ticket_detail", ticket_id=ticket.id)
         if "update_status" in request.POST and status_form.is_valid():
+            if "assigned_to" in status_form.changed_data:
+                # 手动指派视同领取，重新计算未处理退回的时限。
+                ticket.claimed_at = timezone.now() if ticket.assigned_to_id else None
             status_form.save()
             django_messages.success(request, "咨询状态已更新。")
             return redirect("manage_ticket_detail", ticket_id=ticket.id)
@@ -224,7 +302,34 @@ def manage_ticket_detail(request, ticket_id):
     return render(
         request,
         "manage/ticket_detail.html",
-        {"ticket": ticket, "status_form": status_form, "note_form": note_form},
+        {
+            "ticket": ticket,
+            "status_form": status_form,
+            "note_form": note_form,
+            "events_after": ticket_events.latest_event_id(),
+        },
+    )
+
+
+@staff_member_required
+def manage_assessment_analytics(request):
+    """Score distributions and trends per assessment, read only from rollups."""
+    assessments = list(Assessment.objects.order_by("name"))
+    slug = request.GET.get("assessment") or ""
+    assessment = next((item for item in assessments if item.slug == slug), None)
+    if assessment is None and assessments:
+        assessment = assessments[0]
+    province = (request.GET.get("province") or "").strip()
+    analytics = assessment_analytics(assessment, province) if assessment else None
+    return render(
+        request,
+        "manage/assessment_analytics.html",
+        {
+            "assessments": assessments,
+            "assessment": assessment,
+            "province": province,
+            "analytics": analytics,
+        },
     )
 
 
@@ -287,7 +392,8 @@ def assessment_list(request):
 @login_required
 def assessment_detail(request, slug):
     assessment = get_object_or_404(Assessment, slug=slug, is_published=True)
-    questions = assessment.questions.prefetch_related("options")
+    # 题目与选项来自编译缓存，展示和评分都不再查询量表定义。
+    questions = get_compiled(assessment).questions
     if request.method == "POST":
         selected = {}
         missing = []
@@ -309,26 +415,28 @@ def assessment_detail(request, slug):
                     "wellness/assessment_detail.html",
                     {"assessment": assessment, "questions": questions},
                 )
-            submission = AssessmentSubmission.objects.create(
-                assessment=assessment,
-                user=request.user,
-                total_score=result_data.total_score,
-                result_title=result_data.result_title,
-                result_summary=result_data.result_summary,
-                result_advice=result_data.result_advice,
-            )
-            answer_rows = []
-            for question in questions:
-                option = result_data.option_map.get(int(selected[str(question.id)]))
-                answer_rows.append(
-                    AssessmentAnswer(
-                        submission=submission,
-                        question=question,
-                        option=option,
-                        score=option.score if option else 0,
-                    )
+            # 提交与答案同属一个事务，提交后的汇总回调才能看到完整的答卷。
+            with transaction.atomic():
+                submission = AssessmentSubmission.objects.create(
+                    assessment=assessment,
+                    user=request.user,
+                    total_score=result_data.total_score,
+                    result_title=result_data.result_title,
+                    result_summary=result_data.result_summary,
+                    result_advice=result_data.result_advice,
                 )
-            AssessmentAnswer.objects.bulk_create(answer_rows)
+                answer_rows = []
+                for question in questions:
+                    option = result_data.option_map[int(selected[str(question.id)])]
+                    answer_rows.append(
+                        AssessmentAnswer(
+                            submission=submission,
+                            question_id=question.id,
+                            option_id=option.id,
+                            score=option.score,
+                        )
+                    )
+                AssessmentAnswer.objects.bulk_create(answer_rows)
             return redirect("assessment_result", slug=assessment.slug, submission_id=submission.id)
     return render(
         request,
@@ -357,9 +465,8 @@ def assessment_history(request):
     submissions = (
         AssessmentSubmission.objects.filter(user=request.user)
         .select_related("assessment")
-        .order_by("-created_at")
     )
-    page_obj, querystring = paginate_queryset(
+    page_obj, querystring = paginate_keyset(
         request, submissions, settings.PAGINATION_PAGE_SIZE
     )
     return render(
@@ -369,6 +476,16 @@ def assessment_history(request):
     )
 
 
+@login_required
+def assessment_trends(request):
+    trends = AssessmentTrend.objects.filter(user=request.user).select_related("assessment")
+    return render(
+        request,
+        "wellness/assessment_trends.html",
+        {"trends": [(trend, trend_chart(trend)) for trend in trends]},
+    )
+
+
 @login_required
 def service_directory(request):
     query = (request.GET.get("query") or "").strip()
@@ -454,39 +571,86 @@ def relaxation_center(request):
     )
 
 
-@require_POST
-def api_chat(request):
-    if not request.user.is_authenticated:
-        return JsonResponse({"reply": "请先登录后再使用 AI 咨询。", "risk": False}, status=401)
+def _parse_chat_request(request, user):
+    """Return ``(parsed_payload, None)`` or ``(None, error_response)``."""
+    if not user.is_authenticated:
+        return None, JsonResponse({"reply": "请先登录后再使用 AI 咨询。", "risk": False}, status=401)
     try:
         payload = json.loads(request.body.decode("utf-8") or "{}")
     except json.JSONDecodeError:
-        return JsonResponse({"reply": "请求格式不正确，请刷新后再试。", "risk": False}, status=400)
+        return None, JsonResponse({"reply": "请求格式不正确，请刷新后再试。", "risk": False}, status=400)
 
-    provider = payload.get("provider") or "deepseek"
     try:
         parsed: AIChatPayload = parse_ai_payload(payload)
     except ValueError as exc:
         message = "内容过长，请精简后再试。" if "内容过长" in str(exc) else "消息格式不正确，请刷新后再试。"
-        return JsonResponse({"reply": message, "risk": False}, status=400)
-
-    latest_text = " ".join(
-        str(msg.get("content", ""))
-        for msg in parsed.messages
-        if msg.get("role") == "user"
-    )
-    if contains_risk(latest_text):
-        response_text = (
-            "我很在意你的安全。如果你正在经历强烈的痛苦或有伤害自己的想法，请立刻寻求帮助。"
-            "你可以联系身边可信任的人，或拨打当地紧急电话寻求支持。"
-            "如果愿意，也可以提交人工咨询，我们会尽快跟进。"
-        )
-        log_chat(parsed.provider, request.user if request.user.is_authenticated else None, parsed.messages, response_text, True)
-        return JsonResponse({"reply": response_text, "risk": True})
+        return None, JsonResponse({"reply": message, "risk": False}, status=400)
+    return parsed, None
+
+
+SESSION_CONVERSATION_KEY = "chat_conversation_id"
+RATE_LIMIT_REPLIES = {
+    REASON_USER_RATE: "发送太频繁了，请稍等片刻再试。",
+    REASON_USER_CONCURRENCY: "上一条消息还在回复中，请稍候再发送。",
+    REASON_GLOBAL_RATE: "当前咨询人数较多，请稍后再试。",
+    REASON_GLOBAL_CONCURRENCY: "当前咨询人数较多，请稍后再试。",
+}
+
+
+def _rate_limited_response(exc: RateLimited) -> JsonResponse:
+    # 风险对话在限流之前处理，被限流的只会是需要调用 AI 的普通消息。
+    retry_after = max(1, math.ceil(exc.retry_after))
+    response = JsonResponse(
+        {
+            "reply": RATE_LIMIT_REPLIES[exc.reason],
+            "risk": False,
+            "rate_limited": exc.reason,
+            "retry_after": retry_after,
+        },
+        status=429,
+    )
+    response["Retry-After"] = str(retry_after)
+    return response
+
+
+async def _abind_conversation(request, user, parsed: AIChatPayload) -> int | None:
+    if not parsed.server_context:
+        return None
+    current = (
+        None if parsed.new_conversation else await request.session.aget(SESSION_CONVERSATION_KEY)
+    )
+    conversation_id = await astart_conversation(parsed.provider, user, current)
+    if conversation_id == current:
+        parsed.messages = await aload_context(conversation_id) + parsed.messages
+    else:
+        await request.session.aset(SESSION_CONVERSATION_KEY, conversation_id)
+    return conversation_id
 
+
+@require_POST
+async def api_chat(request):
+    # 异步视图：等待 AI 回复期间不占用工作线程（需通过 gradsite.asgi 部署）。
+    user = await request.auser()
+    parsed, error_response = _parse_chat_request(request, user)
+    if error_response:
+        return error_response
+    conversation_id = await _abind_conversation(request, user, parsed)
+
+    assessment = await aassess_conversation(user.pk, parsed.messages)
+    if assessment.intervene:
+        reply = risk_reply(assessment.tier)
+        turn = await alog_chat(parsed.provider, user, parsed.messages, reply, True, conversation_id)
+        await areport_risk(user.pk, assessment.tier, parsed.messages, turn.conversation_id, turn.pk)
+        return JsonResponse({"reply": reply, "risk": True, "tier": assessment.tier})
+
+    limiter = get_rate_limiter()
+    try:
+        admission = await limiter.aadmit(user.pk) if limiter else None
+    except RateLimited as exc:
+        return _rate_limited_response(exc)
     try:
-        reply = generate_ai_reply(parsed)
-        log_chat(parsed.provider, request.user if request.user.is_authenticated else None, parsed.messages, reply, False)
+        reply = await agenerate_ai_reply(parsed)
+        await alog_chat(parsed.provider, user, parsed.messages, reply, False, conversation_id)
         return JsonResponse({"reply": reply, "risk": False})
     except AIServiceError as exc:
         return JsonResponse({"reply": str(exc), "risk": False}, status=200)
@@ -495,3 +659,113 @@ def api_chat(request):
             {"reply": "AI 服务暂时不可用，请稍后再试。", "risk": False},
             status=200,
         )
+    finally:
+        if admission:
+            await admission.arelease()
+
+
+def _sse(data: dict, event: str | None = None) -> str:
+    prefix = f"event: {event}\n" if event else ""
+    return f"{prefix}data: {json.dumps(data, ensure_ascii=False)}\n\n"
+
+
+@staff_member_required
+def manage_ai_metrics(request):
+    """Runtime counters for the AI chat pipeline in this process, as JSON."""
+    limiter = get_rate_limiter()
+    cache = get_reply_cache()
+    writer = get_chat_log_writer()
+    escalation = get_escalation_worker()
+    return JsonResponse(
+        {
+            "rate_limit": limiter.stats() if limiter else None,
+            "reply_cache": cache.stats() if cache else None,
+            "chat_log_writer": writer.stats() if writer else None,
+            "connection_pool": pool_stats(),
+            "router": router_stats(),
+            "risk_escalation": escalation.stats() if escalation else None,
+        },
+        json_dumps_params={"ensure_ascii": False},
+    )
+
+
+class _ReleasingStream:
+    """Releases limiter slots when the stream ends or the response is closed.
+
+    A generator that is closed before its first ``anext()`` never runs its
+    ``finally`` block, e.g. when the client disconnects before streaming starts;
+    Django calls ``close()`` through ``sync_to_async``, off the event loop.
+    """
+
+    def __init__(self, iterator, admission):
+        self.iterator = iterator
+        self.admission = admission
+
+    async def _iterate(self):
+        try:
+            async for chunk in self.iterator:
+                yield chunk
+        finally:
+            await self.admission.arelease()
+
+    def __aiter__(self):
+        return self._iterate()
+
+    def close(self):
+        self.admission.release()
+
+
+@require_POST
+async def api_chat_stream(request):
+    """Same contract as ``api_chat`` but relays the reply as server-sent events.
+
+    Emits ``delta`` events while the provider streams, then a single ``done``
+    (or ``error``) event; the complete reply is logged once the stream ends.
+    Like ``api_chat`` it is an async view, so each piece reaches the client
+    as it arrives and no worker thread is held while the reply streams.
+    """
+    user = await request.auser()
+    parsed, error_response = _parse_chat_request(request, user)
+    if error_response:
+        return error_response
+    conversation_id = await _abind_conversation(request, user, parsed)
+    assessment = await aassess_conversation(user.pk, parsed.messages)
+    admission = None
+    if not assessment.intervene:
+        limiter = get_rate_limiter()
+        try:
+            admission = await limiter.aadmit(user.pk) if limiter else None
+        except RateLimited as exc:
+            return _rate_limited_response(exc)
+
+    async def events():
+        if assessment.intervene:
+            reply = risk_reply(assessment.tier)
+            turn = await alog_chat(parsed.provider, user, parsed.messages, reply, True, conversation_id)
+            await areport_risk(user.pk, assessment.tier, parsed.messages, turn.conversation_id, turn.pk)
+            yield _sse({"text": reply}, "delta")
+            yield _sse({"risk": True, "tier": assessment.tier}, "done")
+            return
+        parts = []
+        try:
+            async for piece in astream_ai_reply(parsed):
+                parts.append(piece)
+                yield _sse({"text": piece}, "delta")
+        except AIServiceError as exc:
+            yield _sse({"reply": str(exc)}, "error")
+            return
+        except Exception:
+            yield _sse({"reply": "AI 服务暂时不可用，请稍后再试。"}, "error")
+            return
+        finally:
+            if admission:
+                await admission.arelease()
+        reply = "".join(parts).strip()
+        await alog_chat(parsed.provider, user, parsed.messages, reply, False, conversation_id)
+        yield _sse({"risk": False}, "done")
+
+    stream = _ReleasingStream(events(), admission) if admission else events()
+    response = StreamingHttpResponse(stream, content_type="text/event-stream")
+    response["Cache-Control"] = "no-cache"
+    response["X-Accel-Buffering"] = "no"
+    return response
@@ -145,6 +145,16 @@ LOGIN_URL = "login"
 LOGIN_REDIRECT_URL = "home"
 LOGOUT_REDIRECT_URL = "home"
 PAGINATION_PAGE_SIZE = int(os.environ.get("PAGINATION_PAGE_SIZE", "10"))
+# 游标分页显示的总条数为近似值，缓存若干秒以避免每页都执行 COUNT(*)。
+PAGINATION_COUNT_CACHE_SECONDS = int(os.environ.get("PAGINATION_COUNT_CACHE_SECONDS", "60"))
+
+# 知识库搜索的 BM25 字段权重：标题命中最重要，正文命中最弱。
+KNOWLEDGE_SEARCH_WEIGHTS = {
+    "title": 10.0,
+    "summary": 4.0,
+    "tags": 6.0,
+    "content": 1.0,
+}
 
 AI_PROVIDERS = {
     "deepseek": {
@@ -154,6 +164,17 @@ AI_PROVIDERS = {
         ),
         "api_key_env": "DEEPSEEK_API_KEY",
         "model": os.environ.get("DEEPSEEK_MODEL", "deepseek-chat"),
+        # 备用地址（如兼容 OpenAI 接口的代理或自建服务），主地址不可用时依次切换；
+        # 未设置 api_key_env 对应的变量时沿用主地址的 Key。
+        "fallbacks": [
+            {
+                "base_url": os.environ.get("DEEPSEEK_FALLBACK_BASE_URL", ""),
+                "api_key_env": "DEEPSEEK_FALLBACK_API_KEY",
+                "model": os.environ.get(
+                    "DEEPSEEK_FALLBACK_MODEL", os.environ.get("DEEPSEEK_MODEL", "deepseek-chat")
+                ),
+            }
+        ],
     }
 }
 
@@ -169,22 +190,219 @@ AI_SYSTEM_PROMPT = (
 AI_MAX_TOKENS = int(os.environ.get("AI_MAX_TOKENS", "1024"))
 AI_MAX_INPUT_CHARS = int(os.environ.get("AI_MAX_INPUT_CHARS", "1200"))
 AI_TIMEOUT = int(os.environ.get("AI_TIMEOUT", "60"))
+# 每个 AI 服务地址保留的空闲长连接数。
+AI_POOL_SIZE = int(os.environ.get("AI_POOL_SIZE", "4"))
+
+# AI 请求路由：超时、连接失败、429 和 5xx 会按指数退避（带随机抖动）重试，并轮换到备用地址；
+# 某地址连续失败 BREAKER_FAILURES 次后熔断 BREAKER_COOLDOWN 秒，之后放行一次试探请求。
+# 开启 HEDGE 后，非流式请求超过该地址最近延迟的 HEDGE_QUANTILE 分位仍未返回时，
+# 向下一个地址再发一份，取先返回的结果（至少积累 HEDGE_MIN_SAMPLES 个样本后才生效）。
+AI_ROUTER = {
+    "RETRIES": int(os.environ.get("AI_RETRIES", "2")),
+    "BACKOFF_BASE": 0.2,
+    "BACKOFF_MAX": 2.0,
+    "BREAKER_FAILURES": 3,
+    "BREAKER_COOLDOWN": 30,
+    "HEDGE": os.environ.get("AI_HEDGE_ENABLED", "0") == "1",
+    "HEDGE_QUANTILE": 0.95,
+    "HEDGE_MIN_SAMPLES": 20,
+    "HEDGE_MIN_DELAY": 0.2,
+    "LATENCY_WINDOW": 200,
+    "HEDGE_WORKERS": 8,
+}
 
-AI_RISK_KEYWORDS = [
-    "自杀",
-    "轻生",
-    "结束生命",
-    "活不下去",
-    "伤害自己",
-    "割腕",
-    "跳楼",
-    "服药",
-    "不想活",
-    "消失",
-]
+# 风险关键词按类别分组（也兼容纯列表写法），启动时编译为 Aho–Corasick 自动机，
+# 关键词数量增加不会拖慢每次对话的检测。
+AI_RISK_KEYWORDS = {
+    "self_harm": [
+        "自杀",
+        "轻生",
+        "结束生命",
+        "活不下去",
+        "伤害自己",
+        "割腕",
+        "跳楼",
+        "不想活",
+    ],
+    "medication": [
+        "服药",
+    ],
+    "withdrawal": [
+        "消失",
+        "想消失",
+    ],
+}
+
+# 风险评分：短语按权重计分（优先 PHRASE_WEIGHTS，其次按类别），命中“按时服药”等良性语境时忽略，
+# 前方 NEGATION_WINDOW 个字内出现否定词时降权。多轮对话的累计分按 DECAY 衰减，
+# 累计分达到 TIERS 中的阈值即进入对应等级，INTERVENE_TIERS 中的等级直接返回安全提示。
+AI_RISK_SCORING = {
+    "CATEGORY_WEIGHTS": {"self_harm": 10, "medication": 3, "withdrawal": 2},
+    "PHRASE_WEIGHTS": {"活不下去": 8, "伤害自己": 8, "想消失": 6},
+    "NEGATIONS": ["没有", "不会", "从没", "从来没", "并没有", "不再"],
+    "NEGATION_WINDOW": 4,
+    "NEGATION_FACTOR": 0.2,
+    "BENIGN_CONTEXTS": ["按时服药", "遵医嘱服药", "规律服药", "坚持服药", "服药提醒", "服药时间"],
+    "TIERS": [(9, "high"), (5, "medium"), (2, "low")],
+    "INTERVENE_TIERS": ["high", "medium"],
+    "DECAY": 0.5,
+    "CACHE_SECONDS": 6 * 60 * 60,
+}
+
+AI_RISK_REPLIES = {
+    "high": (
+        "我很在意你的安全。如果你正在经历强烈的痛苦或有伤害自己的想法，请立刻寻求帮助。"
+        "你可以联系身边可信任的人，或拨打当地紧急电话寻求支持。"
+        "如果愿意，也可以提交人工咨询，我们会尽快跟进。"
+    ),
+    "medium": (
+        "听起来你最近承受了不少压力，谢谢你愿意说出来。"
+        "可以和家人或信任的朋友聊一聊，也可以提交人工咨询，我们会有专人联系你。"
+        "如果出现伤害自己的念头，请立刻拨打当地紧急电话。"
+    ),
+}
 
 CHAT_HISTORY_LIMIT = 8
 
+# 发给模型的上下文按 token 预算裁剪（含系统提示词）：从最新消息往前保留，超出预算时
+# 用 SUMMARY_TOKENS 的额度附上一段较早内容的摘要。token 数按字符估算（DeepSeek 文档：
+# 中文约 0.6 token/字，英文约 0.3 token/字符）。MAX_MESSAGES 为服务端保存的上下文条数上限。
+AI_CONTEXT = {
+    "MAX_TOKENS": int(os.environ.get("AI_CONTEXT_MAX_TOKENS", "3000")),
+    "SUMMARY_TOKENS": 200,
+    "MAX_MESSAGES": 40,
+    "CJK_TOKENS_PER_CHAR": 0.6,
+    "OTHER_TOKENS_PER_CHAR": 0.3,
+    "MESSAGE_OVERHEAD_TOKENS": 4,
+    "CACHE_SECONDS": 60 * 60 * 24,
+}
+
+# 量表统计汇总：REFRESH_ON_SAVE 时每次提交后立即增量汇总，否则依赖定时运行
+# manage.py refresh_assessment_rollups；BATCH_SIZE 为每个事务汇总的提交数。
+ASSESSMENT_ANALYTICS = {
+    "REFRESH_ON_SAVE": os.environ.get("ASSESSMENT_ROLLUP_ON_SAVE", "1") == "1",
+    "BATCH_SIZE": 5000,
+}
+
+# 个人量表趋势：相邻两次得分变化达到 CHANGE_THRESHOLD 分记为加重/好转；
+# 每个用户每个量表最多保留 MAX_POINTS 个点（0 表示不限）。
+ASSESSMENT_TRENDS = {
+    "CHANGE_THRESHOLD": int(os.environ.get("ASSESSMENT_TREND_THRESHOLD", "5")),
+    "MAX_POINTS": 500,
+}
+
+# 咨询工单队列：标题与内容每 1 分风险分相当于多排队 MINUTES_PER_POINT 分钟（上限 MAX_PRIORITY 分），
+# 风险分达到 URGENT_PRIORITY 计为紧急。领取后 CLAIM_TIMEOUT_MINUTES 分钟内未开始处理则退回队列（0 为不退回）。
+# 领取时每轮读取 CLAIM_CANDIDATES 个候选，最多 CLAIM_ROUNDS 轮；等待时长统计最近 METRICS_WINDOW_HOURS 小时。
+TICKET_QUEUE = {
+    "MINUTES_PER_POINT": 30,
+    "MAX_PRIORITY": 50,
+    "URGENT_PRIORITY": 9,
+    "CLAIM_TIMEOUT_MINUTES": int(os.environ.get("TICKET_CLAIM_TIMEOUT_MINUTES", "30")),
+    "CLAIM_CANDIDATES": 5,
+    "CLAIM_ROUNDS": 3,
+    "METRICS_WINDOW_HOURS": 24,
+    "METRICS_SAMPLE": 5000,
+}
+
+# 咨询工单时效目标：创建后 ASSIGN_TARGET_MINUTES 分钟内有人负责、RESOLVE_TARGET_MINUTES 分钟内解决计为达标。
+# 达标数随工单变化累计，修改目标后执行 manage.py reconcile_ticket_counters 重新统计。
+TICKET_SLA = {
+    "ASSIGN_TARGET_MINUTES": int(os.environ.get("TICKET_SLA_ASSIGN_MINUTES", "60")),
+    "RESOLVE_TARGET_MINUTES": int(os.environ.get("TICKET_SLA_RESOLVE_MINUTES", str(3 * 24 * 60))),
+}
+
+# AI 对话限流：每个请求先从用户桶和全站桶各取一个令牌（RATE 为每秒补充数，BURST 为桶容量），
+# 再占用用户和全站各一个并发名额；名额已满时最多排队 QUEUE_TIMEOUT 秒，仍无空位返回 429。
+# 多进程部署时把 BACKEND 换成 core.services.rate_limit.SQLiteLimiterBackend（同一主机共享状态）。
+AI_RATE_LIMIT = {
+    "ENABLED": os.environ.get("AI_RATE_LIMIT_ENABLED", "1") == "1",
+    "BACKEND": os.environ.get("AI_RATE_LIMIT_BACKEND", "core.services.rate_limit.MemoryLimiterBackend"),
+    "OPTIONS": {},
+    "USER_RATE": 10 / 60,
+    "USER_BURST": 5,
+    "GLOBAL_RATE": 5.0,
+    "GLOBAL_BURST": 20,
+    "USER_CONCURRENCY": 2,
+    "GLOBAL_CONCURRENCY": int(os.environ.get("AI_MAX_CONCURRENT", "20")),
+    "QUEUE_TIMEOUT": 2.0,
+    "SLOT_TTL": 120,
+}
+
+# 普通对话记录先进入进程内队列，由后台线程按批量（BATCH_SIZE 条）或定时（FLUSH_INTERVAL 秒）
+# 写入数据库，进程退出时写完剩余记录；风险对话始终同步写入。数据库繁忙导致整批写入失败时，
+# 这一批按 RETRY_DELAY 起指数退避重试（最长 MAX_RETRY_DELAY 秒，最多 MAX_RETRIES 次），之后逐条写入。
+AI_CHATLOG_BUFFER = {
+    "ENABLED": os.environ.get("AI_CHATLOG_BUFFER_ENABLED", "1") == "1",
+    "BATCH_SIZE": int(os.environ.get("AI_CHATLOG_BATCH_SIZE", "50")),
+    "FLUSH_INTERVAL": float(os.environ.get("AI_CHATLOG_FLUSH_INTERVAL", "2")),
+    "MAX_QUEUE": 10000,
+    "RETRY_DELAY": 1.0,
+    "MAX_RETRY_DELAY": 30.0,
+    "MAX_RETRIES": 5,
+}
+
+# 工作人员页面实时更新：工单与处理记录的变更以 SSE 推送（/manage/tickets/events/，仅 ASGI 下提供），
+# 保留最近 BUFFER 条，断线重连时补发。默认 SQLiteEventBackend 让同一主机的各进程共享事件；
+# MemoryEventBackend 只适用于单进程。每条连接 STREAM_SECONDS 秒后结束，由浏览器在 RETRY_SECONDS 秒后自动重连。
+TICKET_EVENTS = {
+    "ENABLED": os.environ.get("TICKET_EVENTS_ENABLED", "1") == "1",
+    "BACKEND": os.environ.get("TICKET_EVENTS_BACKEND", "core.services.ticket_events.SQLiteEventBackend"),
+    "OPTIONS": {},
+    "BUFFER": 500,
+    "POLL_INTERVAL": 0.5,
+    "KEEPALIVE_SECONDS": 15,
+    "STREAM_SECONDS": 300,
+    "RETRY_SECONDS": 2,
+}
+
+# 风险对话自动转人工：TIERS 中的风险等级会为该用户生成一条咨询工单（来源“AI 对话风险”），
+# WINDOW_MINUTES 分钟内已有未结束的同类工单时只追加处理记录。BACKGROUND 时由后台线程处理，
+# 对话请求不等待数据库写入；关闭时在请求内同步处理。失败的事件按 RETRY_DELAY 起指数退避重试
+# （最长 MAX_RETRY_DELAY 秒，最多 MAX_RETRIES 次）。后台线程每 CATCH_UP_INTERVAL 秒补偿扫描一次：
+# 超过 CATCH_UP_GRACE 秒仍未处理的风险对话记录（如进程重启丢失了内存队列）每批 CATCH_UP_BATCH 条补做。
+RISK_ESCALATION = {
+    "ENABLED": os.environ.get("RISK_ESCALATION_ENABLED", "1") == "1",
+    "BACKGROUND": True,
+    "TIERS": ["high", "medium"],
+    "WINDOW_MINUTES": int(os.environ.get("RISK_ESCALATION_WINDOW_MINUTES", "60")),
+    "EXCERPT_CHARS": 500,
+    "FLUSH_INTERVAL": 1.0,
+    "MAX_QUEUE": 1000,
+    "RETRY_DELAY": 1.0,
+    "MAX_RETRY_DELAY": 60.0,
+    "MAX_RETRIES": 8,
+    "CATCH_UP_INTERVAL": 60,
+    "CATCH_UP_GRACE": 120,
+    "CATCH_UP_BATCH": 200,
+}
+
+# 对话记录保留策略（clear_chatlog 使用）：DAYS 为默认保留天数，0 表示全部清理；
+# USER_DAYS 按用户名单独设置保留天数。
+CHATLOG_RETENTION = {
+    "DAYS": int(os.environ.get("CHATLOG_RETENTION_DAYS", "0")),
+    "USER_DAYS": {},
+}
+
+# 对话记录归档（archive_chatlog 使用）：DAYS 天前的记录压缩写入 DIR 下的只追加分段文件。
+CHATLOG_ARCHIVE = {
+    "DIR": os.environ.get("CHATLOG_ARCHIVE_DIR", str(BASE_DIR / "var" / "chatlog_archive")),
+    "DAYS": int(os.environ.get("CHATLOG_ARCHIVE_DAYS", "90")),
+    "BLOCK_ROWS": 512,
+}
+
+# 单轮、无风险的常见问题回复缓存。BACKEND 可选：
+# core.services.reply_cache.MemoryReplyCache / FileReplyCache / DjangoReplyCache。
+AI_REPLY_CACHE = {
+    "ENABLED": os.environ.get("AI_REPLY_CACHE_ENABLED", "1") == "1",
+    "BACKEND": os.environ.get(
+        "AI_REPLY_CACHE_BACKEND", "core.services.reply_cache.MemoryReplyCache"
+    ),
+    "TTL": int(os.environ.get("AI_REPLY_CACHE_TTL", "21600")),
+    "MAX_ENTRIES": int(os.environ.get("AI_REPLY_CACHE_MAX_ENTRIES", "512")),
+    "OPTIONS": {},
+}
+
 LOCAL_PROVINCE = os.environ.get("LOCAL_PROVINCE", "江苏省")
 LOCAL_CITY = os.environ.get("LOCAL_CITY", "南京市")
 
@@ -13,11 +13,13 @@
     const deepThinkToggle = document.getElementById("deepThinkToggle");
     const deepThinkState = document.getElementById("deepThinkState");
     const apiUrl = chatBox.dataset.apiUrl;
+    const streamUrl = window.ReadableStream && window.TextDecoder ? chatBox.dataset.streamUrl : "";
     const provider = chatBox.dataset.provider || "deepseek";
 
     if (!chatPanel || !chatToggle || !chatInput || !chatSend || !chatHistory) return;
 
-    const messages = [];
+    // 上下文由服务端按会话保存，页面只发送新消息；每次打开页面开始新对话。
+    let conversationStarted = false;
     let deepThink = localStorage.getItem("deep-think") === "1";
     let dragged = false;
 
@@ -59,17 +61,66 @@
       }
     };
 
+    // 逐段读取服务端事件流，边收边显示；返回完整回复（出错时返回空字符串）。
+    const readStream = async (response, bubble) => {
+      const reader = response.body.getReader();
+      const decoder = new TextDecoder();
+      let buffer = "";
+      let reply = "";
+      let failed = false;
+
+      const handleEvent = (block) => {
+        let eventName = "message";
+        let data = "";
+        block.split("\n").forEach((line) => {
+          if (line.startsWith("event:")) eventName = line.slice(6).trim();
+          if (line.startsWith("data:")) data += line.slice(5).trim();
+        });
+        if (!data) return;
+        const payload = JSON.parse(data);
+        if (eventName === "delta") {
+          if (!reply) {
+            bubble.textContent = "";
+            bubble.classList.remove("thinking");
+          }
+          reply += payload.text || "";
+          bubble.textContent = reply;
+          chatHistory.scrollTop = chatHistory.scrollHeight;
+        } else if (eventName === "error") {
+          failed = true;
+          bubble.textContent = payload.reply || "抱歉，暂时无法回应。";
+          bubble.classList.remove("thinking");
+        }
+      };
+
+      while (true) {
+        const { value, done } = await reader.read();
+        if (done) break;
+        buffer += decoder.decode(value, { stream: true });
+        let boundary = buffer.indexOf("\n\n");
+        while (boundary !== -1) {
+          handleEvent(buffer.slice(0, boundary));
+          buffer = buffer.slice(boundary + 2);
+          boundary = buffer.indexOf("\n\n");
+        }
+      }
+      if (!reply && !failed) {
+        bubble.textContent = "抱歉，暂时无法回应。";
+        bubble.classList.remove("thinking");
+      }
+      return failed ? "" : reply;
+    };
+
     const sendMessage = async () => {
       const text = chatInput.value.trim();
       if (!text) return;
       appendBubble(text, "user");
-      messages.push({ role: "user", content: text });
       chatInput.value = "";
       chatSend.disabled = true;
       const thinkingBubble = appendBubble("正在思考", "assistant thinking");
 
       try {
-        const response = await fetch(apiUrl, {
+        const response = await fetch(streamUrl || apiUrl, {
           method: "POST",
           headers: {
             "Content-Type": "application/json",
@@ -77,20 +128,26 @@
           },
           body: JSON.stringify({
             provider,
-            messages,
+            message: text,
+            new_conversation: !conversationStarted,
             deep_think: deepThink,
           }),
         });
+        conversationStarted = true;
         if (response.status === 401) {
           thinkingBubble.textContent = "请先登录后使用 AI 咨询。";
           thinkingBubble.classList.remove("thinking");
           return;
         }
+        const contentType = response.headers.get("Content-Type") || "";
+        if (contentType.includes("text/event-stream")) {
+          await readStream(response, thinkingBubble);
+          return;
+        }
         const data = await response.json();
         const reply = data.reply || "抱歉，暂时无法回应。";
         thinkingBubble.textContent = reply;
         thinkingBubble.classList.remove("thinking");
-        messages.push({ role: "assistant", content: reply });
       } catch (error) {
         thinkingBubble.textContent = "网络连接异常，请稍后再试。";
         thinkingBubble.classList.remove("thinking");
@@ -0,0 +1,81 @@
+(() => {
+  let source = null;
+  let panel = null;
+
+  const toElement = (html) => {
+    const template = document.createElement("template");
+    template.innerHTML = html.trim();
+    return template.content.firstElementChild;
+  };
+
+  const replaceRow = (table, ticketId, html) => {
+    const row = table.querySelector(`[data-ticket-id="${ticketId}"]`);
+    if (row) {
+      row.replaceWith(toElement(html));
+    }
+    return Boolean(row);
+  };
+
+  const prependRow = (table, html) => {
+    const empty = table.querySelector(".empty");
+    if (empty) empty.remove();
+    const head = table.querySelector(".table-head");
+    const row = toElement(html);
+    if (head) {
+      head.after(row);
+    } else {
+      table.prepend(row);
+    }
+  };
+
+  const onTicket = (event) => {
+    const data = JSON.parse(event.data);
+    const detailId = panel.dataset.ticketId;
+    if (detailId) {
+      if (String(data.ticket) !== detailId) return;
+      const status = panel.querySelector('[data-live-field="status"]');
+      const assigned = panel.querySelector('[data-live-field="assigned_to"]');
+      if (status) status.textContent = data.status;
+      if (assigned) assigned.textContent = data.assigned_to || "-";
+      return;
+    }
+    const tickets = document.querySelector("[data-live-tickets]");
+    if (tickets && !replaceRow(tickets, data.ticket, data.row) && data.kind === "created") {
+      if (tickets.hasAttribute("data-live-prepend")) prependRow(tickets, data.row);
+    }
+    const queue = document.querySelector("[data-live-queue]");
+    if (!queue) return;
+    if (!data.waiting) {
+      const row = queue.querySelector(`[data-ticket-id="${data.ticket}"]`);
+      if (row) row.remove();
+    } else if (!replaceRow(queue, data.ticket, data.queue_row)) {
+      prependRow(queue, data.queue_row);
+    }
+  };
+
+  const onNote = (event) => {
+    const data = JSON.parse(event.data);
+    if (String(data.ticket) !== panel.dataset.ticketId) return;
+    const notes = panel.querySelector("[data-live-notes]");
+    if (notes) prependRow(notes, data.note);
+  };
+
+  const connect = () => {
+    const current = document.querySelector("[data-ticket-events]");
+    if (current === panel) return;
+    if (source) {
+      source.close();
+      source = null;
+    }
+    panel = current;
+    if (!panel || !window.EventSource) return;
+    source = new EventSource(panel.dataset.ticketEvents);
+    source.addEventListener("created", onTicket);
+    source.addEventListener("updated", onTicket);
+    source.addEventListener("note", onNote);
+    source.addEventListener("reset", () => window.location.reload());
+  };
+
+  document.addEventListener("DOMContentLoaded", connect);
+  document.addEventListener("htmx:afterSwap", connect);
+})();